@@ -0,0 +1,64 @@
+"""
+bench_bed_compression.py - Bytes on the wire and CPU cost of compressed BED responses
+
+Renders a synthetic multi-transcript panel BED with local_bed_stream and sends it through each
+response encoding bed_response offers: identity, gzip (Content-Encoding or .bed.gz file) and BGZF,
+at several zlib levels. Reports the bytes sent, the compression ratio and the CPU time per request
+(time.process_time, BED rendering included, averaged over --repeat runs).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_bed_compression
+    python -m benchmarks.bench_bed_compression --rows 50000 200000 --levels 1 6 9
+"""
+import argparse
+import logging
+import time
+
+from vimmo.logger.logging_config import logger
+from vimmo.utils.compression import bgzf_stream, gzip_stream
+from vimmo.utils.localbed import local_bed_stream
+
+
+def panel_rows(n_rows):
+    """Exons of ~n_rows / 60 genes with several transcripts each, as Query.local_bed yields them."""
+    rows = []
+    for i in range(n_rows):
+        gene, transcript, exon = i // 60, (i // 15) % 4, i % 15
+        start = 1_000_000 + gene * 200_000 + exon * 2_000 + transcript * 10
+        rows.append({"Chromosome": f"chr{gene % 22 + 1}", "Start": start, "End": start + 120 + exon * 7,
+                     "Name": f"GENE{gene}_exon{exon}", "HGNC_ID": f"HGNC:{1000 + gene}",
+                     "Transcript": f"NM_{100000 + gene * 4 + transcript}.{transcript + 1}",
+                     "Strand": "+" if gene % 2 else "-", "Type": ("ms", "mpc", "can")[transcript % 3]})
+    return rows
+
+
+def measure(rows, encode, repeat):
+    sent = 0
+    started = time.process_time()
+    for _ in range(repeat):
+        sent = sum(len(chunk) for chunk in encode(local_bed_stream(rows)))
+    return sent, (time.process_time() - started) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="BED rows per response (default: 10000 100000)")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 6, 9], help="zlib levels (default: 1 6 9)")
+    parser.add_argument("--repeat", type=int, default=3, help="Requests averaged per measurement (default: 3)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    print(f"{'rows':>8}  {'encoding':<10}{'level':>6}{'bytes':>12}{'ratio':>8}{'cpu ms':>10}")
+    for n_rows in args.rows:
+        rows = panel_rows(n_rows)
+        plain, plain_ms = measure(rows, lambda chunks: chunks, args.repeat)
+        print(f"{n_rows:>8}  {'identity':<10}{'-':>6}{plain:>12}{1:>8.1f}{plain_ms:>10.1f}")
+        for label, stream in (("gzip", gzip_stream), ("bgzf", bgzf_stream)):
+            for level in args.levels:
+                sent, cpu_ms = measure(rows, lambda chunks: stream(chunks, level), args.repeat)
+                print(f"{n_rows:>8}  {label:<10}{level:>6}{sent:>12}{plain / sent:>8.1f}{cpu_ms:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+bench_gene_lookup.py - Panels for a gene list, SQL join vs the gene index
+
+Builds synthetic panel, panel_genes and genes_info tables (with the repository's migrations, so
+the SQL side has its covering indexes) and asks get_panels_from_gene_list for random gene lists:
+- sql: Query without a catalogue, one three-way join with an IN (...) list
+- index: Query with a warm PanelCatalogue, answered from its GeneIndex
+- similar: the index with Similar_Matches, for gene symbols with one typo each
+
+sql and index return the same response; the benchmark checks they agree.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_gene_lookup
+    python -m benchmarks.bench_gene_lookup --genes 10 1000 5000 --panels 400
+"""
+import argparse
+import logging
+import random
+import sqlite3
+import string
+import time
+
+from vimmo.logger.logging_config import logger
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.panel_catalogue import PanelCatalogue
+
+
+def build_database(n_genes, n_panels, seed=1):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    run_migrations(conn)
+    symbols = set()
+    while len(symbols) < n_genes:
+        symbols.add("".join(rng.choices(string.ascii_uppercase, k=rng.randint(3, 6))) + str(rng.randint(1, 9)))
+    genes = [(f"HGNC:{i}", symbol, symbol) for i, symbol in enumerate(sorted(symbols))]
+    conn.executemany("INSERT INTO genes_info (HGNC_ID, Gene_Symbol, HGNC_symbol) VALUES (?, ?, ?)", genes)
+    conn.executemany("INSERT INTO panel VALUES (?, ?, ?)", [(i, f"R{i}", 1.0) for i in range(n_panels)])
+    panel_genes = [(panel_id, genes[gene][0], rng.randint(1, 3)) for panel_id in range(n_panels)
+                   for gene in rng.sample(range(n_genes), rng.choice([20, 100, 500]))]
+    conn.executemany("INSERT INTO panel_genes VALUES (?, ?, ?)", panel_genes)
+    conn.commit()
+    return conn, genes
+
+
+def typo(symbol, rng):
+    position = rng.randrange(len(symbol))
+    return symbol[:position] + rng.choice(string.ascii_uppercase) + symbol[position + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, nargs="+", default=[10, 1000, 5000],
+                        help="Genes per request (default: 10 1000 5000)")
+    parser.add_argument("--catalogue-genes", type=int, default=20000, help="Synthetic genes_info rows (default: 20000)")
+    parser.add_argument("--panels", type=int, default=400, help="Synthetic panels (default: 400)")
+    parser.add_argument("--repeat", type=int, default=5, help="Requests per measurement, best is reported (default: 5)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    conn, genes = build_database(args.catalogue_genes, args.panels)
+    catalogue = PanelCatalogue(max_age=None)
+    started = time.perf_counter()
+    catalogue.snapshot(conn).gene_index
+    print(f"catalogue and gene index over {len(genes)} genes, {args.panels} panels loaded in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms")
+    sql, indexed = Query(conn), Query(conn, catalogue=catalogue)
+
+    rng = random.Random(2)
+    print(f"{'genes':>6}  {'method':<8}{'ms':>10}{'us/gene':>10}{'panels':>8}")
+    for n_genes in args.genes:
+        sample = rng.sample(genes, n_genes)
+        hgnc_ids = [hgnc_id for hgnc_id, _, _ in sample]
+        typos = [typo(symbol, rng) for _, symbol, _ in sample]
+        runs = [("sql", lambda: sql.get_panels_from_gene_list(hgnc_ids)),
+                ("index", lambda: indexed.get_panels_from_gene_list(hgnc_ids)),
+                ("similar", lambda: indexed.get_panels_from_gene_list(typos, matches=True))]
+        responses = {}
+        for label, run in runs:
+            best = float("inf")
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                responses[label] = run()
+                best = min(best, time.perf_counter() - started)
+            print(f"{n_genes:>6}  {label:<8}{best * 1000:>10.2f}{best * 1e6 / n_genes:>10.1f}"
+                  f"{len(responses[label].get('Ranked_Panels', [])):>8}")
+        if responses["sql"] != responses["index"]:
+            raise SystemExit("sql and index responses differ")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+bench_local_bed_stream.py - Memory and latency of the local BED download, buffered vs streamed
+
+Builds a synthetic bed38 table in a temporary database and renders every row of it through
+local_bed_formatter (DataFrame -> to_csv -> BytesIO, the previous implementation) and through
+local_bed_stream (lines written straight from the cursor). Each chunk is discarded as it is
+produced, as a client socket would consume it. Reports time to the first byte, total time and the
+Python heap peak measured by tracemalloc.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_local_bed_stream
+    python -m benchmarks.bench_local_bed_stream --rows 10000 100000 500000
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+
+from vimmo.logger.logging_config import logger
+from vimmo.utils.localbed import local_bed_formatter, local_bed_stream
+
+SELECT_BED = "SELECT Chromosome, Start, End, Name, HGNC_ID, Transcript, Strand, Type FROM bed38"
+
+
+def build_database(path, n_rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE bed38 (Chromosome TEXT, Start INTEGER, End INTEGER, Name TEXT, "
+                 "HGNC_ID TEXT, Transcript TEXT, Strand TEXT, Type TEXT)")
+    conn.executemany("INSERT INTO bed38 VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                     ((f"chr{i % 22 + 1}", 1000000 + i * 100, 1000000 + i * 100 + 50, f"x_exon{i % 40}",
+                       f"HGNC:{i // 40}", f"NM_{i // 40:06d}.1", "+" if i % 2 else "-", "ms") for i in range(n_rows)))
+    conn.commit()
+    conn.close()
+
+
+def buffered(conn):
+    output = local_bed_formatter(conn.execute(SELECT_BED))
+    first = time.perf_counter()
+    while output.read(64 * 1024):  # send_file reads the BytesIO in blocks
+        pass
+    return first
+
+
+def streamed(conn):
+    first = None
+    for _ in local_bed_stream(conn.execute(SELECT_BED)):
+        if first is None:
+            first = time.perf_counter()
+    return first
+
+
+def measure(path, render):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    tracemalloc.start()
+    started = time.perf_counter()
+    first = render(conn)
+    total = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    conn.close()
+    return (first - started) * 1000, total * 1000, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 500000],
+                        help="BED rows rendered per run (default: 10000 100000 500000)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    print("times in ms, peak Python heap in MiB (tracemalloc)")
+    print(f"{'rows':>8}  {'formatter':<10}{'first byte':>12}{'total':>10}{'peak MiB':>10}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_rows in args.rows:
+            path = os.path.join(tmp_dir, f"bed_{n_rows}.db")
+            build_database(path, n_rows)
+            for label, render in (("buffered", buffered), ("streamed", streamed)):
+                first_ms, total_ms, peak = measure(path, render)
+                print(f"{n_rows:>8}  {label:<10}{first_ms:>12.1f}{total_ms:>10.1f}{peak:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+bench_region_query.py - Bulk region lookups, interval index vs SQL range queries
+
+Builds synthetic genes_info and bed38 tables in a temporary database (genes with nested and
+overlapping spans, several exons each) and looks up a batch of random regions:
+- sql: one range query per region against indexed (Chr, start) / (Chromosome, Start) columns, the
+  way the lookup would be written without an interval index
+- index: one vectorised IntervalIndex.query call per table (RegionIndex.genes / RegionIndex.exons)
+
+Both report the same overlaps; the benchmark checks the counts agree.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_region_query
+    python -m benchmarks.bench_region_query --regions 1000 10000 100000 --genes 20000
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from vimmo.logger.logging_config import logger
+from vimmo.db.exon_store import ExonStores
+from vimmo.db.interval_index import RegionIndex
+
+
+def build_database(path, n_genes, seed=1):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE genes_info (HGNC_ID TEXT, HGNC_symbol TEXT, GRCh38_Chr TEXT, GRCh38_start REAL, GRCh38_stop REAL)")
+    conn.execute("CREATE TABLE bed38 (Chromosome TEXT, Start INTEGER, End INTEGER, Name TEXT, "
+                 "HGNC_ID TEXT, Transcript TEXT, Strand TEXT, Type TEXT)")
+    conn.execute("CREATE TABLE bed37 AS SELECT * FROM bed38")
+    genes, exons = [], []
+    for i in range(n_genes):
+        chrom = str(i % 22 + 1)
+        start = rng.randint(1, 50_000_000)
+        length = rng.choice([2_000, 20_000, 200_000, 2_000_000])  # a few long genes contain many others
+        genes.append((f"HGNC:{i}", f"G{i}", chrom, start, start + length - 1))
+        for exon in range(8):
+            exon_start = start - 1 + exon * length // 8
+            exons.append((f"chr{chrom}", exon_start, exon_start + 150, f"G{i}_exon{exon}", f"HGNC:{i}", f"NM_{i}", "+", "ms"))
+    conn.executemany("INSERT INTO genes_info VALUES (?, ?, ?, ?, ?)", genes)
+    conn.executemany("INSERT INTO bed38 VALUES (?, ?, ?, ?, ?, ?, ?, ?)", exons)
+    conn.execute("CREATE INDEX idx_genes_span ON genes_info (GRCh38_Chr, GRCh38_start)")
+    conn.execute("CREATE INDEX idx_bed38_span ON bed38 (Chromosome, Start)")
+    conn.commit()
+    return conn
+
+
+def random_regions(n_regions, seed=2):
+    rng = random.Random(seed)
+    regions = []
+    for _ in range(n_regions):
+        start = rng.randint(0, 52_000_000)
+        regions.append((f"chr{rng.randint(1, 22)}", start, start + rng.choice([1, 100, 1_000, 10_000])))
+    return regions
+
+
+def sql_lookup(conn, regions, longest_gene, longest_exon):
+    """Range scan per region; the start bound needs the longest feature to stay correct."""
+    genes = exons = 0
+    for chrom, start, end in regions:
+        genes += conn.execute("SELECT COUNT(*) FROM genes_info WHERE GRCh38_Chr = ? AND GRCh38_start > ? "
+                              "AND GRCh38_start <= ? AND GRCh38_stop > ?",
+                              (chrom[3:], start - longest_gene, end, start)).fetchone()[0]
+        exons += conn.execute("SELECT COUNT(*) FROM bed38 WHERE Chromosome = ? AND Start >= ? AND Start < ? AND End > ?",
+                              (chrom, start - longest_exon, end, start)).fetchone()[0]
+    return genes, exons
+
+
+def index_lookup(index, regions):
+    chroms, starts, ends = zip(*regions)
+    genes = len(index.genes.query(chroms, starts, ends)[1])
+    exons = len(index.exons.query(chroms, starts, ends)[1])
+    return genes, exons
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--regions", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Regions looked up per run (default: 1000 10000 100000)")
+    parser.add_argument("--genes", type=int, default=20000, help="Synthetic genes, 8 exons each (default: 20000)")
+    parser.add_argument("--sql-max", type=int, default=100000,
+                        help="Skip the SQL baseline above this many regions (default: 100000)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = build_database(os.path.join(tmp_dir, "regions.db"), args.genes)
+        started = time.perf_counter()
+        index = RegionIndex(conn, "GRCh38", ExonStores(tmp_dir))
+        print(f"index over {index.genes.size} genes and {index.exons.size} exons built in "
+              f"{(time.perf_counter() - started) * 1000:.0f} ms (exon store included)")
+        longest_gene = conn.execute("SELECT MAX(GRCh38_stop - GRCh38_start) + 1 FROM genes_info").fetchone()[0]
+        longest_exon = conn.execute("SELECT MAX(End - Start) FROM bed38").fetchone()[0]
+
+        print(f"{'regions':>8}  {'method':<7}{'ms':>10}{'genes':>10}{'exons':>10}")
+        for n_regions in args.regions:
+            regions = random_regions(n_regions)
+            runs = [("index", lambda: index_lookup(index, regions))]
+            if n_regions <= args.sql_max:
+                runs.insert(0, ("sql", lambda: sql_lookup(conn, regions, longest_gene, longest_exon)))
+            counts = set()
+            for label, run in runs:
+                started = time.perf_counter()
+                genes, exons = run()
+                elapsed = (time.perf_counter() - started) * 1000
+                counts.add((genes, exons))
+                print(f"{n_regions:>8}  {label:<7}{elapsed:>10.1f}{genes:>10}{exons:>10}")
+            if len(counts) != 1:
+                raise SystemExit(f"overlap counts differ between methods: {counts}")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
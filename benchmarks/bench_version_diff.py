@@ -0,0 +1,103 @@
+"""
+bench_version_diff.py - Panel version comparisons, the three-loop compare_panel_versions vs panel_diff
+
+Generates synthetic panel versions (HGNC_ID -> confidence, a few percent of genes added, removed or
+re-rated between versions) and compares them:
+- legacy: the three loops compare_panel_versions ran before vimmo/db/panel_diff.py, kept here
+- single: diff_versions, one pair at a time
+- many: diff_many over every pair at once, dicts encoded on each call
+- cached: diff_many with each version encoded once beforehand, the shape of a cohort report where
+  many patients share a panel's current version
+
+Every method returns the same changes; the benchmark checks they agree.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_version_diff
+    python -m benchmarks.bench_version_diff --genes 20 500 3000 --pairs 1 100 5000
+"""
+import argparse
+import random
+import time
+
+from vimmo.db.panel_diff import diff_many, diff_versions, encode_contents
+
+
+def legacy_compare(historic_version, current_version):
+    genes_added = {}
+    for gene in current_version.keys():
+        if gene in historic_version.keys():
+            pass
+        else:
+            genes_added.update({gene: current_version[gene]})
+    genes_removed = {}
+    for gene in historic_version.keys():
+        if gene in current_version:
+            pass
+        else:
+            genes_removed.update({gene: historic_version[gene]})
+    conf_changes = {}
+    for HGNC in current_version.keys():
+        if HGNC not in historic_version.keys():
+            pass
+        elif HGNC in historic_version.keys() and current_version[HGNC] == historic_version[HGNC]:
+            pass
+        elif HGNC in historic_version.keys() and current_version[HGNC] != historic_version[HGNC]:
+            conf_changes.update({HGNC: (historic_version[HGNC], current_version[HGNC])})
+    return [genes_added, genes_removed, conf_changes]
+
+
+def build_versions(n_genes, n_panels, rng, churn=0.05):
+    """(old, current) contents of n_panels panels."""
+    versions = []
+    for _ in range(n_panels):
+        genes = rng.sample(range(1, 50000), n_genes + int(n_genes * churn) + 1)
+        old = {f"HGNC:{gene}": rng.randint(1, 3) for gene in genes[:n_genes]}
+        current = dict(old)
+        for gene in rng.sample(list(old), int(n_genes * churn)):
+            if rng.random() < 0.5:
+                del current[gene]
+            else:
+                current[gene] = current[gene] % 3 + 1
+        current.update({f"HGNC:{gene}": rng.randint(1, 3) for gene in genes[n_genes:]})
+        versions.append((old, current))
+    return versions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--genes", type=int, nargs="+", default=[20, 500, 3000],
+                        help="Genes per panel version (default: 20 500 3000)")
+    parser.add_argument("--pairs", type=int, nargs="+", default=[1, 100, 5000],
+                        help="Version pairs compared per call (default: 1 100 5000)")
+    parser.add_argument("--panels", type=int, default=50, help="Distinct panels the pairs are drawn from (default: 50)")
+    parser.add_argument("--repeat", type=int, default=5, help="Calls per measurement, best is reported (default: 5)")
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    print(f"{'genes':>6}{'pairs':>7}  {'method':<8}{'ms':>10}{'us/pair':>10}")
+    for n_genes in args.genes:
+        versions = build_versions(n_genes, args.panels, rng)
+        encoded = [(encode_contents(old), encode_contents(current)) for old, current in versions]
+        for n_pairs in args.pairs:
+            chosen = [rng.randrange(len(versions)) for _ in range(n_pairs)]
+            pairs = [versions[i] for i in chosen]
+            cached = [encoded[i] for i in chosen]
+            runs = [("legacy", lambda: [legacy_compare(old, current) for old, current in pairs]),
+                    ("single", lambda: [diff_versions(old, current) for old, current in pairs]),
+                    ("many", lambda: diff_many(pairs)),
+                    ("cached", lambda: diff_many(cached))]
+            results = {}
+            for label, run in runs:
+                best = float("inf")
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    results[label] = run()
+                    best = min(best, time.perf_counter() - started)
+                print(f"{n_genes:>6}{n_pairs:>7}  {label:<8}{best * 1000:>10.3f}{best * 1e6 / n_pairs:>10.1f}")
+            expected = [list(diff) for diff in results["legacy"]]
+            if any([list(diff) for diff in results[label]] != expected for label in ("single", "many", "cached")):
+                raise SystemExit("methods return different changes")
+
+
+if __name__ == "__main__":
+    main()
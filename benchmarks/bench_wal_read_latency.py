@@ -0,0 +1,145 @@
+"""
+bench_wal_read_latency.py - Read latency on /panels while a full scheduled update runs
+
+Builds a synthetic panels database in a temporary directory, then replays the statements
+scheduled_update.update_or_insert_panel_versions issues for every panel (archive, version bump,
+delete + re-insert of panel_genes, one commit at the end) while reader threads keep running the
+get_panels_by_rcode query, once with SQLite's default rollback journal and once with the
+WAL / PRAGMA profiles from vimmo.db.db.
+
+Usage (from the repository root):
+    python -m benchmarks.bench_wal_read_latency
+    python -m benchmarks.bench_wal_read_latency --panels 600 --genes 200 --readers 8
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from vimmo.db.db import apply_pragmas
+from vimmo.db.db_query import Query
+from vimmo.logger.logging_config import logger
+
+
+def build_database(path, n_panels, n_genes):
+    """Create and populate the tables the updater and the /panels endpoint touch."""
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE panel (Panel_ID INTEGER, rcodes TEXT, Version REAL);
+        CREATE TABLE panel_genes (Panel_ID INTEGER, HGNC_ID TEXT, Confidence INTEGER);
+        CREATE TABLE panel_genes_archive (Panel_ID INTEGER, HGNC_ID TEXT, Version REAL, Confidence INTEGER);
+        CREATE TABLE genes_info (
+            HGNC_ID TEXT, Gene_ID TEXT, HGNC_symbol TEXT, Gene_Symbol TEXT,
+            GRCh38_Chr TEXT, GRCh38_start REAL, GRCh38_stop REAL,
+            GRCh37_Chr TEXT, GRCh37_start REAL, GRCh37_stop REAL
+        );
+        -- indexed so the measurement shows lock waits rather than table scans
+        CREATE INDEX idx_bench_panel_rcodes ON panel (rcodes);
+        CREATE INDEX idx_bench_panel_genes ON panel_genes (Panel_ID);
+        CREATE INDEX idx_bench_genes_info ON genes_info (HGNC_ID);
+    ''')
+    gene_pool = [f"HGNC:{i}" for i in range(1, 6001)]
+    conn.executemany(
+        "INSERT INTO genes_info VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(g, f"ENSG{i:011d}", f"SYM{i}", f"SYM{i}", str(i % 22 + 1), i * 1000, i * 1000 + 500,
+          str(i % 22 + 1), i * 1000, i * 1000 + 500) for i, g in enumerate(gene_pool)]
+    )
+    conn.executemany("INSERT INTO panel VALUES (?, ?, ?)",
+                     [(p, f"R{p}", 1.0) for p in range(1, n_panels + 1)])
+    conn.executemany(
+        "INSERT INTO panel_genes VALUES (?, ?, ?)",
+        [(p, g, random.choice((1, 2, 3))) for p in range(1, n_panels + 1) for g in random.sample(gene_pool, n_genes)]
+    )
+    conn.commit()
+    conn.close()
+    return gene_pool
+
+
+def full_update(conn, n_panels, n_genes, gene_pool, done):
+    """Replay the statements of a full scheduled update, committing once at the end as main() does."""
+    cursor = conn.cursor()
+    for panel_id in range(1, n_panels + 1):
+        existing_version = cursor.execute('SELECT Version FROM panel WHERE Panel_ID = ?', (panel_id,)).fetchone()[0]
+        latest_genes = [(panel_id, g, random.choice((1, 2, 3))) for g in random.sample(gene_pool, n_genes)]
+        cursor.execute('''
+            INSERT INTO panel_genes_archive (Panel_ID, HGNC_ID, Version, Confidence)
+            SELECT Panel_ID, HGNC_ID, ?, Confidence FROM panel_genes WHERE Panel_ID = ?
+        ''', (existing_version, panel_id))
+        cursor.execute('UPDATE panel SET Version = ? WHERE Panel_ID = ?', (existing_version + 1, panel_id))
+        cursor.execute('DELETE FROM panel_genes WHERE Panel_ID = ?', (panel_id,))
+        cursor.executemany('INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence) VALUES (?, ?, ?)', latest_genes)
+        time.sleep(0.001)  # stands in for the PanelApp round-trip made per changed panel
+    conn.commit()
+    done.set()
+
+
+def reader(path, tuned, n_panels, done, latencies, errors):
+    """Run get_panels_by_rcode in a loop until the update finishes."""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    if tuned:
+        apply_pragmas(conn, "reader")
+    query = Query(conn)
+    while not done.is_set():
+        rcode = f"R{random.randint(1, n_panels)}"
+        started = time.perf_counter()
+        try:
+            query.get_panels_by_rcode(rcode)
+            latencies.append((time.perf_counter() - started) * 1000)
+        except sqlite3.OperationalError:
+            errors.append((time.perf_counter() - started) * 1000)
+    conn.close()
+
+
+def run_scenario(label, tuned, args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "bench.db")
+        gene_pool = build_database(path, args.panels, args.genes)
+
+        writer = sqlite3.connect(path, check_same_thread=False)
+        if tuned:
+            apply_pragmas(writer, "batch")
+
+        done = threading.Event()
+        latencies, errors = [], []
+        threads = [threading.Thread(target=reader, args=(path, tuned, args.panels, done, latencies, errors))
+                   for _ in range(args.readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)  # let the readers warm up
+
+        started = time.perf_counter()
+        full_update(writer, args.panels, args.genes, gene_pool, done)
+        update_seconds = time.perf_counter() - started
+        for thread in threads:
+            thread.join()
+        writer.close()
+
+    ordered = sorted(latencies) or [0.0]
+    pct = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+    print(f"{label:<22}{update_seconds:>10.2f}{len(latencies):>10}{len(errors):>8}"
+          f"{statistics.median(ordered):>10.2f}{pct(0.95):>10.2f}{pct(0.99):>10.2f}{ordered[-1]:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--panels", type=int, default=600, help="number of panels updated (default: 600)")
+    parser.add_argument("--genes", type=int, default=250, help="genes per panel (default: 250)")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reader threads (default: 4)")
+    args = parser.parse_args()
+
+    logger.setLevel(logging.WARNING)  # keep per-query INFO logging out of the measurement
+    random.seed(1)
+    print(f"{args.panels} panels x {args.genes} genes, {args.readers} readers; latencies in ms")
+    print(f"{'profile':<22}{'update s':>10}{'reads':>10}{'errors':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    run_scenario("rollback journal", tuned=False, args=args)
+    run_scenario("WAL + tuned PRAGMAs", tuned=True, args=args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 import sqlite3
 import pandas as pd
+from vimmo.db.migrations import run_migrations
+from vimmo.db.exon_store import build_exon_stores
 
 # 1. Load CSV files into pandas DataFrames
 csv1 = 'latest_panel_versions.csv'  # Should have columns: [Panel_ID, rcodes, Version]
@@ -170,7 +172,13 @@ df_patient_info.to_sql('patient_data', conn, if_exists='replace', index=False)
 df_archived_data.columns = ['Panel_ID', 'HGNC_ID', 'Version', 'Confidence']
 df_archived_data.to_sql('panel_genes_archive', conn, if_exists='replace', index=False)
 
-# 11. Commit and close
+# 11. Commit, then (re)create the indexes - to_sql(if_exists='replace') drops the tables together with their
+#     indexes, so the migration history is reset and every migration is applied again
 conn.commit()
+cursor.execute("DROP TABLE IF EXISTS schema_migrations;")
+run_migrations(conn)
+
+# 12. Rebuild the sorted exon stores (vimmo/db/exon_store_bed38.npz / _bed37.npz) from the new bed tables
+build_exon_stores(conn)
 conn.close()
 print("Database updated with composite key (Panel_ID, rcodes).")
\ No newline at end of file
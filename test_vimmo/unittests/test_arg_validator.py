@@ -6,7 +6,9 @@ with patch('vimmo.API.app'):  # Ensures Flask/DB init order
     panel_space_validator,
     bed_space_validator,
     validate_panel_id_or_Rcode_or_hgnc,
-    validate_hgnc_ids
+    validate_hgnc_ids,
+    parse_regions,
+    MAX_POSITION
 )
 class TestValidationFunctions(unittest.TestCase):
 
@@ -84,6 +86,32 @@ class TestValidationFunctions(unittest.TestCase):
             validate_hgnc_ids(["HGNC:12345", "Invalid"])
         self.assertIn("Invalid format for 'HGNC_ID'", str(err.exception))
 
+    def test_validate_hgnc_ids_symbols_and_wildcards(self):
+        validate_hgnc_ids(["BRCA1", "HLA-DRB1", "brc", "HGNC:11"], matches=True)  # Should not raise exceptions
+        validate_hgnc_ids(["HGNC:110*", "HGNC:*"], wildcards=True)
+        validate_hgnc_ids(["BRCA*"], matches=True, wildcards=True)
+        for hgnc_ids, kwargs in [(["BRCA1"], {}), (["HGNC:110*"], {}), (["BRCA*"], {"matches": True}),
+                                 (["BRCA*"], {"wildcards": True}), (["BR CA1"], {"matches": True}),
+                                 (["*"], {"matches": True, "wildcards": True})]:
+            with self.subTest(hgnc_ids=hgnc_ids, **kwargs):
+                with self.assertRaises(ValueError):
+                    validate_hgnc_ids(hgnc_ids, **kwargs)
+
+    def test_similar_matches_accept_symbols_in_panel_space_only(self):
+        args = {'HGNC_ID': ['BRCA1', 'TP5*'], 'Similar_Matches': True}
+        validate_panel_id_or_Rcode_or_hgnc(args, panel_space=True)  # Should not raise exceptions
+        with self.assertRaises(ValueError):
+            validate_panel_id_or_Rcode_or_hgnc(args, bed_space=True)
+        with self.assertRaises(ValueError):
+            validate_panel_id_or_Rcode_or_hgnc({'HGNC_ID': ['BRCA1']}, panel_space=True)
+
+    def test_similar_matches_accept_panel_names_as_rcode(self):
+        panel_space_validator(None, "Hypertrophic cardiomyopathy", None, matches=True)  # Should not raise exceptions
+        with self.assertRaises(ValueError):
+            panel_space_validator(None, "Hypertrophic cardiomyopathy", None)
+        with self.assertRaises(ValueError):
+            panel_space_validator(None, "%R1%", None, matches=True)
+
     # Generic Argument Validation Tests
     def test_validate_single_argument(self):
         args = {'Panel_ID': '123'}
@@ -113,5 +141,23 @@ class TestValidationFunctions(unittest.TestCase):
             validate_panel_id_or_Rcode_or_hgnc(args, bed_space=True)
         self.assertIn("Invalid format for 'Rcode'", str(err.exception))
 
+
+class TestParseRegions(unittest.TestCase):
+
+    def test_region_strings_are_one_based(self):
+        self.assertEqual(parse_regions("chr17:43044295-43125483, 13:100 chrX"),
+                         [("chr17", 43044294, 43125483), ("13", 99, 100), ("chrX", 0, MAX_POSITION)])
+
+    def test_region_objects_are_bed_intervals(self):
+        self.assertEqual(parse_regions([{"chrom": "chr1", "start": 0, "end": 10}, "chr2:5-6"]),
+                         [("chr1", 0, 10), ("chr2", 4, 6)])
+
+    def test_invalid_regions(self):
+        for value in ("", [], "chr17:200-100", "chr17:0-10", "chrZ:1-2", "chr1:a-b",
+                      [{"chrom": "chr1", "start": 5}], [{"chrom": "chr1", "start": 5, "end": 5}]):
+            with self.subTest(value=value), self.assertRaises(ValueError):
+                parse_regions(value)
+
+
 if __name__ == "__main__":
     unittest.main()
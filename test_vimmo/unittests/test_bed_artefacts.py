@@ -0,0 +1,112 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+from unittest.mock import patch
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.db_update import Update
+from vimmo.utils.bed_artefacts import BedArtefactCache
+
+"""
+test_bed_artefacts.py - Test Suite for the rendered BED artefact cache behind /panels/download/local
+
+Files are written to a temporary directory; the Update tests use an in-memory database built by the
+migration runner.
+"""
+
+PANELS = [(635, 2.5)]
+GENES = {"HGNC:1", "HGNC:2"}
+
+
+def key(**changes):
+    params = dict(panels=PANELS, genes=GENES, genome_build="GRCh38", confidence="All", padding=0,
+                  encoding="identity", source=(10.0, 100.0, 200.0))
+    params.update(changes)
+    return BedArtefactCache.make_key(**params)
+
+
+class TestBedArtefactCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = BedArtefactCache(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_key_covers_every_parameter(self):
+        keys = {key(), key(panels=[(635, 2.6)]), key(genes={"HGNC:1"}), key(genome_build="GRCh37"),
+                key(confidence="Green"), key(padding=10), key(encoding="gzip"), key(source=(11.0, 100.0, 200.0))}
+        self.assertEqual(len(keys), 8)
+        self.assertEqual(key(genes=["HGNC:2", "HGNC:1"]), key())
+
+    def test_store_and_get(self):
+        self.assertIsNone(self.cache.get([635], key(), "identity"))
+        path = self.cache.store([635], key(), "identity", iter([b"chr1\t1\t2\n", b"chr1\t3\t4\n"]))
+        self.assertEqual(self.cache.get([635], key(), "identity"), path)
+        with open(path, "rb") as handle:
+            self.assertEqual(handle.read(), b"chr1\t1\t2\nchr1\t3\t4\n")
+        self.assertTrue(os.path.basename(path).startswith("635_"))
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 1)
+
+    def test_invalidate_one_panel(self):
+        self.cache.store([635], key(), "identity", [b"a"])
+        self.cache.store([635], key(encoding="gzip"), "gzip", [b"b"])
+        self.cache.store([63, 6350], key(panels=[(63, 1.0), (6350, 1.0)]), "identity", [b"c"])
+        self.assertEqual(self.cache.invalidate(635), 2)
+        self.assertEqual(len(os.listdir(self.tmp_dir.name)), 1)
+        self.assertEqual(self.cache.invalidate(6350), 1)
+        self.assertEqual(self.cache.invalidate(), 0)
+
+    def test_least_recently_served_files_are_evicted(self):
+        self.cache.max_bytes = 25
+        first = self.cache.store([1], key(panels=[(1, 1.0)]), "identity", [b"x" * 10])
+        second = self.cache.store([2], key(panels=[(2, 1.0)]), "identity", [b"x" * 10])
+        os.utime(first, (1, 1))
+        os.utime(second, (2, 2))
+        self.cache.get([1], key(panels=[(1, 1.0)]), "identity")  # first is now the most recently served
+        self.cache.store([3], key(panels=[(3, 1.0)]), "identity", [b"x" * 10])
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+        self.assertEqual(self.cache.stats()["evicted"], 1)
+
+    def test_failed_render_leaves_nothing_behind(self):
+        def chunks():
+            yield b"partial"
+            raise OSError("disk full")
+        self.assertIsNone(self.cache.store([635], key(), "identity", chunks()))
+        self.assertEqual(os.listdir(self.tmp_dir.name), [])
+
+
+class TestArtefactInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (635, 'R208', 2.5), (636, 'R209', 1.0), (637, 'R209', 3.0);
+        ''')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_panel_versions(self):
+        query = Query(self.conn)
+        self.assertEqual(query.panel_versions(panel_id="635"), [(635, 2.5)])
+        self.assertEqual(query.panel_versions(r_code="R209"), [(636, 1.0), (637, 3.0)])
+        self.assertEqual(query.panel_versions(r_code="R000"), [])
+
+    def test_update_invalidates_the_panel(self):
+        update = Update(self.conn)
+        with patch("vimmo.db.db_update.invalidate_bed_artefacts") as invalidate:
+            with patch.object(update.papp, "get_genes_HGNC", return_value={"HGNC:1": 3}):
+                update.update_gene_contents("R208", 635, archive_version="2.5", new_version="2.6")
+        self.assertEqual([call.args for call in invalidate.call_args_list], [(635,)])
+        self.assertEqual(Query(self.conn).get_db_latest_version("R208"), 2.6)
+
+
+if __name__ == '__main__':
+    unittest.main()
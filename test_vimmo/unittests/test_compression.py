@@ -0,0 +1,158 @@
+import unittest
+import gzip
+import random
+import struct
+import zlib
+from flask import Flask
+import os
+import tempfile
+from vimmo.utils.compression import (BGZF_BLOCK_SIZE, BGZF_EOF, bed_file_response, bed_response, bgzf_stream,
+                                     gzip_stream, negotiate_encoding)
+
+"""
+test_compression.py - Test Suite for the compressed BED responses
+
+Checks Accept-Encoding negotiation, that the gzip and BGZF streams decompress to their input, that
+BGZF blocks carry a correct BSIZE and stay within 64 KiB, and the headers bed_response sets.
+"""
+
+
+def bed_chunks(lines=20000, batch=1000):
+    rng = random.Random(5)
+    rows = [f"chr{rng.randint(1, 22)}\t{i * 100}\t{i * 100 + 50}\tx_exon{i % 30}\t+\tNM_{i // 30}\tms\tHGNC:{i // 30}"
+            for i in range(lines)]
+    return [("\n".join(rows[i:i + batch]) + "\n").encode() for i in range(0, lines, batch)]
+
+
+def bgzf_blocks(data):
+    """Splits a BGZF file into its blocks using the BSIZE of each header."""
+    blocks, offset = [], 0
+    while offset < len(data):
+        magic, flags, xlen, subfield, slen, bsize = struct.unpack_from("<HxBxxxxxxH2sHH", data, offset)
+        assert (magic, flags, xlen, subfield, slen) == (0x8b1f, 4, 6, b"BC", 2)
+        blocks.append(data[offset:offset + bsize + 1])
+        offset += bsize + 1
+    return blocks
+
+
+class TestNegotiateEncoding(unittest.TestCase):
+
+    def test_negotiation(self):
+        cases = {
+            "gzip, deflate, br": "gzip",
+            "br;q=1.0, gzip;q=0.8": "gzip",
+            "x-gzip": "gzip",
+            "*": "gzip",
+            "gzip;q=0, *;q=1": "identity",
+            "identity": "identity",
+            "deflate": "identity",
+            "gzip;q=abc": "identity",
+            "": "identity",
+            None: "identity",
+        }
+        for header, expected in cases.items():
+            with self.subTest(header=header):
+                self.assertEqual(negotiate_encoding(header), expected)
+
+
+class TestCompressedStreams(unittest.TestCase):
+
+    def setUp(self):
+        self.chunks = bed_chunks()
+        self.plain = b"".join(self.chunks)
+
+    def test_gzip_round_trip(self):
+        for level in (1, 6, 9):
+            with self.subTest(level=level):
+                compressed = b"".join(gzip_stream(iter(self.chunks), level))
+                self.assertEqual(gzip.decompress(compressed), self.plain)
+                self.assertLess(len(compressed), len(self.plain) / 3)
+
+    def test_bgzf_round_trip_and_blocks(self):
+        compressed = b"".join(bgzf_stream(iter(self.chunks), level=6))
+        self.assertEqual(gzip.decompress(compressed), self.plain)
+
+        blocks = bgzf_blocks(compressed)
+        self.assertEqual(blocks[-1], BGZF_EOF)
+        sizes = []
+        for block in blocks[:-1]:
+            self.assertLessEqual(len(block), 65536)
+            data = zlib.decompress(block[18:-8], -15)
+            crc, isize = struct.unpack("<2I", block[-8:])
+            self.assertEqual((crc, isize), (zlib.crc32(data), len(data)))
+            sizes.append(isize)
+        self.assertTrue(all(size == BGZF_BLOCK_SIZE for size in sizes[:-1]))
+        self.assertEqual(sum(sizes), len(self.plain))
+
+    def test_bgzf_of_incompressible_data(self):
+        noise = random.Random(1).randbytes(3 * BGZF_BLOCK_SIZE)
+        compressed = b"".join(bgzf_stream([noise], level=9))
+        self.assertTrue(all(len(block) <= 65536 for block in bgzf_blocks(compressed)))
+        self.assertEqual(gzip.decompress(compressed), noise)
+
+    def test_empty_stream(self):
+        self.assertEqual(gzip.decompress(b"".join(gzip_stream([]))), b"")
+        self.assertEqual(b"".join(bgzf_stream([])), BGZF_EOF)
+
+
+class TestBedResponse(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.chunks = bed_chunks(lines=3000)
+        self.plain = b"".join(self.chunks)
+
+    def respond(self, compression, accept_encoding=None):
+        headers = {"Accept-Encoding": accept_encoding} if accept_encoding else {}
+        with self.app.test_request_context("/", headers=headers):
+            response = bed_response(iter(self.chunks), "R208_GRCh38_Gencode.bed", compression)
+            response.direct_passthrough = False
+            return response, response.get_data()
+
+    def test_auto_follows_accept_encoding(self):
+        response, body = self.respond("auto", "gzip, deflate")
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(response.headers["Vary"], "Accept-Encoding")
+        self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=R208_GRCh38_Gencode.bed")
+        self.assertEqual(gzip.decompress(body), self.plain)
+
+        response, body = self.respond("auto")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(body, self.plain)
+
+    def test_none_is_never_compressed(self):
+        response, body = self.respond("none", "gzip")
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(body, self.plain)
+
+    def test_gzip_and_bgzf_files(self):
+        for compression in ("gzip", "bgzf"):
+            with self.subTest(compression=compression):
+                response, body = self.respond(compression, "gzip")
+                self.assertNotIn("Content-Encoding", response.headers)
+                self.assertEqual(response.mimetype, "application/gzip")
+                self.assertEqual(response.headers["Content-Disposition"], "attachment; filename=R208_GRCh38_Gencode.bed.gz")
+                self.assertEqual(gzip.decompress(body), self.plain)
+        self.assertTrue(body.endswith(BGZF_EOF))
+
+    def test_file_response_etag(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "635_abc.bed.gz")
+            with open(path, "wb") as handle:
+                handle.write(gzip.compress(self.plain))
+            with self.app.test_request_context("/"):
+                response = bed_file_response(path, "R208.bed", "gzip", True, etag="abc")
+                response.direct_passthrough = False
+                self.assertEqual(response.headers["ETag"], '"abc"')
+                self.assertEqual(response.headers["Content-Encoding"], "gzip")
+                self.assertEqual(gzip.decompress(response.get_data()), self.plain)
+                response.close()
+            with self.app.test_request_context("/", headers={"If-None-Match": '"abc"'}):
+                response = bed_file_response(path, "R208.bed", "gzip", True, etag="abc")
+                self.assertEqual(response.status_code, 304)
+                self.assertNotIn("Content-Encoding", response.headers)
+                response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
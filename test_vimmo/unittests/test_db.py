@@ -1,9 +1,12 @@
 import unittest
 import sqlite3
 import os
+import tempfile
+import threading
+import time
 from unittest.mock import MagicMock, patch
 from datetime import date
-from vimmo.db.db import Database 
+from vimmo.db.db import Database, ConnectionPool, DatabasePoolError, PRAGMA_PROFILES, apply_pragmas
 from vimmo.db.db_query import Query
 from vimmo.db.db_update import Update
 import datetime
@@ -486,6 +489,55 @@ class TestQuery(BaseTestCase):
         version = self.query.check_patient_history("TEST_P123", "TEST_R999")
         self.assertEqual(version, 2.5)
 
+    def test_check_patient_history_same_day(self):
+        """
+        Test two tests on the same date resolve to the highest version, and unknown patients return None.
+        """
+        cursor = self.db.conn.cursor()
+        cursor.executemany('''
+            INSERT INTO patient_data (Patient_ID, Panel_ID, Rcode, Version, Date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            ("TEST_P124", 999999999, "TEST_R999", 1.0, "2024-12-01"),
+            ("TEST_P124", 999999999, "TEST_R999", 3.0, "2024-12-01"),
+            ("TEST_P124", 999999999, "TEST_R999", 2.0, "2024-11-01"),
+        ])
+
+        self.assertEqual(self.query.check_patient_history("TEST_P124", "TEST_R999"), 3.0)
+        self.assertIsNone(self.query.check_patient_history("TEST_NOBODY", "TEST_R999"))
+
+    def test_check_patient_histories(self):
+        """
+        Test the batch lookup matches check_patient_history for every pair, including pairs without records.
+        """
+        cursor = self.db.conn.cursor()
+        cursor.executemany('''
+            INSERT INTO patient_data (Patient_ID, Panel_ID, Rcode, Version, Date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', [
+            ("TEST_P123", 999999999, "TEST_R999", 2.0, "2023-01-01"),
+            ("TEST_P123", 999999999, "TEST_R999", 2.5, "2024-12-01"),
+            ("TEST_P123", 999999998, "TEST_R998", 1.0, "2024-12-01"),
+            ("TEST_P124", 999999999, "TEST_R999", 1.5, "2024-12-01"),
+            ("TEST_P124", 999999999, "TEST_R999", 3.0, "2024-12-01"),
+        ])
+        pairs = [("TEST_P123", "TEST_R999"), ("TEST_P123", "TEST_R998"),
+                 ("TEST_P124", "TEST_R999"), ("TEST_P124", "TEST_R998"), ("TEST_NOBODY", "TEST_R999")]
+
+        # a batch size smaller than the number of pairs exercises the chunking
+        histories = self.query.check_patient_histories(pairs, batch_size=2)
+
+        self.assertEqual(histories, {
+            ("TEST_P123", "TEST_R999"): 2.5,
+            ("TEST_P123", "TEST_R998"): 1.0,
+            ("TEST_P124", "TEST_R999"): 3.0,
+            ("TEST_P124", "TEST_R998"): None,
+            ("TEST_NOBODY", "TEST_R999"): None,
+        })
+        for patient_id, rcode in pairs:
+            self.assertEqual(histories[(patient_id, rcode)], self.query.check_patient_history(patient_id, rcode))
+        self.assertEqual(self.query.check_patient_histories([]), {})
+
     def test_error_cases(self):
         """
         Test various error conditions and edge cases.
@@ -522,6 +574,151 @@ class TestQuery(BaseTestCase):
     
 
 
+class TestConnectionPool(unittest.TestCase):
+    """
+    Test suite for the ConnectionPool used by vimmo.API.get_db.
+
+    Uses a throwaway database file so it does not depend on panels_data.db:
+    - Readers are read-only, have sqlite3.Row preset and are reused between leases
+    - The writer is a single connection that can modify the database
+    - The pool is bounded and reports occupancy and wait statistics
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "pool_test.db")
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("CREATE TABLE panel (Panel_ID INTEGER, rcodes TEXT, Version REAL)")
+        conn.execute("INSERT INTO panel VALUES (100001, 'R999.01', 2.5)")
+        conn.commit()
+        conn.close()
+        self.pool = ConnectionPool(db_path=self.db_path, max_readers=2, min_readers=1, acquire_timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close_all()
+        self.tmp_dir.cleanup()
+
+    def test_reader_is_read_only_with_row_factory(self):
+        lease = self.pool.lease()
+        row = lease.conn.execute("SELECT Panel_ID, rcodes FROM panel").fetchone()
+        self.assertEqual(row["rcodes"], "R999.01")
+        with self.assertRaises(sqlite3.OperationalError):
+            lease.conn.execute("INSERT INTO panel VALUES (100002, 'R999.02', 1.0)")
+        lease.close()
+
+    def test_reader_connections_are_reused(self):
+        first = self.pool.lease()
+        conn = first.conn
+        first.close()
+        second = self.pool.lease()
+        self.assertIs(second.conn, conn)
+        second.close()
+
+    def test_writer_commits_are_visible_to_readers(self):
+        writer = self.pool.lease(write=True)
+        writer.conn.execute("INSERT INTO panel VALUES (100002, 'R999.02', 1.0)")
+        writer.conn.commit()
+        writer.close()
+
+        reader = self.pool.lease()
+        count = reader.conn.execute("SELECT COUNT(*) FROM panel").fetchone()[0]
+        reader.close()
+        self.assertEqual(count, 2)
+
+    def test_uncommitted_writes_are_rolled_back_on_release(self):
+        writer = self.pool.lease(write=True)
+        writer.conn.execute("INSERT INTO panel VALUES (100002, 'R999.02', 1.0)")
+        writer.close()
+
+        reader = self.pool.lease()
+        count = reader.conn.execute("SELECT COUNT(*) FROM panel").fetchone()[0]
+        reader.close()
+        self.assertEqual(count, 1)
+
+    def test_pool_is_bounded(self):
+        leases = [self.pool.lease(), self.pool.lease()]
+        with self.assertRaises(DatabasePoolError):
+            self.pool.lease()
+        writer = self.pool.lease(write=True)
+        with self.assertRaises(DatabasePoolError):
+            self.pool.lease(write=True)
+        writer.close()
+        for lease in leases:
+            lease.close()
+
+    def test_lease_close_is_idempotent(self):
+        lease = self.pool.lease()
+        lease.close()
+        lease.close()
+        self.assertEqual(self.pool.stats()["readers_in_use"], 0)
+
+    def test_stats(self):
+        lease = self.pool.lease()
+        stats = self.pool.stats()
+        self.assertEqual(stats["readers_in_use"], 1)
+        self.assertEqual(stats["acquisitions"], 1)
+        self.assertFalse(stats["writer_in_use"])
+        lease.close()
+
+        held = [self.pool.lease(), self.pool.lease()]
+        waiter = threading.Thread(target=lambda: self.pool.lease().close())
+        waiter.start()
+        time.sleep(0.05)
+        held.pop().close()
+        waiter.join()
+        held.pop().close()
+
+        stats = self.pool.stats()
+        self.assertEqual(stats["readers_open"], 2)
+        self.assertEqual(stats["readers_idle"], 2)
+        self.assertGreaterEqual(stats["waits"], 1)
+        self.assertGreater(stats["max_wait_ms"], 0)
+
+
+class TestPragmaProfiles(unittest.TestCase):
+    """
+    Test suite for the per-role PRAGMA profiles applied when connections are opened.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, "pragma_test.db")
+        sqlite3.connect(self.db_path).close()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_writer_profile_enables_wal(self):
+        conn = sqlite3.connect(self.db_path)
+        apply_pragmas(conn, "writer")
+        self.assertEqual(conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(conn.execute("PRAGMA synchronous").fetchone()[0], 1)  # NORMAL
+        self.assertEqual(conn.execute("PRAGMA temp_store").fetchone()[0], 2)   # MEMORY
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], PRAGMA_PROFILES["writer"]["busy_timeout"])
+        conn.close()
+
+    def test_overrides_replace_profile_values(self):
+        conn = sqlite3.connect(self.db_path)
+        applied = apply_pragmas(conn, "batch", {"busy_timeout": 1234})
+        self.assertEqual(applied["busy_timeout"], 1234)
+        self.assertEqual(conn.execute("PRAGMA busy_timeout").fetchone()[0], 1234)
+        conn.close()
+
+    def test_unknown_role(self):
+        conn = sqlite3.connect(self.db_path)
+        with self.assertRaises(ValueError):
+            apply_pragmas(conn, "not_a_role")
+        conn.close()
+
+    def test_pool_applies_reader_and_writer_profiles(self):
+        pool = ConnectionPool(db_path=self.db_path, min_readers=1, reader_pragmas={"busy_timeout": 250})
+        reader = pool.lease()
+        self.assertEqual(reader.conn.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        self.assertEqual(reader.conn.execute("PRAGMA busy_timeout").fetchone()[0], 250)
+        reader.close()
+        pool.close_all()
+
+
 # class TestUpdate(BaseTestCase):
 #     """
 #     Test suite for database update operations.
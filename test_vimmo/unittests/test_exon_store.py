@@ -0,0 +1,123 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+from vimmo.db.db_query import Query
+from vimmo.db.exon_store import ExonStore, ExonStores, build_exon_stores, chromosome_rank, store_path
+from vimmo.utils.localbed import local_bed_stream
+
+"""
+test_exon_store.py - Test Suite for the sorted exon store behind the local BED endpoints
+
+Uses an in-memory database whose bed38 rows are deliberately out of order, with genes on the same
+chromosome overlapping each other.
+"""
+
+BED38_ROWS = [
+    # Chromosome, Start, End, Name, HGNC_ID, Transcript, Strand, Type
+    ("chr2", 500, 600, "B_exon1", "HGNC:2", "NM_2", "-", "ms"),
+    ("chr10", 100, 200, "C_exon0", "HGNC:3", "NM_3", "+", "ms"),
+    ("chr2", 100, 200, "B_exon0", "HGNC:2", "NM_2", "-", "ms"),
+    ("chrX", 50, 80, "D_exon0", "HGNC:4", None, "+", "ms"),
+    ("chr2", 300, 400, "A_exon0", "HGNC:1", "NM_1", "+", "ms"),   # between B's exons
+    ("chr1", 900, 950, "E_exon0", "HGNC:5", "NM_5", "+", "ms"),
+    ("chr2", 300, 350, "A_exon0b", "HGNC:1", "NM_1", "+", "ms"),  # same start, shorter
+]
+
+
+def build_test_db():
+    conn = sqlite3.connect(":memory:")
+    conn.row_factory = sqlite3.Row
+    for table in ("bed38", "bed37"):
+        conn.execute(f"CREATE TABLE {table} (Chromosome TEXT, Start INTEGER, End INTEGER, Name TEXT, "
+                     "HGNC_ID TEXT, Transcript TEXT, Strand TEXT, Type TEXT)")
+        conn.executemany(f"INSERT INTO {table} VALUES (?, ?, ?, ?, ?, ?, ?, ?)", BED38_ROWS)
+    conn.commit()
+    return conn
+
+
+class TestExonStore(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = build_test_db()
+        self.store = ExonStore.build_from_db(self.conn, "GRCh38")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def names(self, rows):
+        return [record["Name"] for record in self.store.records(rows)]
+
+    def test_chromosome_rank(self):
+        labels = ["chrX", "chr10", "chrM", "chr2", "chrUn_KI270742v1", "chrY", "chr1"]
+        self.assertEqual(sorted(labels, key=chromosome_rank),
+                         ["chr1", "chr2", "chr10", "chrX", "chrY", "chrM", "chrUn_KI270742v1"])
+
+    def test_store_is_coordinate_sorted(self):
+        self.assertEqual(list(self.store.columns["Chromosome"]), ["chr1", "chr2", "chr2", "chr2", "chr2", "chr10", "chrX"])
+        self.assertEqual(self.names(range(len(self.store))),
+                         ["E_exon0", "B_exon0", "A_exon0b", "A_exon0", "B_exon1", "C_exon0", "D_exon0"])
+
+    def test_panel_rows_come_out_sorted(self):
+        rows = self.store.rows_for_genes({"HGNC:2", "HGNC:1", "HGNC:4"})
+        self.assertEqual(self.names(rows), ["B_exon0", "A_exon0b", "A_exon0", "B_exon1", "D_exon0"])
+
+    def test_unknown_genes_are_ignored(self):
+        self.assertEqual(self.names(self.store.rows_for_genes(["HGNC:3", "HGNC:999", "HGNC:0"])), ["C_exon0"])
+        self.assertEqual(len(self.store.rows_for_genes([])), 0)
+
+    def test_records_match_the_table(self):
+        record = next(self.store.records(self.store.rows_for_genes(["HGNC:4"])))
+        self.assertEqual(record, {"Chromosome": "chrX", "Start": 50, "End": 80, "Name": "D_exon0", "HGNC_ID": "HGNC:4",
+                                  "Transcript": "", "Strand": "+", "Type": "ms"})
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "store.npz")
+            self.store.save(path)
+            loaded = ExonStore.load(path, "GRCh38")
+        self.assertEqual(loaded.fingerprint, self.store.fingerprint)
+        self.assertEqual(list(loaded.records(loaded.rows_for_genes(["HGNC:1", "HGNC:2"]))),
+                         list(self.store.records(self.store.rows_for_genes(["HGNC:1", "HGNC:2"]))))
+
+
+class TestExonStores(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = build_test_db()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_missing_store_is_built_and_saved(self):
+        stores = ExonStores(self.tmp_dir.name)
+        self.assertEqual(len(stores.get(self.conn, "GRCh38")), len(BED38_ROWS))
+        self.assertTrue(os.path.exists(store_path("GRCh38", self.tmp_dir.name)))
+        self.assertIs(stores.get(self.conn, "GRCh38"), stores.get(self.conn, "GRCh38"))
+
+    def test_stale_store_is_rebuilt(self):
+        build_exon_stores(self.conn, self.tmp_dir.name)
+        self.conn.execute("INSERT INTO bed38 VALUES ('chr3', 1, 2, 'F_exon0', 'HGNC:6', 'NM_6', '+', 'ms')")
+        store = ExonStores(self.tmp_dir.name).get(self.conn, "GRCh38")
+        self.assertEqual(len(store), len(BED38_ROWS) + 1)
+        self.assertEqual(len(ExonStore.load(store_path("GRCh38", self.tmp_dir.name), "GRCh38")), len(BED38_ROWS) + 1)
+
+    def test_local_bed_from_store(self):
+        genes = {"HGNC:1", "HGNC:2", "HGNC:5"}
+        sql_rows = [dict(row) for row in Query(self.conn).local_bed(genes, "GRCh38")]
+        store_rows = list(Query(self.conn, exon_stores=ExonStores(self.tmp_dir.name)).local_bed(genes, "GRCh38"))
+
+        key = lambda row: (row["Chromosome"], row["Start"], row["End"], row["Name"])
+        self.assertEqual(sorted(store_rows, key=key), sorted(sql_rows, key=key))
+        self.assertEqual([row["Name"] for row in store_rows], ["E_exon0", "B_exon0", "A_exon0b", "A_exon0", "B_exon1"])
+        self.assertTrue(b"".join(local_bed_stream(iter(store_rows))).startswith(b"chr1\t900\t950\tE_exon0\t+\tNM_5\tms\tHGNC:5\n"))
+
+    def test_no_matching_genes(self):
+        records = Query(self.conn, exon_stores=ExonStores(self.tmp_dir.name)).local_bed({"HGNC:999"}, "GRCh37")
+        self.assertIsNone(local_bed_stream(records))
+
+
+if __name__ == '__main__':
+    unittest.main()
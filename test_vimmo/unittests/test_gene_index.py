@@ -0,0 +1,94 @@
+import unittest
+import sqlite3
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.panel_catalogue import PanelCatalogue, bump_generation
+from vimmo.db.gene_index import within_one_edit
+
+"""
+test_gene_index.py - Test Suite for the HGNC ID / symbol index behind /panels?HGNC_ID=
+
+Runs against a small in-memory database built by the migration runner and checks the indexed
+lookups against the SQL ones.
+"""
+
+
+class TestWithinOneEdit(unittest.TestCase):
+
+    def test_within_one_edit(self):
+        cases = [("BRCA1", "BRCA1", True), ("BRCA1", "BRCA2", True), ("BRCA1", "BRCA", True), ("BRAC1", "BRCA1", True),
+                 ("BRCA1", "BRCA12", True), ("BRCA1", "XBRCA1", True), ("ABC", "BCA", False), ("TP53", "ATM", False),
+                 ("ABCD", "BADC", False), ("ABCD", "ACBE", False), ("", "A", True)]
+        for a, b, expected in cases:
+            with self.subTest(a=a, b=b):
+                self.assertEqual(within_one_edit(a, b), expected)
+                self.assertEqual(within_one_edit(b, a), expected)
+
+
+class TestGeneIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO genes_info (HGNC_ID, Gene_Symbol, HGNC_symbol) VALUES
+                ('HGNC:1100', 'BRCA1', 'BRCA1'), ('HGNC:1101', 'BRCA2', 'BRCA2'), ('HGNC:11998', 'TP53', 'TP53'),
+                ('HGNC:795', 'ATM', 'ATM'), ('HGNC:9802', 'RAC2', 'RAC2');
+            INSERT INTO panel VALUES (10, 'R10', 1.0), (20, 'R20', 2.0), (30, 'R30', 3.0);
+            INSERT INTO panel_genes VALUES
+                (10, 'HGNC:1100', 3), (10, 'HGNC:11998', 2),
+                (20, 'HGNC:1100', 3), (20, 'HGNC:1101', 3), (20, 'HGNC:11998', 3), (20, 'HGNC:11998', 3),
+                (30, 'HGNC:795', 1), (30, 'HGNC:404', 3);
+        ''')
+        self.catalogue = PanelCatalogue()
+        self.query = Query(self.conn, catalogue=self.catalogue)
+        self.index = self.catalogue.snapshot(self.conn).gene_index
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_lookup(self):
+        self.assertEqual(self.index.lookup("brca1"), [("HGNC:1100", "exact")])
+        self.assertEqual(self.index.lookup("BRCA"), [])
+        self.assertEqual(self.index.lookup("BRCA*"), [("HGNC:1100", "prefix"), ("HGNC:1101", "prefix")])
+        self.assertEqual(self.index.lookup("HGNC:110", matches=True), [("HGNC:1100", "prefix"), ("HGNC:1101", "prefix")])
+        self.assertEqual(self.index.lookup("TP53", matches=True), [("HGNC:11998", "exact")])
+        self.assertEqual(self.index.lookup("BRAC2", matches=True), [("HGNC:1101", "fuzzy"), ("HGNC:9802", "fuzzy")])
+        self.assertEqual(self.index.lookup("AT", matches=True), [("HGNC:795", "prefix")])
+        self.assertEqual(self.index.lookup("XYZ", matches=True), [])
+
+    def test_panels_are_ranked_by_genes_matched(self):
+        result = self.query.get_panels_from_gene_list(["HGNC:11998", "HGNC:1100", "HGNC:1101"])
+        self.assertEqual([(panel["Panel_ID"], panel["Gene_Count"], panel["HGNC_IDs"]) for panel in result["Ranked_Panels"]],
+                         [(20, 3, ["HGNC:11998", "HGNC:1100", "HGNC:1101"]), (10, 2, ["HGNC:11998", "HGNC:1100"])])
+        self.assertEqual([(panel["Panel_ID"], panel["Gene_Symbol"]) for panel in result["Panels"]],
+                         [(20, "TP53"), (20, "BRCA1"), (20, "BRCA2"), (10, "TP53"), (10, "BRCA1")])
+        self.assertNotIn("Matches", result)
+
+    def test_index_matches_sql(self):
+        for hgnc_ids in (["HGNC:1100"], ["HGNC:11998", "HGNC:795", "HGNC:404"], ["HGNC:0"], []):
+            for confidence in ("All", "Green", "Red"):
+                with self.subTest(hgnc_ids=hgnc_ids, confidence=confidence):
+                    self.assertEqual(self.query.get_panels_from_gene_list(hgnc_ids, confidence=confidence),
+                                     Query(self.conn).get_panels_from_gene_list(hgnc_ids, confidence=confidence))
+
+    def test_similar_matches(self):
+        for query in (self.query, Query(self.conn)):  # without a catalogue the index is built for the call
+            result = query.get_panels_from_gene_list(["brac1", "HGNC:79", "ZZZ"], matches=True)
+            self.assertEqual(result["Matches"]["brac1"], [{"HGNC_ID": "HGNC:1100", "HGNC_symbol": "BRCA1", "Match": "fuzzy"}])
+            self.assertEqual(result["Matches"]["HGNC:79"], [{"HGNC_ID": "HGNC:795", "HGNC_symbol": "ATM", "Match": "prefix"}])
+            self.assertEqual(result["Unmatched"], ["ZZZ"])
+            self.assertEqual([panel["Panel_ID"] for panel in result["Ranked_Panels"]], [10, 20, 30])
+
+    def test_index_follows_panel_updates(self):
+        self.conn.execute("INSERT INTO panel_genes VALUES (30, 'HGNC:1100', 3)")
+        self.conn.commit()
+        bump_generation("test")
+        result = self.query.get_panels_from_gene_list(["HGNC:1100"])
+        self.assertEqual([panel["Panel_ID"] for panel in result["Ranked_Panels"]], [10, 20, 30])
+        self.assertIsNot(self.catalogue.snapshot(self.conn).gene_index, self.index)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import unittest
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from vimmo.utils.http_transport import HttpTransport, get_transport
+
+"""
+test_http_transport.py - Test Suite for the shared HTTP transport
+
+Runs HttpTransport against a local stub server whose behaviour is chosen by the request path:
+/ok, /flaky (503 twice, then 200), /limited (429 with Retry-After once, then 200), /slow
+"""
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    lock = threading.Lock()
+    hits = {}
+    ports = set()
+    in_flight = 0
+    max_in_flight = 0
+
+    def reply(self, status, body=None, headers=None):
+        payload = json.dumps(body or {}).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        cls = StubHandler
+        with cls.lock:
+            cls.hits[self.path] = cls.hits.get(self.path, 0) + 1
+            hit = cls.hits[self.path]
+            cls.ports.add(self.client_address[1])
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            if self.path == "/flaky" and hit <= 2:
+                self.reply(503)
+            elif self.path == "/limited" and hit == 1:
+                self.reply(429, headers={"Retry-After": "0"})
+            elif self.path == "/broken":
+                self.reply(500)
+            elif self.path.startswith("/slow"):
+                time.sleep(0.2)
+                self.reply(200, {"path": self.path})
+            else:
+                self.reply(200, {"path": self.path})
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def log_message(self, *args):
+        pass
+
+
+class TestHttpTransport(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f"127.0.0.1:{cls.server.server_address[1]}"
+        cls.url = f"http://{cls.host}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        while StubHandler.in_flight:  # a request a previous test timed out on may still be served
+            time.sleep(0.01)
+        StubHandler.hits = {}
+        StubHandler.ports = set()
+        StubHandler.max_in_flight = 0
+        self.transport = HttpTransport(backoff_factor=0)
+
+    def tearDown(self):
+        self.transport.close()
+
+    def test_connections_are_kept_alive(self):
+        for _ in range(5):
+            self.assertEqual(self.transport.get(f"{self.url}/ok").json(), {"path": "/ok"})
+        self.assertEqual(len(StubHandler.ports), 1)
+
+    def test_5xx_is_retried(self):
+        response = self.transport.get(f"{self.url}/flaky")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubHandler.hits["/flaky"], 3)
+
+    def test_429_is_retried(self):
+        response = self.transport.get(f"{self.url}/limited")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StubHandler.hits["/limited"], 2)
+
+    def test_retries_are_bounded(self):
+        response = HttpTransport(retries=1, backoff_factor=0).get(f"{self.url}/broken")
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(StubHandler.hits["/broken"], 2)
+
+    def test_read_timeout(self):
+        transport = HttpTransport(timeout=(1, 0.05), retries=0)
+        with self.assertRaises(requests.exceptions.ConnectionError):  # ReadTimeoutError surfaces as ConnectionError after retries
+            transport.get(f"{self.url}/slow")
+
+    def test_per_host_concurrency_limit(self):
+        transport = HttpTransport(host_limits={self.host: 2})
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            responses = list(executor.map(lambda i: transport.get(f"{self.url}/slow{i}"), range(6)))
+        self.assertTrue(all(response.ok for response in responses))
+        self.assertEqual(StubHandler.max_in_flight, 2)
+
+    def test_without_retries(self):
+        transport = HttpTransport(host_limits={self.host: 2}, backoff_factor=0)
+        single = transport.without_retries()
+        self.assertIs(single, transport.without_retries())
+        self.assertEqual(single.get(f"{self.url}/broken").status_code, 500)
+        self.assertEqual(StubHandler.hits["/broken"], 1)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            list(executor.map(lambda i: (transport if i % 2 else single).get(f"{self.url}/slow{i}"), range(6)))
+        self.assertEqual(StubHandler.max_in_flight, 2)  # the per-host limit is shared
+        transport.close()
+
+    def test_shared_transport_is_a_singleton(self):
+        self.assertIs(get_transport(), get_transport())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+import random
+import sqlite3
+import tempfile
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.panel_catalogue import PanelCatalogue
+from vimmo.db.exon_store import ExonStores
+from vimmo.db.interval_index import IntervalIndex, RegionIndex, normalise_chromosome
+
+"""
+test_interval_index.py - Test Suite for the interval index behind /panels/regions
+
+The NCList is checked against a brute force overlap scan on random, heavily nested intervals, and
+the region lookup against a small in-memory database built by the migration runner. Region parsing
+is covered in test_arg_validator.py.
+"""
+
+
+def brute_force(intervals, queries):
+    return {(q, i) for q, (q_chrom, q_start, q_end) in enumerate(queries)
+            for i, (chrom, start, end) in enumerate(intervals)
+            if normalise_chromosome(chrom) == normalise_chromosome(q_chrom) and start < q_end and end > q_start}
+
+
+class TestIntervalIndex(unittest.TestCase):
+
+    def query(self, intervals, queries):
+        index = IntervalIndex(*zip(*intervals))
+        positions, ids = index.query(*zip(*queries))
+        return set(zip(positions.tolist(), ids.tolist()))
+
+    def test_matches_brute_force(self):
+        rng = random.Random(7)
+        intervals = []
+        for _ in range(1500):
+            start = rng.randint(0, 5000)
+            intervals.append((rng.choice(["chr1", "2", "chrX"]), start, start + rng.choice([1, 5, 50, 500, 4000])))
+        intervals += [("chr1", 100, 200)] * 3  # duplicates
+        queries = []
+        for _ in range(400):
+            start = rng.randint(0, 6000)
+            queries.append((rng.choice(["1", "chr2", "X", "chrY"]), start, start + rng.randint(1, 300)))
+        self.assertEqual(self.query(intervals, queries), brute_force(intervals, queries))
+
+    def test_nested_and_touching_intervals(self):
+        intervals = [("chr1", 0, 1000), ("chr1", 10, 900), ("chr1", 20, 30), ("chr1", 40, 50), ("chr1", 1000, 1100)]
+        self.assertEqual(self.query(intervals, [("chr1", 45, 46)]), {(0, 0), (0, 1), (0, 3)})
+        self.assertEqual(self.query(intervals, [("chr1", 30, 40)]), {(0, 0), (0, 1)})      # half-open ends
+        self.assertEqual(self.query(intervals, [("chr1", 999, 1001)]), {(0, 0), (0, 4)})
+
+    def test_results_are_ordered(self):
+        index = IntervalIndex(["chr1", "chr1", "chr2"], [50, 0, 0], [60, 100, 10])
+        positions, ids = index.query(["chr2", "chr1"], [0, 0], [5, 70])
+        self.assertEqual(positions.tolist(), [0, 1, 1])
+        self.assertEqual(ids.tolist(), [2, 0, 1])
+
+    def test_empty_index_and_unknown_chromosomes(self):
+        positions, ids = IntervalIndex([], [], []).query(["chr1"], [0], [10])
+        self.assertEqual(len(positions), 0)
+        positions, ids = IntervalIndex(["chr1"], [0], [10]).query(["chrUn"], [0], [10])
+        self.assertEqual(len(ids), 0)
+
+    def test_normalise_chromosome(self):
+        self.assertEqual([normalise_chromosome(label) for label in ("chr17", "17", "chrx", "chrM", "MT")],
+                         ["17", "17", "X", "MT", "MT"])
+
+
+class TestRegionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO genes_info VALUES
+                ('HGNC:1', '1', 'AAA', 'AAA', '17', 1001, 2000, '17', 5001, 6000),
+                ('HGNC:2', '2', 'BBB', 'BBB', '17', 1501, 1600, '17', 9001, 9100),
+                ('HGNC:3', '3', 'CCC', 'CCC', 'X', 101, 200, NULL, NULL, NULL);
+            INSERT INTO bed38 VALUES
+                ('chr17', 1100, 1200, 'AAA_exon0', 'HGNC:1', 'NM_1', '+', 'ms'),
+                ('chr17', 1550, 1580, 'BBB_exon0', 'HGNC:2', 'NM_2', '-', 'ms'),
+                ('chrX', 120, 150, 'CCC_exon0', 'HGNC:3', 'NM_3', '+', 'ms');
+            INSERT INTO panel VALUES (10, 'R10', 1.0), (20, 'R20', 2.0);
+            INSERT INTO panel_genes VALUES (10, 'HGNC:1', 3), (10, 'HGNC:2', 1), (20, 'HGNC:2', 3);
+        ''')
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.index = RegionIndex(self.conn, "GRCh38", ExonStores(self.tmp_dir.name))
+
+    def tearDown(self):
+        self.conn.close()
+        self.tmp_dir.cleanup()
+
+    def test_genes_use_half_open_coordinates(self):
+        # genes_info is 1-based inclusive: AAA covers bases 1001-2000, i.e. [1000, 2000)
+        results = self.index.overlaps([("chr17", 999, 1000), ("chr17", 1000, 1001), ("chr17", 1999, 2000)])
+        self.assertEqual([[gene["HGNC_ID"] for gene in result["genes"]] for result in results], [[], ["HGNC:1"], ["HGNC:1"]])
+        self.assertEqual(results[1]["genes"][0]["start"], 1000)
+
+    def test_genes_exons_and_panels(self):
+        query = Query(self.conn)
+        result = self.index.overlaps([("chr17", 1540, 1560)], panel_lookup=query.gene_panels)[0]
+        self.assertEqual(result["region"], "chr17:1541-1560")
+        self.assertEqual([gene["HGNC_symbol"] for gene in result["genes"]], ["AAA", "BBB"])
+        self.assertEqual([exon["Name"] for exon in result["exons"]], ["BBB_exon0"])
+        self.assertEqual(result["panels"], [{"Panel_ID": 10, "rcodes": "R10", "HGNC_IDs": ["HGNC:1", "HGNC:2"]},
+                                            {"Panel_ID": 20, "rcodes": "R20", "HGNC_IDs": ["HGNC:2"]}])
+
+    def test_gene_panels_confidence_and_catalogue(self):
+        sql = Query(self.conn).gene_panels(["HGNC:1", "HGNC:2", "HGNC:3"], confidence="Green")
+        self.assertEqual(sql, {"HGNC:1": [{"Panel_ID": 10, "rcodes": "R10", "Confidence": 3}],
+                               "HGNC:2": [{"Panel_ID": 20, "rcodes": "R20", "Confidence": 3}]})
+        cached = Query(self.conn, catalogue=PanelCatalogue()).gene_panels(["HGNC:1", "HGNC:2", "HGNC:3"], confidence="Green")
+        self.assertEqual(cached, sql)
+        batched = Query(self.conn).gene_panels(["HGNC:1", "HGNC:2"], batch_size=1)
+        self.assertEqual({panel["Panel_ID"] for panel in batched["HGNC:2"]}, {10, 20})
+
+    def test_genes_without_build_coordinates_are_skipped(self):
+        index = RegionIndex(self.conn, "GRCh37", ExonStores(self.tmp_dir.name))
+        self.assertEqual(index.genes.size, 2)
+        self.assertEqual(index.overlaps([("X", 0, 1000)], include_exons=False)[0]["genes"], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,9 @@ import unittest
 from unittest.mock import patch
 from io import BytesIO
 import pandas as pd
-from vimmo.utils.localbed import local_bed_formatter
+import sqlite3
+import random
+from vimmo.utils.localbed import local_bed_formatter, local_bed_stream, merged_bed_stream
 
 class TestLocalBed(unittest.TestCase):
     """
@@ -150,5 +152,94 @@ class TestLocalBed(unittest.TestCase):
         # Check that pd.DataFrame was called once with the expected data
         mock_dataframe.assert_called_once_with(expected_rows)
 
+
+class TestLocalBedStream(unittest.TestCase):
+    """
+    Tests for local_bed_stream, which must produce the same BED as local_bed_formatter
+    without building it in memory.
+    """
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("CREATE TABLE bed38 (Chromosome TEXT, Start INTEGER, End INTEGER, Name TEXT, "
+                          "HGNC_ID TEXT, Transcript TEXT, Strand TEXT, Type TEXT)")
+        self.conn.executemany("INSERT INTO bed38 VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                              [(f"chr{i % 22 + 1}", i * 100, i * 100 + 50, f"x_exon{i}", f"HGNC:{i % 7}",
+                                "NM_1" if i % 5 else None, "+" if i % 2 else "-", "ms") for i in range(2500)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def cursor(self):
+        return self.conn.execute("SELECT Chromosome, Start, End, Name, HGNC_ID, Transcript, Strand, Type FROM bed38")
+
+    def test_matches_local_bed_formatter(self):
+        for padding in (0, 25):
+            with self.subTest(padding=padding):
+                expected = local_bed_formatter(self.cursor(), padding).getvalue()
+                self.assertEqual(b"".join(local_bed_stream(self.cursor(), padding)), expected)
+
+    def test_chunks_are_bounded(self):
+        chunks = list(local_bed_stream(self.cursor(), batch_size=1000))
+        self.assertEqual([chunk.count(b"\n") for chunk in chunks], [1000, 1000, 500])
+
+    def test_padding_is_applied_inline(self):
+        records = [{'Chromosome': 'chr1', 'Start': 100, 'End': 200, 'Name': 'Test1', 'Strand': '+',
+                    'Transcript': 'NM_001', 'Type': 'ms', 'HGNC_ID': 'HGNC:1'}]
+        self.assertEqual(b"".join(local_bed_stream(records, padding=10)),
+                         b"chr1\t90\t210\tTest1\t+\tNM_001\tms\tHGNC:1\n")
+
+    def test_no_records(self):
+        self.assertIsNone(local_bed_stream(None))
+        self.assertIsNone(local_bed_stream([]))
+        self.assertIsNone(local_bed_stream(self.conn.execute("SELECT * FROM bed38 WHERE 0")))
+
+
+class TestMergedBedStream(unittest.TestCase):
+    """
+    Tests for merged_bed_stream, the padded interval merge behind /panels/download/local/bulk.
+    """
+
+    @staticmethod
+    def record(chrom, start, end, hgnc_id):
+        return {'Chromosome': chrom, 'Start': start, 'End': end, 'Name': 'x_exon0', 'Strand': '+',
+                'Transcript': 'NM_1', 'Type': 'ms', 'HGNC_ID': hgnc_id}
+
+    @staticmethod
+    def merged(records, padding=0, batch_size=1000):
+        text = b"".join(merged_bed_stream(records, padding, batch_size)).decode()
+        return [tuple(line.split("\t")) for line in text.splitlines()]
+
+    def test_overlapping_and_adjacent_intervals_merge(self):
+        records = [self.record('chr1', 100, 200, 'HGNC:1'), self.record('chr1', 150, 180, 'HGNC:2'),
+                   self.record('chr1', 200, 250, 'HGNC:1'), self.record('chr1', 251, 300, 'HGNC:3'),
+                   self.record('chr2', 0, 10, 'HGNC:4')]
+        self.assertEqual(self.merged(records), [('chr1', '100', '250', 'HGNC:1,HGNC:2'), ('chr1', '251', '300', 'HGNC:3'),
+                                                ('chr2', '0', '10', 'HGNC:4')])
+
+    def test_padding_is_applied_before_merging(self):
+        records = [self.record('chr1', 5, 100, 'HGNC:1'), self.record('chr1', 120, 200, 'HGNC:2')]
+        self.assertEqual(self.merged(records, padding=10), [('chr1', '0', '210', 'HGNC:1,HGNC:2')])
+        self.assertEqual(len(self.merged(records, padding=9)), 2)
+
+    def test_matches_base_by_base_union(self):
+        rng = random.Random(3)
+        starts = sorted(rng.randint(0, 5000) for _ in range(300))
+        records = [self.record('chr1', start, start + rng.randint(1, 80), f'HGNC:{i % 9}') for i, start in enumerate(starts)]
+        covered = set()
+        for record in records:
+            covered.update(range(max(record['Start'] - 15, 0), record['End'] + 15))
+        intervals = self.merged(records, padding=15, batch_size=7)
+        merged_bases = [base for _, start, end, _ in intervals for base in range(int(start), int(end))]
+        self.assertEqual(sorted(merged_bases), sorted(covered))
+        for (_, _, end, _), (_, start, _, _) in zip(intervals, intervals[1:]):
+            self.assertGreater(int(start), int(end))  # neither overlapping nor touching
+
+    def test_no_records(self):
+        self.assertIsNone(merged_bed_stream(None))
+        self.assertIsNone(merged_bed_stream([]))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
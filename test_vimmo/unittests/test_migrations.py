@@ -0,0 +1,118 @@
+import unittest
+import sqlite3
+from vimmo.db.migrations import MIGRATIONS, applied_versions, run_migrations
+from vimmo.db.db_query import Query
+
+"""
+test_migrations.py - Test Suite for the schema migration runner
+
+Runs the migrations against an in-memory database, so no panels_data.db is needed:
+- TestRunMigrations: versions are applied once, recorded and failures are rolled back
+- TestQueryPlans: every hot query in db_query.py is answered through an index (no full table scans)
+"""
+
+
+class TestRunMigrations(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_all_migrations_applied_and_recorded(self):
+        applied = run_migrations(self.conn)
+        self.assertEqual(applied, [version for version, _, _ in MIGRATIONS])
+        self.assertEqual(applied_versions(self.conn), set(applied))
+
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table in ("panel", "panel_genes", "genes_info", "patient_data", "panel_genes_archive", "bed37", "bed38"):
+            self.assertIn(table, tables)
+
+    def test_second_run_is_a_no_op(self):
+        run_migrations(self.conn)
+        self.assertEqual(run_migrations(self.conn), [])
+
+    def test_existing_tables_are_kept(self):
+        # Databases built by create_newdb.py already have the tables (and data) before the runner first sees them
+        self.conn.execute("CREATE TABLE panel (Panel_ID INTEGER, rcodes TEXT, Version REAL)")
+        self.conn.execute("INSERT INTO panel VALUES (3, 'R45', 4.0)")
+        self.conn.commit()
+        run_migrations(self.conn)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM panel").fetchone()[0], 1)
+
+    def test_failed_migration_is_rolled_back(self):
+        broken = MIGRATIONS + [(999, "broken", [
+            "CREATE TABLE half_done (id INTEGER)",
+            "CREATE INDEX idx_missing ON no_such_table (id)",
+        ])]
+        with self.assertRaises(sqlite3.Error):
+            run_migrations(self.conn, broken)
+
+        self.assertNotIn(999, applied_versions(self.conn))
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        self.assertNotIn("half_done", tables)
+        self.assertIn("panel", tables)  # earlier migrations stay applied
+
+
+class TestQueryPlans(unittest.TestCase):
+    """
+    Captures the SQL each Query method sends (with its parameters bound) through a trace callback,
+    then checks EXPLAIN QUERY PLAN reaches every table through an index SEARCH.
+    """
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (100001, 'R999', 2.5), (100002, 'R998', 1.0);
+            INSERT INTO genes_info (HGNC_ID, HGNC_symbol, Gene_Symbol) VALUES ('HGNC:1', 'G1', 'G1'), ('HGNC:2', 'G2', 'G2');
+            INSERT INTO panel_genes VALUES (100001, 'HGNC:1', 3), (100001, 'HGNC:2', 2), (100002, 'HGNC:2', 3);
+            INSERT INTO panel_genes_archive VALUES (100001, 'HGNC:1', 2.0, 2);
+            INSERT INTO patient_data VALUES ('P1', 100001, 'R999', 2.0, '2023-01-01'), ('P1', 100001, 'R999', 2.5, '2024-01-01');
+            INSERT INTO bed38 VALUES ('chr1', 100, 200, 'G1_exon1', 'HGNC:1', 'NM_1', '+', 'ms');
+            INSERT INTO bed37 VALUES ('chr1', 90, 190, 'G1_exon1', 'HGNC:1', 'NM_1', '+', 'ms');
+        ''')
+        self.query = Query(self.conn)
+        self.statements = []
+        self.conn.set_trace_callback(self.statements.append)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def run_hot_queries(self):
+        self.query.get_panel_data(panel_id=100001)
+        self.query.get_panel_data(panel_id=100001, confidence='Green')
+        self.query.get_panels_by_rcode(rcode='R999')
+        self.query.get_panels_by_rcode(rcode='R999', confidence='Amber')
+        self.query.get_panels_from_gene_list(['HGNC:1', 'HGNC:2'])
+        self.query.get_gene_symbol(['HGNC:1'])
+        self.query.local_bed(['HGNC:1', 'HGNC:2'], 'GRCh38').fetchall()
+        self.query.local_bed(['HGNC:1', 'HGNC:2'], 'GRCh37').fetchall()
+        self.query.check_patient_history('P1', 'R999')
+        self.query.check_patient_histories([('P1', 'R999'), ('P2', 'R998')])
+        self.query.get_db_latest_version('R999')
+        self.query.rcode_to_panelID('R999')
+        self.query.return_all_records('P1')
+        self.query.return_all_patients('R999')
+        self.query.current_panel_contents(100001)
+        self.query.historic_panel_retrieval(100001, 2.0)
+        self.query.rcode_checker('R999')
+
+    def test_no_full_table_scans(self):
+        self.run_hot_queries()
+        self.conn.set_trace_callback(None)
+        selects = [sql for sql in self.statements if sql.lstrip().upper().startswith(("SELECT", "WITH"))]
+        self.assertGreaterEqual(len(selects), 17)
+
+        # Scans of CTEs, subqueries and VALUES lists are fine, only scans of stored tables are reported
+        tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for sql in selects:
+            plan = [row["detail"] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+            scans = [step for step in plan if step.startswith("SCAN") and step.split()[1] in tables]
+            self.assertEqual(scans, [], f"Full scan in query plan {plan} for:\n{sql}")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,187 @@
+import unittest
+import sqlite3
+from unittest.mock import patch
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.db_update import Update
+from vimmo.db.db_downgrade import Downgrade
+from vimmo.db.panel_catalogue import PanelCatalogue, bump_generation, current_generation
+
+"""
+test_panel_catalogue.py - Test Suite for the in-memory panel catalogue
+
+Uses an in-memory database built by the migration runner, so no panels_data.db is needed:
+- TestCatalogueLookups: Query answers the same with and without the catalogue
+- TestCatalogueInvalidation: generation bumps from Update / Downgrade, max_age and open transactions
+"""
+
+
+def build_test_db():
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    run_migrations(conn)
+    conn.executescript('''
+        INSERT INTO panel VALUES (100001, 'R999', 2.5), (100002, 'R998', 1.0);
+        INSERT INTO genes_info VALUES
+            ('HGNC:1', 'ENSG1', 'G1', 'G1', '1', 100, 200, '1', 90, 190),
+            ('HGNC:2', 'ENSG2', 'G2', 'G2', '2', 300, 400, '2', 290, 390),
+            ('HGNC:3', 'ENSG3', 'G3', 'G3', 'X', 500, 600, 'X', 490, 590);
+        INSERT INTO panel_genes VALUES (100001, 'HGNC:1', 3), (100001, 'HGNC:2', 2), (100001, 'HGNC:3', 3),
+                                       (100002, 'HGNC:2', 3);
+    ''')
+    return conn
+
+
+def by_gene(response):
+    """Sort the records of a get_panel_data / get_panels_by_rcode response so SQL and catalogue order compare equal."""
+    records = response.get("Associated Gene Records")
+    if records is not None:
+        response = dict(response, **{"Associated Gene Records": sorted(records, key=lambda r: r["HGNC_ID"])})
+    return response
+
+
+class TestCatalogueLookups(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = build_test_db()
+        self.catalogue = PanelCatalogue()
+        self.sql = Query(self.conn)
+        self.cached = Query(self.conn, catalogue=self.catalogue)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_get_panel_data_matches_sql(self):
+        for panel_id in (100001, "100001", 100002, 424242):
+            for confidence in ("All", "Green", "Amber", "Red"):
+                with self.subTest(panel_id=panel_id, confidence=confidence):
+                    expected = by_gene(self.sql.get_panel_data(panel_id=panel_id, confidence=confidence))
+                    actual = by_gene(self.cached.get_panel_data(panel_id=panel_id, confidence=confidence))
+                    self.assertEqual(actual, expected)
+                    if "Associated Gene Records" in actual:
+                        # Same column order as the SQL rows, the JSON responses are identical
+                        self.assertEqual([list(r) for r in actual["Associated Gene Records"]],
+                                         [list(r) for r in expected["Associated Gene Records"]])
+
+    def test_get_panels_by_rcode_matches_sql(self):
+        for rcode in ("R999", "R998", "R000"):
+            for confidence in ("All", "Green", "Amber"):
+                with self.subTest(rcode=rcode, confidence=confidence):
+                    expected = by_gene(self.sql.get_panels_by_rcode(rcode=rcode, confidence=confidence))
+                    actual = by_gene(self.cached.get_panels_by_rcode(rcode=rcode, confidence=confidence))
+                    self.assertEqual(actual, expected)
+                    if "Associated Gene Records" in actual:
+                        self.assertEqual([list(r) for r in actual["Associated Gene Records"]],
+                                         [list(r) for r in expected["Associated Gene Records"]])
+
+    def test_scalar_lookups_match_sql(self):
+        for rcode in ("R999", "R998", "R000"):
+            self.assertEqual(self.cached.get_db_latest_version(rcode), self.sql.get_db_latest_version(rcode))
+            self.assertEqual(self.cached.rcode_to_panelID(rcode), self.sql.rcode_to_panelID(rcode))
+        for panel_id in (100001, "100002", 424242):
+            self.assertEqual(self.cached.current_panel_contents(panel_id), self.sql.current_panel_contents(panel_id))
+
+    def test_get_gene_lists_matches_sql(self):
+        for panel_ids, rcodes in (([100001], ["R998"]), (["100002"], []), ([], ["R999", "R000"]), ([424242], [])):
+            for confidence in ("All", "Green", "Amber"):
+                with self.subTest(panel_ids=panel_ids, rcodes=rcodes, confidence=confidence):
+                    self.assertEqual(self.cached.get_gene_lists(panel_ids, rcodes, confidence),
+                                     self.sql.get_gene_lists(panel_ids, rcodes, confidence))
+        self.assertEqual(self.sql.get_gene_lists([100002], ["R999"], "Green"), ({"HGNC:1", "HGNC:2", "HGNC:3"}, []))
+        self.assertEqual(self.sql.get_gene_lists([], ["R998", "R000"], "Amber"), (set(), ["R998", "R000"]))
+
+    def test_similar_matches_use_the_search_index(self):
+        # The panel search index (vimmo/db/panel_search.py) finds the panels LIKE '%R99%' did
+        with patch("vimmo.db.panel_search.load_panel_names", return_value={}):
+            result = self.cached.get_panels_by_rcode(rcode="R99", matches=True)
+        self.assertEqual(self.catalogue.stats()["misses"], 1)
+        like = {row[0] for row in self.conn.execute("SELECT Panel_ID FROM panel WHERE rcodes LIKE '%R99%'")}
+        self.assertEqual({panel["Panel_ID"] for panel in result["Ranked_Panels"]}, like)
+        self.assertEqual({record["Panel_ID"] for record in result["Associated Gene Records"]}, like)
+
+    def test_hit_and_miss_metrics(self):
+        self.cached.get_db_latest_version("R999")
+        self.cached.rcode_to_panelID("R999")
+        self.cached.current_panel_contents(100001)
+
+        stats = self.catalogue.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["reloads"], 1)
+        self.assertEqual(stats["panels"], 2)
+        self.assertEqual(stats["genes"], 3)
+        self.assertAlmostEqual(stats["hit_ratio"], 2 / 3, places=3)
+
+
+class TestCatalogueInvalidation(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = build_test_db()
+        self.catalogue = PanelCatalogue()
+        self.query = Query(self.conn, catalogue=self.catalogue)
+        self.query.get_db_latest_version("R999")  # load the catalogue
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_bump_generation_reloads(self):
+        generation = current_generation()
+        self.assertEqual(bump_generation("test"), generation + 1)
+        self.query.get_db_latest_version("R999")
+        self.assertEqual(self.catalogue.stats()["reloads"], 2)
+
+    def test_external_write_is_not_seen_until_bumped(self):
+        self.conn.execute("UPDATE panel SET Version = 9.0 WHERE rcodes = 'R999'")
+        self.conn.commit()
+        self.assertEqual(self.query.get_db_latest_version("R999"), 2.5)
+        bump_generation()
+        self.assertEqual(self.query.get_db_latest_version("R999"), 9.0)
+
+    def test_update_bumps_generation(self):
+        update = Update(self.conn)
+        with patch.object(update.papp, "get_genes_HGNC", return_value={"HGNC:1": 2}):
+            update.update_gene_contents("R999", 100001, archive_version="2.5", new_version="3.0")
+        self.assertEqual(self.query.get_db_latest_version("R999"), 3.0)
+        self.assertEqual(self.query.current_panel_contents(100001), {"HGNC:1": 2})
+
+    def test_downgrade_bumps_generation(self):
+        self.conn.commit()
+        panel_records = {"genes": [{"gene_data": {"hgnc_id": "HGNC:3"}, "confidence_level": "3"}]}
+        Downgrade(self.conn).process_downgrade("R999", 100001, 1.0, panel_records)
+
+        self.assertEqual(self.query.get_db_latest_version("R999"), 1.0)
+        self.assertEqual(self.query.current_panel_contents(100001), {"HGNC:3": 3})
+
+    def test_skipped_downgrade_writes_nothing(self):
+        self.conn.commit()
+        generation = current_generation()
+        downgrade = Downgrade(self.conn)
+        panel_records = {"genes": [{"gene_data": {"hgnc_id": "HGNC:3"}, "confidence_level": "3"}]}
+        with patch.object(downgrade.query, "get_db_latest_version", return_value=2.0), \
+                patch("vimmo.db.db_downgrade.invalidate_bed_artefacts") as invalidate:
+            result = downgrade.process_downgrade("R999", 100001, 1.0, panel_records)
+
+        self.assertIn("error", result)
+        self.assertEqual(current_generation(), generation)
+        invalidate.assert_not_called()
+        self.assertFalse(self.conn.in_transaction)
+        self.assertEqual(self.query.get_db_latest_version("R999"), 2.5)
+        self.assertEqual(self.query.current_panel_contents(100001), {"HGNC:1": 3, "HGNC:2": 2, "HGNC:3": 3})
+
+    def test_open_transaction_bypasses_catalogue(self):
+        self.conn.execute("UPDATE panel SET Version = 7.0 WHERE rcodes = 'R999'")
+        self.assertTrue(self.conn.in_transaction)
+        self.assertEqual(self.query.get_db_latest_version("R999"), 7.0)
+        self.conn.rollback()
+        self.assertEqual(self.query.get_db_latest_version("R999"), 2.5)
+
+    def test_max_age(self):
+        catalogue = PanelCatalogue(max_age=0)
+        query = Query(self.conn, catalogue=catalogue)
+        query.get_db_latest_version("R999")
+        query.get_db_latest_version("R999")
+        self.assertEqual(catalogue.stats()["reloads"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+import unittest
+import sqlite3
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.panel_contents import (backfill_gene_changes, compose_gene_changes, diff_panel_genes, record_gene_changes,
+                                     replace_panel_genes)
+from vimmo.db.panel_diff import VersionDiff
+
+"""
+test_panel_contents.py - Test Suite for the shared archive-and-replace of a panel's genes
+
+Runs against a small in-memory database built by the migration runner.
+"""
+
+
+class TestReplacePanelGenes(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (635, 'R208', 2.5), (636, 'R209', 1.0);
+            INSERT INTO panel_genes VALUES (635, 'HGNC:1', 3), (635, 'HGNC:2', 3), (635, 'HGNC:3', 2), (636, 'HGNC:1', 3);
+        ''')
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def genes(self, panel_id):
+        return sorted(tuple(row) for row in self.conn.execute(
+            "SELECT HGNC_ID, Confidence FROM panel_genes WHERE Panel_ID = ?", (panel_id,)))
+
+    def rowids(self, panel_id):
+        return {row[1]: row[0] for row in self.conn.execute(
+            "SELECT rowid, HGNC_ID FROM panel_genes WHERE Panel_ID = ?", (panel_id,))}
+
+    def test_only_changed_rows_are_written(self):
+        before = self.rowids(635)
+        changes = replace_panel_genes(self.conn, 635, {"HGNC:1": "3", "HGNC:3": "3", "HGNC:4": "1"})
+        self.assertEqual(changes["added"], ["HGNC:4"])
+        self.assertEqual(changes["removed"], ["HGNC:2"])
+        self.assertEqual(changes["confidence_changed"], [{"hgnc_id": "HGNC:3", "old_confidence": 2, "new_confidence": 3}])
+        self.assertEqual(changes["rows"], {"inserted": 1, "updated": 1, "deleted": 1})
+        self.assertEqual(self.genes(635), [("HGNC:1", 3), ("HGNC:3", 3), ("HGNC:4", 1)])
+        after = self.rowids(635)
+        self.assertEqual((after["HGNC:1"], after["HGNC:3"]), (before["HGNC:1"], before["HGNC:3"]))
+        self.assertEqual(self.genes(636), [("HGNC:1", 3)])
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_unchanged_contents_write_nothing(self):
+        changes_before = self.conn.total_changes
+        changes = replace_panel_genes(self.conn, "635", [("HGNC:3", "2"), ("HGNC:2", 3), ("HGNC:1", 3)])
+        self.assertEqual(changes["rows"], {"inserted": 0, "updated": 0, "deleted": 0})
+        self.assertEqual(self.conn.total_changes, changes_before)
+
+    def test_duplicate_rows_are_collapsed(self):
+        self.conn.execute("INSERT INTO panel_genes VALUES (636, 'HGNC:1', 3)")
+        self.conn.commit()
+        changes = replace_panel_genes(self.conn, 636, {"HGNC:1": 3})
+        self.assertEqual(changes["rows"], {"inserted": 0, "updated": 0, "deleted": 1})
+        self.assertEqual(self.genes(636), [("HGNC:1", 3)])
+
+    def test_archive_runs_in_the_same_transaction(self):
+        replace_panel_genes(self.conn, 635, {"HGNC:1": 3}, archive_version=2.5)
+        archived = sorted(tuple(row) for row in self.conn.execute(
+            "SELECT Panel_ID, HGNC_ID, Version, Confidence FROM panel_genes_archive"))
+        self.assertEqual(archived, [(635, "HGNC:1", 2.5, 3), (635, "HGNC:2", 2.5, 3), (635, "HGNC:3", 2.5, 2)])
+
+    def test_failure_rolls_back_the_archive_too(self):
+        conn = self.conn
+        original = conn.executemany
+
+        class FailingConnection:
+            in_transaction = False
+
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+            def executemany(self, sql, rows):
+                if sql.startswith("INSERT INTO panel_genes"):
+                    raise sqlite3.OperationalError("disk I/O error")
+                return original(sql, rows)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            replace_panel_genes(FailingConnection(), 635, {"HGNC:7": 3}, archive_version=3.0)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(self.genes(635), [("HGNC:1", 3), ("HGNC:2", 3), ("HGNC:3", 2)])
+        self.assertEqual(conn.execute("SELECT COUNT(*) FROM panel_genes_archive WHERE Version = 3.0").fetchone()[0], 0)
+
+    def test_inside_the_callers_transaction(self):
+        self.conn.execute("BEGIN")
+        self.conn.execute("UPDATE panel SET Version = 1.0 WHERE Panel_ID = 635")
+        replace_panel_genes(self.conn, 635, {"HGNC:9": 3})
+        self.assertTrue(self.conn.in_transaction)
+        self.conn.rollback()
+        self.assertEqual(self.genes(635), [("HGNC:1", 3), ("HGNC:2", 3), ("HGNC:3", 2)])
+
+    def test_diff(self):
+        self.assertEqual(diff_panel_genes([("A", 3)], [("A", 3)]), {"added": [], "removed": [], "confidence_changed": []})
+
+
+class TestPanelGeneChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (635, 'R208', 1.5);
+            INSERT INTO panel_genes VALUES (635, 'HGNC:1', 3), (635, 'HGNC:2', 3), (635, 'HGNC:3', 2);
+        ''')
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def update(self, old, new, genes):
+        replace_panel_genes(self.conn, 635, genes, archive_version=old, versions=(old, new))
+
+    def test_updates_store_their_changes(self):
+        self.update(1.5, 2.0, {"HGNC:1": 3, "HGNC:3": 3, "HGNC:4": 1})
+        rows = sorted(tuple(row) for row in self.conn.execute(
+            "SELECT From_Version, To_Version, HGNC_ID, Change, Old_Confidence, New_Confidence FROM panel_gene_changes"))
+        self.assertEqual(rows, [(1.5, 2.0, "HGNC:2", "removed", 3, None), (1.5, 2.0, "HGNC:3", "confidence", 2, 3),
+                                (1.5, 2.0, "HGNC:4", "added", None, 1)])
+        self.assertEqual(compose_gene_changes(self.conn, 635, 1.5, 2.0),
+                         VersionDiff({"HGNC:4": 1}, {"HGNC:2": 3}, {"HGNC:3": (2, 3)}))
+
+    def test_multi_hop_matches_the_full_comparison(self):
+        self.update(1.5, 2.0, {"HGNC:1": 3, "HGNC:3": 3, "HGNC:4": 1})
+        self.update(2.0, 2.5, {"HGNC:1": 3, "HGNC:3": 3, "HGNC:4": 1})  # no gene changes
+        self.update(2.5, 3.0, {"HGNC:1": 2, "HGNC:3": 2, "HGNC:5": 3})
+
+        query = Query(self.conn)
+        expected = query.compare_panel_versions(query.historic_panel_retrieval(635, 1.5), query.current_panel_contents(635))
+        self.assertEqual(query.stored_version_comparison("635", 1.5, 3.0), expected)
+        # HGNC:4 was added then removed, HGNC:3 went 2 -> 3 -> 2
+        self.assertEqual(expected, VersionDiff({"HGNC:5": 3}, {"HGNC:2": 3}, {"HGNC:1": (3, 2)}))
+        self.assertFalse(compose_gene_changes(self.conn, 635, 2.0, 2.5).changed)
+        self.assertFalse(compose_gene_changes(self.conn, 635, 3.0, 3.0).changed)
+
+    def test_version_moves_with_the_contents(self):
+        self.update(1.5, 2.0, {"HGNC:1": 3})
+        self.assertEqual(self.conn.execute("SELECT Version FROM panel WHERE Panel_ID = 635").fetchone()[0], 2.0)
+
+        conn = self.conn
+        original = conn.executemany
+
+        class FailingConnection:
+            in_transaction = False
+
+            def __getattr__(self, name):
+                return getattr(conn, name)
+
+            def executemany(self, sql, rows):
+                if sql.startswith("INSERT INTO panel_genes"):
+                    raise sqlite3.OperationalError("disk I/O error")
+                return original(sql, rows)
+
+        with self.assertRaises(sqlite3.OperationalError):
+            replace_panel_genes(FailingConnection(), 635, {"HGNC:7": 3}, archive_version=2.0, versions=(2.0, 3.0))
+        self.assertEqual(self.conn.execute("SELECT Version FROM panel WHERE Panel_ID = 635").fetchone()[0], 2.0)
+        self.assertIsNone(compose_gene_changes(self.conn, 635, 2.0, 3.0))
+
+    def test_repeated_update_keeps_the_stored_changes(self):
+        self.update(1.5, 2.0, {"HGNC:1": 3, "HGNC:3": 3, "HGNC:4": 1})
+        changes = replace_panel_genes(self.conn, 635, {"HGNC:1": 3, "HGNC:3": 3, "HGNC:4": 1},
+                                      archive_version=1.5, versions=(1.5, 2.0))
+        self.assertTrue(changes["skipped"])
+        self.assertEqual(compose_gene_changes(self.conn, 635, 1.5, 2.0),
+                         VersionDiff({"HGNC:4": 1}, {"HGNC:2": 3}, {"HGNC:3": (2, 3)}))
+        archived = sorted(tuple(row) for row in self.conn.execute(
+            "SELECT HGNC_ID, Confidence FROM panel_genes_archive WHERE Version = 1.5"))
+        self.assertEqual(archived, [("HGNC:1", 3), ("HGNC:2", 3), ("HGNC:3", 2)])
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_downgrade_stores_no_changes(self):
+        self.update(1.5, 2.0, {"HGNC:1": 3, "HGNC:3": 3, "HGNC:4": 1})
+        changes = replace_panel_genes(self.conn, 635, {"HGNC:1": 3, "HGNC:2": 3, "HGNC:3": 2}, versions=(2.0, 1.5))
+        self.assertEqual(changes["added"], ["HGNC:2"])
+        self.assertEqual(self.conn.execute("SELECT Version FROM panel WHERE Panel_ID = 635").fetchone()[0], 1.5)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM panel_gene_changes WHERE From_Version > To_Version")
+                         .fetchone()[0], 0)
+        self.assertEqual(compose_gene_changes(self.conn, 635, 1.5, 2.0),
+                         VersionDiff({"HGNC:4": 1}, {"HGNC:2": 3}, {"HGNC:3": (2, 3)}))
+
+    def test_missing_steps_return_none(self):
+        self.update(1.5, 2.0, {"HGNC:1": 3})
+        self.assertIsNone(compose_gene_changes(self.conn, 635, 1.0, 2.0))
+        self.assertIsNone(compose_gene_changes(self.conn, 635, 1.5, 3.0))
+
+    def test_longest_step_is_used(self):
+        record_gene_changes(self.conn, 635, 1.0, 3.0, {"HGNC:1": 3}, {"HGNC:1": 2})
+        record_gene_changes(self.conn, 635, 1.0, 2.0, {"HGNC:1": 3}, {})
+        self.assertEqual(compose_gene_changes(self.conn, 635, 1.0, 3.0), VersionDiff({}, {}, {"HGNC:1": (3, 2)}))
+
+    def test_backfill_from_the_archive(self):
+        self.conn.executescript('''
+            INSERT INTO panel_genes_archive VALUES (635, 'HGNC:1', 1.0, 3), (635, 'HGNC:9', 1.0, 3),
+                                                   (635, 'HGNC:1', 1.2, 2), (635, 'HGNC:2', 1.2, 3);
+        ''')
+        self.assertEqual(backfill_gene_changes(self.conn), 2)
+        self.assertEqual(compose_gene_changes(self.conn, 635, 1.0, 1.5),
+                         VersionDiff({"HGNC:2": 3, "HGNC:3": 2}, {"HGNC:9": 3}, {}))
+        self.assertEqual(backfill_gene_changes(self.conn), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
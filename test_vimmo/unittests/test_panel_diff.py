@@ -0,0 +1,98 @@
+import unittest
+import random
+import sqlite3
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.panel_catalogue import PanelCatalogue
+from vimmo.db.panel_diff import OTHER_CODES, VersionDiff, diff_many, diff_versions, encode_contents, gene_code, gene_id
+
+"""
+test_panel_diff.py - Test Suite for the panel version diff engine and Query.compare_panel_version_pairs
+
+The Query tests run against a small in-memory database built by the migration runner.
+"""
+
+
+class TestPanelDiff(unittest.TestCase):
+
+    def test_diff_versions(self):
+        old = {"HGNC:1": 3, "HGNC:2": 3, "HGNC:3": 2}
+        new = {"HGNC:3": 3, "HGNC:1": 3, "HGNC:4": 1}
+        diff = diff_versions(old, new)
+        self.assertEqual(diff, VersionDiff({"HGNC:4": 1}, {"HGNC:2": 3}, {"HGNC:3": (2, 3)}))
+        self.assertEqual((diff[0], diff[1], diff[2]), (diff.added, diff.removed, diff.confidence_changed))
+        self.assertTrue(diff.changed)
+        self.assertFalse(diff_versions(old, dict(old)).changed)
+
+    def test_gene_codes(self):
+        self.assertEqual(gene_code("HGNC:1100"), 1100)
+        for hgnc_id in ["HGNC:0012", "HGNC:", "ENSG00000139618", "HGNC:12345678901"]:
+            self.assertGreaterEqual(gene_code(hgnc_id), OTHER_CODES)
+            self.assertEqual(gene_id(gene_code(hgnc_id)), hgnc_id)
+        self.assertEqual(gene_code("ENSG00000139618"), gene_code("ENSG00000139618"))
+        encoded = encode_contents({"HGNC:30": 1, "HGNC:4": None, "HGNC:100": 3})
+        self.assertEqual(encoded.codes.tolist(), [4, 30, 100])
+        self.assertEqual(encoded.confidence.tolist(), [-1, 1, 3])
+
+    def test_diff_many_matches_diff_versions(self):
+        rng = random.Random(4)
+        pairs = []
+        for _ in range(40):
+            genes = [f"HGNC:{gene}" for gene in rng.sample(range(1, 200), 60)] + ["ENSG01"]
+            old = {gene: rng.randint(1, 3) for gene in rng.sample(genes, 30)}
+            new = {gene: rng.choice([1, 2, 3, None]) for gene in rng.sample(genes, 30)}
+            pairs.append((old, new))
+        pairs += [({}, {}), ({"HGNC:1": 3}, {}), ({}, {"HGNC:1": 3}), pairs[0]]
+        for diff, (old, new) in zip(diff_many(pairs), pairs):
+            self.assertEqual(diff, diff_versions(old, new))
+        self.assertEqual(diff_many([]), [])
+
+    def test_repeated_versions_are_encoded_once(self):
+        current = encode_contents({"HGNC:1": 3, "HGNC:2": 3})
+        old = {"HGNC:1": 2}
+        diffs = diff_many([(old, current)] * 3 + [(current, current)])
+        self.assertIs(diffs[0], diffs[2])
+        self.assertEqual(diffs[0], VersionDiff({"HGNC:2": 3}, {}, {"HGNC:1": (2, 3)}))
+        self.assertFalse(diffs[3].changed)
+
+
+class TestCompareVersionPairs(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (635, 'R208', 2.5), (636, 'R209', 1.0);
+            INSERT INTO panel_genes VALUES (635, 'HGNC:1', 3), (635, 'HGNC:3', 3), (636, 'HGNC:7', 3);
+            INSERT INTO panel_genes_archive VALUES (635, 'HGNC:1', 2.0, 3), (635, 'HGNC:2', 2.0, 3), (635, 'HGNC:3', 2.0, 2),
+                                                   (635, 'HGNC:1', 1.0, 2);
+        ''')
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_pairs(self):
+        for query in [Query(self.conn), Query(self.conn, catalogue=PanelCatalogue())]:
+            comparisons = query.compare_panel_version_pairs([("635", 2.0), (635, 2.0), (635, 1.0, 2.0), (635, 2.5),
+                                                             (636, 1.0), (635, 9.0), (999, 1.0)])
+            self.assertEqual(comparisons[("635", 2.0)],
+                             query.compare_panel_versions(query.historic_panel_retrieval(635, 2.0),
+                                                          query.current_panel_contents(635)))
+            self.assertEqual(comparisons[(635, 2.0)], VersionDiff({}, {"HGNC:2": 3}, {"HGNC:3": (2, 3)}))
+            self.assertEqual(comparisons[(635, 1.0, 2.0)],
+                             VersionDiff({"HGNC:2": 3, "HGNC:3": 2}, {}, {"HGNC:1": (2, 3)}))
+            self.assertFalse(comparisons[(635, 2.5)].changed)
+            self.assertFalse(comparisons[(636, 1.0)].changed)
+            self.assertIsNone(comparisons[(635, 9.0)])
+            self.assertIsNone(comparisons[(999, 1.0)])
+
+    def test_archive_reads_are_batched(self):
+        versions = [(635, 1.0, 2.0), (635, 2.0)]
+        self.assertEqual(Query(self.conn).compare_panel_version_pairs(versions, batch_size=1),
+                         Query(self.conn).compare_panel_version_pairs(versions))
+
+
+if __name__ == '__main__':
+    unittest.main()
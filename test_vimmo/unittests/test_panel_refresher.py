@@ -0,0 +1,152 @@
+import unittest
+import sqlite3
+import threading
+import time
+from unittest.mock import MagicMock, patch
+from vimmo.db.migrations import run_migrations
+from vimmo.db.panel_refresher import PanelRefresher, freshness_disclaimer
+
+"""
+test_panel_refresher.py - Test Suite for the background panel refresher behind /patient
+
+Uses an in-memory database built by the migration runner and a mocked PanelAppClient, so no
+panels_data.db or network access is needed.
+"""
+
+
+class FakeLease:
+    def __init__(self, conn, write, leases):
+        self.conn = conn
+        leases.append(write)
+
+    def close(self):
+        pass
+
+
+class TestPanelRefresher(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:", check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (100001, 'R999', 2.5);
+            INSERT INTO panel_genes VALUES (100001, 'HGNC:1', 3), (100001, 'HGNC:2', 2);
+        ''')
+        self.leases = []
+        self.client = MagicMock()
+        self.client.get_latest_online_version.return_value = 2.5
+        self.client.get_genes_HGNC.return_value = {"HGNC:1": 3, "HGNC:3": 3}
+        self.refresher = PanelRefresher(connect=lambda write=False: FakeLease(self.conn, write, self.leases),
+                                        client=self.client, interval=60)
+
+    def tearDown(self):
+        self.refresher.stop()
+        self.conn.close()
+
+    def test_unchanged_panel_only_reads(self):
+        status = self.refresher.refresh("R999")
+
+        self.assertTrue(status["ok"])
+        self.assertFalse(status["updated"])
+        self.assertEqual(status["version"], 2.5)
+        self.assertEqual(self.leases, [False])
+        self.client.get_latest_online_version.assert_called_once_with(100001)
+
+    def test_newer_panel_is_updated(self):
+        self.client.get_latest_online_version.return_value = 3.0
+        status = self.refresher.refresh("R999")
+
+        self.assertTrue(status["updated"])
+        self.assertEqual(status["version"], 3.0)
+        self.assertEqual(self.leases, [False, True])
+        genes = dict(self.conn.execute("SELECT HGNC_ID, Confidence FROM panel_genes WHERE Panel_ID = 100001").fetchall())
+        self.assertEqual(genes, {"HGNC:1": 3, "HGNC:3": 3})
+        archived = self.conn.execute("SELECT HGNC_ID, Version FROM panel_genes_archive ORDER BY HGNC_ID").fetchall()
+        self.assertEqual([tuple(row) for row in archived], [("HGNC:1", 2.5), ("HGNC:2", 2.5)])
+
+    def test_update_applied_by_another_writer_is_not_repeated(self):
+        self.client.get_latest_online_version.return_value = 3.0
+
+        def updated_elsewhere(rcode):
+            self.conn.execute("UPDATE panel SET Version = 3.0 WHERE Panel_ID = 100001")
+            self.conn.commit()
+            return {"HGNC:1": 3, "HGNC:3": 3}
+
+        self.client.get_genes_HGNC.side_effect = updated_elsewhere
+        status = self.refresher.refresh("R999")
+
+        self.assertTrue(status["ok"])
+        self.assertFalse(status["updated"])
+        self.assertEqual(status["version"], 3.0)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM panel_genes_archive").fetchone()[0], 0)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM panel_gene_changes").fetchone()[0], 0)
+
+    def test_failed_gene_fetch_writes_nothing(self):
+        self.client.get_latest_online_version.return_value = 3.0
+        self.client.get_genes_HGNC.side_effect = Exception("PanelApp down")
+        status = self.refresher.refresh("R999")
+
+        self.assertFalse(status["ok"])
+        self.assertEqual(self.leases, [False])
+        self.assertEqual(self.conn.execute("SELECT Version FROM panel WHERE Panel_ID = 100001").fetchone()[0], 2.5)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM panel_genes_archive").fetchone()[0], 0)
+
+    def test_failures_are_recorded_not_raised(self):
+        self.refresher.refresh("R999")
+        self.client.get_latest_online_version.side_effect = Exception("PanelApp down")
+        status = self.refresher.refresh("R999")
+
+        self.assertFalse(status["ok"])
+        self.assertEqual(status["error"], "PanelApp down")
+        self.assertIsNotNone(status["last_ok_at"])
+        self.assertIn("unable to be contacted", freshness_disclaimer(status))
+        self.assertIn("last confirmed", freshness_disclaimer(status))
+
+    def test_touch_does_not_wait_for_panelapp(self):
+        release = threading.Event()
+        self.client.get_latest_online_version.side_effect = lambda panel_id: release.wait(5) and 2.5
+
+        started = time.perf_counter()
+        status = self.refresher.touch("R999")
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertIsNone(status)
+        self.assertIn("not yet checked", freshness_disclaimer(status))
+
+        release.set()
+        self.refresher.refresh_async("R999").result(timeout=5)
+        self.assertIn("up to date as of", freshness_disclaimer(self.refresher.status("R999")))
+
+    def test_concurrent_refreshes_are_single_flight(self):
+        release = threading.Event()
+        self.client.get_latest_online_version.side_effect = lambda panel_id: release.wait(5) and 2.5
+
+        futures = [self.refresher.refresh_async("R999") for _ in range(5)]
+        self.assertTrue(all(future is futures[0] for future in futures))
+        release.set()
+        futures[0].result(timeout=5)
+
+        self.assertEqual(self.client.get_latest_online_version.call_count, 1)
+        self.assertEqual(self.refresher.stats()["deduplicated"], 4)
+
+    def test_fresh_check_is_not_repeated(self):
+        self.refresher.refresh("R999")
+        self.refresher.touch("R999")
+        self.assertEqual(self.refresher.stats()["in_flight"], 0)
+        self.assertEqual(self.client.get_latest_online_version.call_count, 1)
+
+    def test_sweep_refreshes_recently_queried_stale_codes(self):
+        self.refresher.interval = 0
+        with patch.object(self.refresher, "refresh_async") as refresh_async:
+            self.refresher.touch("R999")
+            self.refresher.touch("R998")
+            self.refresher.recent_window = 0  # both queries are now too old to keep refreshing
+            self.assertEqual(self.refresher.sweep(), [])
+            self.refresher.recent_window = 3600
+            self.refresher.touch("R999")
+            self.assertEqual(len(self.refresher.sweep()), 1)
+        self.assertEqual(refresh_async.call_args_list[-1].args, ("R999",))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import json
+import os
+import sqlite3
+import tempfile
+from unittest.mock import patch
+from vimmo.db.migrations import run_migrations
+from vimmo.db.db_query import Query
+from vimmo.db.panel_catalogue import PanelCatalogue, bump_generation
+from vimmo.db.panel_search import load_panel_names
+
+"""
+test_panel_search.py - Test Suite for the n-gram panel search behind Similar_Matches
+
+Runs against a small in-memory database built by the migration runner, with panel names given in
+place of vimmo/db/all_panel.json.
+"""
+
+NAMES = {
+    10: ("Hypertrophic cardiomyopathy", []),
+    12: ("Dilated cardiomyopathy", ["Cardiomyopathies - dilated"]),
+    101: ("Brugada syndrome", ["Cardiac sodium channel disease"]),
+}
+
+
+class TestPanelSearch(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO genes_info (HGNC_ID, Gene_Symbol, HGNC_symbol) VALUES ('HGNC:1', 'G1', 'G1'), ('HGNC:2', 'G2', 'G2');
+            INSERT INTO panel VALUES (10, 'R131', 1.0), (12, 'R13', 2.0), (101, 'R128', 3.0), (1013, 'R1', 4.0), (7, '', 1.0);
+            INSERT INTO panel_genes VALUES (10, 'HGNC:1', 3), (12, 'HGNC:1', 3), (12, 'HGNC:2', 1), (101, 'HGNC:2', 3),
+                (1013, 'HGNC:1', 2), (7, 'HGNC:2', 3);
+        ''')
+        self.catalogue = PanelCatalogue()
+        patcher = patch("vimmo.db.panel_search.load_panel_names", return_value=NAMES)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.query = Query(self.conn, catalogue=self.catalogue)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def search(self, query, fields=("Panel_ID", "rcodes", "name")):
+        index = self.catalogue.snapshot(self.conn).panel_search
+        return [(index.snapshot.panels[hit.panel][0], hit.field, hit.match) for hit in index.search(query, fields)]
+
+    def test_substring_matches_like_did(self):
+        self.assertEqual(self.search("R13", ("rcodes",)), [(12, "rcodes", "exact"), (10, "rcodes", "prefix")])
+        self.assertEqual(self.search("r1", ("rcodes",)),
+                         [(1013, "rcodes", "exact"), (12, "rcodes", "prefix"), (10, "rcodes", "prefix"),
+                          (101, "rcodes", "prefix")])
+        self.assertEqual(self.search("01", ("Panel_ID",)), [(101, "Panel_ID", "substring"), (1013, "Panel_ID", "substring")])
+        self.assertEqual(self.search("7", ("Panel_ID",)), [(7, "Panel_ID", "exact")])
+        self.assertEqual(self.search("R99"), [])
+        self.assertEqual(self.search(""), [])
+
+    def test_names(self):
+        self.assertEqual(self.search("cardiomyopathy", ("rcodes", "name")), [(12, "name", "word"), (10, "name", "word")])
+        self.assertEqual(self.search("sodium", ("rcodes", "name")), [(101, "name", "word")])
+        self.assertEqual(self.search("cardiomiopathy", ("rcodes", "name")),
+                         [(12, "name", "similar"), (10, "name", "similar")])
+        self.assertEqual(self.search("brugada", ("Panel_ID",)), [])
+
+    def test_query_similar_matches(self):
+        result = self.query.get_panels_by_rcode("R13", matches=True)
+        self.assertEqual([(panel["Panel_ID"], panel["Match"]) for panel in result["Ranked_Panels"]], [(12, "exact"), (10, "prefix")])
+        self.assertEqual([record["Panel_ID"] for record in result["Associated Gene Records"]], [12, 12, 10])
+        self.assertEqual(result["Ranked_Panels"][0]["Name"], "Dilated cardiomyopathy")
+
+        result = self.query.get_panels_by_rcode("R13", matches=True, confidence="Red")
+        self.assertEqual([panel["Panel_ID"] for panel in result["Ranked_Panels"]], [12])  # 10 has no red genes
+
+        result = self.query.get_panel_data(panel_id="101", matches=True)
+        self.assertEqual([panel["Panel_ID"] for panel in result["Ranked_Panels"]], [101, 1013])
+        self.assertIn("Message", self.query.get_panel_data(panel_id="555", matches=True))
+
+    def test_without_a_catalogue(self):
+        result = Query(self.conn).get_panels_by_rcode("Brugada", matches=True)
+        self.assertEqual([panel["Panel_ID"] for panel in result["Ranked_Panels"]], [101])
+        self.assertEqual(Query(self.conn).get_panel_data(panel_id=10, matches=False)["Associated Gene Records"][0]["Panel_ID"], 10)
+
+    def test_index_follows_panel_updates(self):
+        self.assertEqual(self.search("R200"), [])
+        self.conn.execute("INSERT INTO panel VALUES (20, 'R200', 1.0)")
+        self.conn.commit()
+        bump_generation("test")
+        self.assertEqual(self.search("R200"), [(20, "rcodes", "exact")])
+
+
+class TestLoadPanelNames(unittest.TestCase):
+
+    def test_load_panel_names(self):
+        pages = [{"results": [{"id": 9, "name": "Differences in sex development",
+                               "relevant_disorders": ["R146", "Disorders of sex development"]}]},
+                 {"results": [{"id": 3, "name": "Stickler syndrome", "relevant_disorders": ["R45"]}]}]
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "all_panel.json")
+            with open(path, "w") as handle:
+                json.dump(pages, handle)
+            self.assertEqual(load_panel_names(path), {9: ("Differences in sex development", ["Disorders of sex development"]),
+                                                      3: ("Stickler syndrome", [])})
+            self.assertEqual(load_panel_names(os.path.join(tmp_dir, "missing.json")), {})
+
+    def test_repository_listing(self):
+        names = load_panel_names()
+        self.assertGreater(len(names), 0)
+        self.assertTrue(all(isinstance(name, str) for name, _ in names.values()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,18 @@
 import requests
 import unittest
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
 from unittest.mock import patch
-from vimmo.utils.panelapp import PanelAppClient, PanelAppAPIError
+from vimmo.utils.panelapp import PanelAppClient, PanelAppAPIError, PanelVersionCache
 
 
 class TestPanelAppClient(unittest.TestCase):
 
     # Test for the _check_response method (using a mock response)
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_check_response_success(self, mock_get):
         # Mock the response to return a valid JSON with status code 200
         mock_response = {'results': []}  # Sample mock data
@@ -18,7 +23,7 @@ class TestPanelAppClient(unittest.TestCase):
         result = client._check_response('https://panelapp.genomicsengland.co.uk/api/v1/panels')
         self.assertEqual(result, mock_response)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_check_response_http_error(self, mock_get):
         # Simulate an HTTP error (e.g., 404 Not Found)
         mock_get.return_value.status_code = 404
@@ -28,7 +33,7 @@ class TestPanelAppClient(unittest.TestCase):
         with self.assertRaises(PanelAppAPIError):
             client._check_response('https://panelapp.genomicsengland.co.uk/api/v1/panels')
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_check_response_request_exception(self, mock_get):
         # Simulate a network error (RequestException)
         mock_get.side_effect = requests.exceptions.RequestException("Network error")
@@ -38,7 +43,7 @@ class TestPanelAppClient(unittest.TestCase):
             client._check_response('https://panelapp.genomicsengland.co.uk/api/v1/panels')
 
     # Test for get_genes_HUGO method
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_genes_hugo(self, mock_get):
         # Mock the API response for get_genes_HUGO
         mock_response = {
@@ -56,7 +61,7 @@ class TestPanelAppClient(unittest.TestCase):
         self.assertEqual(result, ['BRCA1', 'TP53', 'EGFR'])
 
     # Test for get_genes_HGNC method
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_genes_hgnc(self, mock_get):
         # Mock the API response for get_genes_HGNC
         mock_response = {
@@ -79,7 +84,7 @@ class TestPanelAppClient(unittest.TestCase):
         self.assertEqual(result, expected_result)
 
     # Test for get_latest_online_version method
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_latest_online_version(self, mock_get):
         # Mock the API response for get_latest_online_version
         mock_response = {
@@ -92,7 +97,7 @@ class TestPanelAppClient(unittest.TestCase):
         result = client.get_latest_online_version('635')
         self.assertEqual(result, 2.5)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_latest_online_version_error(self, mock_get):
         # Simulate a missing or invalid version response
         mock_response = {"results": []}
@@ -106,7 +111,7 @@ class TestPanelAppClient(unittest.TestCase):
 
 
     # Test for dowgrade_records method
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_dowgrade_records(self, mock_get):
         # Mock the API response for dowgrade_records
         mock_response = {
@@ -119,7 +124,7 @@ class TestPanelAppClient(unittest.TestCase):
         result = client.dowgrade_records('635', '2.5')
         self.assertEqual(result, mock_response)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_dowgrade_records_error(self, mock_get):
         # Simulate an HTTP error (e.g., 404 Not Found)
         mock_get.return_value.status_code = 404
@@ -130,5 +135,99 @@ class TestPanelAppClient(unittest.TestCase):
             client.dowgrade_records('635', '2.5')
 
 
+class StubSignedoffHandler(BaseHTTPRequestHandler):
+    # Panel id -> (version, ETag); the ETag changes with the version, as PanelApp's does
+    panels = {}
+    seen = []  # (panel_id, If-None-Match, If-Modified-Since) per request
+
+    def do_GET(self):
+        panel_id = parse_qs(urlsplit(self.path).query)["panel_id"][0]
+        version, etag = StubSignedoffHandler.panels[panel_id]
+        StubSignedoffHandler.seen.append((panel_id, self.headers.get("If-None-Match"),
+                                          self.headers.get("If-Modified-Since")))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        payload = json.dumps({"results": [{"id": int(panel_id), "version": version}]}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", "Mon, 02 Dec 2024 10:00:00 GMT")
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPanelVersionCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubSignedoffHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/api/v1/panels"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubSignedoffHandler.panels = {"635": ("2.5", '"v2.5"'), "100": ("1.0", '"v1.0"')}
+        StubSignedoffHandler.seen = []
+        self.cache = PanelVersionCache(freshness=60)
+        self.client = PanelAppClient(base_url=self.base_url, version_cache=self.cache)
+
+    def test_fresh_version_is_served_from_cache(self):
+        self.assertEqual(self.client.get_latest_online_version(635), 2.5)
+        self.assertEqual(self.client.get_latest_online_version("635"), 2.5)
+
+        self.assertEqual(StubSignedoffHandler.seen, [("635", None, None)])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_stale_version_is_revalidated(self):
+        self.cache.freshness = 0
+        self.client.get_latest_online_version(635)
+        self.assertEqual(self.client.get_latest_online_version(635), 2.5)
+
+        self.assertEqual(StubSignedoffHandler.seen[1], ("635", '"v2.5"', "Mon, 02 Dec 2024 10:00:00 GMT"))
+        self.assertEqual(self.cache.stats()["revalidated"], 1)
+
+    def test_revalidation_restarts_the_freshness_window(self):
+        self.cache.freshness = 0.05
+        self.client.get_latest_online_version(635)
+        time.sleep(0.1)
+        self.client.get_latest_online_version(635)  # 304
+        self.client.get_latest_online_version(635)  # fresh again
+        self.assertEqual(len(StubSignedoffHandler.seen), 2)
+
+    def test_changed_version_replaces_entry(self):
+        self.cache.freshness = 0
+        self.client.get_latest_online_version(635)
+        StubSignedoffHandler.panels["635"] = ("2.6", '"v2.6"')
+
+        self.assertEqual(self.client.get_latest_online_version(635), 2.6)
+        self.assertEqual(self.cache.get(635)["etag"], '"v2.6"')
+        self.assertEqual(self.cache.stats()["fetched"], 2)
+
+    def test_panels_are_cached_separately(self):
+        self.assertEqual(self.client.get_latest_online_version(635), 2.5)
+        self.assertEqual(self.client.get_latest_online_version(100), 1.0)
+        self.cache.invalidate(635)
+        self.client.get_latest_online_version(635)
+        self.assertEqual([panel_id for panel_id, _, _ in StubSignedoffHandler.seen], ["635", "100", "635"])
+
+    def test_errors_are_not_cached(self):
+        with patch('requests.Session.get', side_effect=requests.exceptions.ConnectionError("down")):
+            with self.assertRaises(PanelAppAPIError):
+                self.client.get_latest_online_version(635)
+        self.assertIsNone(self.cache.get(635))
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import unittest
+import json
+import sqlite3
+from datetime import date
+from vimmo.db.migrations import run_migrations
+from vimmo.db.panel_catalogue import PanelCatalogue
+from vimmo.db.patient_ingest import IngestError, ingest_records, insert_records, read_records, validate_records, panel_map
+
+"""
+test_patient_ingest.py - Test Suite for the bulk patient record ingestion
+
+Runs against a small in-memory database built by the migration runner.
+"""
+
+CSV = """Patient ID,R code,Version,Date
+T1,R208,2.5,2024-01-02
+T2,r208,,2024-01-03
+T3,R167,1.0,
+T4,R208,3.0,2024-01-02
+T5,R999,1.0,2024-01-02
+T6!,R208,2.5,2024-01-02
+T7,R208,abc,2024-01-02
+T8,R208,2.5,2024-13-01
+T9,R208,2.5,2999-01-01
+T1,R208,2.5,2024-02-02
+T123,R208,2.5,2024-05-05
+"""
+
+
+class TestPatientIngest(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (635, 'R208', 2.5), (557, 'R167', 1.5);
+            INSERT INTO patient_data VALUES ('T123', 635, 'R208', 2.5, '2023-12-30');
+        ''')
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+
+    def rows(self):
+        return [tuple(row) for row in self.conn.execute(
+            "SELECT * FROM patient_data ORDER BY Patient_ID, Rcode, Version")]
+
+    def test_csv_ingest(self):
+        summary = ingest_records(self.conn, CSV, catalogue=PanelCatalogue())
+        self.assertEqual(summary["Received"], 11)
+        self.assertEqual((summary["Inserted"], summary["Duplicates"], summary["Already_Present"], summary["Rejected"]),
+                         (3, 1, 1, 6))
+        self.assertEqual([error["Line"] for error in summary["Errors"]], [5, 6, 7, 8, 9, 10])
+        self.assertEqual(summary["Errors"][0]["Error"], "Version is newer than the database's, run the scheduled update first")
+        self.assertEqual(summary["Errors"][1]["Error"], "R code not in the database")
+        self.assertEqual(self.rows(), [
+            ("T1", 635, "R208", 2.5, "2024-01-02"),
+            ("T123", 635, "R208", 2.5, "2023-12-30"),
+            ("T2", 635, "R208", 2.5, "2024-01-03"),
+            ("T3", 557, "R167", 1.0, date.today().isoformat()),
+        ])
+
+        again = ingest_records(self.conn, CSV)
+        self.assertEqual((again["Inserted"], again["Already_Present"]), (0, 4))
+
+    def test_ndjson_matches_csv(self):
+        lines = [json.dumps({"patient_id": "T1", "rcode": "R208", "version": 2.5, "date": "2024-01-02"}),
+                 "",
+                 "not json",
+                 json.dumps({"Patient ID": 42, "R code": "R167"}),
+                 json.dumps(["T3", "R167"])]
+        summary = ingest_records(self.conn, "\n".join(lines).encode(), content_type="application/x-ndjson")
+        self.assertEqual((summary["Received"], summary["Inserted"], summary["Rejected"]), (4, 2, 2))
+        self.assertEqual([error["Line"] for error in summary["Errors"]], [3, 5])
+        self.assertIn(("42", 557, "R167", 1.5, date.today().isoformat()), self.rows())
+
+    def test_blank_lines_keep_line_numbers(self):
+        records, _ = read_records(b'\nPatient ID,Rcode\nP1,R1\n\n  \nP2,R2\n"P3","R\n3"\n\nP4,R4\n', fmt="csv")
+        self.assertEqual(list(records["Patient_ID"]), ["P1", "P2", "P3", "P4"])
+        self.assertEqual(list(records["Line"]), [3, 6, 7, 10])
+        csv_lines = list(read_records(b"Patient ID,Rcode\nP1,R1\n\n\nP2,R2\n", fmt="csv")[0]["Line"])
+        ndjson_lines = list(read_records(b'{"patient": "P1", "rcode": "R1"}\n\n\n{"patient": "P2", "rcode": "R2"}\n',
+                                         fmt="ndjson")[0]["Line"])
+        self.assertEqual(csv_lines, [2, 5])
+        self.assertEqual(ndjson_lines, [1, 4])
+
+    def test_dry_run_inserts_nothing(self):
+        summary = ingest_records(self.conn, CSV, dry_run=True)
+        self.assertEqual((summary["Inserted"], summary["Chunks"], summary["Rejected"]), (0, 0, 6))
+        self.assertEqual(len(self.rows()), 1)
+
+    def test_chunked_transactions(self):
+        csv = "Patient ID,R code\n" + "".join(f"P{i},R208\n" for i in range(25))
+        summary = ingest_records(self.conn, csv, chunk_size=10)
+        self.assertEqual((summary["Inserted"], summary["Chunks"]), (25, 3))
+        self.assertFalse(self.conn.in_transaction)
+
+    def test_failed_chunk_is_rolled_back(self):
+        rows = [(f"P{i}", 635, "R208", 2.5, "2024-01-01") for i in range(10)]
+        rows[7] = ("P7", 635, "R208")  # wrong number of bindings
+        inserted, chunks, error = insert_records(self.conn, rows, chunk_size=5)
+        self.assertEqual((inserted, chunks), (5, 1))
+        self.assertIsNotNone(error)
+        self.assertEqual(len(self.rows()), 6)
+
+    def test_unreadable_uploads(self):
+        with self.assertRaises(IngestError):
+            read_records("Name,Panel\nx,y\n", "csv")
+        with self.assertRaises(IngestError):
+            read_records("", "xml")
+        frame, rejected = read_records(b"", "auto")
+        self.assertEqual((len(frame), rejected), (0, []))
+        valid, invalid = validate_records(frame, panel_map(self.conn))
+        self.assertEqual((len(valid), invalid), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,258 @@
+import unittest
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import urlsplit, parse_qs
+from vimmo.db.migrations import run_migrations
+from vimmo.db import scheduled_update
+
+"""
+test_scheduled_update.py - Test Suite for the scheduled PanelApp updater
+
+Runs the updater against a local fake PanelApp (signedoff pages + per-panel gene downloads) and an
+in-memory database built by the migration runner.
+"""
+
+PAGE_SIZE = 3
+
+# Panel id -> (R code, latest version, genes as (HGNC_ID, confidence))
+FAKE_PANELS = {
+    1: ("R1", 2.0, [("HGNC:10", "3"), ("HGNC:11", "3")]),   # changed (1.0 in the database)
+    2: ("R2", 1.0, [("HGNC:20", "3")]),                      # unchanged
+    3: ("R3", 1.5, [("HGNC:30", "2"), ("HGNC:31", "3")]),   # new
+    4: ("R4", 3.0, [("HGNC:40", "3")]),                      # changed, but its gene download fails
+    5: ("R5", 1.0, [("HGNC:50", "1")]),                      # new
+    6: ("R6", 1.0, [("HGNC:60", "3")]),                      # unchanged
+    7: ("R7", 4.0, [("HGNC:70", "3")]),                      # new, on the last page
+}
+
+
+class FakePanelAppHandler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    paths = []
+    in_flight = 0
+    max_in_flight = 0
+
+    def reply(self, status, body):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        cls = FakePanelAppHandler
+        with cls.lock:
+            cls.paths.append(self.path)
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(0.05)  # round-trip time
+            url = urlsplit(self.path)
+            query = parse_qs(url.query)
+            base = f"http://{self.headers['Host']}/api/v1/panels"
+            if url.path == "/api/v1/panels/signedoff/":
+                page = int(query["page"][0])
+                ids = sorted(FAKE_PANELS)[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+                has_next = page * PAGE_SIZE < len(FAKE_PANELS)
+                self.reply(200, {
+                    "count": len(FAKE_PANELS),
+                    "next": f"{base}/signedoff/?display=latest&page={page + 1}" if has_next else None,
+                    "results": [{"id": i, "version": str(FAKE_PANELS[i][1]),
+                                 "relevant_disorders": ["A worded description", FAKE_PANELS[i][0]]} for i in ids],
+                })
+            else:
+                panel_id = int(url.path.strip("/").split("/")[-1])
+                if panel_id == 4:
+                    self.reply(404, {"detail": "Not found."})
+                    return
+                _, version, genes = FAKE_PANELS[panel_id]
+                self.assertVersion(query, version)
+                self.reply(200, {"id": panel_id, "genes": [
+                    {"gene_data": {"hgnc_id": hgnc_id}, "confidence_level": confidence} for hgnc_id, confidence in genes
+                ]})
+        finally:
+            with cls.lock:
+                cls.in_flight -= 1
+
+    def assertVersion(self, query, version):
+        assert float(query["version"][0]) == version
+
+    def log_message(self, *args):
+        pass
+
+
+class TestScheduledUpdate(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), FakePanelAppHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/api/v1/panels"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        FakePanelAppHandler.paths = []
+        FakePanelAppHandler.max_in_flight = 0
+        self.conn = sqlite3.connect(":memory:")
+        self.conn.row_factory = sqlite3.Row
+        run_migrations(self.conn)
+        self.conn.executescript('''
+            INSERT INTO panel VALUES (1, 'R1', 1.0), (2, 'R2', 1.0), (4, 'R4', 2.0), (6, 'R6', 1.0);
+            INSERT INTO panel_genes VALUES (1, 'HGNC:10', 2), (1, 'HGNC:12', 3), (2, 'HGNC:20', 3),
+                                           (4, 'HGNC:40', 3), (6, 'HGNC:60', 3);
+        ''')
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_extract_rcodes(self):
+        self.assertEqual(scheduled_update.extract_rcodes(["R45", "Not an R code", "R21.5", "R1x"]), ["R45", "R21.5"])
+
+    def test_fetch_latest_versions_fetches_every_page(self):
+        latest_versions = scheduled_update.fetch_latest_versions(f"{self.base_url}/signedoff/?display=latest&page=1")
+
+        self.assertEqual(latest_versions, [[i, FAKE_PANELS[i][0], FAKE_PANELS[i][1]] for i in sorted(FAKE_PANELS)])
+        pages = sorted(path for path in FakePanelAppHandler.paths if "signedoff" in path)
+        self.assertEqual(len(pages), 3)
+
+    def test_update_or_insert_panel_versions(self):
+        latest_versions = scheduled_update.fetch_latest_versions(f"{self.base_url}/signedoff/?display=latest&page=1")
+        with self.assertLogs(level="INFO") as logs:
+            updated = scheduled_update.update_or_insert_panel_versions(self.conn.cursor(), latest_versions,
+                                                                       base_url=self.base_url)
+        self.conn.commit()
+        self.assertTrue(updated)
+
+        versions = dict(self.conn.execute("SELECT Panel_ID, Version FROM panel").fetchall())
+        self.assertEqual(versions, {1: 2.0, 2: 1.0, 3: 1.5, 4: 2.0, 5: 1.0, 6: 1.0, 7: 4.0})
+
+        genes = {}
+        for panel_id, hgnc_id, confidence in self.conn.execute("SELECT Panel_ID, HGNC_ID, Confidence FROM panel_genes"):
+            genes.setdefault(panel_id, {})[hgnc_id] = int(confidence)
+        self.assertEqual(genes[1], {"HGNC:10": 3, "HGNC:11": 3})
+        self.assertEqual(genes[3], {"HGNC:30": 2, "HGNC:31": 3})
+        self.assertEqual(genes[4], {"HGNC:40": 3})  # download failed: left as it was
+        self.assertEqual(genes[7], {"HGNC:70": 3})
+
+        archive = self.conn.execute("SELECT Panel_ID, HGNC_ID, Version, Confidence FROM panel_genes_archive").fetchall()
+        self.assertEqual(sorted(tuple(row) for row in archive), [(1, "HGNC:10", 1.0, 2), (1, "HGNC:12", 1.0, 3)])
+
+        # only new and changed panels are downloaded, unchanged ones are not
+        downloaded = {int(path.split("/")[4]) for path in FakePanelAppHandler.paths if "version=" in path}
+        self.assertEqual(downloaded, {1, 3, 4, 5, 7})
+        self.assertGreater(FakePanelAppHandler.max_in_flight, 1)
+        self.assertTrue(any("panels/s" in message for message in logs.output))
+        self.assertTrue(any("Skipping 1 panels" in message for message in logs.output))
+
+    def test_no_changes(self):
+        latest_versions = [[2, "R2", 1.0], [6, "R6", 1.0]]
+        self.assertFalse(scheduled_update.update_or_insert_panel_versions(self.conn.cursor(), latest_versions,
+                                                                          base_url=self.base_url))
+        self.assertEqual(FakePanelAppHandler.paths, [])
+
+    def test_gene_downloads_run_concurrently(self):
+        panels = [(i, FAKE_PANELS[i][1]) for i in (1, 2, 3, 5, 6, 7)]
+        started = time.perf_counter()
+        genes, failed = scheduled_update.fetch_panels_genes(panels, base_url=self.base_url, max_workers=6)
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(failed, [])
+        self.assertEqual(set(genes), {1, 2, 3, 5, 6, 7})
+        self.assertLess(elapsed, 6 * 0.05)  # serial downloads would take at least 6 round trips
+
+    def run_update(self, **kwargs):
+        return scheduled_update.run_journaled_update(
+            self.conn, f"{self.base_url}/signedoff/?display=latest&page=1", base_url=self.base_url, **kwargs)
+
+    def journal(self):
+        return {row["Panel_ID"]: (row["State"], row["Fetched_Version"], row["Applied_Version"])
+                for row in self.conn.execute("SELECT * FROM update_journal")}
+
+    def test_journaled_update(self):
+        run = self.run_update(batch_size=2)
+        self.assertEqual(run["Status"], "completed")
+        self.assertEqual((run["Listed"], run["Changed"], run["New"], run["Skipped"]), (7, 2, 3, 0))
+        self.assertEqual((run["Applied"], run["Failed"], run["Batches"]), (4, 1, 3))
+        for timing in ("Crawl_Seconds", "Download_Seconds", "Apply_Seconds", "Total_Seconds"):
+            self.assertGreater(run[timing], 0)
+
+        versions = dict(self.conn.execute("SELECT Panel_ID, Version FROM panel").fetchall())
+        self.assertEqual(versions, {1: 2.0, 2: 1.0, 3: 1.5, 4: 2.0, 5: 1.0, 6: 1.0, 7: 4.0})
+        journal = self.journal()
+        self.assertEqual(journal[1], ("applied", 2.0, 2.0))
+        self.assertEqual(journal[2], ("unchanged", 1.0, 1.0))
+        self.assertEqual(journal[4], ("failed", 3.0, None))
+
+        changes = sorted(tuple(row) for row in self.conn.execute(
+            "SELECT Panel_ID, From_Version, To_Version, HGNC_ID, Change FROM panel_gene_changes"))
+        self.assertEqual(changes, [(1, 1.0, 2.0, "HGNC:10", "confidence"), (1, 1.0, 2.0, "HGNC:11", "added"),
+                                   (1, 1.0, 2.0, "HGNC:12", "removed")])
+        self.assertEqual(scheduled_update.fetch_gene_changes(self.conn.cursor(), 1, 1.0),
+                         ([("HGNC:11", 3)], [("HGNC:12", 3)], [("HGNC:10", 2, 3)]))
+        self.assertEqual(scheduled_update.recent_runs(self.conn)[0]["Run_ID"], run["Run_ID"])
+
+    def test_interrupted_run_resumes(self):
+        fetch = scheduled_update.fetch_panels_genes
+        calls = []
+
+        def fail_second_batch(*args, **kwargs):
+            calls.append(args[0])
+            if len(calls) == 2:
+                raise ConnectionError("network down")
+            return fetch(*args, **kwargs)
+
+        with patch.object(scheduled_update, "fetch_panels_genes", side_effect=fail_second_batch):
+            with self.assertRaises(ConnectionError):
+                self.run_update(batch_size=2)
+        run = scheduled_update.recent_runs(self.conn)[0]
+        self.assertEqual((run["Status"], run["Applied"], run["Batches"]), ("failed", 2, 1))
+        self.assertEqual(self.conn.execute("SELECT Version FROM panel WHERE Panel_ID = 1").fetchone()[0], 2.0)
+
+        FakePanelAppHandler.paths = []
+        resumed = self.run_update(batch_size=2)
+        self.assertEqual(resumed["Run_ID"], run["Run_ID"])
+        self.assertEqual((resumed["Status"], resumed["Applied"], resumed["Failed"]), ("completed", 4, 1))
+        self.assertFalse(any("signedoff" in path for path in FakePanelAppHandler.paths))  # no new crawl
+        downloaded = {int(path.split("/")[4]) for path in FakePanelAppHandler.paths if "version=" in path}
+        self.assertEqual(downloaded, {4, 5, 7})  # the first batch (1, 3) is not downloaded again
+        self.assertEqual(dict(self.conn.execute("SELECT Panel_ID, Version FROM panel").fetchall())[7], 4.0)
+
+    def test_recently_confirmed_panels_are_skipped(self):
+        self.run_update()
+        FakePanelAppHandler.paths = []
+        run = self.run_update(recheck_after=timedelta(hours=1))
+        self.assertEqual((run["Status"], run["Skipped"], run["Changed"], run["Failed"]), ("completed", 6, 1, 1))
+        downloaded = {int(path.split("/")[4]) for path in FakePanelAppHandler.paths if "version=" in path}
+        self.assertEqual(downloaded, {4})
+
+        self.conn.execute("UPDATE update_journal SET State = 'unchanged', Confirmed_At = ? WHERE Panel_ID = 4",
+                          (datetime.now().isoformat(timespec="seconds"),))
+        self.conn.commit()
+        FakePanelAppHandler.paths = []
+        run = self.run_update(recheck_after=timedelta(hours=1))
+        self.assertEqual(run["Status"], "skipped")
+        self.assertEqual(FakePanelAppHandler.paths, [])
+
+    def test_recently_confirmed_panels_are_still_compared(self):
+        self.run_update()
+        FakePanelAppHandler.paths = []
+        with patch.dict(FAKE_PANELS, {2: ("R2", 1.5, [("HGNC:20", "3"), ("HGNC:21", "2")])}):
+            run = self.run_update(recheck_after=timedelta(hours=1))
+        self.assertEqual((run["Status"], run["Skipped"], run["Changed"], run["Applied"]), ("completed", 5, 2, 1))
+        self.assertEqual(self.journal()[2], ("applied", 1.5, 1.5))
+        self.assertEqual(self.conn.execute("SELECT Version FROM panel WHERE Panel_ID = 2").fetchone()[0], 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -35,12 +35,16 @@ circular import issues while maintaining proper test isolation.
 """
 
 import unittest
+import random
+import time
 from unittest.mock import patch, mock_open, MagicMock, call
 from io import BytesIO
+from urllib.parse import unquote
 import pandas as pd
 # Use patch to mock the imports
 with patch('vimmo.API.app'):  # Ensures Flask/DB init order
     from vimmo.utils.variantvalidator import VarValClient, VarValAPIError
+from vimmo.utils.http_transport import DEFAULT_TIMEOUT
 
 
 
@@ -65,7 +69,7 @@ class TestVarValClient(unittest.TestCase):
         """
         self.client = VarValClient()
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_check_response_success(self, mock_get):
         """
         Test successful API response handling.
@@ -77,7 +81,7 @@ class TestVarValClient(unittest.TestCase):
         result = self.client._check_response("test_url")
         self.assertEqual(result, {"test": "data"})
 
-    @patch('requests.get', side_effect=Exception("Connection failed"))
+    @patch('requests.Session.get', side_effect=Exception("Connection failed"))
     def test_check_response_connection_error(self, mock_get):
         """
         Test handling of connection failures.
@@ -87,7 +91,7 @@ class TestVarValClient(unittest.TestCase):
             self.client._check_response("test_url")
         self.assertIn("Failed to connect", str(context.exception))
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_check_response_non_200(self, mock_get):
         """
         Test handling of non-200 status codes.
@@ -172,11 +176,31 @@ class TestVarValClient(unittest.TestCase):
             (float('inf'), float('1'), float('inf'))
         )
 
-    @patch('requests.get')
+    def test_sort_order_matches_custom_sort(self):
+        """
+        The vectorised sort_order must give the same (stable) order as sorting rows by custom_sort,
+        including the NoRecord/Error rows, which stay last in the order they were parsed in.
+        """
+        rng = random.Random(7)
+        chroms = [f"chr{i}" for i in range(1, 24)] + ['chrX', 'chrY', 'chrMT', 'chrUn', 'chr', '', 'NoRecord', 'Error']
+        rows = []
+        for i in range(2000):
+            chrom = rng.choice(chroms)
+            if chrom in ('NoRecord', 'Error'):
+                rows.append({'chrom': chrom, 'start': chrom, 'end': chrom, 'name': f"G{i}_{chrom}"})
+            else:
+                start = rng.choice([rng.randint(1, 50), str(rng.randint(1, 50)), 'Error', ''])
+                rows.append({'chrom': chrom, 'start': start, 'end': rng.randint(1, 5), 'name': f"G{i}"})
+        test_data = pd.DataFrame(rows)
+
+        expected = sorted(range(len(rows)), key=lambda i: self.client.custom_sort(test_data.iloc[i]))
+        self.assertEqual(list(self.client.sort_order(test_data)), expected)
+
+    @patch('requests.Session.get')
     def test_get_gene_data_success(self, mock_get):
         """
         Test successful retrieval of gene data via get_gene_data.
-        Mocks requests.get to return a successful response.
+        Mocks the pooled session's get to return a successful response.
         """
         mock_response_data = [{"mock": "gene_data"}]
         mock_get.return_value.ok = True
@@ -210,12 +234,12 @@ class TestVarValClient(unittest.TestCase):
 
         # Check only the function calls, ignoring the call().json() part
         expected_calls = [
-            unittest.mock.call(expected_url_brca),
-            unittest.mock.call(expected_url_hgnc),
+            unittest.mock.call(expected_url_brca, timeout=DEFAULT_TIMEOUT),
+            unittest.mock.call(expected_url_hgnc, timeout=DEFAULT_TIMEOUT),
         ]
         self.assertEqual(mock_get.call_args_list, expected_calls)
 
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_get_gene_data_non_200(self, mock_get):
         """
         Test get_gene_data raises VarValAPIError when the API returns non-200.
@@ -260,7 +284,7 @@ class TestVarValClient(unittest.TestCase):
     @patch('builtins.open', new_callable=mock_open, read_data="")
     @patch('vimmo.utils.variantvalidator.Query')
     @patch('vimmo.utils.variantvalidator.get_db')
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_parse_to_bed_success(self, mock_get, mock_get_db, mock_query_cls, mock_file):
         """
         Test parse_to_bed outputs valid BED content from the API data.
@@ -376,7 +400,7 @@ class TestVarValClient(unittest.TestCase):
     @patch('builtins.open', new_callable=mock_open, read_data="")
     @patch('vimmo.utils.variantvalidator.Query')
     @patch('vimmo.utils.variantvalidator.get_db')
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_parse_to_bed_missing_transcripts(self, mock_get, mock_get_db, mock_query_cls, mock_file):
         """
         Tests handling of API responses where the transcripts array is empty or missing.
@@ -397,7 +421,7 @@ class TestVarValClient(unittest.TestCase):
         4. Verify correct formatting of "NoRecord" entry
         
         Args:
-            mock_get: Mocked requests.get function
+            mock_get: Mocked requests.Session.get function
             mock_get_db: Mocked database connection
             mock_query_cls: Mocked Query class
             mock_file: Mocked file operations
@@ -434,7 +458,7 @@ class TestVarValClient(unittest.TestCase):
     @patch('builtins.open', new_callable=mock_open, read_data="")
     @patch('vimmo.utils.variantvalidator.Query')
     @patch('vimmo.utils.variantvalidator.get_db')
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_parse_to_bed_api_error_response(self, mock_get, mock_get_db, mock_query_cls, mock_file):
         """
         Tests handling of API error responses where the server returns an error message
@@ -461,7 +485,7 @@ class TestVarValClient(unittest.TestCase):
         4. Verify error handling in output
         
         Args:
-            mock_get: Mocked requests.get function
+            mock_get: Mocked requests.Session.get function
             mock_get_db: Mocked database connection
             mock_query_cls: Mocked Query class
             mock_file: Mocked file operations
@@ -510,7 +534,7 @@ class TestVarValClient(unittest.TestCase):
     @patch('builtins.open', new_callable=mock_open, read_data="")
     @patch('vimmo.utils.variantvalidator.Query')
     @patch('vimmo.utils.variantvalidator.get_db')
-    @patch('requests.get')
+    @patch('requests.Session.get')
     def test_parse_to_bed_missing_genomic_spans(self, mock_get, mock_get_db, mock_query_cls, mock_file):
         """
         Tests behavior when API response contains transcripts without genomic span information.
@@ -531,7 +555,7 @@ class TestVarValClient(unittest.TestCase):
         4. Verify error handling and output format
         
         Args:
-            mock_get: Mocked requests.get function
+            mock_get: Mocked requests.Session.get function
             mock_get_db: Mocked database connection
             mock_query_cls: Mocked Query class
             mock_file: Mocked file operations
@@ -566,6 +590,116 @@ class TestVarValClient(unittest.TestCase):
         self.assertTrue("Error" in bed_data[0])
 
 
+def fake_varval_response(url, **kwargs):
+    """requests.get side effect answering gene2transcripts_v2 URLs with one exon per requested gene."""
+    genes = unquote(url).split("/")[-4].split("|")
+    response = MagicMock()
+    response.ok = True
+    response.json.return_value = [
+        {
+            "requested_symbol": gene,
+            "current_symbol": f"SYM{gene.split(':')[-1]}",
+            "transcripts": [{
+                "reference": f"NM_{gene.split(':')[-1]}",
+                "annotations": {"chromosome": str(int(gene.split(':')[-1]) % 3 + 1)},
+                "genomic_spans": {"NC_1": {"orientation": 1, "exon_structure": [
+                    {"exon_number": 1, "genomic_start": 1000 * int(gene.split(':')[-1]), "genomic_end": 1000 * int(gene.split(':')[-1]) + 100}
+                ]}}
+            }]
+        }
+        for gene in genes
+    ]
+    return response
+
+
+class TestVarValChunking(unittest.TestCase):
+    """
+    Test suite for the chunked (fan-out) mode of VarValClient.get_gene_data.
+    """
+
+    def setUp(self):
+        self.genes = [f"HGNC:{i}" for i in range(1, 11)]
+        self.client = VarValClient(chunk_size=3, max_workers=2, chunk_retries=1, retry_backoff=0)
+
+    def requested_chunks(self, mock_get):
+        return [unquote(c.args[0]).split("/")[-4].split("|") for c in mock_get.call_args_list]
+
+    @patch('requests.Session.get', side_effect=fake_varval_response)
+    def test_gene_set_is_split_into_chunks(self, mock_get):
+        records = self.client.get_gene_data("|".join(self.genes))
+
+        chunks = self.requested_chunks(mock_get)
+        self.assertEqual(len(chunks), 4)
+        self.assertTrue(all(len(chunk) <= 3 for chunk in chunks))
+        self.assertEqual(sorted(gene for chunk in chunks for gene in chunk), sorted(self.genes))
+        # records are merged back in query order
+        self.assertEqual([record["requested_symbol"] for record in records], self.genes)
+
+    @patch('requests.Session.get', side_effect=fake_varval_response)
+    def test_small_queries_are_not_split(self, mock_get):
+        self.client.get_gene_data("HGNC:1|HGNC:2")
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('requests.Session.get')
+    def test_failed_chunk_is_retried_alone(self, mock_get):
+        failures = []
+
+        def flaky(url, **kwargs):
+            if "HGNC%3A4" in url and not failures:
+                failures.append(url)
+                raise ConnectionError("reset by peer")
+            return fake_varval_response(url)
+        mock_get.side_effect = flaky
+
+        records = self.client.get_gene_data("|".join(self.genes))
+
+        chunks = self.requested_chunks(mock_get)
+        self.assertEqual(len(chunks), 5)  # 4 chunks + 1 retry
+        self.assertEqual(sum(1 for chunk in chunks if "HGNC:4" in chunk), 2)
+        self.assertEqual(len(records), len(self.genes))
+
+    @patch('requests.Session.get')
+    def test_chunk_failing_every_attempt_raises(self, mock_get):
+        def always_failing(url, **kwargs):
+            if "HGNC%3A4" in url:
+                raise ConnectionError("reset by peer")
+            return fake_varval_response(url)
+        mock_get.side_effect = always_failing
+
+        with self.assertRaises(VarValAPIError):
+            self.client.get_gene_data("|".join(self.genes))
+        self.assertEqual(sum(1 for chunk in self.requested_chunks(mock_get) if "HGNC:4" in chunk), 2)
+
+    @patch('requests.Session.get')
+    def test_chunk_timeout_bounds_the_retries(self, mock_get):
+        def always_failing(url, **kwargs):
+            if "HGNC%3A4" in url:
+                raise ConnectionError("reset by peer")
+            return fake_varval_response(url)
+        mock_get.side_effect = always_failing
+        client = VarValClient(chunk_size=3, max_workers=2, chunk_retries=2, retry_backoff=1, chunk_timeout=0.5)
+
+        started = time.perf_counter()
+        with self.assertRaises(VarValAPIError):
+            client.get_gene_data("|".join(self.genes))
+        self.assertLess(time.perf_counter() - started, 0.5)  # the 1 s backoff would overrun the chunk timeout
+        self.assertEqual(sum(1 for chunk in self.requested_chunks(mock_get) if "HGNC:4" in chunk), 1)
+        self.assertTrue(all(c.kwargs["timeout"][1] <= 0.5 for c in mock_get.call_args_list))
+        self.assertEqual(client.transport.without_retries().retries, 0)
+
+    @patch('builtins.open', new_callable=mock_open, read_data="")
+    @patch('requests.Session.get', side_effect=fake_varval_response)
+    def test_parse_to_bed_merges_chunks_into_one_sorted_bed(self, mock_get, mock_file):
+        chunked_bed = self.client.parse_to_bed(gene_query=self.genes).read().decode('utf-8')
+        single_bed = VarValClient().parse_to_bed(gene_query=self.genes).read().decode('utf-8')
+
+        self.assertGreater(mock_get.call_count, 2)
+        self.assertEqual(chunked_bed, single_bed)
+        rows = [line.split('\t') for line in chunked_bed.strip().split('\n')]
+        self.assertEqual(len(rows), len(self.genes))
+        keys = [(int(row[0][3:]), int(row[1])) for row in rows]
+        self.assertEqual(keys, sorted(keys))
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,182 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+from unittest.mock import patch
+from vimmo.utils.varval_cache import VarValCache
+# Same Flask/DB init order as test_variant_validator.py
+with patch('vimmo.API.app'):
+    from vimmo.utils.variantvalidator import VarValClient
+
+"""
+test_varval_cache.py - Test Suite for the VariantValidator response cache
+
+VarValClient talks to a local stub of the gene2transcripts_v2 endpoint, which records the genes
+requested on every call:
+- TestVarValCache: the cache on its own (TTL, LRU caps, parameter sets)
+- TestCachedVarValClient: hits, misses and expiry through VarValClient.get_gene_data
+"""
+
+
+class StubVarValHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_GET(self):
+        # /gene2transcripts_v2/<genes>/<limit_transcripts>/<transcript_set>/<genome_build>
+        genes, limit_transcripts, transcript_set, genome_build = unquote(self.path).split("/")[-4:]
+        genes = genes.split("|")
+        StubVarValHandler.requests_seen.append(genes)
+        body = []
+        for gene in genes:
+            if gene == "BROKEN":
+                body.append({"error": "Unable to retrieve data from the VVTA", "requested_symbol": gene})
+            else:
+                body.append({"requested_symbol": gene, "current_symbol": gene.replace("HGNC:", "SYM"),
+                             "transcripts": [{"reference": f"NM_{genome_build}", "annotations": {"chromosome": "1"},
+                                              "genomic_spans": {}}]})
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestVarValCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "varval_cache.db")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip_and_persistence(self):
+        cache = VarValCache(self.path)
+        cache.put_many({"HGNC:1": {"current_symbol": "A"}}, "GRCh38", "all", "mane_select")
+        cache.close()
+
+        reopened = VarValCache(self.path)
+        self.assertEqual(reopened.get_many(["HGNC:1", "HGNC:2"], "GRCh38", "all", "mane_select"),
+                         {"HGNC:1": {"current_symbol": "A"}})
+        self.assertEqual(reopened.stats()["hits"], 1)
+        self.assertEqual(reopened.stats()["misses"], 1)
+        reopened.close()
+
+    def test_parameter_sets_are_keyed_separately(self):
+        cache = VarValCache(self.path)
+        cache.put_many({"HGNC:1": {"build": 38}}, "GRCh38", "all", "mane_select")
+        self.assertEqual(cache.get_many(["HGNC:1"], "GRCh37", "all", "mane_select"), {})
+        self.assertEqual(cache.get_many(["HGNC:1"], "GRCh38", "refseq", "mane_select"), {})
+        self.assertEqual(cache.get_many(["HGNC:1"], "GRCh38", "all", "mane"), {})
+        self.assertEqual(cache.get_many(["HGNC:1"], "GRCh38", "all", "mane_select"), {"HGNC:1": {"build": 38}})
+        cache.close()
+
+    def test_ttl(self):
+        cache = VarValCache(self.path, ttl=0.05)
+        cache.put_many({"HGNC:1": {}}, "GRCh38", "all", "mane_select")
+        time.sleep(0.1)
+        self.assertEqual(cache.get_many(["HGNC:1"], "GRCh38", "all", "mane_select"), {})
+        self.assertEqual(cache.stats()["expired"], 1)
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.close()
+
+    def test_lru_entry_cap(self):
+        cache = VarValCache(self.path, max_entries=2)
+        cache.put_many({"HGNC:1": {}}, "GRCh38", "all", "mane_select")
+        time.sleep(0.01)
+        cache.put_many({"HGNC:2": {}}, "GRCh38", "all", "mane_select")
+        time.sleep(0.01)
+        cache.get_many(["HGNC:1"], "GRCh38", "all", "mane_select")  # HGNC:2 is now least recently used
+        time.sleep(0.01)
+        cache.put_many({"HGNC:3": {}}, "GRCh38", "all", "mane_select")
+
+        self.assertEqual(set(cache.get_many(["HGNC:1", "HGNC:2", "HGNC:3"], "GRCh38", "all", "mane_select")),
+                         {"HGNC:1", "HGNC:3"})
+        self.assertEqual(cache.stats()["evictions"], 1)
+        cache.close()
+
+    def test_lru_byte_cap(self):
+        cache = VarValCache(self.path, max_bytes=1)
+        cache.put_many({"HGNC:1": {"x": "y"}}, "GRCh38", "all", "mane_select")
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.close()
+
+
+class TestCachedVarValClient(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), StubVarValHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/gene2transcripts_v2"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        StubVarValHandler.requests_seen = []
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache = VarValCache(os.path.join(self.tmp_dir.name, "varval_cache.db"))
+        self.client = VarValClient(base_url=self.base_url, cache=self.cache)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp_dir.cleanup()
+
+    def test_miss_then_hit(self):
+        first = self.client.get_gene_data("HGNC:1|HGNC:2")
+        second = self.client.get_gene_data("HGNC:1|HGNC:2")
+
+        self.assertEqual(StubVarValHandler.requests_seen, [["HGNC:1", "HGNC:2"]])
+        self.assertEqual(first, second)
+        self.assertEqual([record["requested_symbol"] for record in second], ["HGNC:1", "HGNC:2"])
+
+    def test_only_misses_go_to_the_network(self):
+        self.client.get_gene_data("HGNC:1|HGNC:2")
+        records = self.client.get_gene_data("HGNC:2|HGNC:3|HGNC:1")
+
+        self.assertEqual(StubVarValHandler.requests_seen, [["HGNC:1", "HGNC:2"], ["HGNC:3"]])
+        self.assertEqual(sorted(record["requested_symbol"] for record in records), ["HGNC:1", "HGNC:2", "HGNC:3"])
+
+    def test_builds_are_cached_separately(self):
+        self.client.get_gene_data("HGNC:1", genome_build="GRCh38")
+        records = self.client.get_gene_data("HGNC:1", genome_build="GRCh37")
+
+        self.assertEqual(len(StubVarValHandler.requests_seen), 2)
+        self.assertEqual(records[0]["transcripts"][0]["reference"], "NM_GRCh37")
+
+    def test_expired_records_are_refetched(self):
+        self.cache.ttl = 0.05
+        self.client.get_gene_data("HGNC:1")
+        time.sleep(0.1)
+        self.client.get_gene_data("HGNC:1")
+
+        self.assertEqual(StubVarValHandler.requests_seen, [["HGNC:1"], ["HGNC:1"]])
+
+    def test_error_records_are_not_cached(self):
+        records = self.client.get_gene_data("BROKEN|HGNC:1")
+        self.assertIn("error", records[0])
+        self.client.get_gene_data("BROKEN|HGNC:1")
+
+        self.assertEqual(StubVarValHandler.requests_seen, [["BROKEN", "HGNC:1"], ["BROKEN"]])
+
+    def test_uncached_client_is_unchanged(self):
+        client = VarValClient(base_url=self.base_url)
+        client.get_gene_data("HGNC:1")
+        client.get_gene_data("HGNC:1")
+        self.assertEqual(len(StubVarValHandler.requests_seen), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,26 +1,55 @@
 from flask import Flask, g
 from flask_restx import Api
-from vimmo.db.db import Database
+from vimmo.db.db import ConnectionPool
+from vimmo.db.panel_catalogue import panel_catalogue
+from vimmo.utils.panelapp import panel_version_cache
+from vimmo.db.panel_refresher import PanelRefresher
+from vimmo.logger.logging_config import logger
+import threading
 
 app = Flask(__name__)
 api = Api(app=app)
 
+# Process-wide connection pool, created on first use so the database path is only resolved once
+_pool = None
+_pool_lock = threading.Lock()
 
-def get_db():
-    # If a database connection does not exist in the current request context, create one
-    if 'db' not in g:
-        g.db = Database()
-        g.db.connect()
-    return g.db
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+# Keeps the panels behind recent /patient queries up to date in the background (vimmo/db/panel_refresher.py)
+panel_refresher = PanelRefresher(connect=lambda write=False: get_pool().lease(write=write), autostart=True)
+
+
+def get_db(write=False):
+    # If a pooled connection has not been leased in the current request context, lease one
+    # Read-only requests share the reader pool, requests that modify the database take the single writer
+    key = 'db_writer' if write else 'db'
+    if key not in g:
+        setattr(g, key, get_pool().lease(write=write))
+    return g.get(key)
 
 @app.teardown_appcontext
 def shutdown_session(exception=None):
-    try:
-        db = g.pop('db', None)
-        if db is not None:
-            db.close()
-    except:
-        print("db connection should have been closed in the application contextbut fialed to close ", "Error mode =" )
+    for key in ('db', 'db_writer'):
+        try:
+            db = g.pop(key, None)
+            if db is not None:
+                db.close()
+        except Exception as err:
+            logger.error(f"db connection should have been returned to the pool in the application context but failed: {err}")
+    if _pool is not None:
+        logger.debug(f"Connection pool stats: {_pool.stats()}")
+    logger.debug(f"Panel catalogue stats: {panel_catalogue.stats()}")
+    logger.debug(f"PanelApp version cache stats: {panel_version_cache.stats()}")
+    logger.debug(f"Panel refresher stats: {panel_refresher.stats()}")
 
 # Import the routes to register them
 from vimmo.API import endpoints
\ No newline at end of file
@@ -2,25 +2,36 @@ from vimmo.logger.logging_config import logger
 import sys
 
 try:
-    from flask import send_file
+    from flask import request
     from flask_restx import Resource
-    from vimmo.API import api,get_db
+    from vimmo.API import api,get_db,panel_refresher
     from vimmo.utils.endpoint_process_func import bed_processor
     from vimmo.db.db_query import Query
+    from vimmo.db.panel_catalogue import panel_catalogue
+    from vimmo.db.exon_store import exon_stores
+    from vimmo.db.interval_index import region_indexes
+    from vimmo.db.panel_refresher import freshness_disclaimer
     from vimmo.db.db_update import Update
     from vimmo.db.db_downgrade import Downgrade
-    from vimmo.utils.panelapp import  PanelAppClient
+    from vimmo.db.patient_ingest import ingest_records, IngestError
+    from vimmo.utils.panelapp import  PanelAppClient, PanelAppAPIError, panel_version_cache
     from vimmo.utils.variantvalidator import VarValClient, VarValAPIError
-    from vimmo.utils.localbed import local_bed_formatter
-    from vimmo.utils.arg_validator import validate_panel_id_or_Rcode_or_hgnc, hgnc_to_list, patient_update_validator
+    from vimmo.utils.varval_cache import varval_cache
+    from vimmo.utils.localbed import local_bed_stream, merged_bed_stream
+    from vimmo.utils.compression import bed_response, bed_file_response, choose_encoding, encode_stream, file_chunks
+    from vimmo.utils.bed_artefacts import bed_artefacts
+    from vimmo.utils.arg_validator import validate_panel_id_or_Rcode_or_hgnc, hgnc_to_list, patient_update_validator, parse_regions, panel_lists_validator
     from vimmo.utils.parser import (
         IDParser, 
         PatientParser,
         PatientBedParser,
         DownloadParser, 
         UpdateParser, 
+        BulkUpdateParser,
         LocalDownloadParser,
+        BulkLocalDownloadParser,
         PatientLocalBedParser,
+        RegionParser,
         DowngradeParser
     )
     
@@ -75,7 +86,7 @@ class PanelSearch(Resource):
         # Retrieve the database connection
         db = get_db()
         # Initialize a query object with the database connection
-        query = Query(db.conn)
+        query = Query(db.conn, catalogue=panel_catalogue)
         logger.info("DB connection made from panel endpoint")
         
 
@@ -98,8 +109,9 @@ class PanelSearch(Resource):
 
         elif args.get("HGNC_ID"):
             # Fetch panels associated with a specific HGNC_ID with optional similar matches or a using a list
-            panels_returned = query.get_panels_from_gene_list(hgnc_ids=args.get("HGNC_ID"), matches=args.get("Similar_Matches"))
-            logger.debug(f"Args passed to get_panels_from_gene_list func: hgnc_ids={args.get("HGNC_ID")}, matches={args.get("Similar_Matches")}")
+            panels_returned = query.get_panels_from_gene_list(hgnc_ids=args.get("HGNC_ID"), matches=args.get("Similar_Matches"),
+                                                              confidence=args.get('Confidence'))
+            logger.debug(f"Args passed to get_panels_from_gene_list func: hgnc_ids={args.get("HGNC_ID")}, matches={args.get("Similar_Matches")},confidence={args.get('Confidence')}")
             logger.debug(f"Got response: {panels_returned}")
             return panels_returned
             # If no valid parameter is provided, return an error response
@@ -154,7 +166,7 @@ class PanelDownload(Resource):
         # Retrieve the database connection
         db = get_db()
         # Initialize a query object with the database connection
-        query = Query(db.conn)
+        query = Query(db.conn, catalogue=panel_catalogue)
         logger.info("DB connection made from download endpoint")
         
         if not args["HGNC_ID"]:
@@ -176,7 +188,7 @@ class PanelDownload(Resource):
         
 
         # Initialize the VariantValidator client
-        var_val_client = VarValClient()
+        var_val_client = VarValClient(cache=varval_cache, chunk_size=25, max_workers=4)
         logger.info("Variant Validator Client is instantiated in Panel Download space")
 
         try:
@@ -208,13 +220,8 @@ class PanelDownload(Resource):
          # Return the BED file as a downloadable response
         if bed_file:
             logger.info(f"Bed file generated with {filename}")
-            # Return the BED file using send_file
-            return send_file(
-                bed_file,
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=filename
-            )
+            # Stream the BED file, compressed as the request asks
+            return bed_response(file_chunks(bed_file), filename, args.get('Compression', 'auto'))
         else:
             logger.error("error, No BED data could be generated from the provided gene query.")
             return {"error": "No BED data could be generated from the provided gene query."}, 400
@@ -260,7 +267,7 @@ class LocalPanelDownload(Resource):
         # Retrieve the database connection
         db = get_db()
         # Initialize a query object with the database connection
-        query = Query(db.conn)
+        query = Query(db.conn, catalogue=panel_catalogue, exon_stores=exon_stores)
         logger.info("DB connection made from local bed endpoint")
 
         if not HGNC_ID:
@@ -275,14 +282,10 @@ class LocalPanelDownload(Resource):
         
         logger.info(f"Gene HGNC List for creating a bed file: {gene_query}")
         genome_build = args.get('genome_build', 'GRCh38')
-        local_bed_records=query.local_bed(gene_query,genome_build)
-        logger.debug(f"query.local_bed({gene_query},{genome_build})")
-        bed_file=local_bed_formatter(local_bed_records)
-        logger.debug(f"local_bed_formatter({local_bed_records})")
-        
-
+        padding = args.get('Padding') or 0
+        if padding < 0:
+            return {"error": "Invalid 'Padding': must be zero or a positive number of bases."}, 400
 
-        db.close()
         # Generate a meaningful filename for the download
         if panel_id:
             filename = f"{panel_id}_{genome_build}_Gencode.bed"
@@ -291,14 +294,31 @@ class LocalPanelDownload(Resource):
         else:
             filename = f"Genes_{genome_build}_Gencode.bed"
 
-        if bed_file:
+        # Whole panels are deterministic for a panel version: serve them from the rendered artefact cache
+        if (panel_id or r_code) and not matches:
+            panels = query.panel_versions(panel_id=panel_id, r_code=r_code)
+            panel_ids = [panel for panel, _ in panels]
+            encoding, content_encoding = choose_encoding(args.get('Compression', 'auto'), request.headers.get("Accept-Encoding"))
+            key = bed_artefacts.make_key(panels, gene_query, genome_build, confidence, padding, encoding,
+                                         exon_stores.get(db.conn, genome_build).fingerprint)
+            path = bed_artefacts.get(panel_ids, key, encoding)
+            if path is None:
+                bed_stream = local_bed_stream(query.local_bed(gene_query, genome_build), padding)
+                if not bed_stream:
+                    return {"error": "No BED data could be generated from the provided gene query."}, 400
+                path = bed_artefacts.store(panel_ids, key, encoding, encode_stream(bed_stream, encoding))
+            if path is not None:
+                logger.info(f"Bed file {filename} served from artefact {path}")
+                return bed_file_response(path, filename, encoding, content_encoding, etag=key[:32])
+
+        local_bed_records=query.local_bed(gene_query,genome_build)
+        logger.debug(f"query.local_bed({gene_query},{genome_build})")
+        bed_stream=local_bed_stream(local_bed_records, padding)
+
+        # The connection stays leased while the BED streams; the teardown handler returns it to the pool
+        if bed_stream:
             logger.info(f"Bed file generated with {filename}")
-            return send_file(
-                bed_file,
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=filename
-            )
+            return bed_response(bed_stream, filename, args.get('Compression', 'auto'))
         else:
             logger.info("Bed was not generated please enable Debug if needed")
             logger.debug(f"{local_bed_records}")
@@ -309,6 +329,123 @@ class LocalPanelDownload(Resource):
     
 
 
+bulk_download_parser=BulkLocalDownloadParser.create_parser()
+@panels_space.route('/download/local/bulk')
+class BulkLocalPanelDownload(Resource):
+    @api.doc(parser=bulk_download_parser)
+    def get(self):
+        """
+        Endpoint to download one BED file covering several panels (e.g. a multi-panel test).
+
+        Query Parameters:
+        - Panel_ID (str): Comma separated Panel_IDs.
+        - Rcode (str): Comma separated Rcodes; may be combined with Panel_ID.
+        - Confidence (str): Gene confidence filter applied to every panel (default: 'All').
+        - genome_build (str): Genome build version (default: 'GRCh38').
+        - Padding (int): Bases added either side of every exon (default: 0).
+        - Merge (bool): Merge overlapping and adjacent exons after padding (default: false).
+
+        Returns:
+        - FileResponse: The exons of the union of the panels' genes, coordinate-sorted. With Merge, a
+          4-column BED of merged intervals and the HGNC IDs they cover.
+        """
+        args = bulk_download_parser.parse_args()
+        try:
+            panel_ids, r_codes = panel_lists_validator(args)
+        except ValueError as e:
+            logger.error(f"error: {str(e)}")
+            return {"error": str(e)}, 400
+
+        db = get_db()
+        query = Query(db.conn, catalogue=panel_catalogue, exon_stores=exon_stores)
+        confidence = args.get("Confidence", 'All')
+        gene_query, unmatched = query.get_gene_lists(panel_ids, r_codes, confidence)
+        if unmatched:
+            logger.info(f"No genes matched for {unmatched}")
+            return {"error": f"No matches found for {', '.join(map(str, unmatched))} with confidence : {confidence}."}, 400
+
+        genome_build = args.get('genome_build', 'GRCh38')
+        padding = args.get('Padding') or 0
+        local_bed_records = query.local_bed(gene_query, genome_build)  # one pass over the exon store, sorted
+        if args.get('Merge'):
+            bed_stream = merged_bed_stream(local_bed_records, padding=padding)
+        else:
+            bed_stream = local_bed_stream(local_bed_records, padding=padding)
+
+        identifiers = [str(value) for value in panel_ids + r_codes]
+        if len(identifiers) > 10:
+            identifiers = identifiers[:10] + [f"and_{len(identifiers) - 10}_more"]
+        filename = f"{'_'.join(identifiers)}_{genome_build}_Gencode{'_merged' if args.get('Merge') else ''}.bed"
+
+        if bed_stream:
+            logger.info(f"Bed file generated with {filename} for {len(gene_query)} genes")
+            return bed_response(bed_stream, filename, args.get('Compression', 'auto'))
+        logger.info("Bed was not generated please enable Debug if needed")
+        return {"error": "No BED data could be generated from the provided panels."}, 400
+
+
+
+
+region_parser=RegionParser.create_parser()
+@panels_space.route('/regions')
+class RegionSearch(Resource):
+    @api.doc(parser=region_parser)
+    def get(self):
+        """
+        Genes, exons and panels overlapping one or more genomic regions.
+
+        Query Parameters:
+        - regions (str): Comma separated 'chrom:start-end' regions, 1-based inclusive.
+        - genome_build (str): Genome build of the coordinates (default: 'GRCh38').
+        - Confidence (str): Only report panels on which the genes have this confidence (default: 'All').
+        - exons (bool): Include the overlapping exons (default: true).
+
+        Returns:
+        - JSON: One entry per region with its genes, exons and panels. Gene and exon coordinates are
+          0-based half-open, as in the BED downloads.
+        """
+        args = region_parser.parse_args()
+        return self.lookup(args.get("regions"), args.get("genome_build"), args.get("Confidence"), args.get("exons"))
+
+    def post(self):
+        """
+        Same lookup for large batches, with a JSON body:
+        {"regions": ["chr17:43044295-43125483", {"chrom": "chr13", "start": 32315507, "end": 32400268}],
+         "genome_build": "GRCh38", "Confidence": "All", "exons": true}
+
+        Region objects are BED intervals (0-based, end exclusive); region strings are 1-based inclusive.
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            return {"error": "Expected a JSON object with a 'regions' list."}, 400
+        genome_build = body.get("genome_build", "GRCh38")
+        confidence = str(body.get("Confidence", "All")).title()
+        if genome_build not in ("GRCh37", "GRCh38"):
+            return {"error": "genome_build must be 'GRCh37' or 'GRCh38'."}, 400
+        if confidence not in ("Green", "Amber", "Red", "All"):
+            return {"error": "Confidence must be one of 'Green', 'Amber', 'Red' or 'All'."}, 400
+        return self.lookup(body.get("regions"), genome_build, confidence, bool(body.get("exons", True)))
+
+    @staticmethod
+    def lookup(regions_value, genome_build, confidence, include_exons):
+        try:
+            regions = parse_regions(regions_value)
+        except ValueError as e:
+            logger.error(f"error: {str(e)}")
+            return {"error": str(e)}, 400
+
+        db = get_db()
+        query = Query(db.conn, catalogue=panel_catalogue)
+        index = region_indexes.get(db.conn, genome_build)
+
+        results = index.overlaps(regions, panel_lookup=lambda hgnc_ids: query.gene_panels(hgnc_ids, confidence=confidence),
+                                 include_exons=include_exons)
+        logger.info(f"Region lookup: {len(regions)} regions on {genome_build}")
+        return {"genome_build": genome_build, "Confidence": confidence, "Regions": results}
+
+
+
+
 patient_space = api.namespace('patient', description='Return a patient panel provided by the user')
 patient_parser = PatientParser.create_parser()
 @patient_space.route("")
@@ -345,11 +482,10 @@ class PatientResource(Resource):
             logger.error(f"Value Error raised by input args {str(e)}")
             return {"error": str(e)}, 400
          
-        db = get_db()  # Fetch the database and connect
+        db = get_db()  # Fetch a read-only database connection; panel updates happen in the background
         logger.info("DB connection made from patient endpoint")
 
-        query = Query(db.conn)
-        update = Update(db.conn)
+        query = Query(db.conn, catalogue=panel_catalogue)
         
         # Return all records for a patient
         if args["R code"] is None:
@@ -370,46 +506,16 @@ class PatientResource(Resource):
         else:
             logger.info(f"Both Patient ID: {args["Patient ID"]} & Rcode: {args["R code"]} provided")
             # Version comparison workflow
-            # Check database version is up to date.
+            # Answer from the database as it stands; the refresher checks PanelApp (and updates the panel
+            # if it has moved on) asynchronously when the last check is older than its interval
             panel_id = query.rcode_to_panelID(args["R code"])  # Convert R code to panel ID.
+            refresh_status = panel_refresher.touch(args["R code"])
+            disclaimer = freshness_disclaimer(refresh_status)
             database_version = query.get_db_latest_version(args["R code"])
-            try:
-                panel_app_client = PanelAppClient()
-                latest_online_version = panel_app_client.get_latest_online_version(panel_id)
-                logger.debug(f"Latest online version retreived: {latest_online_version}")
-            except:
-                # If any error occurs, set latest_online_version to None and create the disclaimer
-                logger.info("Database not updated during query")
-                latest_online_version = None
-                disclaimer = (
-                    "The latest version of PanelApp was unable to be contacted. "
-                    "Results are valid as of the last update date."
-                )
-            else:
-                if database_version != latest_online_version:
-                    logger.info("Differerence between Vimmo db and latest online panel version")
-                    try: # If our local version NOT same as panel app latest, then update database and continue
-                    #  Update the database to match the latest online version.
-                        update.update_panels_version(args["R code"], latest_online_version, panel_id)
-                        logger.info("panel version updated successfully")
-
-                        update.archive_panel_contents(panel_id, database_version)
-                        logger.info(f"{args["R code"]} v{database_version} archived successfully")
-
-                        update.update_gene_contents(args["R code"],panel_id)
-                        logger.info(f"{args['Patient ID']} v{latest_online_version} inserted successfully")
-                        disclaimer = 'Panel comparison up to date'
-                        logger.info(f"UPDATE database - {args['R code']}  {database_version} --> {latest_online_version}")
-                        database_version = query.get_db_latest_version(args["R code"])  # get newly updated database version
-                    except:
-                        logger.warning("Database could not be updated")
-                        disclaimer=f'Database update failed - using most recent db version ({database_version}) for panel comparison ' 
-                else: 
-                # Database is up-to-date; no updates/disclaimers needed.
-                    disclaimer = 'Panel comparison up to date'
+            logger.debug(f"Database version {database_version}, last PanelApp check: {refresh_status}")
             
             
-            # At this point the database should be current and  necessary disclaimers inplace
+            # At this point the disclaimer records how current the database version is
            
             patient_history = query.check_patient_history(args["Patient ID"], args["R code"])  # Returns most recent panel version from db           
             # Check if the patient is in the table
@@ -433,15 +539,17 @@ class PatientResource(Resource):
                  
             else: #  If patient_ID in archive table with outdated version, find the difference between most recent archived panel version & the current panel version contents
                 # Comparison function
-                historic_panel_data = query.historic_panel_retrieval(panel_id,patient_history)              # Retrieve archived version contents
-                current_panel_data = query.current_panel_contents(panel_id)                                 # Retreieve current panel contents
-                version_comparison = query.compare_panel_versions(historic_panel_data,current_panel_data)   # Compare 
+                version_comparison = query.stored_version_comparison(panel_id, patient_history, database_version)  # Stored deltas
+                if version_comparison is None:  # Updates applied before the deltas were stored
+                    historic_panel_data = query.historic_panel_retrieval(panel_id,patient_history)              # Retrieve archived version contents
+                    current_panel_data = query.current_panel_contents(panel_id)                                 # Retreieve current panel contents
+                    version_comparison = query.compare_panel_versions(historic_panel_data,current_panel_data)   # Compare 
                 logger.info("Panel comparison successfully returned")
                 return {"disclaimer": disclaimer,"status": f"Version changed since last {args["Patient ID"]} had {args['R code']}", 
                         "Version":f"{database_version}", 
-                        "Genes added": version_comparison[0], 
-                        "Genes removed": version_comparison[1], 
-                        "Confidence changes (old ver -> new ver)": version_comparison[2]}
+                        "Genes added": version_comparison.added, 
+                        "Genes removed": version_comparison.removed, 
+                        "Confidence changes (old ver -> new ver)": version_comparison.confidence_changed}
             
 
 
@@ -471,7 +579,7 @@ class PatientBed(Resource):
         db = get_db()
         logger.info("DBconnection made from patient bed endpoint")
     
-        query = Query(db.conn)  
+        query = Query(db.conn, catalogue=panel_catalogue)  
         processed_info=bed_processor(query,patient_id,r_code,version,args,logger)
         if processed_info["type"] == "gene_query":
             # Perform additional processing on response["data"]
@@ -482,7 +590,7 @@ class PatientBed(Resource):
         
 
         # Initialize the VariantValidator client
-        var_val_client = VarValClient()
+        var_val_client = VarValClient(cache=varval_cache, chunk_size=25, max_workers=4)
 
         try:
             # Generate the BED file content
@@ -510,13 +618,8 @@ class PatientBed(Resource):
         
         # Return the BED file as a downloadable response
         if bed_file:
-            # Return the BED file using send_file
-            return send_file(
-                bed_file,
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=filename
-            )
+            # Stream the BED file, compressed as the request asks
+            return bed_response(file_chunks(bed_file), filename, args.get('Compression', 'auto'))
         else:
             logger.debug("Bed was not generated please enable Debug")
             return {"error": "No BED data could be generated from the provided gene query.",
@@ -545,7 +648,7 @@ class PatientLocalBed(Resource):
         db = get_db()
         logger.info("DB connection made from patient local bed endpoint")
         
-        query = Query(db.conn) 
+        query = Query(db.conn, catalogue=panel_catalogue, exon_stores=exon_stores) 
         processed_info=bed_processor(query,patient_id,r_code,version,args,logger)
         if processed_info["type"] == "gene_query":
             # Perform additional processing on response["data"]
@@ -555,19 +658,13 @@ class PatientLocalBed(Resource):
             return processed_info["data"]
     
         local_bed_records=query.local_bed(gene_query,genome_build)
-        bed_file=local_bed_formatter(local_bed_records,padding)
+        bed_stream=local_bed_stream(local_bed_records,padding)
 
         filename = f"{patient_id}_{r_code}_{genome_build}_Gencode.bed"
 
-        db.close()
-
-        if bed_file:
-            return send_file(
-                bed_file,
-                mimetype='text/plain',
-                as_attachment=True,
-                download_name=filename
-            )
+        if bed_stream:
+            # The connection stays leased while the BED streams; the teardown handler returns it to the pool
+            return bed_response(bed_stream, filename, args.get('Compression', 'auto'))
         else:
             logger.debug(f"Failed local BED for patient {patient_id}. DB returned: {local_bed_records}")
             return {"error": "No BED data could be generated from the provided gene query."}, 400
@@ -619,41 +716,36 @@ class UpdateClass(Resource):
             logger.error(f"Value error raised by arg parser: {e}")
             return {"error": str(e)}, 400
 
-        db = get_db()
+        db = get_db()  # Read lease: the PanelApp calls below must not hold the single writer
         logger.info("DB connection made from patient update endpoint")
 
-        update = Update(db.conn) # Instantiate an Update class object
-        query = Query(db.conn)   # Instantiate an Query  class object
-        panel_app_client = PanelAppClient()
+        query = Query(db.conn, catalogue=panel_catalogue)   # Instantiate an Query  class object
+        panel_app_client = PanelAppClient(version_cache=panel_version_cache)
         # Check the database is up to date before updating the db with the now current current verison
         panel_id = query.rcode_to_panelID(args["R code"])  # Convert the rcode into the panel id
         database_version = query.get_db_latest_version(args["R code"])
         latest_online_version = panel_app_client.get_latest_online_version(panel_id)
  
-        
+        genes = None
         if database_version != latest_online_version:
-                # Update version and panel contents (panel and panel_contents tables)
-            
             try:
+                genes = panel_app_client.get_genes_HGNC(args["R code"])  # Fetch the new contents before writing anything
+            except (KeyError, PanelAppAPIError) as e:
+                logger.error(f"Database could not be updated: {e}")
+                return "The database could not be updated at this point"
+
+        writer = get_db(write=True)  # The writer is only leased for the writes
+        update = Update(writer.conn) # Instantiate an Update class object
+        if genes is not None:
+            # Update version and panel contents (panel and panel_contents tables)
+            database_version = Query(writer.conn).get_db_latest_version(args["R code"])  # Another writer may have updated it meanwhile
+            if database_version != latest_online_version:
                 logger.info(f"Attempting to update database: Rcode: {args["R code"]} {database_version} --> {latest_online_version}")
-                # Update the panel version in 'panels' table
-                update.update_panels_version(args["R code"], latest_online_version, panel_id)
-                logger.info("panel version updated successfully")
-                # Archive the old panel verison to 'archive_panel_genes'
-                update.archive_panel_contents(panel_id, database_version)
-                logger.info(f"{args["R code"]} v{database_version} archived successfully")         
-                # Update the version in the 'panel_genes' table
-                update.update_gene_contents(args["R code"],panel_id)
-                logger.info(f"{args['Patient ID']} v{latest_online_version} inserted successfully")
+                # Set the version in 'panel', archive the old panel version to 'archive_panel_genes' and update the 'panel_genes' table, in one transaction
+                update.update_gene_contents(args["R code"], panel_id, archive_version=database_version,
+                                            new_version=latest_online_version, genes=genes)
                 logger.info(f"UPDATE database success - {args['R code']}  {database_version} --> {latest_online_version}")
-                database_version = query.get_db_latest_version(args["R code"])  # Retrieve newly updated db panel version
-
-            except KeyError: 
-                logger.error("Database could not be updated")
-                return "The database could not be updated at this point"
-            
-        else:
-            pass
+            database_version = Query(writer.conn).get_db_latest_version(args["R code"])  # Retrieve newly updated db panel version
         
         is_present = update.check_presence(args["Patient ID"], args["R code"])  # Check presence pre-existing record with patient ID, R code and Version
         if is_present is False:
@@ -675,6 +767,49 @@ class UpdateClass(Resource):
 
 
   
+bulk_update_parser = BulkUpdateParser.create_parser()
+@update_space.route("/bulk")
+class BulkUpdateClass(Resource):
+    @api.doc(parser=bulk_update_parser)
+    def post(self):
+        """
+        Endpoint to add many patient test records in one request, e.g. to back-load LIMS data.
+
+        Request Body:
+        - CSV with a header row (text/csv), or one JSON object per line (application/x-ndjson), of
+          Patient ID, R code and optionally Version (default: the database's current version) and
+          Date (YYYY-MM-DD, default: today).
+
+        Query Parameters:
+        - Format (str): 'auto', 'csv' or 'ndjson' (default: 'auto').
+        - Dry_Run (bool): Validate and deduplicate only (default: false).
+
+        Returns:
+        - dict: Counts of received, inserted, duplicate, already present and rejected records, and
+          the line and reason of the first rejected ones.
+
+        Notes:
+        - Versions are not checked against PanelApp; run the scheduled update first
+        - Records already in the database (same Patient ID, R code and version) are skipped
+        """
+        args = bulk_update_parser.parse_args()
+        data = request.get_data()
+        if not data.strip():
+            return {"error": "No records were sent, post them as CSV or NDJSON in the request body."}, 400
+
+        db = get_db(write=True)
+        logger.info("DB connection made from bulk patient update endpoint")
+        try:
+            summary = ingest_records(db.conn, data, args.get('Format', 'auto'), request.content_type,
+                                     catalogue=panel_catalogue, dry_run=args.get('Dry_Run', False))
+        except IngestError as e:
+            logger.error(f"Bulk patient update rejected: {e}")
+            return {"error": str(e)}, 400
+        if "Error" in summary:
+            return summary, 500
+        return summary
+
+
 downgrade_space = api.namespace('DowngradeRecords', description='WARNING please use the guide before using this functionality !!!! > Downgrade the Vimmo database with a panel and version from panel app')
 downgrade_parser = DowngradeParser.create_parser()
 @downgrade_space.route("")
@@ -686,9 +821,8 @@ class DowngradeClass(Resource):
         rcode=args.get("R_Code")
         version=args.get("version")
 
-        db = get_db()
-        downgrade = Downgrade(db.conn) # Instantiate an Update class object
-        query = Query(db.conn)   # Instantiate an Query  class object
+        db = get_db()  # Read lease: the PanelApp download below must not hold the single writer
+        query = Query(db.conn, catalogue=panel_catalogue)   # Instantiate an Query  class object
         panel_app_client = PanelAppClient()
 
         database_version = query.get_db_latest_version(rcode)
@@ -712,7 +846,8 @@ class DowngradeClass(Resource):
                     logger.info(f"No records found for panel {panel_id} version {version} for downgrading")
                     return {"error": f"No records found for panel {panel_id} version {version}"}
 
-                                # Process and downgrade records
+                                # Process and downgrade records, the writer is only leased for the writes
+                downgrade = Downgrade(get_db(write=True).conn)
                 logger.debug(f"downgrade.process_downgrade(rcode={rcode},panel_id={panel_id},version={version},panel_records={panel_records})")
                 result = downgrade.process_downgrade(
                     rcode=rcode,
@@ -720,6 +855,8 @@ class DowngradeClass(Resource):
                     version=version,
                     panel_records=panel_records
                 )
+                if "error" in result:
+                    return result, 409  # the panel moved while the downgrade was prepared
 
             except:
                 logger.info("Downgrade failed")
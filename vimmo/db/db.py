@@ -1,17 +1,90 @@
 from vimmo.logger.logging_config import logger
+from vimmo.db.migrations import run_migrations
 import sqlite3
 from sqlite3 import Connection
 from typing import Optional
+from urllib.request import pathname2url
 import importlib.resources
 import os
+import queue
 import sys
+import threading
+import time
 
 
+# Connection-initialisation profiles, applied per role whenever a connection is opened.
+# - reader: the API's read-only pooled connections (journal_mode is a database setting and is left to the writers)
+# - writer: the API's single writer connection (Update, Downgrade, patient records)
+# - batch:  long running updaters such as scheduled_update.py, which may wait longer for locks and use more cache
+# WAL lets readers keep reading while a writer holds its transaction open, and synchronous=NORMAL is
+# durable in WAL mode apart from the last commits before a power loss.
+PRAGMA_PROFILES = {
+    "reader": {
+        "busy_timeout": 5000,        # ms
+        "cache_size": -16000,        # negative = KiB, i.e. ~16 MB page cache per connection
+        "mmap_size": 268435456,      # 256 MB memory-mapped I/O
+        "temp_store": "MEMORY",
+    },
+    "writer": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 10000,
+        "cache_size": -16000,
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+    "batch": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 60000,
+        "cache_size": -65536,        # ~64 MB, the updater rewrites whole tables
+        "mmap_size": 268435456,
+        "temp_store": "MEMORY",
+    },
+}
+
+
+def apply_pragmas(conn: Connection, role: str = "writer", overrides: Optional[dict] = None) -> dict:
+    """
+    Apply the PRAGMA profile for a connection role.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        The connection to initialise
+    role : str
+        One of the keys of PRAGMA_PROFILES ('reader', 'writer', 'batch')
+    overrides : dict, optional
+        PRAGMA name -> value pairs replacing or extending the role's profile
+
+    Returns
+    -------
+    dict
+        The settings that were applied
+
+    Raises
+    ------
+    ValueError
+        If the role is not a known profile
+    """
+    if role not in PRAGMA_PROFILES:
+        logger.error("Unknown connection role: %s", role)
+        raise ValueError(f"Unknown connection role '{role}'. Use one of: {', '.join(PRAGMA_PROFILES)}")
+    settings = {**PRAGMA_PROFILES[role], **(overrides or {})}
+    for pragma, value in settings.items():
+        row = conn.execute(f"PRAGMA {pragma} = {value}").fetchone()
+        if pragma == "journal_mode" and row is not None and str(row[0]).upper() != str(value).upper():
+            # SQLite silently keeps the old mode if it cannot switch (e.g. in-memory databases)
+            logger.warning("journal_mode %s requested but database is using %s", value, row[0])
+    logger.debug("Applied %s PRAGMA profile: %s", role, settings)
+    return settings
 
 
 class Database:
-    def __init__(self, db_path: str = 'db/panels_data.db'):
+    def __init__(self, db_path: str = 'db/panels_data.db', role: str = 'writer', pragmas: Optional[dict] = None):
         self.db_path = db_path
+        self.role = role
+        self.pragmas = pragmas
         self.conn: Optional[Connection] = None
 
     def get_db_path(self) -> str:
@@ -53,6 +126,7 @@ class Database:
                 raise FileNotFoundError("database file could not be located. Please close the app and create db")
             self.conn = sqlite3.connect(db_path)
             self.conn.row_factory = sqlite3.Row
+            apply_pragmas(self.conn, self.role, self.pragmas)
             
             
     
@@ -61,4 +135,202 @@ class Database:
         if self.conn:
             self.conn.close()
             self.conn = None
-        
\ No newline at end of file
+
+
+class DatabasePoolError(Exception):
+    """Custom exception for errors related to the database connection pool."""
+    pass
+
+
+class PoolLease:
+    """
+    A pooled connection handed out by ConnectionPool.
+
+    Exposes the same ``conn`` attribute and ``close()`` method as Database, so the
+    endpoints can keep using ``db.conn`` and ``db.close()`` unchanged. Closing a
+    lease returns the connection to the pool instead of closing it.
+    """
+    def __init__(self, pool, conn: Connection, write: bool = False):
+        self.pool = pool
+        self.conn: Optional[Connection] = conn
+        self.write = write
+
+    def close(self):
+        """Return the connection to the pool (safe to call more than once)."""
+        if self.conn:
+            self.pool.release(self.conn, write=self.write)
+            self.conn = None
+
+
+class ConnectionPool:
+    """
+    Bounded, thread-safe pool of SQLite connections to panels_data.db.
+
+    Parameters
+    ----------
+    db_path : str, optional
+        Path to the database file. Resolved once through Database.get_db_path() if omitted.
+    max_readers : int
+        Upper bound on the number of read-only connections open at the same time.
+    min_readers : int
+        Number of read-only connections opened up front and kept warm.
+    acquire_timeout : float
+        Seconds to wait for a free connection before raising DatabasePoolError.
+    reader_pragmas, writer_pragmas : dict, optional
+        Overrides for the 'reader' and 'writer' entries of PRAGMA_PROFILES.
+    migrate : bool
+        Apply pending schema migrations (vimmo/db/migrations.py) through the writer on start-up.
+
+    Notes
+    -----
+    - Readers are opened with ``mode=ro`` and ``row_factory = sqlite3.Row`` preset
+    - A single writer connection is kept separately and handed out to one request at a time
+    - Connections are opened with ``check_same_thread=False`` as Flask serves requests from several threads
+    - Occupancy and wait-time statistics are available from stats()
+    """
+    def __init__(self, db_path: Optional[str] = None, max_readers: int = 8, min_readers: int = 2,
+                 acquire_timeout: float = 30.0, reader_pragmas: Optional[dict] = None,
+                 writer_pragmas: Optional[dict] = None, migrate: bool = True):
+        if db_path is None:
+            try:
+                db_path = Database().get_db_path()
+            except Exception:
+                logger.critical("database file could not be located. Please close the app and create db")
+                raise FileNotFoundError("database file could not be located. Please close the app and create db")
+        self.db_path = db_path
+        self.max_readers = max(1, max_readers)
+        self.acquire_timeout = acquire_timeout
+        self.reader_pragmas = reader_pragmas
+        self.writer_pragmas = writer_pragmas
+
+        self._idle_readers = queue.LifoQueue()  # LIFO so the most recently used (warmest) connection is reused first
+        self._reader_count = 0
+        self._lock = threading.Lock()
+        self._writer = self._open(readonly=False)
+        self._writer_lock = threading.Lock()
+        if migrate:
+            run_migrations(self._writer)
+
+        self._acquisitions = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+        for _ in range(min(min_readers, self.max_readers)):
+            with self._lock:
+                self._reader_count += 1
+            self._idle_readers.put(self._open(readonly=True))
+        logger.info("Connection pool created for %s (max readers: %d)", self.db_path, self.max_readers)
+
+    def _open(self, readonly: bool) -> Connection:
+        """Open a new connection with the row factory and the role's PRAGMA profile preset."""
+        if readonly:
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            apply_pragmas(conn, "reader", self.reader_pragmas)
+        else:
+            # The writer is opened first, so WAL is switched on before any reader connects
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            apply_pragmas(conn, "writer", self.writer_pragmas)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _record_wait(self, waited: float):
+        with self._lock:
+            self._acquisitions += 1
+            self._total_wait += waited
+            self._max_wait = max(self._max_wait, waited)
+            if waited > 0.001:
+                self._waits += 1
+
+    def _acquire_reader(self) -> Connection:
+        try:
+            return self._idle_readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_open = self._reader_count < self.max_readers
+            if can_open:
+                self._reader_count += 1
+        if can_open:
+            try:
+                return self._open(readonly=True)
+            except Exception:
+                with self._lock:
+                    self._reader_count -= 1
+                raise
+
+        try:
+            return self._idle_readers.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            with self._lock:
+                self._timeouts += 1
+            logger.error("No read connection became free within %s seconds", self.acquire_timeout)
+            raise DatabasePoolError(f"No database connection available after {self.acquire_timeout} seconds")
+
+    def _acquire_writer(self) -> Connection:
+        if not self._writer_lock.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._timeouts += 1
+            logger.error("Writer connection was not released within %s seconds", self.acquire_timeout)
+            raise DatabasePoolError(f"Database writer unavailable after {self.acquire_timeout} seconds")
+        return self._writer
+
+    def lease(self, write: bool = False) -> PoolLease:
+        """
+        Hand out a connection wrapped in a PoolLease.
+
+        Parameters
+        ----------
+        write : bool
+            True for the single writer connection, False for a read-only connection.
+        """
+        started = time.perf_counter()
+        conn = self._acquire_writer() if write else self._acquire_reader()
+        self._record_wait(time.perf_counter() - started)
+        return PoolLease(self, conn, write=write)
+
+    def release(self, conn: Connection, write: bool = False):
+        """Return a connection to the pool, rolling back anything left uncommitted."""
+        try:
+            if conn.in_transaction:
+                logger.warning("Rolling back uncommitted work on a released %s connection", "writer" if write else "reader")
+                conn.rollback()
+        except sqlite3.Error as err:
+            logger.error("Failed to reset pooled connection: %s", err)
+        if write:
+            self._writer_lock.release()
+        else:
+            self._idle_readers.put(conn)
+
+    def stats(self) -> dict:
+        """Return pool occupancy and wait-time statistics."""
+        with self._lock:
+            idle = self._idle_readers.qsize()
+            return {
+                "db_path": self.db_path,
+                "max_readers": self.max_readers,
+                "readers_open": self._reader_count,
+                "readers_idle": idle,
+                "readers_in_use": self._reader_count - idle,
+                "writer_in_use": self._writer_lock.locked(),
+                "acquisitions": self._acquisitions,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "total_wait_ms": round(self._total_wait * 1000, 3),
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "mean_wait_ms": round(self._total_wait * 1000 / self._acquisitions, 3) if self._acquisitions else 0.0,
+            }
+
+    def close_all(self):
+        """Close every idle reader and the writer connection."""
+        while True:
+            try:
+                self._idle_readers.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._reader_count -= 1
+        self._writer.close()
@@ -2,6 +2,9 @@
 from vimmo.logger.logging_config import logger
 from vimmo.db.db_query import Query
 from vimmo.db.db_update import Update
+from vimmo.db.panel_catalogue import bump_generation
+from vimmo.db.panel_contents import replace_panel_genes
+from vimmo.utils.bed_artefacts import invalidate_bed_artefacts
 from vimmo.utils.panelapp import PanelAppClient
 
 class Downgrade:
@@ -12,31 +15,6 @@ class Downgrade:
         self.papp = PanelAppClient(base_url="https://panelapp.genomicsengland.co.uk/api/v1/panels")
 
 
-    def _get_current_genes(self, panel_id: str) -> dict:
-        """Get current genes and their confidence levels for a panel"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT HGNC_ID, Confidence
-            FROM panel_genes
-            WHERE Panel_ID = ?
-        """, (panel_id,))
-        return {row["HGNC_ID"]: row["Confidence"] for row in cursor.fetchall()}
-    
-    def change_panels_version(self, rcode: str, new_version: float, panel_id: str):
-        """Update the panel table with the downgraded version"""
-        cursor = self.conn.cursor()
-        logger.info(f"Updating panel version: {new_version}, {panel_id}, {rcode}")
-        cursor.execute("""
-            UPDATE panel 
-            SET Version = ?
-            WHERE Panel_ID = ? AND rcodes = ?
-        """, (new_version, panel_id, rcode))
-        
-        if cursor.rowcount == 0:
-            logger.error(f"No matching record found for Panel_ID: {panel_id} and R_code: {rcode}.")
-            raise ValueError(f"No matching record found for Panel_ID: {panel_id} and rcode: {rcode}")
-        
-
     def _extract_genes_from_records(self, panel_records: dict) -> list:
         """
         Extract gene information from panel records
@@ -54,7 +32,7 @@ class Downgrade:
 
 
         
-    def change_gene_contents(self, panel_id: str, new_genes: list) -> dict:
+    def change_gene_contents(self, panel_id: str, new_genes: list, versions: tuple = None) -> dict:
         """
         Update panel_genes table with downgraded version contents
         
@@ -64,58 +42,26 @@ class Downgrade:
             The Panel_ID to update
         new_genes: list
             List of tuples containing (HGNC_ID, Confidence) pairs
+        versions: tuple, optional
+            (current version, downgraded version), to move the panel's Version with its contents
         
         Returns:
         --------
         dict
-            Summary of changes made to the gene contents
+            Summary of changes made to the gene contents, or an error when the panel is no longer at
+            the current version (another writer moved it) and nothing was written
         """
-        cursor = self.conn.cursor()
-        
-        # Get current genes for comparison
-        current_genes = self._get_current_genes(panel_id)
-        
         try:
-            # Create dictionary of new genes
-            new_gene_dict = {hgnc_id: conf for hgnc_id, conf in new_genes}
-            
-            # Track changes
-            added_genes = [hgnc_id for hgnc_id in new_gene_dict if hgnc_id not in current_genes]
-            removed_genes = [hgnc_id for hgnc_id in current_genes if hgnc_id not in new_gene_dict]
-            confidence_changes = [
-                {
-                    "hgnc_id": hgnc_id,
-                    "old_confidence": current_genes[hgnc_id],
-                    "new_confidence": new_gene_dict[hgnc_id]
-                }
-                for hgnc_id in current_genes
-                if hgnc_id in new_gene_dict and current_genes[hgnc_id] != new_gene_dict[hgnc_id]
-            ]
-            
-            # Check if there are any changes
-            if not added_genes and not removed_genes and not confidence_changes:
+            # Only the rows that differ are written, inside process_downgrade's transaction
+            changes = replace_panel_genes(self.conn, panel_id, new_genes, versions=versions)
+            if changes["skipped"]:
+                return {"error": f"Panel {panel_id} is no longer at version {versions[0]}, downgrade not applied"}
+            if not changes["added"] and not changes["removed"] and not changes["confidence_changed"]:
                 return {"message": "No changes detected between versions"}
-            
-            # If there are changes, proceed with update
-            logger.info(f"Db deleting records {panel_id}")
-            cursor.execute("""
-                DELETE FROM panel_genes 
-                WHERE Panel_ID = ?
-            """, (panel_id,))
-            
-            # Insert new records
-            for hgnc_id, confidence in new_genes:
-                logger.info(f"Db is updating {panel_id}, {hgnc_id}, {confidence}")
-                cursor.execute("""
-                    INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence)
-                    VALUES (?, ?, ?)
-                """, (panel_id, hgnc_id, confidence))
-            
-            # Return detailed changes
             return {
-                "added": added_genes,
-                "removed": removed_genes,
-                "confidence_changed": confidence_changes
+                "added": changes["added"],
+                "removed": changes["removed"],
+                "confidence_changed": changes["confidence_changed"]
             }
                 
         except Exception as e:
@@ -139,18 +85,28 @@ class Downgrade:
             current_version = self.query.get_db_latest_version(rcode)
             
             
-            # Update panel version
             logger.info(f"Downgrading {rcode} to {version}")
-            self.change_panels_version(rcode, version, panel_id)
             
             # Extract and process genes from panel_records
             new_genes = self._extract_genes_from_records(panel_records)
             
-            # Update gene contents
-            changes = self.change_gene_contents(panel_id, new_genes)
-            
-            # Commit transaction
+            # Update the panel version and gene contents
+            changes = self.change_gene_contents(panel_id, new_genes, versions=(current_version, float(version)))
+            if "error" in changes:
+                # Nothing was written; leave the catalogue and BED artefacts as they are
+                cursor.execute("ROLLBACK")
+                logger.warning(f"Downgrade of {rcode} to {version} skipped: {changes['error']}")
+                return {
+                    "error": changes["error"],
+                    "panel_id": panel_id,
+                    "rcode": rcode,
+                    "current_version": self.query.get_db_latest_version(rcode)
+                }
+
+            # Commit transaction and mark cached panel lookups stale
             self.conn.commit()
+            bump_generation(f"({rcode} downgraded to {version})")
+            invalidate_bed_artefacts(panel_id)
             
             return {
                 "panel_id": panel_id,
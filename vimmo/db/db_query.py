@@ -1,10 +1,48 @@
 from vimmo.logger.logging_config import logger
+from vimmo.db.panel_catalogue import GENE_FIELDS, CatalogueSnapshot, current_generation
+from vimmo.db.panel_contents import compose_gene_changes
+from vimmo.db.panel_diff import VersionDiff, diff_many, diff_versions
 from typing import Optional
 
 
 class Query:
-    def __init__(self, connection):
+    def __init__(self, connection, catalogue=None, exon_stores=None):
+        """
+        Args:
+            connection: sqlite3 connection to the Vimmo database
+            catalogue: Optional PanelCatalogue (vimmo/db/panel_catalogue.py). When given, the panel lookups
+                (get_panel_data, get_panels_by_rcode, get_db_latest_version, rcode_to_panelID,
+                current_panel_contents) are served from memory instead of SQL
+            exon_stores: Optional ExonStores (vimmo/db/exon_store.py). When given, local_bed answers from the
+                coordinate-sorted exon store instead of the bed38 / bed37 tables
+        """
         self.conn = connection
+        self.catalogue = catalogue
+        self.exon_stores = exon_stores
+
+    def _catalogue_snapshot(self):
+        """Return the catalogue snapshot to serve a lookup from, or None to run the SQL query instead."""
+        if self.catalogue is None or self.conn.in_transaction:  # uncommitted writes are only visible through SQL
+            return None
+        return self.catalogue.snapshot(self.conn)
+
+    def _search_snapshot(self):
+        """Catalogue snapshot for the similar-match indexes, a one-off load through this connection without one."""
+        return self._catalogue_snapshot() or CatalogueSnapshot(self.conn, current_generation())
+
+    @staticmethod
+    def _ranked_panels(snapshot, hits, found) -> list:
+        """Ranked_Panels of a similar-match response: the search hits that contributed records."""
+        return [{"Panel_ID": snapshot.panels[hit.panel][0], "rcodes": snapshot.panels[hit.panel][1],
+                 "Version": snapshot.panels[hit.panel][2], "Name": snapshot.panel_search.names[hit.panel],
+                 "Matched_Field": hit.field, "Match": hit.match} for hit in hits if hit.panel in found]
+
+    @staticmethod
+    def _panel_key(panel_id):
+        """Normalise a Panel_ID argument the way SQLite's INTEGER column affinity would ('635' -> 635)."""
+        if isinstance(panel_id, str) and panel_id.strip().isdigit():
+            return int(panel_id)
+        return panel_id
 
     def _map_confidence(self, confidence: str) -> Optional[int]:
         """Map user-friendly confidence levels to numeric values.
@@ -28,7 +66,8 @@ class Query:
         
         Args:
             panel_id: The panel ID to search for
-            matches: Whether to use LIKE for pattern matching
+            matches: Whether to return every panel whose Panel_ID contains panel_id, best matches first
+                (vimmo/db/panel_search.py); the response then also lists them under "Ranked_Panels"
             confidence: Confidence level filter ('Green', 'Amber', 'Red', 'All')
         
         Returns:
@@ -45,35 +84,58 @@ class Query:
         org_conf=confidence
         confidence = self._map_confidence(confidence)
         
-        base_query = '''
-            SELECT panel.Panel_ID, panel.rcodes, panel.Version, genes_info.HGNC_ID, 
-                genes_info.Gene_Symbol, genes_info.HGNC_symbol, genes_info.GRCh38_Chr, 
-                genes_info.GRCh38_start, genes_info.GRCh38_stop, genes_info.GRCh37_Chr,
-                genes_info.GRCh37_start, genes_info.GRCh37_stop, panel_genes.Confidence
-            FROM panel
-            JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
-            JOIN genes_info ON panel_genes.HGNC_ID = genes_info.HGNC_ID
-            WHERE panel.Panel_ID {} ?
-        '''.format('LIKE' if matches else '=')
-        
-        cursor = self.conn.cursor()
-        params = [f"%{panel_id}%" if matches else panel_id]
-        
-        if confidence is not None:
-            base_query += " AND panel_genes.Confidence = ?"
-            params.append(confidence)
-        
-        result= cursor.execute(base_query, tuple(params)).fetchall()
+        hits = None
+        snapshot = self._search_snapshot() if matches else self._catalogue_snapshot()
+        if snapshot is not None:
+            if matches:
+                hits = snapshot.panel_search.search(str(panel_id), fields=("Panel_ID",))
+                panel_indexes = [hit.panel for hit in hits]
+            else:
+                panel_indexes = snapshot.by_panel_id.get(self._panel_key(panel_id), [])
+            result = []
+            found = set()
+            for i in panel_indexes:
+                panel_key, rcode, version = snapshot.panels[i]
+                for hgnc_id, gene_confidence in snapshot.panel_genes.get(panel_key, []):
+                    if confidence is not None and gene_confidence != confidence:
+                        continue
+                    for gene in snapshot.genes.get(hgnc_id, []):
+                        found.add(i)
+                        result.append({"Panel_ID": panel_key, "rcodes": rcode, "Version": version,
+                                       **dict(zip(GENE_FIELDS, gene)), "Confidence": gene_confidence})
+        else:
+            base_query = '''
+                SELECT panel.Panel_ID, panel.rcodes, panel.Version, genes_info.HGNC_ID, 
+                    genes_info.Gene_Symbol, genes_info.HGNC_symbol, genes_info.GRCh38_Chr, 
+                    genes_info.GRCh38_start, genes_info.GRCh38_stop, genes_info.GRCh37_Chr,
+                    genes_info.GRCh37_start, genes_info.GRCh37_stop, panel_genes.Confidence
+                FROM panel
+                JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
+                JOIN genes_info ON panel_genes.HGNC_ID = genes_info.HGNC_ID
+                WHERE panel.Panel_ID = ?
+            '''
+            
+            cursor = self.conn.cursor()
+            params = [panel_id]
+            
+            if confidence is not None:
+                base_query += " AND panel_genes.Confidence = ?"
+                params.append(confidence)
+            
+            result = [dict(row) for row in cursor.execute(base_query, tuple(params)).fetchall()]
         logger.info("The run was successful for Panel_ID: %s, and retrieved %d records.", panel_id, len(result))
-        logger.debug(f"Panel_ID: {panel_id}, Result: {result}")
+        logger.debug("Panel_ID: %s, Result: %s", panel_id, result)
 
 
         if result:
             logger.info("Returning %d records for Panel_ID: %s.", len(result), panel_id)
-            return {
+            response = {
                 "Panel_ID": panel_id,
-                "Associated Gene Records": [dict(row) for row in result]
+                "Associated Gene Records": result
             }
+            if hits is not None:
+                response["Ranked_Panels"] = self._ranked_panels(snapshot, hits, found)
+            return response
         else:
             logger.warning("No matches found for Panel_ID: %s.", panel_id)
             return {
@@ -87,7 +149,9 @@ class Query:
         
         Args:
             rcode: The R-code to search for
-            matches: Whether to use LIKE for pattern matching
+            matches: Whether to return every panel whose R code or name (vimmo/db/all_panel.json) contains
+                rcode, or whose name is close to it, best matches first (vimmo/db/panel_search.py); the
+                response then also lists them under "Ranked_Panels"
             confidence: Confidence level filter ('Green', 'Amber', 'Red', 'All')
         
         Returns:
@@ -103,42 +167,61 @@ class Query:
             raise ValueError("R_code could not be retrieved something went wrong, please raise an issue")
         org_conf= confidence
         confidence = self._map_confidence(confidence)
-        operator = "LIKE" if matches else "="
-        rcode_query = f"%{rcode}%" if matches else rcode
-        
-        logger.debug("Using operator '%s' with R_code query: %s.", operator, rcode_query)
-
-        base_query = f'''
-        SELECT panel.Panel_ID, panel.rcodes, panel.Version, panel_genes.Confidence, genes_info.HGNC_ID, 
-            genes_info.Gene_Symbol, genes_info.HGNC_symbol, genes_info.GRCh38_Chr, 
-            genes_info.GRCh38_start, genes_info.GRCh38_stop, genes_info.GRCh37_Chr,
-            genes_info.GRCh37_start, genes_info.GRCh37_stop
-        FROM panel
-        JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
-        JOIN genes_info ON panel_genes.HGNC_ID = genes_info.HGNC_ID
-        WHERE panel.rcodes {operator} ?
-        '''
+        hits = None
+        snapshot = self._search_snapshot() if matches else self._catalogue_snapshot()
+        if snapshot is not None:
+            logger.debug("Serving R_code: %s from the panel catalogue.", rcode)
+            if matches:
+                hits = snapshot.panel_search.search(rcode, fields=("rcodes", "name"))
+                panel_indexes = [hit.panel for hit in hits]
+            else:
+                panel_indexes = snapshot.by_rcode.get(rcode, [])
+            result = []
+            found = set()
+            for i in panel_indexes:
+                panel_key, rcodes, version = snapshot.panels[i]
+                for hgnc_id, gene_confidence in snapshot.panel_genes.get(panel_key, []):
+                    if confidence is not None and gene_confidence != confidence:
+                        continue
+                    for gene in snapshot.genes.get(hgnc_id, []):
+                        found.add(i)
+                        result.append({"Panel_ID": panel_key, "rcodes": rcodes, "Version": version,
+                                       "Confidence": gene_confidence, **dict(zip(GENE_FIELDS, gene))})
+        else:
+            base_query = '''
+            SELECT panel.Panel_ID, panel.rcodes, panel.Version, panel_genes.Confidence, genes_info.HGNC_ID, 
+                genes_info.Gene_Symbol, genes_info.HGNC_symbol, genes_info.GRCh38_Chr, 
+                genes_info.GRCh38_start, genes_info.GRCh38_stop, genes_info.GRCh37_Chr,
+                genes_info.GRCh37_start, genes_info.GRCh37_stop
+            FROM panel
+            JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
+            JOIN genes_info ON panel_genes.HGNC_ID = genes_info.HGNC_ID
+            WHERE panel.rcodes = ?
+            '''
 
-        params = [rcode_query]
-        
-        if confidence is not None:
-            base_query += " AND panel_genes.Confidence = ?"
-            params.append(confidence)
+            params = [rcode]
+            
+            if confidence is not None:
+                base_query += " AND panel_genes.Confidence = ?"
+                params.append(confidence)
 
-        logger.debug("Running SQL query: %s with params: %s", base_query, params)
+            logger.debug("Running SQL query: %s with params: %s", base_query, params)
 
-        cursor = self.conn.cursor()
-        result = cursor.execute(base_query, tuple(params)).fetchall()
+            cursor = self.conn.cursor()
+            result = [dict(row) for row in cursor.execute(base_query, tuple(params)).fetchall()]
         logger.info("Query ran successfully for R_code: %s, and retrieved %d records.", rcode, len(result))
 
-        logger.debug("R_code Query: %s, Result: %s", rcode_query, result)
+        logger.debug("R_code Query: %s, Result: %s", rcode, result)
         
         if result:
             logger.info("Returning %d records for R_code: %s.", len(result), rcode)
-            return {
+            response = {
                 "Rcode": rcode,
-                "Associated Gene Records": [dict(row) for row in result]
+                "Associated Gene Records": result
             }
+            if hits is not None:
+                response["Ranked_Panels"] = self._ranked_panels(snapshot, hits, found)
+            return response
         else:
             logger.debug("No matches found for R_code: %s.", rcode)
             return {
@@ -147,22 +230,34 @@ class Query:
             }
 
 
-    def get_panels_from_gene_list(self, hgnc_ids: list[str], matches: bool=False) -> list[dict]:
+    def get_panels_from_gene_list(self, hgnc_ids: list[str], matches: bool=False, confidence: str = 'All') -> list[dict]:
         """
-        Retrieves panels associated with multiple HGNC IDs.
+        Retrieves panels associated with multiple HGNC IDs, ranked by how many of the genes they contain.
 
         Parameters
         ----------
         hgnc_ids : list[str]
-            List of HGNC IDs (e.g., ["HGNC:12345", "HGNC:67890"]).
+            List of HGNC IDs (e.g., ["HGNC:12345", "HGNC:67890"]). A trailing '*' matches every HGNC ID
+            or symbol starting with the term (e.g., "HGNC:110*", "BRCA*").
         matches : bool
-            Whether to use wildcard matching or exact matching.
-            (For multiple IDs, we only perform exact matches here.)
+            Whether to use similar matching or exact matching. Similar matching also accepts gene
+            symbols: a term that is not an exact HGNC ID / symbol matches the IDs and symbols starting
+            with it, failing that the symbols one edit away from it (e.g., "BRAC1" -> BRCA1).
+        confidence : str
+            Confidence level filter ('Green', 'Amber', 'Red', 'All')
 
         Returns
         -------
-        list[dict]
-            A list of dictionaries containing panel data for the given HGNC IDs.
+        dict
+            - "Panels": one {Panel_ID, rcodes, Gene_Symbol} record per panel and matched gene, best
+              ranked panels first
+            - "Ranked_Panels": one record per panel with the matched HGNC IDs and their count
+            - "Matches" / "Unmatched" (similar or wildcard lookups): what each term resolved to
+
+        Notes
+        -----
+        - Served from the gene index of the panel catalogue (vimmo/db/gene_index.py) when the Query has one;
+          exact lookups without it run an indexed IN (...) query
         """
         logger.info("Pulling all records associated with HGNC_ID: %s.", hgnc_ids)
 
@@ -170,54 +265,126 @@ class Query:
             logger.error("ValueError- HGNC_ID must be provided")
             raise ValueError("HGNC_ID must be provided.")
 
-        cursor = self.conn.cursor()
-        
-        
-        
-        if matches:
-            # If matches is True, you might implement logic to do wildcard search for each ID,
-            # but this can become complex. For now, we assume matches=False or handle it as exact.
-            # For demonstration, we can handle matches by using LIKE for each ID combined with OR.
-            # Example:
-            # WHERE panel_genes.HGNC_ID LIKE ?
-            # OR panel_genes.HGNC_ID LIKE ?
-            # ...
-            # You would need to dynamically build the query.
-            
-            # But let's raise a NotImplementedError if needed:
-            logger.error("Wildcard matching for multiple HGNC_IDs not implemented")
-            raise NotImplementedError("Wildcard matching for multiple HGNC_IDs not implemented.")
+        confidence = self._map_confidence(confidence)
+        wildcard = matches or any(str(term).endswith("*") for term in hgnc_ids)
+        # Similar matching needs the symbol index, exact lookups fall back to SQL without a catalogue
+        snapshot = self._search_snapshot() if wildcard else self._catalogue_snapshot()
+
+        resolved = None
+        if snapshot is not None:
+            index = snapshot.gene_index
+            if wildcard:
+                logger.info("Similar match for HGNC_ID was selected: %s", hgnc_ids)
+                resolved = {term: index.lookup(term, matches=matches) for term in hgnc_ids}
+                genes = [hgnc_id for hits in resolved.values() for hgnc_id, _ in hits]
+            else:
+                logger.info("Exact match for HGNC_ID was selected: %s", hgnc_ids)
+                genes = [str(term).strip() for term in hgnc_ids]
+            ranked = [(snapshot.panels[i], [(hgnc_id, index.gene_symbols[hgnc_id]) for hgnc_id in panel_genes])
+                      for i, panel_genes in index.rank(genes, confidence)]
         else:
             # Exact matching using IN clause
             logger.info("Exact match for HGNC_ID was selected: %s", hgnc_ids)
             placeholders = ','.join('?' * len(hgnc_ids))
             query = f'''
-            SELECT panel.Panel_ID, panel.rcodes, genes_info.Gene_Symbol
+            SELECT DISTINCT panel.Panel_ID, panel.rcodes, panel.Version, panel_genes.HGNC_ID, genes_info.Gene_Symbol
             FROM panel
             JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
             JOIN genes_info ON panel_genes.HGNC_ID = genes_info.HGNC_ID
             WHERE panel_genes.HGNC_ID IN ({placeholders})
             '''
+            params = list(hgnc_ids)
+            if confidence is not None:
+                query += " AND panel_genes.Confidence = ?"
+                params.append(confidence)
             logger.debug("Running SQL query: %s.", query)
 
-            result = cursor.execute(query, tuple(hgnc_ids)).fetchall()
-            logger.info("Query ran successfully for HGNC_ID: %s, and retrieved %d records.", hgnc_ids, len(result))
-            logger.debug(f"HGNC_ID: {hgnc_ids}, Result: {result}")
-            
+            # Same ranking as GeneIndex.rank: most genes first, genes in query order, ties by Panel_ID
+            order = {hgnc_id: position for position, hgnc_id in reversed(list(enumerate(hgnc_ids)))}
+            by_panel = {}
+            for panel_id, rcode, version, hgnc_id, gene_symbol in self.conn.execute(query, params):
+                panel_genes = by_panel.setdefault((panel_id, rcode, version), {})
+                panel_genes.setdefault(hgnc_id, []).append(gene_symbol)
+            ranked = sorted(((panel, sorted(panel_genes.items(), key=lambda gene: order[gene[0]]))
+                             for panel, panel_genes in by_panel.items()),
+                            key=lambda item: (-len(item[1]), str(item[0][0]).zfill(12)))
+
+        result = [{"Panel_ID": panel_id, "rcodes": rcode, "Gene_Symbol": gene_symbol}
+                  for (panel_id, rcode, _), panel_genes in ranked for _, gene_symbols in panel_genes
+                  for gene_symbol in gene_symbols]
+        logger.info("Query ran successfully for HGNC_ID: %s, and retrieved %d records.", hgnc_ids, len(result))
+        logger.debug("HGNC_ID: %s, Result: %s", hgnc_ids, result)
+
+        response = {"HGNC_IDs": hgnc_ids}
+        if resolved is not None:
+            response["Matches"] = {term: [{"HGNC_ID": hgnc_id, "HGNC_symbol": index.symbols[hgnc_id], "Match": match}
+                                          for hgnc_id, match in hits] for term, hits in resolved.items()}
+            unmatched = [term for term, hits in resolved.items() if not hits]
+            if unmatched:
+                response["Unmatched"] = unmatched
+        if result:
+            logger.info("Returning %d records for HGNC_ID: %s.", len(result), hgnc_ids)
+            response["Panels"] = result
+            response["Ranked_Panels"] = [{"Panel_ID": panel_id, "rcodes": rcode, "Version": version,
+                                          "Gene_Count": len(panel_genes),
+                                          "HGNC_IDs": [hgnc_id for hgnc_id, _ in panel_genes]}
+                                         for (panel_id, rcode, version), panel_genes in ranked]
+        else:
+            logger.warning("No matches found for HGNC_ID: %s.", hgnc_ids)
+            response["Message"] = "Could not find any match for the provided HGNC IDs."
+        return response
+
+    def gene_panels(self, hgnc_ids, confidence: str = 'All', batch_size: int = 900) -> dict:
+        """
+        Panels containing each of the given genes, for annotating many genes at once.
+
+        Parameters
+        ----------
+        hgnc_ids : iterable of str
+            HGNC IDs to look up
+        confidence : str
+            Confidence level filter ('Green', 'Amber', 'Red', 'All')
+        batch_size : int
+            IDs per IN (...) query when answering from SQL, below SQLite's bound parameter limit
+
+        Returns
+        -------
+        dict
+            HGNC_ID -> list of {"Panel_ID", "rcodes", "Confidence"}; genes on no panel are left out
+        """
+        genes = {str(hgnc_id) for hgnc_id in hgnc_ids}
+        confidence = self._map_confidence(confidence)
+        result = {}
+        if not genes:
+            return result
+
+        snapshot = self._catalogue_snapshot()
+        if snapshot is not None:
+            for panel_id, rcode, _ in snapshot.panels:
+                for hgnc_id, gene_confidence in snapshot.panel_genes.get(panel_id, []):
+                    if hgnc_id in genes and (confidence is None or gene_confidence == confidence):
+                        result.setdefault(hgnc_id, []).append({"Panel_ID": panel_id, "rcodes": rcode,
+                                                               "Confidence": gene_confidence})
+        else:
+            ordered = sorted(genes)
+            for i in range(0, len(ordered), batch_size):
+                batch = ordered[i:i + batch_size]
+                query = f'''
+                SELECT panel_genes.HGNC_ID, panel.Panel_ID, panel.rcodes, panel_genes.Confidence
+                FROM panel
+                JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
+                WHERE panel_genes.HGNC_ID IN ({','.join('?' * len(batch))})
+                '''
+                params = list(batch)
+                if confidence is not None:
+                    query += " AND panel_genes.Confidence = ?"
+                    params.append(confidence)
+                for hgnc_id, panel_id, rcode, gene_confidence in self.conn.execute(query, params):
+                    result.setdefault(hgnc_id, []).append({"Panel_ID": panel_id, "rcodes": rcode,
+                                                           "Confidence": gene_confidence})
+        logger.info("Panels found for %d of %d genes.", len(result), len(genes))
+        return result
 
-            if result:
-                logger.info("Returning %d records for HGNC_ID: %s.", len(result), hgnc_ids)
-                return {
-                    "HGNC_IDs": hgnc_ids,
-                    "Panels": [dict(row) for row in result]
-                }
-            else:
-                logger.warning("No matches found for HGNC_ID: %s.", hgnc_ids)
-                return {
-                    "HGNC_IDs": hgnc_ids,
-                    "Message": "Could not find any match for the provided HGNC IDs."
-                }
-        
     def get_gene_list(self,panel_id=None,r_code=None,matches=False, confidence='All'):
         logger.info("Pulling the gene list associated with Panel_ID: %s, R_code: %s.", panel_id, r_code)
 
@@ -242,6 +409,61 @@ class Query:
         logger.debug(f"Gene list: {gene_query}")
         return gene_query
     
+    def get_gene_lists(self, panel_ids=(), r_codes=(), confidence='All') -> tuple:
+        """
+        Union of the genes of several panels, resolved in one lookup (the multi-panel get_gene_list).
+
+        Parameters
+        ----------
+        panel_ids : iterable
+            Panel_IDs to include
+        r_codes : iterable of str
+            R codes to include
+        confidence : str
+            Confidence level filter ('Green', 'Amber', 'Red', 'All'), applied to every panel
+
+        Returns
+        -------
+        (set, list)
+            HGNC IDs of the requested panels (genes missing from genes_info are left out, as in
+            get_gene_list), and the Panel_IDs / R codes that matched no panel
+        """
+        panel_keys = [self._panel_key(panel_id) for panel_id in panel_ids]
+        r_codes = list(r_codes)
+        confidence = self._map_confidence(confidence)
+        logger.info("Pulling the gene lists associated with Panel_IDs: %s, R_codes: %s.", panel_keys, r_codes)
+        genes, matched = set(), set()
+
+        snapshot = self._catalogue_snapshot()
+        if snapshot is not None:
+            rows = [i for key in panel_keys for i in snapshot.by_panel_id.get(key, [])]
+            rows += [i for rcode in r_codes for i in snapshot.by_rcode.get(rcode, [])]
+            for i in rows:
+                panel_key, rcode, _ = snapshot.panels[i]
+                for hgnc_id, gene_confidence in snapshot.panel_genes.get(panel_key, []):
+                    if (confidence is None or gene_confidence == confidence) and hgnc_id in snapshot.genes:
+                        genes.add(hgnc_id)
+                        matched.update((panel_key, rcode))
+        elif panel_keys or r_codes:
+            query = f'''
+            SELECT DISTINCT panel.Panel_ID, panel.rcodes, panel_genes.HGNC_ID
+            FROM panel
+            JOIN panel_genes ON panel.Panel_ID = panel_genes.Panel_ID
+            JOIN genes_info ON panel_genes.HGNC_ID = genes_info.HGNC_ID
+            WHERE (panel.Panel_ID IN ({','.join('?' * len(panel_keys))}) OR panel.rcodes IN ({','.join('?' * len(r_codes))}))
+            '''
+            params = panel_keys + r_codes
+            if confidence is not None:
+                query += " AND panel_genes.Confidence = ?"
+                params.append(confidence)
+            for panel_key, rcode, hgnc_id in self.conn.execute(query, params):
+                genes.add(hgnc_id)
+                matched.update((panel_key, rcode))
+
+        unmatched = [value for value in panel_keys + r_codes if value not in matched]
+        logger.info("Resolved %d genes, unmatched identifiers: %s.", len(genes), unmatched)
+        return genes, unmatched
+
     def get_gene_symbol(self, ids_to_replace):
         logger.info("Pulling the gene_symbol called with IDs to replace: %s.", ids_to_replace)
 
@@ -260,6 +482,12 @@ class Query:
         return result
     
     def local_bed(self, gene_query, genome_build):
+        if self.exon_stores is not None and genome_build in ("GRCh38", "GRCh37"):
+            # Exons of the requested genes, in chromosome / start / end order, sliced from the exon store
+            store = self.exon_stores.get(self.conn, genome_build)
+            rows = store.rows_for_genes(gene_query)
+            logger.info(f"Local bed searched in the exon store: {len(rows)} exons, {gene_query}, {genome_build}")
+            return store.records(rows)
         if genome_build=="GRCh38":
             cursor = self.conn.cursor()
             # Prepare placeholders for SQL IN clause
@@ -305,9 +533,11 @@ class Query:
         
         Notes
         -----
-        - Excutes a simple SQL query
+        - Excutes a single SQL query, answered from the idx_patient_data_patient index
+          (ties on Date are broken by the highest Version)
         - Queries the patient_data table
         - For the entire test history of a patient, see return_all_records()
+        - For many patients at once, see check_patient_histories()
 
         Example
         -----
@@ -322,28 +552,74 @@ class Query:
         patient_history = cursor.execute('''
         SELECT Version
         FROM patient_data
-        WHERE Date = (
-            SELECT MAX(Date) 
-            FROM patient_data
-            WHERE Patient_ID = ? AND Rcode = ?
-        ) 
-        AND Version = (
-            SELECT MAX(Version)
-            FROM patient_data
-            WHERE Patient_ID = ? AND Rcode = ?
-            AND Date = (
-                SELECT MAX(Date)
-                FROM patient_data
-                WHERE Patient_ID = ? AND Rcode = ?
-            )
-        )
-        AND Patient_ID = ? AND Rcode = ?         
-        ''', (Patient_id, Rcode, Patient_id, Rcode, Patient_id, Rcode, Patient_id, Rcode)).fetchone()
+        WHERE Patient_ID = ? AND Rcode = ?
+        ORDER BY Date DESC, Version DESC
+        LIMIT 1
+        ''', (Patient_id, Rcode)).fetchone()
         
         if patient_history is None:
             return None
         return patient_history[0]
 
+    def check_patient_histories(self, patient_rcodes: list[tuple[str, str]], batch_size: int = 400) -> dict:
+        """
+        Retrieves the latest test version for many (Patient ID, R code) pairs, e.g. for a cohort report.
+
+        Parameters
+        ----------
+        patient_rcodes: list[tuple[str, str]] (required)
+        The (Patient_ID, Rcode) pairs to look up
+
+        batch_size: int (optional)
+        Number of pairs bound per statement, keeps the bound parameters under SQLite's variable limit
+
+        Returns
+        -------
+        patient_histories: dict
+        Maps each (Patient_ID, Rcode) pair to its most recent version, or None if the patient has no record of that R code
+
+        Notes
+        -----
+        - One SQL query per batch instead of one check_patient_history() call per pair
+        - The latest record per pair is picked with a ROW_NUMBER() window ordered like check_patient_history()
+
+        Example
+        -----
+        Query class method: check_patient_histories([(123, R208), (456, R208)]) -> {(123, R208): 2.5, (456, R208): None}
+        """
+        pairs = list(dict.fromkeys((patient_id, rcode) for patient_id, rcode in patient_rcodes))
+        patient_histories = dict.fromkeys(pairs)
+        cursor = self.conn.cursor()
+
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            placeholders = ', '.join(['(?, ?)'] * len(batch))
+            params = [value for pair in batch for value in pair]
+
+            rows = cursor.execute(f'''
+            WITH requested(Patient_ID, Rcode) AS (VALUES {placeholders}),
+            ranked AS (
+                SELECT requested.Patient_ID, requested.Rcode, patient_data.Version,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY requested.Patient_ID, requested.Rcode
+                           ORDER BY patient_data.Date DESC, patient_data.Version DESC
+                       ) AS recency
+                FROM requested
+                JOIN patient_data
+                    ON patient_data.Patient_ID = requested.Patient_ID
+                    AND patient_data.Rcode = requested.Rcode
+            )
+            SELECT Patient_ID, Rcode, Version
+            FROM ranked
+            WHERE recency = 1
+            ''', params).fetchall()
+
+            for row in rows:
+                patient_histories[(row[0], row[1])] = row[2]
+
+        logger.debug(f"Retrieved latest versions for {len(pairs)} patient/R code pairs")
+        return patient_histories
+
     def get_db_latest_version(self, Rcode: str) -> str:
         """
         Returns the most uptodate panel verision stored within the Vimmo database for an input R code
@@ -369,6 +645,11 @@ class Query:
         
         Here 635 is the R208 panel ID, as of (26/11/24)
         """
+        snapshot = self._catalogue_snapshot()
+        if snapshot is not None:
+            rows = snapshot.by_rcode.get(Rcode)
+            return snapshot.panels[rows[0]][2] if rows else None
+
         cursor = self.conn.cursor()
 
 
@@ -411,6 +692,11 @@ class Query:
         Here 635 is the R208 panel ID, as of (26/11/24)
         """
 
+        snapshot = self._catalogue_snapshot()
+        if snapshot is not None:
+            rows = snapshot.by_rcode.get(Rcode)
+            return snapshot.panels[rows[0]][0] if rows else None
+
         cursor = self.conn.cursor()
 
         panel_id = cursor.execute(f'''
@@ -422,7 +708,25 @@ class Query:
         if panel_id is None:
             return None
         else:
-            return panel_id[0] 
+            return panel_id[0]
+
+    def panel_versions(self, panel_id=None, r_code=None) -> list:
+        """
+        Returns the (Panel_ID, Version) rows of the panel table for a Panel_ID or an R code
+
+        Notes
+        -----
+        - An R code can appear on more than one panel row, every row is returned
+        - Used to key the rendered BED artefacts (vimmo/utils/bed_artefacts.py) by panel version
+        """
+        snapshot = self._catalogue_snapshot()
+        if snapshot is not None:
+            rows = snapshot.by_panel_id.get(self._panel_key(panel_id), []) if panel_id else snapshot.by_rcode.get(r_code, [])
+            return sorted({(snapshot.panels[i][0], snapshot.panels[i][2]) for i in rows})
+
+        column, value = ("Panel_ID", panel_id) if panel_id else ("rcodes", r_code)
+        rows = self.conn.execute(f"SELECT DISTINCT Panel_ID, Version FROM panel WHERE {column} = ?", (value,)).fetchall()
+        return sorted(tuple(row) for row in rows)
     
     def return_all_records(self, Patient_id: str) -> str:
         """
@@ -544,6 +848,10 @@ class Query:
         "HGNC:20000": 3
         }
         """
+        snapshot = self._catalogue_snapshot()
+        if snapshot is not None:
+            return dict(snapshot.panel_genes.get(self._panel_key(panelID), []))
+
         cursor = self.conn.cursor()
         query = f"""
         SELECT HGNC_ID, Confidence
@@ -609,7 +917,7 @@ class Query:
 
         return historic_data
 
-    def compare_panel_versions(self, historic_version: dict, current_version: dict) -> dict:
+    def compare_panel_versions(self, historic_version: dict, current_version: dict) -> VersionDiff:
         """ Compares historic and current panel contents
 
         Parameters
@@ -623,6 +931,7 @@ class Query:
 
         Returns
         -------
+        VersionDiff (vimmo/db/panel_diff.py), a tuple of
         genes_added: dict
         Genes added from the current panel, not present in historic version 
 
@@ -634,41 +943,110 @@ class Query:
         
         Notes
         -----
-        - Executes a simple SQL query to Vimmo's 'panel' table (see db schema in repository root)
         - All dicts, except conf changes are Key:Value = HGNC_ID:Confidence
-        - Comparison is done via 3 seperate loops through the two input dicts
+        - One pass through each input dict (diff_versions); to compare many versions at once use
+          compare_panel_version_pairs
 
         Example
         -----
         For a detailed example, see user manual (vimmo.docx)
         """ 
-        # find genes added
-        genes_added = {}
-        for gene in current_version.keys():
-            if gene in historic_version.keys():
-                pass
-            else:
-                genes_added.update({gene:current_version[gene]})
-        # find genes remove
-        genes_removed = {}
-        for gene in historic_version.keys():
-            if gene in current_version:
-                pass
-            else:
-                genes_removed.update({gene:historic_version[gene]})
-        # find gene conf change
-        conf_changes = {}
-        for HGNC in current_version.keys():
-            if HGNC not in historic_version.keys(): # If gene new to panel, pass
-                pass
-            elif HGNC in historic_version.keys() and current_version[HGNC] == historic_version[HGNC]: # If gene confidence unchanged, pass
-                pass
-            
-            elif HGNC in historic_version.keys() and current_version[HGNC] != historic_version[HGNC]: # If gene in both versions and has changed, up
-                conf_changes.update({HGNC:(historic_version[HGNC],current_version[HGNC])})
-            
+        return diff_versions(historic_version, current_version)
+
+    def compare_panel_version_pairs(self, panel_versions, batch_size: int = 400) -> dict:
+        """ Compares many panel versions at once, for the cohort-wide change reports run after a PanelApp release
+
+        Parameters
+        ----------
+        - panel_versions : iterable of tuples
+          (Panel_ID, version) to compare a version with the panel's current contents, or
+          (Panel_ID, from_version, to_version)
+
+        - batch_size: int
+          Versions bound per archive query, keeps the bound parameters under SQLite's variable limit
+
+        Returns
+        -------
+        comparisons: dict
+        Maps each tuple as given to its VersionDiff (vimmo/db/panel_diff.py), or to None when one of its
+        versions is neither the panel's current version nor archived
 
-        return [genes_added, genes_removed, conf_changes] # Return the panel comparison information
+        Notes
+        -----
+        - Archived contents are read in one query per batch of versions, current contents as
+          current_panel_contents returns them
+        - Every version is loaded and encoded once and all pairs are diffed in one diff_many call, so
+          the patients who had the same panel version cost one comparison
+
+        Example
+        -----
+        Query class method: compare_panel_version_pairs([(635, 2.1), (635, 2.1, 2.5)]) -> {(635, 2.1): VersionDiff(...), ...}
+        """
+        requested = {}
+        for pair in panel_versions:
+            panel_id, from_version, *to_version = pair
+            to_version = to_version[0] if to_version else None
+            requested[tuple(pair)] = (self._panel_key(panel_id), float(from_version),
+                                      None if to_version is None else float(to_version))
+        panels = {panel_id for panel_id, _, _ in requested.values()}
+        current = {}
+        for panel_id, version in self.conn.execute("SELECT Panel_ID, MAX(Version) FROM panel GROUP BY Panel_ID"):
+            if panel_id in panels and version is not None:
+                current[panel_id] = (float(version), self.current_panel_contents(panel_id))
+
+        contents = {(panel_id, version): panel_genes for panel_id, (version, panel_genes) in current.items()}
+        archived = sorted({(panel_id, version) for panel_id, from_version, to_version in requested.values()
+                           for version in (from_version, to_version)
+                           if version is not None and (panel_id, version) not in contents}, key=str)
+        for start in range(0, len(archived), batch_size):
+            batch = archived[start:start + batch_size]
+            placeholders = ', '.join(['(?, ?)'] * len(batch))
+            rows = self.conn.execute(f'''
+            WITH requested(Panel_ID, Version) AS (VALUES {placeholders})
+            SELECT panel_genes_archive.Panel_ID, panel_genes_archive.Version, HGNC_ID, Confidence
+            FROM requested
+            JOIN panel_genes_archive
+                ON panel_genes_archive.Panel_ID = requested.Panel_ID
+                AND panel_genes_archive.Version = requested.Version
+            ''', [value for version in batch for value in version]).fetchall()
+            for panel_id, version, hgnc_id, confidence in rows:
+                contents.setdefault((panel_id, float(version)), {})[hgnc_id] = confidence
+
+        comparable = {}
+        for pair, (panel_id, from_version, to_version) in requested.items():
+            if to_version is None and panel_id in current:
+                to_version = current[panel_id][0]
+            old, new = contents.get((panel_id, from_version)), contents.get((panel_id, to_version))
+            if old is not None and new is not None:
+                comparable[pair] = (old, new)
+        comparisons = dict.fromkeys(requested)
+        comparisons.update(zip(comparable, diff_many(comparable.values())))
+        logger.debug(f"Compared {len(comparable)} of {len(requested)} panel version pairs")
+        return comparisons
+
+    def stored_version_comparison(self, panelID: str, from_version: float, to_version: float) -> Optional[VersionDiff]:
+        """ Compares two panel versions from the gene changes stored when the panel was updated
+
+        Parameters
+        ----------
+        - panelID : str
+          The panelApp panelID for the queried R code
+        - from_version, to_version: float
+          The older and the newer panel version
+
+        Returns
+        -------
+        VersionDiff or None
+        genes_added, genes_removed, confidence_changes as compare_panel_versions returns them, None
+        if the updates between the versions were applied before 'panel_gene_changes' existed
+
+        Notes
+        -----
+        - One indexed read of 'panel_gene_changes'; the changes of each update in between are composed
+          (see compose_gene_changes in vimmo/db/panel_contents.py)
+        - Fall back to historic_panel_retrieval, current_panel_contents and compare_panel_versions on None
+        """
+        return compose_gene_changes(self.conn, self._panel_key(panelID), from_version, to_version)
     
     def rcode_checker(self, rcode_value):
         """ Checks the validity of input rcodes
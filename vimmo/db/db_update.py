@@ -1,6 +1,9 @@
 from vimmo.logger.logging_config import logger
 from vimmo.utils.panelapp import PanelAppClient
 from vimmo.db.db_query import Query
+from vimmo.db.panel_catalogue import bump_generation
+from vimmo.db.panel_contents import replace_panel_genes
+from vimmo.utils.bed_artefacts import invalidate_bed_artefacts
 from datetime import date
 
 class Update:
@@ -106,88 +109,8 @@ class Update:
             self.conn.commit()
         return f'Record added to database: Patient_id: {patient_id}, Rcode: {rcode}, version: {version}, date: {date_today}'
     
-    def update_panels_version(self, rcode: str, new_version: str, panel_id: str):
-        """
-        Update the panel table with new version
-
-        Parameters
-        ----------
-       
-        - rcode (required): str
-          A specific R code to search for a given patient
-        - new_version (required): str
-          Most recent panel version
-        - panel_id (requeird): str
-          Panelapp panel Id corresponding to input Rcode 
-
-        Returns
-        -------
-        N/a 
-
-        Notes
-        -------
-        - Uses a simple SQL query to update 'panel' table with new version
-
-
-        Example 
-        -------
-        User input : rcode R45, patient_id 789
-        add_record(R45, 2.2, 3) -> 
-        <3    R45     2.2> inserted into db
-        """
-     
-        cursor = self.conn.cursor()
-        operator = "="
-        cursor.execute(f"""
-        UPDATE panel
-        SET Panel_ID {operator} ?, rcodes {operator} ?, Version {operator} ?
-        WHERE Panel_ID {operator} ? AND rcodes {operator} ?
-        """, (panel_id,rcode,new_version,panel_id,rcode))
-
-        self.conn.commit()
-    
-    def archive_panel_contents(self, panel_id: str, archive_version: str):
-        """
-        Archives outdated panel contents
-        
-        Parameters
-        ----------
-       
-        - panel_id (required): str
-          Panelapp panel Id corresponding to input Rcode 
-        - archive_version (required): str
-          Outdated panel version within Vimmo db
-         
-
-        Returns
-        -------
-        N/a 
-
-        Notes
-        -------
-        - Uses a simple SQL query to archive outdated panel contents
-        - Panel data archived from 'panel_genes' -> 'archive_panel_genes'
-
-        """
-        cursor = self.conn.cursor()
-        cursor.execute(
-            '''
-            INSERT INTO panel_genes_archive (Panel_ID, HGNC_ID, Version, Confidence)
-            SELECT pg.Panel_ID, pg.HGNC_ID, ?, pg.Confidence
-            FROM panel_genes pg
-            WHERE pg.Panel_ID = ?
-            AND NOT EXISTS (
-                SELECT 1 
-                FROM panel_genes_archive pga 
-                WHERE pga.Panel_ID = pg.Panel_ID 
-                AND pga.HGNC_ID = pg.HGNC_ID 
-                AND pga.Version = ?
-            )
-            ''', (archive_version, panel_id, archive_version)
-        )
-        self.conn.commit()
-
-    def update_gene_contents(self, Rcode: str, panel_id: str):
+    def update_gene_contents(self, Rcode: str, panel_id: str, archive_version: str = None, new_version: str = None,
+                             genes: dict = None) -> dict:
         """
         Updates the panel_genes table with new panel version contents
         
@@ -198,35 +121,39 @@ class Update:
           Panelapp panel Id corresponding to input Rcode 
         - Rcode (required): str
           PanelApp rare diease panel code
+        - archive_version (optional): str
+          Outdated panel version within Vimmo db, archived in the same transaction as the update
+        - new_version (optional): str
+          Version the panel is updated to; with archive_version the 'panel' version is set and the gene
+          changes between the two are stored in 'panel_gene_changes' (for /patient version
+          comparisons), in the same transaction as the contents
+        - genes (optional): dict
+          The new contents (HGNC_ID: Confidence) when already fetched with get_genes_HGNC(), so no
+          PanelApp request is made while the writer is held
          
 
         Returns
         -------
-        N/a 
+        dict
+        Added, removed and confidence changed genes (see replace_panel_genes)
 
         Notes
         -------
-        - Uses a simple SQL query to populate db with update panel contents
-        - First, retrieves most recent panel contents <get_genes_HGNC()>
-        - Second, deletes all genes in 'panel_genes' with given panel _id
-        - Third, populates table with new genes + conf
+        - First, retrieves most recent panel contents <get_genes_HGNC()>, unless genes are given; nothing
+          is written if this fails
+        - Second, replaces the panel's rows of 'panel_genes' with replace_panel_genes(), which only
+          writes the genes that changed, archiving the old contents first when archive_version is given.
+          The version, archive, contents and gene changes commit or roll back together
+        - Bumps the panel catalogue generation so cached panel lookups are reloaded, and removes the
+          panel's rendered BED downloads
 
         """
-        genes = self.papp.get_genes_HGNC(Rcode) # All HGNC:conf in panel version
+        if genes is None:
+            genes = self.papp.get_genes_HGNC(Rcode) # All HGNC:conf in panel version
 
-        cursor = self.conn.cursor()
+        versions = (float(archive_version), float(new_version)) if archive_version is not None and new_version is not None else None
+        changes = replace_panel_genes(self.conn, panel_id, genes, archive_version=archive_version, versions=versions)
 
-        cursor.execute(f"""
-        DELETE FROM panel_genes
-        WHERE Panel_ID = ?
-        """,(panel_id,))
-
-        for gene in genes:
-        
-            cursor.execute(f"""
-            INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence)
-            VALUES (?, ?, ?)
-            """,(panel_id, gene, genes[gene]))
-        
-        self.conn.commit()
-        
+        bump_generation(f"(panel {panel_id} gene contents updated)")
+        invalidate_bed_artefacts(panel_id)
+        return changes
@@ -0,0 +1,212 @@
+from vimmo.logger.logging_config import logger
+from sqlite3 import Connection
+from typing import Optional
+import numpy as np
+import os
+import threading
+import time
+
+
+DEFAULT_STORE_DIR = os.path.dirname(os.path.realpath(__file__))
+
+# genome build -> table holding its exons (written by database_prework/createdb/create_newdb.py)
+BED_TABLES = {"GRCh38": "bed38", "GRCh37": "bed37"}
+
+# Columns of the bed tables kept in the store (the columns Query.local_bed selects)
+STORE_COLUMNS = ("Chromosome", "Start", "End", "Name", "HGNC_ID", "Transcript", "Strand", "Type")
+
+# Sort rank of the non-numeric chromosomes, after the autosomes; any other contig sorts after these by name
+CHROMOSOME_RANKS = {"X": 23, "Y": 24, "M": 25, "MT": 25}
+
+
+def chromosome_rank(label: str) -> tuple:
+    """Sort key of a chromosome label: chr1..chr22, chrX, chrY, chrM, then any other contig by name."""
+    name = label[3:] if label.lower().startswith("chr") else label
+    if name.isdigit():
+        return (int(name), "")
+    return (CHROMOSOME_RANKS.get(name.upper(), 26), name)
+
+
+class ExonStore:
+    """
+    Coordinate-sorted, columnar copy of one genome build's exon table (bed38 / bed37).
+
+    Attributes
+    ----------
+    build : str
+        Genome build, a key of BED_TABLES
+    fingerprint : tuple
+        (rows, sum of Start, sum of End) of the table the store was built from
+    columns : dict
+        Column name -> NumPy array, rows sorted by chromosome (chromosome_rank), Start and End
+    gene_ids : np.ndarray
+        Sorted unique HGNC_IDs
+    gene_offsets : np.ndarray
+        gene_rows[gene_offsets[i]:gene_offsets[i + 1]] are the rows of gene_ids[i], in ascending order
+    gene_rows : np.ndarray
+        Row numbers grouped by gene
+
+    Notes
+    -----
+    - Genes are found by binary search (np.searchsorted) in gene_ids, and the rows of a panel are the
+      union of its genes' slices of gene_rows. Sorting those row numbers puts the panel back in
+      coordinate order, so the BED comes out sorted without sorting any coordinates
+    - Saved as a single uncompressed .npz (see save / load)
+    """
+    def __init__(self, build: str, columns: dict, fingerprint: tuple):
+        self.build = build
+        self.columns = columns
+        self.fingerprint = tuple(fingerprint)
+
+        order = np.argsort(columns["HGNC_ID"], kind="stable")  # rows of each gene stay in ascending order
+        self.gene_rows = order.astype(np.int64)
+        self.gene_ids, starts = np.unique(columns["HGNC_ID"][order], return_index=True)
+        self.gene_offsets = np.append(starts, len(order)).astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self.columns["Start"])
+
+    @classmethod
+    def build_from_db(cls, conn: Connection, build: str) -> "ExonStore":
+        """Reads the build's bed table and sorts it by chromosome, Start and End."""
+        table = BED_TABLES[build]
+        started = time.perf_counter()
+        rows = conn.execute(f"SELECT {', '.join(STORE_COLUMNS)} FROM {table}").fetchall()
+        values = dict(zip(STORE_COLUMNS, zip(*rows))) if rows else {column: () for column in STORE_COLUMNS}
+
+        columns = {}
+        for column in STORE_COLUMNS:
+            if column in ("Start", "End"):
+                columns[column] = np.array(values[column], dtype=np.int64)
+            else:  # NULLs become empty strings, which is how local_bed_stream writes them anyway
+                columns[column] = np.array(["" if value is None else str(value) for value in values[column]], dtype=str)
+
+        # Rank the few distinct chromosome labels once, then sort all rows with one lexsort
+        labels, codes = np.unique(columns["Chromosome"], return_inverse=True)
+        label_rank = np.empty(len(labels), dtype=np.int64)
+        label_rank[sorted(range(len(labels)), key=lambda i: chromosome_rank(str(labels[i])))] = np.arange(len(labels))
+        order = np.lexsort((columns["End"], columns["Start"], label_rank[codes.reshape(-1)]))
+        columns = {column: array[order] for column, array in columns.items()}
+
+        store = cls(build, columns, fingerprint(conn, build))
+        logger.info(f"Exon store for {build} built from {table}: {len(store)} exons, {len(store.gene_ids)} genes "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return store
+
+    def rows_for_genes(self, gene_query) -> np.ndarray:
+        """Row numbers, in coordinate order, of every exon of the genes in gene_query."""
+        genes = np.array(sorted({str(gene).strip() for gene in gene_query}), dtype=str)
+        positions = np.searchsorted(self.gene_ids, genes)
+        inside = positions < len(self.gene_ids)
+        positions = positions[inside][self.gene_ids[positions[inside]] == genes[inside]]  # genes in the store
+        slices = [self.gene_rows[self.gene_offsets[i]:self.gene_offsets[i + 1]] for i in positions]
+        if not slices:
+            return np.array([], dtype=np.int64)
+        return np.sort(np.concatenate(slices))
+
+    def records(self, rows: np.ndarray):
+        """Yields the given rows as dicts keyed like the bed table columns (what local_bed_stream reads)."""
+        for values in zip(*(self.columns[column][rows].tolist() for column in STORE_COLUMNS)):
+            yield dict(zip(STORE_COLUMNS, values))
+
+    def save(self, path: str):
+        """Writes the store to path (.npz) through a temporary file, so readers never see a partial file."""
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(tmp_path, fingerprint=np.array(self.fingerprint, dtype=np.float64),
+                 **{f"column_{name}": values for name, values in self.columns.items()})
+        os.replace(tmp_path, path)
+        logger.info(f"Exon store for {self.build} written to {path}")
+
+    @classmethod
+    def load(cls, path: str, build: str) -> "ExonStore":
+        with np.load(path, allow_pickle=False) as data:
+            columns = {key[len("column_"):]: data[key] for key in data.files if key.startswith("column_")}
+            return cls(build, columns, tuple(data["fingerprint"].tolist()))
+
+
+def fingerprint(conn: Connection, build: str) -> tuple:
+    """(rows, sum of Start, sum of End) of a bed table; a store built from other contents is stale."""
+    rows, starts, ends = conn.execute(f"SELECT COUNT(*), TOTAL(Start), TOTAL(End) FROM {BED_TABLES[build]}").fetchone()
+    return (float(rows), float(starts), float(ends))
+
+
+def store_path(build: str, directory: Optional[str] = None) -> str:
+    directory = directory or os.environ.get("VIMMO_EXON_STORE_DIR", DEFAULT_STORE_DIR)
+    return os.path.join(directory, f"exon_store_{BED_TABLES[build]}.npz")
+
+
+def build_exon_stores(conn: Connection, directory: Optional[str] = None) -> dict:
+    """
+    Rebuilds and saves the store of every genome build; run whenever the bed tables are reloaded.
+
+    Returns
+    -------
+    dict
+        Genome build -> ExonStore
+    """
+    stores = {}
+    for build in BED_TABLES:
+        stores[build] = ExonStore.build_from_db(conn, build)
+        stores[build].save(store_path(build, directory))
+    return stores
+
+
+class ExonStores:
+    """
+    Lazily loaded ExonStore per genome build, shared by the API's local BED endpoints.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Where the .npz files live, defaults to $VIMMO_EXON_STORE_DIR or vimmo/db
+
+    Notes
+    -----
+    - On first use of a build the saved store is loaded and checked against the table's fingerprint.
+      A missing or stale store is rebuilt from the database and saved again (falling back to the
+      in-memory copy if the directory is read-only)
+    - The check runs once per build and process; the bed tables only change when create_newdb.py
+      reloads them, and that rebuilds the stores itself
+    """
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self._stores = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn: Connection, build: str) -> ExonStore:
+        store = self._stores.get(build)
+        if store is not None:
+            return store
+        with self._lock:
+            store = self._stores.get(build)
+            if store is None:
+                store = self._load_or_build(conn, build)
+                self._stores[build] = store
+        return store
+
+    def _load_or_build(self, conn: Connection, build: str) -> ExonStore:
+        path = store_path(build, self.directory)
+        current = fingerprint(conn, build)
+        if os.path.exists(path):
+            try:
+                store = ExonStore.load(path, build)
+                if store.fingerprint == current:
+                    logger.info(f"Exon store for {build} loaded from {path}")
+                    return store
+                logger.info(f"Exon store {path} is stale, rebuilding")
+            except Exception as err:
+                logger.warning(f"Exon store {path} could not be read, rebuilding: {err}")
+        store = ExonStore.build_from_db(conn, build)
+        try:
+            store.save(path)
+        except OSError as err:
+            logger.warning(f"Exon store for {build} could not be saved, keeping it in memory: {err}")
+        return store
+
+    def invalidate(self):
+        with self._lock:
+            self._stores.clear()
+
+
+# Shared by the API endpoints
+exon_stores = ExonStores()
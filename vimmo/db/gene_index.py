@@ -0,0 +1,160 @@
+from vimmo.logger.logging_config import logger
+from bisect import bisect_left
+from typing import Iterable, Optional
+import time
+
+
+# Fuzzy matching is only tried for symbols at least this long, shorter ones are within one edit of too much
+MIN_FUZZY_LENGTH = 3
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """
+    True when a and b differ by at most one insertion, deletion, substitution or adjacent transposition.
+
+    Linear in the length of the strings, unlike a full edit distance.
+    """
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < len(a) and i < len(b) and a[i] == b[i]:
+        i += 1
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    if len(a) < len(b):
+        return a[i:] == b[i + 1:]
+    return a[i + 1:] == b[i + 1:] or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:])
+
+
+def _deletes(key: str) -> set:
+    """The key with each one of its characters removed."""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+class GeneIndex:
+    """
+    Inverted index from HGNC IDs and gene symbols to the panels containing them.
+
+    Parameters
+    ----------
+    snapshot : CatalogueSnapshot
+        Panel, panel_genes and genes_info tables to index (vimmo/db/panel_catalogue.py)
+
+    Attributes
+    ----------
+    symbols : dict
+        HGNC_ID -> HGNC_symbol
+    gene_symbols : dict
+        HGNC_ID -> distinct Gene_Symbol values of its genes_info rows
+    keys : dict
+        Upper-cased HGNC_ID, HGNC_symbol and Gene_Symbol -> tuple of HGNC_IDs
+    gene_panels : dict
+        HGNC_ID -> list of (index into snapshot.panels, Confidence), in panel table order
+
+    Notes
+    -----
+    - Built once per snapshot (CatalogueSnapshot.gene_index), so it is rebuilt with the catalogue after
+      any panel update or downgrade
+    - Only genes present in genes_info are indexed, as in the SQL join of get_panels_from_gene_list
+    - Prefix lookups bisect a sorted key list; fuzzy lookups go through a single-deletion neighbourhood
+      of every symbol (symmetric delete), so neither scans the ~5k genes
+    """
+    def __init__(self, snapshot):
+        started = time.perf_counter()
+        self.snapshot = snapshot
+        self.symbols = {}
+        self.gene_symbols = {}
+        self.keys = {}
+        for hgnc_id, rows in snapshot.genes.items():
+            self.symbols[hgnc_id] = rows[0][2] or rows[0][1]
+            self.gene_symbols[hgnc_id] = list(dict.fromkeys(row[1] for row in rows))
+            for key in {hgnc_id, *(row[1] for row in rows), *(row[2] for row in rows)}:
+                if key:
+                    key = str(key).upper()
+                    self.keys[key] = self.keys.get(key, ()) + (hgnc_id,)
+        self._sorted_keys = sorted(self.keys)
+
+        self._symbol_deletes = {}
+        for key in self.keys:
+            if not key.startswith("HGNC:"):
+                for variant in _deletes(key) | {key}:
+                    self._symbol_deletes.setdefault(variant, []).append(key)
+
+        self.gene_panels = {}
+        for i, (panel_id, _, _) in enumerate(snapshot.panels):
+            for hgnc_id, confidence in snapshot.panel_genes.get(panel_id, []):
+                if hgnc_id in snapshot.genes:
+                    self.gene_panels.setdefault(hgnc_id, []).append((i, confidence))
+        logger.info(f"Gene index built: {len(self.keys)} keys, {len(self.gene_panels)} genes on panels "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _prefix(self, prefix: str, limit: int) -> list:
+        keys = []
+        position = bisect_left(self._sorted_keys, prefix)
+        while position < len(self._sorted_keys) and len(keys) < limit:
+            key = self._sorted_keys[position]
+            if not key.startswith(prefix):
+                break
+            keys.append(key)
+            position += 1
+        return keys
+
+    def _fuzzy(self, term: str) -> list:
+        candidates = set()
+        for variant in _deletes(term) | {term}:
+            candidates.update(self._symbol_deletes.get(variant, ()))
+        return sorted(key for key in candidates if within_one_edit(term, key))
+
+    def lookup(self, term: str, matches: bool = False, limit: int = 1000) -> list:
+        """
+        Resolves one query term to HGNC IDs.
+
+        Parameters
+        ----------
+        term : str
+            HGNC ID or gene symbol (case-insensitive). A trailing '*' asks for a prefix lookup
+        matches : bool
+            False: exact matches only. True: exact matches, else keys starting with the term, else
+            symbols within one edit of it
+        limit : int
+            Keys expanded per prefix lookup
+
+        Returns
+        -------
+        list of (HGNC_ID, match type)
+            Each HGNC_ID once, in the order found
+        """
+        key = term.strip().upper()
+        if key.endswith("*"):
+            found = [(found_key, "prefix") for found_key in self._prefix(key.rstrip("*"), limit)]
+        elif key in self.keys or not matches:
+            found = [(key, "exact")] if key in self.keys else []
+        else:
+            found = [(found_key, "prefix") for found_key in self._prefix(key, limit)]
+            if not found and len(key) >= MIN_FUZZY_LENGTH:
+                found = [(found_key, "fuzzy") for found_key in self._fuzzy(key)]
+        hits = {}
+        for found_key, match in found:
+            for hgnc_id in self.keys[found_key]:
+                hits.setdefault(hgnc_id, match)
+        return list(hits.items())
+
+    def rank(self, hgnc_ids: Iterable[str], confidence: Optional[int] = None) -> list:
+        """
+        Panels containing any of the genes, most query genes first.
+
+        Returns
+        -------
+        list of (index into snapshot.panels, list of HGNC_IDs)
+            Each gene once per panel, in query order; ties are ordered by Panel_ID
+        """
+        by_panel = {}
+        for hgnc_id in dict.fromkeys(hgnc_ids):
+            for i, gene_confidence in self.gene_panels.get(hgnc_id, ()):
+                if confidence is None or gene_confidence == confidence:
+                    by_panel.setdefault(i, {})[hgnc_id] = None  # panel_genes can list a gene twice
+        panels = self.snapshot.panels
+        ranked = sorted(by_panel.items(), key=lambda item: (-len(item[1]), str(panels[item[0]][0]).zfill(12), item[0]))
+        return [(i, list(genes)) for i, genes in ranked]
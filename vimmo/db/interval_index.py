@@ -0,0 +1,239 @@
+from vimmo.logger.logging_config import logger
+from vimmo.db.exon_store import ExonStores, chromosome_rank, exon_stores
+from sqlite3 import Connection
+from typing import Callable, Optional
+import numpy as np
+import threading
+import time
+
+
+# Coordinates are packed below the container id in one int64 key (container << COORD_BITS | coordinate)
+COORD_BITS = 32
+MAX_COORD = (1 << COORD_BITS) - 1
+
+
+def normalise_chromosome(label) -> str:
+    """'chr17' / '17' -> '17', 'chrX' -> 'X', 'chrM' / 'MT' -> 'MT'."""
+    name = str(label).strip()
+    if name.lower().startswith("chr"):
+        name = name[3:]
+    name = name.upper()
+    return "MT" if name == "M" else name
+
+
+class IntervalIndex:
+    """
+    Nested containment list (NCList) over half-open intervals [start, end), stored as flat sorted arrays.
+
+    Parameters
+    ----------
+    chroms : sequence of str
+        Chromosome of each interval (normalised with normalise_chromosome)
+    starts, ends : array-like of int
+        0-based, half-open coordinates
+
+    Notes
+    -----
+    - Every interval lives in one container: the top-level list of its chromosome, or the sublist of
+      the smallest interval containing it. Within a container no interval contains another, so its
+      starts and ends are both strictly increasing and the overlaps of a query are one contiguous run,
+      found with two binary searches
+    - All containers share two sorted int64 key arrays ((container << 32) | start, and the same for
+      end), so a whole batch of queries is answered level by level with vectorised np.searchsorted
+      calls: O((n + k) log m) for n queries, k overlaps and m intervals
+    """
+    def __init__(self, chroms, starts, ends):
+        started = time.perf_counter()
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, MAX_COORD)
+        ends = np.clip(np.asarray(ends, dtype=np.int64), 0, MAX_COORD)
+        self.starts, self.ends = starts, ends
+        self.chromosomes = sorted({normalise_chromosome(chrom) for chrom in chroms}, key=chromosome_rank)
+        self._chrom_codes = {chrom: code for code, chrom in enumerate(self.chromosomes)}
+        codes = np.array([self._chrom_codes[normalise_chromosome(chrom)] for chrom in chroms], dtype=np.int64)
+        self.size = len(starts)
+        n_roots = len(self.chromosomes)
+
+        # Sorted by chromosome, start ascending and end descending, a containing interval always comes first
+        order = np.lexsort((-ends, starts, codes))
+        container = np.empty(self.size, dtype=np.int64)  # container each interval lives in
+        stack = []
+        for i in order.tolist():
+            chrom, end = codes[i], ends[i]
+            while stack and (codes[stack[-1]] != chrom or ends[stack[-1]] < end):
+                stack.pop()
+            container[i] = n_roots + stack[-1] if stack else chrom  # interval j's sublist is container n_roots + j
+            stack.append(i)
+
+        has_children = np.zeros(self.size, dtype=bool)
+        parents = container[container >= n_roots] - n_roots
+        has_children[parents] = True
+
+        layout = np.lexsort((starts, container))
+        self._ids = layout                                  # layout position -> interval id
+        self._key_start = (container[layout] << COORD_BITS) | starts[layout]
+        self._key_end = (container[layout] << COORD_BITS) | ends[layout]
+        self._has_children = has_children[layout]
+        self._child_container = n_roots + layout             # sublist container of the interval at each position
+        logger.debug(f"Interval index over {self.size} intervals built in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def query(self, chroms, starts, ends) -> tuple:
+        """
+        Finds every interval overlapping each query region.
+
+        Parameters
+        ----------
+        chroms : sequence of str
+        starts, ends : array-like of int
+            Query regions, 0-based half-open
+
+        Returns
+        -------
+        (np.ndarray, np.ndarray)
+            Parallel arrays of query positions and interval ids, one pair per overlap, sorted by query
+            position and then interval id
+        """
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, MAX_COORD)
+        ends = np.clip(np.asarray(ends, dtype=np.int64), 0, MAX_COORD)
+        chroms = list(chroms)
+        label_codes = {label: self._chrom_codes.get(normalise_chromosome(label), -1) for label in set(chroms)}
+        codes = np.array([label_codes[label] for label in chroms], dtype=np.int64)
+
+        pair_query = np.flatnonzero(codes >= 0)
+        pair_container = codes[pair_query]
+        hit_query, hit_position = [], []
+        while len(pair_query):
+            base = pair_container << COORD_BITS
+            lo = np.searchsorted(self._key_end, base | starts[pair_query], side="right")   # first end > start
+            hi = np.searchsorted(self._key_start, base | ends[pair_query], side="left")    # first start >= end
+            counts = np.maximum(hi - lo, 0)
+            total = int(counts.sum())
+            if not total:
+                break
+            query = np.repeat(pair_query, counts)
+            position = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(lo, counts)
+            hit_query.append(query)
+            hit_position.append(position)
+
+            nested = self._has_children[position]  # overlaps may continue inside the sublists of the hits
+            pair_query = query[nested]
+            pair_container = self._child_container[position[nested]]
+
+        if not hit_query:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+        query = np.concatenate(hit_query)
+        ids = self._ids[np.concatenate(hit_position)]
+        key = np.sort(query * max(self.size, 1) + ids)  # one int64 sort instead of a two-key lexsort
+        return key // max(self.size, 1), key % max(self.size, 1)
+
+
+class RegionIndex:
+    """
+    Interval indexes over one genome build's genes (genes_info) and exons (the exon store).
+
+    Attributes
+    ----------
+    genes : IntervalIndex
+        Gene spans, converted from genes_info's 1-based closed coordinates to half-open
+    gene_ids, gene_symbols : np.ndarray
+        HGNC_ID and HGNC symbol of each gene interval
+    exons : IntervalIndex
+        Rows of the build's ExonStore (already 0-based half-open, as in the BED files)
+    exon_store : ExonStore
+    """
+    def __init__(self, conn: Connection, build: str, exon_stores: ExonStores):
+        prefix = build  # genes_info columns are GRCh38_Chr / GRCh38_start / ... and GRCh37_...
+        rows = conn.execute(f'''
+            SELECT HGNC_ID, HGNC_symbol, {prefix}_Chr, {prefix}_start, {prefix}_stop
+            FROM genes_info
+            WHERE {prefix}_Chr IS NOT NULL AND {prefix}_start IS NOT NULL AND {prefix}_stop IS NOT NULL
+        ''').fetchall()
+        self.gene_ids = np.array([row[0] for row in rows], dtype=str)
+        self.gene_symbols = np.array(["" if row[1] is None else str(row[1]) for row in rows], dtype=str)
+        self.genes = IntervalIndex([row[2] for row in rows], [int(row[3]) - 1 for row in rows], [int(row[4]) for row in rows])
+
+        self.exon_store = exon_stores.get(conn, build)
+        columns = self.exon_store.columns
+        self.exons = IntervalIndex(columns["Chromosome"].tolist(), columns["Start"], columns["End"])
+        logger.info(f"Region index for {build}: {self.genes.size} genes, {self.exons.size} exons")
+
+    def overlaps(self, regions: list, panel_lookup: Optional[Callable] = None, include_exons: bool = True) -> list:
+        """
+        Genes, exons and panels overlapping each region.
+
+        Parameters
+        ----------
+        regions : list of (chrom, start, end)
+            0-based half-open regions, as parsed by arg_validator.parse_regions
+        panel_lookup : callable, optional
+            Called once with the set of overlapping HGNC_IDs, returns HGNC_ID -> list of panel dicts
+            (e.g. Query.gene_panels); each region then lists the panels of its genes
+        include_exons : bool
+            Also report the overlapping exons (the bulk of the response for large regions)
+
+        Returns
+        -------
+        list of dict
+            One entry per region, in input order. The region is echoed 1-based inclusive
+            ('chr17:43044295-43125483'); gene and exon coordinates are 0-based half-open, like the BED
+            downloads
+        """
+        chroms = [region[0] for region in regions]
+        starts = [region[1] for region in regions]
+        ends = [region[2] for region in regions]
+        # Regions are echoed in 1-based inclusive notation, whichever way they were given
+        results = [{"region": f"{chrom}:{start + 1}-{end}", "genes": [], "panels": []} for chrom, start, end in regions]
+
+        gene_query, gene_hits = self.genes.query(chroms, starts, ends)
+        gene_starts, gene_ends = self.genes.starts, self.genes.ends
+        for position, gene in zip(gene_query.tolist(), gene_hits.tolist()):
+            results[position]["genes"].append({"HGNC_ID": str(self.gene_ids[gene]), "HGNC_symbol": str(self.gene_symbols[gene]),
+                                               "start": int(gene_starts[gene]), "end": int(gene_ends[gene])})
+
+        if panel_lookup is not None:
+            gene_panels = panel_lookup({str(self.gene_ids[gene]) for gene in np.unique(gene_hits).tolist()})
+            for result in results:
+                panels = {}
+                for gene in result["genes"]:
+                    for panel in gene_panels.get(gene["HGNC_ID"], []):
+                        genes = panels.setdefault((panel["Panel_ID"], panel["rcodes"]), [])
+                        if gene["HGNC_ID"] not in genes:
+                            genes.append(gene["HGNC_ID"])
+                result["panels"] = [{"Panel_ID": panel_id, "rcodes": rcode, "HGNC_IDs": genes}
+                                    for (panel_id, rcode), genes in sorted(panels.items(), key=lambda item: (str(item[0][0]).zfill(8), str(item[0][1])))]
+        else:
+            for result in results:
+                del result["panels"]
+
+        if include_exons:
+            for result in results:
+                result["exons"] = []
+            exon_query, exon_hits = self.exons.query(chroms, starts, ends)
+            for position, record in zip(exon_query.tolist(), self.exon_store.records(exon_hits)):
+                results[position]["exons"].append(record)
+        return results
+
+
+class RegionIndexes:
+    """Lazily built RegionIndex per genome build, shared by the region endpoint."""
+    def __init__(self, exon_stores: Optional[ExonStores] = None):
+        self.exon_stores = exon_stores
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, conn: Connection, build: str) -> RegionIndex:
+        index = self._indexes.get(build)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(build)
+                if index is None:
+                    index = RegionIndex(conn, build, self.exon_stores or ExonStores())
+                    self._indexes[build] = index
+        return index
+
+    def invalidate(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+# Shared by the API endpoints
+region_indexes = RegionIndexes(exon_stores)
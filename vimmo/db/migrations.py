@@ -0,0 +1,163 @@
+from vimmo.logger.logging_config import logger
+from sqlite3 import Connection
+from datetime import datetime
+import sqlite3
+
+
+# Ordered list of (version, description, statements). Append new migrations with the next version number,
+# never edit one that has been released: the versions already applied to a database are recorded in
+# the schema_migrations table and are skipped on the next run.
+MIGRATIONS = [
+    (1, "base tables (layout written by database_prework/createdb/create_newdb.py)", [
+        '''CREATE TABLE IF NOT EXISTS panel (
+            Panel_ID INTEGER, rcodes TEXT, Version REAL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS panel_genes (
+            Panel_ID INTEGER, HGNC_ID TEXT, Confidence INTEGER
+        )''',
+        '''CREATE TABLE IF NOT EXISTS genes_info (
+            HGNC_ID TEXT, Gene_ID TEXT, HGNC_symbol TEXT, Gene_Symbol TEXT,
+            GRCh38_Chr TEXT, GRCh38_start REAL, GRCh38_stop REAL,
+            GRCh37_Chr TEXT, GRCh37_start REAL, GRCh37_stop REAL
+        )''',
+        '''CREATE TABLE IF NOT EXISTS patient_data (
+            Patient_ID TEXT, Panel_ID INTEGER, Rcode TEXT, Version REAL, Date TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS panel_genes_archive (
+            Panel_ID INTEGER, HGNC_ID TEXT, Version REAL, Confidence INTEGER
+        )''',
+        '''CREATE TABLE IF NOT EXISTS bed38 (
+            Chromosome TEXT, Start INTEGER, End INTEGER, Name TEXT,
+            HGNC_ID TEXT, Transcript TEXT, Strand TEXT, Type TEXT
+        )''',
+        '''CREATE TABLE IF NOT EXISTS bed37 (
+            Chromosome TEXT, Start INTEGER, End INTEGER, Name TEXT,
+            HGNC_ID TEXT, Transcript TEXT, Strand TEXT, Type TEXT
+        )''',
+    ]),
+    (2, "covering indexes for the Query and Update lookups", [
+        # get_panel_data, replace_panel_genes version moves
+        "CREATE INDEX IF NOT EXISTS idx_panel_panel_id ON panel (Panel_ID, rcodes, Version)",
+        # get_panels_by_rcode, get_db_latest_version, rcode_to_panelID, rcode_checker
+        "CREATE INDEX IF NOT EXISTS idx_panel_rcodes ON panel (rcodes, Panel_ID, Version)",
+        # panel joins, current_panel_contents, update/downgrade deletes
+        "CREATE INDEX IF NOT EXISTS idx_panel_genes_panel ON panel_genes (Panel_ID, Confidence, HGNC_ID)",
+        # get_panels_from_gene_list
+        "CREATE INDEX IF NOT EXISTS idx_panel_genes_hgnc ON panel_genes (HGNC_ID, Panel_ID)",
+        # joins on genes_info, get_gene_symbol
+        "CREATE INDEX IF NOT EXISTS idx_genes_info_hgnc ON genes_info (HGNC_ID, HGNC_symbol)",
+        # check_patient_history, return_all_records, Update.check_presence
+        "CREATE INDEX IF NOT EXISTS idx_patient_data_patient ON patient_data (Patient_ID, Rcode, Date, Version)",
+        # return_all_patients
+        "CREATE INDEX IF NOT EXISTS idx_patient_data_rcode ON patient_data (Rcode, Patient_ID)",
+        # historic_panel_retrieval, replace_panel_genes archiving
+        "CREATE INDEX IF NOT EXISTS idx_panel_genes_archive ON panel_genes_archive (Panel_ID, Version, HGNC_ID, Confidence)",
+        # local_bed
+        "CREATE INDEX IF NOT EXISTS idx_bed38_hgnc ON bed38 (HGNC_ID)",
+        "CREATE INDEX IF NOT EXISTS idx_bed37_hgnc ON bed37 (HGNC_ID)",
+        "ANALYZE",
+    ]),
+    (3, "scheduled update journal: per-run timings and per-panel crawl state", [
+        # One row per scheduled_update run, see scheduled_update.run_journaled_update
+        '''CREATE TABLE IF NOT EXISTS update_runs (
+            Run_ID INTEGER PRIMARY KEY AUTOINCREMENT, Started_At TEXT, Finished_At TEXT, Status TEXT,
+            Listed INTEGER DEFAULT 0, Changed INTEGER DEFAULT 0, New INTEGER DEFAULT 0, Skipped INTEGER DEFAULT 0,
+            Applied INTEGER DEFAULT 0, Failed INTEGER DEFAULT 0, Batches INTEGER DEFAULT 0,
+            Crawl_Seconds REAL, Download_Seconds REAL DEFAULT 0, Apply_Seconds REAL DEFAULT 0, Total_Seconds REAL,
+            Error TEXT
+        )''',
+        # Latest state of each panel: the version PanelApp listed, and whether it has been applied
+        '''CREATE TABLE IF NOT EXISTS update_journal (
+            Panel_ID INTEGER PRIMARY KEY, rcodes TEXT, Run_ID INTEGER, Fetched_Version REAL,
+            Applied_Version REAL, State TEXT, Attempts INTEGER DEFAULT 0, Fetched_At TEXT,
+            Confirmed_At TEXT, Error TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_update_journal_run ON update_journal (Run_ID, State)",
+    ]),
+    (4, "gene-level deltas of applied panel updates", [
+        # Written by replace_panel_genes, read by compose_gene_changes (vimmo/db/panel_contents.py)
+        '''CREATE TABLE IF NOT EXISTS panel_gene_changes (
+            Panel_ID INTEGER, From_Version REAL, To_Version REAL, HGNC_ID TEXT, Change TEXT,
+            Old_Confidence INTEGER, New_Confidence INTEGER, Recorded_At TEXT
+        )''',
+        "CREATE INDEX IF NOT EXISTS idx_panel_gene_changes ON panel_gene_changes (Panel_ID, From_Version, To_Version)",
+    ]),
+]
+
+
+def applied_versions(conn: Connection) -> set:
+    """
+    Returns the migration versions already applied to a database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the database
+
+    Returns
+    -------
+    set
+        Version numbers recorded in the schema_migrations table
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TEXT
+        )
+    ''')
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations").fetchall()}
+
+
+def run_migrations(conn: Connection, migrations: list = None) -> list:
+    """
+    Applies every migration that has not yet been applied to the database.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection with write access to the database
+    migrations : list, optional
+        (version, description, statements) tuples, defaults to MIGRATIONS
+
+    Returns
+    -------
+    list
+        The versions applied during this run (empty if the schema was already current)
+
+    Notes
+    -----
+    - Each migration runs in its own transaction together with its schema_migrations entry,
+      so a failure leaves the database at the last fully applied version
+    - Statements must be idempotent (IF NOT EXISTS) so a database built before the runner existed
+      can be brought under version control
+    """
+    migrations = MIGRATIONS if migrations is None else migrations
+    done = applied_versions(conn)
+    conn.commit()
+    newly_applied = []
+
+    for version, description, statements in sorted(migrations, key=lambda migration: migration[0]):
+        if version in done:
+            continue
+        logger.info("Applying database migration %d: %s", version, description)
+        try:
+            conn.execute("BEGIN")
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_migrations (version, description, applied_at) VALUES (?, ?, ?)",
+                (version, description, datetime.now().isoformat(timespec="seconds"))
+            )
+            conn.commit()
+        except sqlite3.Error as err:
+            conn.rollback()
+            logger.error("Database migration %d failed: %s", version, err)
+            raise
+        newly_applied.append(version)
+
+    if newly_applied:
+        logger.info("Database migrated to version %d", max(newly_applied))
+    else:
+        logger.debug("Database schema is up to date")
+    return newly_applied
@@ -0,0 +1,201 @@
+from vimmo.logger.logging_config import logger
+from vimmo.db.gene_index import GeneIndex
+from vimmo.db.panel_search import PanelSearchIndex
+from sqlite3 import Connection
+from typing import Optional
+import threading
+import time
+
+
+# Process-wide generation counter. Anything that changes the panel, panel_genes or genes_info tables
+# calls bump_generation() after committing, and every PanelCatalogue built from an older generation
+# reloads on its next lookup.
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def bump_generation(reason: str = "") -> int:
+    """
+    Marks every loaded panel catalogue as stale.
+
+    Parameters
+    ----------
+    reason : str, optional
+        Logged with the new generation, e.g. "panel 635 updated to 4.2"
+
+    Returns
+    -------
+    int
+        The new generation
+    """
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        generation = _generation
+    logger.debug(f"Panel catalogue generation bumped to {generation} {reason}".rstrip())
+    return generation
+
+
+def current_generation() -> int:
+    return _generation
+
+
+# Column order of the genes_info fields returned by Query.get_panel_data / get_panels_by_rcode
+GENE_FIELDS = ("HGNC_ID", "Gene_Symbol", "HGNC_symbol", "GRCh38_Chr", "GRCh38_start", "GRCh38_stop",
+               "GRCh37_Chr", "GRCh37_start", "GRCh37_stop")
+
+
+class CatalogueSnapshot:
+    """
+    Immutable copy of the panel, panel_genes and genes_info tables.
+
+    Attributes
+    ----------
+    generation : int
+        Generation the snapshot was loaded at
+    loaded_at : float
+        time.monotonic() of the load
+    panels : list[tuple]
+        (Panel_ID, rcodes, Version) rows of the panel table, in table order
+    by_panel_id, by_rcode : dict
+        Panel_ID / R code -> indexes into panels
+    panel_genes : dict
+        Panel_ID -> list of (HGNC_ID, Confidence), in table order
+    genes : dict
+        HGNC_ID -> list of genes_info rows (tuples ordered as GENE_FIELDS)
+    gene_index : GeneIndex
+        HGNC ID / symbol -> panels index, built on first use
+    panel_search : PanelSearchIndex
+        Panel_ID / R code / name n-gram index for similar matches, built on first use
+    """
+    def __init__(self, conn: Connection, generation: int):
+        self.generation = generation
+        self.loaded_at = time.monotonic()
+        cursor = conn.cursor()
+
+        self.panels = [tuple(row) for row in cursor.execute("SELECT Panel_ID, rcodes, Version FROM panel")]
+        self.by_panel_id = {}
+        self.by_rcode = {}
+        for i, (panel_id, rcode, _) in enumerate(self.panels):
+            self.by_panel_id.setdefault(panel_id, []).append(i)
+            self.by_rcode.setdefault(rcode, []).append(i)
+
+        self.panel_genes = {}
+        for panel_id, hgnc_id, confidence in cursor.execute("SELECT Panel_ID, HGNC_ID, Confidence FROM panel_genes"):
+            self.panel_genes.setdefault(panel_id, []).append((hgnc_id, confidence))
+
+        self.genes = {}
+        for row in cursor.execute(f"SELECT {', '.join(GENE_FIELDS)} FROM genes_info"):
+            self.genes.setdefault(row[0], []).append(tuple(row))
+
+        self._indexes = {}
+        self._indexes_lock = threading.Lock()
+
+    def _index(self, index_class):
+        index = self._indexes.get(index_class)
+        if index is None:
+            with self._indexes_lock:
+                index = self._indexes.get(index_class)
+                if index is None:
+                    index = self._indexes[index_class] = index_class(self)
+        return index
+
+    @property
+    def gene_index(self) -> GeneIndex:
+        return self._index(GeneIndex)
+
+    @property
+    def panel_search(self) -> PanelSearchIndex:
+        return self._index(PanelSearchIndex)
+
+
+class PanelCatalogue:
+    """
+    Process-local, read-only cache of the panel catalogue used by the Query read methods.
+
+    Parameters
+    ----------
+    max_age : float, optional
+        Seconds after which a snapshot is reloaded even if the generation has not changed.
+        Covers writes made by another process (scheduled_update.py, weekly_update.py) which
+        cannot bump this process' generation counter. None disables the age check.
+
+    Notes
+    -----
+    - Snapshots are swapped in whole, so readers on other threads never see a half-loaded catalogue
+    - A lookup served by the current snapshot counts as a hit, a lookup that (re)loads it as a miss
+    - Query bypasses the catalogue while its connection has an open transaction, so a request always
+      sees its own uncommitted writes
+    """
+    def __init__(self, max_age: Optional[float] = 300.0):
+        self.max_age = max_age
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._reloads = 0
+        self._last_load_ms = 0.0
+
+    def _is_current(self, snapshot: Optional[CatalogueSnapshot]) -> bool:
+        if snapshot is None or snapshot.generation != _generation:
+            return False
+        return self.max_age is None or time.monotonic() - snapshot.loaded_at < self.max_age
+
+    def snapshot(self, conn: Connection) -> CatalogueSnapshot:
+        """
+        Returns the current snapshot, loading it through conn if it is missing or stale.
+
+        Parameters
+        ----------
+        conn : sqlite3.Connection
+            Connection used for the load (any pooled reader will do)
+
+        Returns
+        -------
+        CatalogueSnapshot
+        """
+        snapshot = self._snapshot
+        if self._is_current(snapshot):
+            self._hits += 1
+            return snapshot
+
+        with self._lock:
+            self._misses += 1
+            snapshot = self._snapshot
+            if self._is_current(snapshot):  # another thread reloaded while we waited
+                return snapshot
+            generation = _generation
+            started = time.perf_counter()
+            snapshot = CatalogueSnapshot(conn, generation)
+            self._last_load_ms = (time.perf_counter() - started) * 1000
+            self._snapshot = snapshot
+            self._reloads += 1
+        logger.info(f"Panel catalogue loaded at generation {generation}: {len(snapshot.panels)} panels, "
+                    f"{len(snapshot.genes)} genes in {self._last_load_ms:.1f} ms")
+        return snapshot
+
+    def invalidate(self):
+        """Drops the loaded snapshot, the next lookup reloads it."""
+        self._snapshot = None
+
+    def stats(self) -> dict:
+        """
+        Returns hit / miss counters and the state of the loaded snapshot.
+        """
+        snapshot = self._snapshot
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "reloads": self._reloads,
+            "last_load_ms": round(self._last_load_ms, 3),
+            "generation": _generation,
+            "loaded_generation": snapshot.generation if snapshot else None,
+            "panels": len(snapshot.panels) if snapshot else 0,
+            "genes": len(snapshot.genes) if snapshot else 0,
+        }
+
+
+# Shared by the API endpoints, see Query(connection, catalogue=panel_catalogue)
+panel_catalogue = PanelCatalogue()
@@ -0,0 +1,313 @@
+from vimmo.logger.logging_config import logger
+from vimmo.db.panel_diff import VersionDiff
+from collections import Counter
+from datetime import datetime
+from sqlite3 import Connection
+from typing import Iterable, Optional, Union
+import time
+
+
+def _affinity(confidence):
+    """Confidence as the INTEGER column stores it, PanelApp sends '3'."""
+    if isinstance(confidence, str) and confidence.strip().isdigit():
+        return int(confidence)
+    return confidence
+
+
+def diff_panel_genes(current: Iterable[tuple], new: Iterable[tuple]) -> dict:
+    """
+    Gene level differences between two versions of a panel's contents.
+
+    Parameters
+    ----------
+    current, new : iterable of (HGNC_ID, Confidence)
+
+    Returns
+    -------
+    dict
+        added and removed HGNC_IDs, and confidence_changed as {"hgnc_id", "old_confidence", "new_confidence"}
+    """
+    current, new = dict(current), dict(new)
+    return {
+        "added": [hgnc_id for hgnc_id in new if hgnc_id not in current],
+        "removed": [hgnc_id for hgnc_id in current if hgnc_id not in new],
+        "confidence_changed": [
+            {"hgnc_id": hgnc_id, "old_confidence": current[hgnc_id], "new_confidence": new[hgnc_id]}
+            for hgnc_id in current if hgnc_id in new and current[hgnc_id] != new[hgnc_id]
+        ],
+    }
+
+
+def record_gene_changes(conn: Connection, panel_id, from_version: float, to_version: float,
+                        current: dict, new: dict) -> int:
+    """
+    Stores the gene changes from one panel version to another in panel_gene_changes, without committing.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Writable connection
+    panel_id : int or str
+        Panel the versions belong to
+    from_version, to_version : float
+        Versions the contents are of
+    current, new : dict
+        HGNC_ID -> Confidence of the panel at from_version and at to_version
+
+    Returns
+    -------
+    int
+        Rows written
+
+    Notes
+    -----
+    - One row per added (Old_Confidence NULL), removed (New_Confidence NULL) or confidence changed gene
+    - A change that leaves the genes as they were is stored as a single 'none' row without an HGNC_ID,
+      so compose_gene_changes can still step through it
+    - Replaces any rows stored earlier for the same panel and versions
+    """
+    current = {hgnc_id: _affinity(confidence) for hgnc_id, confidence in current.items()}
+    new = {hgnc_id: _affinity(confidence) for hgnc_id, confidence in new.items()}
+    changes = [(hgnc_id, "added", None, confidence) for hgnc_id, confidence in new.items() if hgnc_id not in current]
+    changes += [(hgnc_id, "removed", confidence, None) for hgnc_id, confidence in current.items() if hgnc_id not in new]
+    changes += [(hgnc_id, "confidence", current[hgnc_id], new[hgnc_id]) for hgnc_id in current
+                if hgnc_id in new and current[hgnc_id] != new[hgnc_id]]
+    if not changes:
+        changes = [(None, "none", None, None)]
+    recorded_at = datetime.now().isoformat(timespec="seconds")
+    conn.execute("DELETE FROM panel_gene_changes WHERE Panel_ID = ? AND From_Version = ? AND To_Version = ?",
+                 (panel_id, from_version, to_version))
+    conn.executemany(
+        "INSERT INTO panel_gene_changes (Panel_ID, From_Version, To_Version, HGNC_ID, Change, Old_Confidence, "
+        "New_Confidence, Recorded_At) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(panel_id, from_version, to_version, hgnc_id, change, old, new_confidence, recorded_at)
+         for hgnc_id, change, old, new_confidence in changes]
+    )
+    return len(changes)
+
+
+def _path(hops: dict, start: float, end: float) -> Optional[list]:
+    """Versions leading from start to end through the stored changes, trying the longest steps first."""
+    stack = [(start, [start])]
+    seen = set()
+    while stack:
+        version, path = stack.pop()
+        if version == end:
+            return path
+        if version in seen:
+            continue
+        seen.add(version)
+        # Pushed smallest first so the longest step is tried first
+        for next_version in sorted(hops.get(version, ())):
+            stack.append((next_version, path + [next_version]))
+    return None
+
+
+def compose_gene_changes(conn: Connection, panel_id, from_version: float, to_version: float) -> Optional[VersionDiff]:
+    """
+    Gene changes of a panel between two versions, from the deltas stored when its updates were applied.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection to the database
+    panel_id : int or str
+        Panel to compare
+    from_version, to_version : float
+        The older and the newer version
+
+    Returns
+    -------
+    VersionDiff or None
+        Genes added, genes removed and confidence changes as Query.compare_panel_versions returns them,
+        or None when the stored deltas do not lead from one version to the other
+
+    Notes
+    -----
+    - One indexed read of panel_gene_changes; a multi-hop comparison (1.5 -> 2.0 -> 3.0) composes the
+      deltas of each step gene by gene, so a gene added then removed again does not show
+    - Only forward steps are read; downgrades store none, the filter drops any an older build stored
+    """
+    if from_version == to_version:
+        return VersionDiff({}, {}, {})
+    rows = conn.execute(
+        "SELECT From_Version, To_Version, HGNC_ID, Old_Confidence, New_Confidence FROM panel_gene_changes "
+        "WHERE Panel_ID = ? AND From_Version >= ? AND To_Version <= ? AND To_Version > From_Version",
+        (panel_id, from_version, to_version)).fetchall()
+    hops = {}
+    for step_from, step_to, hgnc_id, old, new in rows:
+        changes = hops.setdefault(step_from, {}).setdefault(step_to, [])
+        if hgnc_id is not None:
+            changes.append((hgnc_id, old, new))
+    path = _path(hops, from_version, to_version)
+    if path is None:
+        return None
+
+    net = {}
+    for step_from, step_to in zip(path, path[1:]):
+        for hgnc_id, old, new in hops[step_from][step_to]:
+            net[hgnc_id] = (net[hgnc_id][0] if hgnc_id in net else old, new)
+    genes_added = {hgnc_id: new for hgnc_id, (old, new) in net.items() if old is None and new is not None}
+    genes_removed = {hgnc_id: old for hgnc_id, (old, new) in net.items() if old is not None and new is None}
+    conf_changes = {hgnc_id: (old, new) for hgnc_id, (old, new) in net.items()
+                    if old is not None and new is not None and old != new}
+    return VersionDiff(genes_added, genes_removed, conf_changes)
+
+
+def backfill_gene_changes(conn: Connection) -> int:
+    """
+    Stores the deltas of panel updates applied before panel_gene_changes existed, and commits.
+
+    Each panel's archived versions (panel_genes_archive) and its current version are taken in order
+    and the change between each consecutive pair not yet stored is recorded.
+
+    Returns
+    -------
+    int
+        Version steps recorded
+    """
+    stored = {tuple(row) for row in conn.execute("SELECT DISTINCT Panel_ID, From_Version, To_Version FROM panel_gene_changes")}
+    archived = {}
+    for panel_id, version, hgnc_id, confidence in conn.execute(
+            "SELECT Panel_ID, Version, HGNC_ID, Confidence FROM panel_genes_archive"):
+        archived.setdefault(panel_id, {}).setdefault(version, {})[hgnc_id] = confidence
+    current = {}
+    for panel_id, hgnc_id, confidence in conn.execute("SELECT Panel_ID, HGNC_ID, Confidence FROM panel_genes"):
+        current.setdefault(panel_id, {})[hgnc_id] = confidence
+    recorded = 0
+    for panel_id, version in conn.execute("SELECT Panel_ID, Version FROM panel").fetchall():
+        if panel_id not in archived:
+            continue
+        contents = dict(archived[panel_id])
+        contents.setdefault(version, current.get(panel_id, {}))
+        versions = sorted(step for step in contents if step <= version)
+        for from_version, to_version in zip(versions, versions[1:]):
+            if (panel_id, from_version, to_version) not in stored:
+                record_gene_changes(conn, panel_id, from_version, to_version, contents[from_version], contents[to_version])
+                recorded += 1
+    conn.commit()
+    logger.info(f"Backfilled {recorded} panel version changes")
+    return recorded
+
+
+def replace_panel_genes(conn: Connection, panel_id, genes: Union[dict, Iterable[tuple]],
+                        archive_version: Optional[float] = None, versions: Optional[tuple] = None) -> dict:
+    """
+    Makes a panel's rows of panel_genes equal to genes, writing only the rows that differ.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Writable connection
+    panel_id : int or str
+        Panel to replace the contents of
+    genes : dict or iterable of (HGNC_ID, Confidence)
+        The panel's new contents
+    archive_version : float, optional
+        Copy the current contents to panel_genes_archive under this version first, skipping genes
+        already archived for it
+    versions : tuple, optional
+        (from version, to version) the contents change between. The panel's Version is moved from the
+        one to the other in the same transaction and, when the to version is newer, the gene changes
+        are stored in panel_gene_changes (record_gene_changes). If the panel is no longer at the from
+        version (another writer already applied the update) nothing is written
+
+    Returns
+    -------
+    dict
+        diff_panel_genes of the old and new contents, plus rows: the panel_genes rows inserted,
+        updated and deleted, and skipped: True when the update was not applied (see versions)
+
+    Notes
+    -----
+    - Without an open transaction the version, the archive and the replacement run in one BEGIN
+      IMMEDIATE transaction, committed here and rolled back on error, so a failed update leaves the
+      panel at its old version with its old genes. Inside the caller's transaction
+      (Downgrade.process_downgrade) nothing is committed
+    - The old and new rows are compared as multisets: rows only in the new contents are inserted,
+      rows only in the old deleted by rowid, and a deleted and an inserted row of the same gene
+      become one UPDATE of its Confidence
+    - A downgrade (to version older than from version) stores no gene changes: compose_gene_changes
+      only steps forward, and the deltas stored by the updates since the older version still hold
+    - Leaves the catalogue generation and BED artefacts to the caller
+    """
+    started = time.perf_counter()
+    new_rows = [(hgnc_id, _affinity(confidence))
+                for hgnc_id, confidence in (genes.items() if isinstance(genes, dict) else genes)]
+    owns_transaction = not conn.in_transaction
+    if owns_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    try:
+        if versions is not None and not conn.execute(
+                "UPDATE panel SET Version = ? WHERE Panel_ID = ? AND Version = ?",
+                (versions[1], panel_id, versions[0])).rowcount:
+            if owns_transaction:
+                conn.rollback()
+            logger.info(f"Panel {panel_id} is no longer at version {versions[0]}, update to {versions[1]} skipped")
+            return {"added": [], "removed": [], "confidence_changed": [], "skipped": True,
+                    "rows": {"inserted": 0, "updated": 0, "deleted": 0}}
+        current_rows = conn.execute(
+            "SELECT rowid, HGNC_ID, Confidence FROM panel_genes WHERE Panel_ID = ?", (panel_id,)).fetchall()
+        if archive_version is not None:
+            conn.execute(
+                '''
+                INSERT INTO panel_genes_archive (Panel_ID, HGNC_ID, Version, Confidence)
+                SELECT pg.Panel_ID, pg.HGNC_ID, ?, pg.Confidence
+                FROM panel_genes pg
+                WHERE pg.Panel_ID = ?
+                AND NOT EXISTS (
+                    SELECT 1
+                    FROM panel_genes_archive pga
+                    WHERE pga.Panel_ID = pg.Panel_ID
+                    AND pga.HGNC_ID = pg.HGNC_ID
+                    AND pga.Version = ?
+                )
+                ''', (archive_version, panel_id, archive_version)
+            )
+
+        unmatched = Counter(new_rows)
+        unmatched.subtract(Counter((hgnc_id, confidence) for _, hgnc_id, confidence in current_rows))
+        to_insert = [row for row, count in unmatched.items() if count > 0 for _ in range(count)]
+        surplus = {row: -count for row, count in unmatched.items() if count < 0}
+        to_delete = []
+        for rowid, hgnc_id, confidence in current_rows:
+            if surplus.get((hgnc_id, confidence), 0) > 0:
+                surplus[(hgnc_id, confidence)] -= 1
+                to_delete.append((rowid, hgnc_id))
+
+        # Pair a deleted and an inserted row of the same gene into one UPDATE
+        deleted_by_gene = {}
+        for rowid, hgnc_id in to_delete:
+            deleted_by_gene.setdefault(hgnc_id, []).append(rowid)
+        to_update, inserts = [], []
+        for hgnc_id, confidence in to_insert:
+            rowids = deleted_by_gene.get(hgnc_id)
+            if rowids:
+                to_update.append((confidence, rowids.pop()))
+            else:
+                inserts.append((panel_id, hgnc_id, confidence))
+        deletes = [(rowid,) for rowids in deleted_by_gene.values() for rowid in rowids]
+
+        if deletes:
+            conn.executemany("DELETE FROM panel_genes WHERE rowid = ?", deletes)
+        if to_update:
+            conn.executemany("UPDATE panel_genes SET Confidence = ? WHERE rowid = ?", to_update)
+        if inserts:
+            conn.executemany("INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence) VALUES (?, ?, ?)", inserts)
+        if versions is not None and versions[1] > versions[0]:
+            record_gene_changes(conn, panel_id, versions[0], versions[1],
+                                {hgnc_id: confidence for _, hgnc_id, confidence in current_rows}, dict(new_rows))
+        if owns_transaction:
+            conn.commit()
+    except Exception:
+        if owns_transaction:
+            conn.rollback()
+        raise
+
+    changes = diff_panel_genes([(hgnc_id, confidence) for _, hgnc_id, confidence in current_rows], new_rows)
+    changes["skipped"] = False
+    changes["rows"] = {"inserted": len(inserts), "updated": len(to_update), "deleted": len(deletes)}
+    logger.info(f"Panel {panel_id} contents replaced: {len(changes['added'])} added, {len(changes['removed'])} removed, "
+                f"{len(changes['confidence_changed'])} confidence changes ({len(inserts)} rows inserted, "
+                f"{len(to_update)} updated, {len(deletes)} deleted) in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return changes
@@ -0,0 +1,207 @@
+from typing import Iterable, NamedTuple
+import threading
+import numpy as np
+
+
+# HGNC IDs are encoded as their number ('HGNC:1100' -> 1100). IDs of any other form get a code from
+# OTHER_CODES up. Codes are interned for the life of the process (there are ~45,000 HGNC IDs), so
+# encoding a version is one dict lookup per gene and encoded contents can be kept and reused
+OTHER_CODES = 1 << 31
+
+# diff_many keeps the index of the pair in the bits above the gene code, so one sorted array holds
+# the genes of every pair
+PAIR_SHIFT = 32
+
+# A NULL confidence in the encoded arrays
+NO_CONFIDENCE = -1
+
+_codes = {}
+_other_ids = []
+_codes_lock = threading.Lock()
+
+
+class VersionDiff(NamedTuple):
+    """
+    Gene changes between two versions of a panel.
+
+    A tuple, so diff[0], diff[1] and diff[2] read it as the [genes_added, genes_removed,
+    confidence_changes] list Query.compare_panel_versions used to return.
+    """
+    added: dict               # HGNC_ID -> confidence in the newer version
+    removed: dict             # HGNC_ID -> confidence in the older version
+    confidence_changed: dict  # HGNC_ID -> (old confidence, new confidence)
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.confidence_changed)
+
+
+class EncodedContents(NamedTuple):
+    """A panel version's contents as arrays sorted by gene code, see encode_contents."""
+    codes: np.ndarray       # int64 gene codes, ascending
+    confidence: np.ndarray  # int64 confidence of each gene, NO_CONFIDENCE for NULL
+
+
+def gene_code(hgnc_id) -> int:
+    """Compact integer for an HGNC_ID, its number for the 'HGNC:<n>' form."""
+    code = _codes.get(hgnc_id)
+    if code is not None:
+        return code
+    digits = hgnc_id[5:] if isinstance(hgnc_id, str) and hgnc_id.startswith("HGNC:") else ""
+    with _codes_lock:
+        if digits.isascii() and digits.isdigit() and (digits == "0" or digits[0] != "0") and len(digits) < 10:
+            code = int(digits)
+        else:
+            code = _codes.get(hgnc_id)
+            if code is None:
+                code = OTHER_CODES + len(_other_ids)
+                _other_ids.append(hgnc_id)
+        _codes[hgnc_id] = code
+    return code
+
+
+def gene_id(code: int):
+    """The HGNC_ID gene_code encoded."""
+    return f"HGNC:{code}" if code < OTHER_CODES else _other_ids[code - OTHER_CODES]
+
+
+def encode_contents(contents: dict) -> EncodedContents:
+    """
+    Encodes a panel version's contents for diff_many.
+
+    Parameters
+    ----------
+    contents : dict
+        HGNC_ID -> integer confidence (or None), as current_panel_contents and historic_panel_retrieval return
+
+    Returns
+    -------
+    EncodedContents
+        Worth keeping when the same version is compared more than once
+    """
+    count = len(contents)
+    try:
+        codes = np.fromiter(map(_codes.__getitem__, contents), dtype=np.int64, count=count)
+    except KeyError:  # genes not seen before
+        codes = np.fromiter(map(gene_code, contents), dtype=np.int64, count=count)
+    confidence = np.fromiter((NO_CONFIDENCE if value is None else value for value in contents.values()),
+                             dtype=np.int64, count=count)
+    order = np.argsort(codes, kind="stable")
+    return EncodedContents(codes[order], confidence[order])
+
+
+def diff_versions(old: dict, new: dict) -> VersionDiff:
+    """
+    Gene changes between two versions of a panel's contents.
+
+    Parameters
+    ----------
+    old, new : dict
+        HGNC_ID -> confidence of the older and the newer version
+
+    Returns
+    -------
+    VersionDiff
+        Genes added and confidence changes in the order of new, genes removed in the order of old
+
+    Notes
+    -----
+    - One pass over each version with a single dict lookup per gene; cheaper than encoding for one
+      pair, see diff_many for comparing many
+    """
+    added, confidence_changed = {}, {}
+    for hgnc_id, confidence in new.items():
+        if hgnc_id not in old:
+            added[hgnc_id] = confidence
+        elif old[hgnc_id] != confidence:
+            confidence_changed[hgnc_id] = (old[hgnc_id], confidence)
+    removed = {hgnc_id: confidence for hgnc_id, confidence in old.items() if hgnc_id not in new}
+    return VersionDiff(added, removed, confidence_changed)
+
+
+def _stack(versions: list) -> tuple:
+    """Keys ((pair index << PAIR_SHIFT) | gene code, ascending) and confidences of every pair's versions."""
+    sizes = np.fromiter((len(version.codes) for version in versions), dtype=np.int64, count=len(versions))
+    pairs = np.repeat(np.arange(len(versions), dtype=np.int64), sizes)
+    keys = np.concatenate([version.codes for version in versions]) | (pairs << PAIR_SHIFT)
+    return keys, np.concatenate([version.confidence for version in versions])
+
+
+def _match(old_keys: np.ndarray, new_keys: np.ndarray) -> tuple:
+    """Indexes of the keys found on both sides, into old_keys and into new_keys."""
+    keys = np.concatenate((old_keys, new_keys))
+    order = np.argsort(keys, kind="stable")  # a merge of two sorted runs, old before new on a tie
+    same = keys[order[1:]] == keys[order[:-1]]
+    return order[:-1][same], order[1:][same] - len(old_keys)
+
+
+def _split(keys: np.ndarray, values: list, count: int) -> list:
+    """{HGNC_ID: value} of each of count pairs from keys ascending and their values."""
+    bounds = np.searchsorted(keys >> PAIR_SHIFT, np.arange(count + 1)).tolist()
+    codes = (keys & ((1 << PAIR_SHIFT) - 1)).tolist()
+    if codes and max(codes) >= OTHER_CODES:
+        genes = [gene_id(code) for code in codes]
+    else:
+        genes = list(map("HGNC:{}".format, codes))
+    return [dict(zip(genes[start:end], values[start:end])) for start, end in zip(bounds, bounds[1:])]
+
+
+def _confidences(array: np.ndarray) -> list:
+    return [None if value == NO_CONFIDENCE else value for value in array.tolist()]
+
+
+def diff_many(pairs: Iterable[tuple]) -> list:
+    """
+    Gene changes of many pairs of panel versions in one call.
+
+    Parameters
+    ----------
+    pairs : iterable of (old, new)
+        Each a dict of HGNC_ID -> integer confidence or the EncodedContents of one
+
+    Returns
+    -------
+    list of VersionDiff
+        One per pair, in order; genes within each dict are ordered by HGNC number. A pair passed more
+        than once (the same two objects) is diffed once and its VersionDiff repeated
+
+    Notes
+    -----
+    - Each distinct version object is encoded once, so a cohort report passing a panel's current
+      version for every patient who had it pays for it once
+    - The versions of every distinct pair are stacked into one sorted key array per side, the pair
+      index above the gene code, and matched by one stable argsort of the two, so the work done per
+      gene is numpy's; Python only builds the dicts of the genes that changed
+    """
+    encoded = {}  # id -> (EncodedContents, the version itself, so the id is not reused during the call)
+    slots, distinct, order = {}, [], []
+    for old, new in pairs:
+        for version in (old, new):
+            if id(version) not in encoded:
+                encoded[id(version)] = (version if isinstance(version, EncodedContents)
+                                        else encode_contents(version), version)
+        key = (id(old), id(new))
+        if key not in slots:
+            slots[key] = len(distinct)
+            distinct.append((encoded[id(old)][0], encoded[id(new)][0]))
+        order.append(slots[key])
+    if not distinct:
+        return []
+    old_keys, old_confidence = _stack([old for old, _ in distinct])
+    new_keys, new_confidence = _stack([new for _, new in distinct])
+
+    old_index, new_index = _match(old_keys, new_keys)
+    removed = np.ones(len(old_keys), dtype=bool)
+    removed[old_index] = False
+    added = np.ones(len(new_keys), dtype=bool)
+    added[new_index] = False
+    old_kept, new_kept = old_confidence[old_index], new_confidence[new_index]
+    moved = old_kept != new_kept
+
+    count = len(distinct)
+    diffs = [VersionDiff(*diff) for diff in zip(
+        _split(new_keys[added], _confidences(new_confidence[added]), count),
+        _split(old_keys[removed], _confidences(old_confidence[removed]), count),
+        _split(old_keys[old_index][moved], list(zip(_confidences(old_kept[moved]), _confidences(new_kept[moved]))),
+               count))]
+    return [diffs[slot] for slot in order]
@@ -0,0 +1,247 @@
+from vimmo.logger.logging_config import logger
+from vimmo.db.db_query import Query
+from vimmo.db.db_update import Update
+from vimmo.utils.panelapp import PanelAppClient, panel_version_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Optional
+import threading
+import time
+
+
+class PanelRefresher:
+    """
+    Keeps the panels behind recent /patient queries in line with PanelApp, off the request path.
+
+    Parameters
+    ----------
+    connect : callable
+        connect(write=False) -> object with ``conn`` and ``close()`` (a PoolLease in the API). The version
+        check reads through a read lease; the writer is only leased when the panel has to be updated
+    client : PanelAppClient, optional
+        Client used for the version checks. Defaults to one sharing the API's panel_version_cache
+    interval : float
+        Seconds after a check before the same R code is checked again
+    recent_window : float
+        R codes queried within this many seconds are kept refreshed by the background sweep
+    max_workers : int
+        Refreshes run at the same time (each holds the writer while it updates a panel)
+    autostart : bool
+        Start the background sweep on the first touch()
+
+    Notes
+    -----
+    - touch() records the query and schedules a refresh when the last check is older than interval;
+      it never waits for PanelApp
+    - Refreshes are single-flight: while one is running for an R code, further requests for it
+      share its Future instead of starting another
+    - Each check's outcome is kept per R code (status()) so /patient can say how current its answer is
+    """
+    def __init__(self, connect: Callable, client: Optional[PanelAppClient] = None, interval: float = 300.0,
+                 recent_window: float = 3600.0, max_workers: int = 2, autostart: bool = False):
+        self.connect = connect
+        self.client = client or PanelAppClient(version_cache=panel_version_cache)
+        self.interval = interval
+        self.recent_window = recent_window
+        self.max_workers = max_workers
+        self.autostart = autostart
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._in_flight = {}    # R code -> Future of the running refresh
+        self._last_query = {}   # R code -> time.monotonic() of the last touch
+        self._status = {}       # R code -> outcome of the last check, see status()
+        self._stop = threading.Event()
+        self._sweeper = None
+
+        self._refreshes = 0
+        self._deduplicated = 0
+        self._updates = 0
+        self._failures = 0
+
+    def touch(self, rcode: str) -> Optional[dict]:
+        """
+        Records a query for rcode and schedules a refresh if its last check is stale.
+
+        Returns
+        -------
+        dict or None
+            status(rcode) as it was before any refresh scheduled here
+        """
+        with self._lock:
+            self._last_query[rcode] = time.monotonic()
+        if self.autostart:
+            self.start()
+        status = self.status(rcode)
+        if self._is_stale(rcode):
+            self.refresh_async(rcode)
+        return status
+
+    def status(self, rcode: str) -> Optional[dict]:
+        """
+        Outcome of the last completed check of rcode, or None if it has not been checked.
+
+        Keys: checked_at (datetime), ok (bool), version (database version after the check),
+        online_version, updated (bool), error (str or None)
+        """
+        with self._lock:
+            status = self._status.get(rcode)
+            return dict(status) if status is not None else None
+
+    def _is_stale(self, rcode: str) -> bool:
+        with self._lock:
+            status = self._status.get(rcode)
+        return status is None or time.monotonic() - status["checked_monotonic"] >= self.interval
+
+    def refresh_async(self, rcode: str) -> Future:
+        """Schedules refresh(rcode), or returns the Future of the refresh already running for it."""
+        with self._lock:
+            future = self._in_flight.get(rcode)
+            if future is not None:
+                self._deduplicated += 1
+                return future
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="panel-refresh")
+            future = self._executor.submit(self.refresh, rcode)
+            self._in_flight[rcode] = future
+        future.add_done_callback(lambda _: self._finished(rcode))
+        return future
+
+    def _finished(self, rcode: str):
+        with self._lock:
+            self._in_flight.pop(rcode, None)
+
+    def refresh(self, rcode: str) -> dict:
+        """
+        Checks rcode against PanelApp and brings the database up to date if it has moved on.
+
+        Returns
+        -------
+        dict
+            The recorded status (see status())
+
+        Notes
+        -----
+        - Runs the same steps /UpdatePatientRecords runs: the new genes are fetched first, then
+          update_gene_contents sets the version and archives and replaces the contents in one transaction
+        - The database version is read again once the writer is leased, and the update skipped if
+          another writer has already applied it
+        - Errors are logged and recorded rather than raised
+        """
+        started = time.perf_counter()
+        with self._lock:
+            self._refreshes += 1
+        status = {"ok": False, "version": None, "online_version": None, "updated": False, "error": None}
+        try:
+            lease = self.connect(write=False)
+            try:
+                query = Query(lease.conn)
+                panel_id = query.rcode_to_panelID(rcode)
+                database_version = query.get_db_latest_version(rcode)
+            finally:
+                lease.close()
+            status["version"] = database_version
+
+            online_version = self.client.get_latest_online_version(panel_id)
+            status["online_version"] = online_version
+            if database_version != online_version:
+                genes = self.client.get_genes_HGNC(rcode)
+                lease = self.connect(write=True)
+                try:
+                    # Another writer (/UpdatePatientRecords) may have applied the update since the read above
+                    database_version = Query(lease.conn).get_db_latest_version(rcode)
+                    if database_version != online_version:
+                        changes = Update(lease.conn).update_gene_contents(
+                            rcode, panel_id, archive_version=database_version, new_version=online_version, genes=genes)
+                        status["updated"] = not changes.get("skipped", False)
+                    status["version"] = Query(lease.conn).get_db_latest_version(rcode)
+                finally:
+                    lease.close()
+                if status["updated"]:
+                    logger.info(f"Background refresh updated {rcode}: {database_version} --> {online_version}")
+                else:
+                    logger.info(f"Background refresh of {rcode}: already updated to {status['version']} by another writer")
+            status["ok"] = True
+        except Exception as err:
+            status["error"] = str(err)
+            logger.warning(f"Background refresh of {rcode} failed: {err}")
+
+        status["checked_at"] = datetime.now()
+        status["checked_monotonic"] = time.monotonic()
+        with self._lock:
+            previous = self._status.get(rcode)
+            if not status["ok"] and previous is not None:
+                status["last_ok_at"] = previous.get("last_ok_at")
+            else:
+                status["last_ok_at"] = status["checked_at"] if status["ok"] else None
+            self._status[rcode] = status
+            self._updates += status["updated"]
+            self._failures += not status["ok"]
+        logger.debug(f"Background refresh of {rcode} took {(time.perf_counter() - started) * 1000:.1f} ms")
+        return dict(status)
+
+    def recent(self) -> list:
+        """R codes queried within recent_window seconds."""
+        cutoff = time.monotonic() - self.recent_window
+        with self._lock:
+            for rcode in [rcode for rcode, queried in self._last_query.items() if queried < cutoff]:
+                del self._last_query[rcode]
+            return list(self._last_query)
+
+    def sweep(self) -> list:
+        """Schedules a refresh of every recently queried R code whose check is stale; returns the Futures."""
+        return [self.refresh_async(rcode) for rcode in self.recent() if self._is_stale(rcode)]
+
+    def start(self):
+        """Starts the background sweep (a daemon thread running sweep() every interval / 2 seconds)."""
+        with self._lock:
+            if self._sweeper is not None:
+                return
+            self._stop.clear()
+            self._sweeper = threading.Thread(target=self._run, name="panel-refresh-sweeper", daemon=True)
+            self._sweeper.start()
+        logger.info("Background panel refresher started")
+
+    def _run(self):
+        while not self._stop.wait(self.interval / 2):
+            try:
+                self.sweep()
+            except Exception as err:
+                logger.error(f"Background panel sweep failed: {err}")
+
+    def stop(self, wait: bool = True):
+        """Stops the background sweep and the refresh workers."""
+        self._stop.set()
+        with self._lock:
+            sweeper, self._sweeper = self._sweeper, None
+            executor, self._executor = self._executor, None
+        if sweeper is not None and wait:
+            sweeper.join()
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tracked": len(self._last_query), "checked": len(self._status), "in_flight": len(self._in_flight),
+                    "refreshes": self._refreshes, "deduplicated": self._deduplicated, "updates": self._updates,
+                    "failures": self._failures}
+
+
+def freshness_disclaimer(status: Optional[dict]) -> str:
+    """
+    Disclaimer for a /patient answer served from the database, saying when its panel was last checked.
+
+    Parameters
+    ----------
+    status : dict or None
+        PanelRefresher.status() of the queried R code
+    """
+    if status is None:
+        return ("Panel version not yet checked against PanelApp; results are valid as of the last database "
+                "update. A check has been scheduled.")
+    if status["ok"]:
+        return f"Panel comparison up to date as of {status['checked_at'].isoformat(timespec='seconds')}"
+    last_ok = status.get("last_ok_at")
+    since = f" (last confirmed {last_ok.isoformat(timespec='seconds')})" if last_ok else ""
+    return ("The latest version of PanelApp was unable to be contacted. "
+            f"Results are valid as of the last update date{since}.")
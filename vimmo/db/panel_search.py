@@ -0,0 +1,191 @@
+from vimmo.logger.logging_config import logger
+from collections import Counter, namedtuple
+from typing import Optional
+import json
+import os
+import re
+import threading
+import time
+
+
+# PanelApp signed-off panel listing saved by database_prework/createdb/jason_all_data.py
+PANEL_NAMES_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "all_panel.json")
+
+# Longest n-gram indexed. Every substring up to this length is a posting key, so queries of 1 or 2
+# characters ('R1', '6') are answered from a single posting list and longer ones by intersecting
+# the postings of their trigrams.
+NGRAM = 3
+
+# Match types, best first
+MATCH_ORDER = {"exact": 0, "prefix": 1, "word": 2, "substring": 3, "similar": 4}
+
+# Share of the query's trigrams a name needs to be returned when nothing contains the query
+MIN_SIMILARITY = 0.5
+
+SearchHit = namedtuple("SearchHit", ["panel", "field", "text", "match", "score"])
+SearchHit.__doc__ = "A panel found by PanelSearchIndex.search: index into snapshot.panels, the field and text that matched."
+
+_names_cache = {}
+_names_lock = threading.Lock()
+
+
+def load_panel_names(path: str = PANEL_NAMES_FILE) -> dict:
+    """
+    Panel names from the PanelApp listing, reread when the file changes.
+
+    Returns
+    -------
+    dict
+        Panel_ID -> (name, list of relevant disorders that are not R codes); empty if the file is missing
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        logger.warning(f"Panel names file {path} not found, panel names will not be searched")
+        return {}
+    with _names_lock:
+        cached = _names_cache.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        with open(path, encoding="utf-8") as handle:
+            pages = json.load(handle)
+        names = {}
+        for page in pages if isinstance(pages, list) else [pages]:
+            for panel in page.get("results", []):
+                disorders = [disorder for disorder in panel.get("relevant_disorders") or []
+                             if disorder and not re.fullmatch(r"R\d+(\.\d+)?", disorder.strip())]
+                names[panel["id"]] = (panel.get("name"), disorders)
+        _names_cache[path] = (mtime, names)
+    return names
+
+
+def normalise(text) -> str:
+    return " ".join(str(text).upper().split())
+
+
+def ngrams(text: str, n: int = NGRAM) -> set:
+    """Every substring of text of length 1 to n."""
+    return {text[i:i + length] for length in range(1, n + 1) for i in range(len(text) - length + 1)}
+
+
+def trigrams(text: str) -> set:
+    """Trigrams of each word of text, padded with spaces as PostgreSQL's pg_trgm does."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class PanelSearchIndex:
+    """
+    N-gram index over the Panel_ID (as text), R code and name of every panel, for Similar_Matches.
+
+    Parameters
+    ----------
+    snapshot : CatalogueSnapshot
+        Panels to index (vimmo/db/panel_catalogue.py)
+    names : dict, optional
+        Panel_ID -> (name, relevant disorders), defaults to load_panel_names()
+
+    Notes
+    -----
+    - Built once per snapshot (CatalogueSnapshot.panel_search), so it follows panel updates
+    - A query matches the fields containing it, case-insensitively, as LIKE '%query%' did; candidates
+      come from the posting lists, only they are compared with the query
+    - Names (the panel name and its non R code relevant disorders) that do not contain the query are
+      still returned when they hold most of its word trigrams (MIN_SIMILARITY), so misspelt names
+      find their panel
+    """
+    def __init__(self, snapshot, names: Optional[dict] = None):
+        started = time.perf_counter()
+        self.snapshot = snapshot
+        names = load_panel_names() if names is None else names
+        self.names = {}
+        self.documents = []  # (panel index, field, normalised text)
+        for i, (panel_id, rcode, _) in enumerate(snapshot.panels):
+            self.documents.append((i, "Panel_ID", normalise(panel_id)))
+            if rcode:
+                self.documents.append((i, "rcodes", normalise(rcode)))
+            name, disorders = names.get(panel_id, names.get(str(panel_id), (None, [])))
+            self.names[i] = name
+            for text in ([name] if name else []) + disorders:
+                self.documents.append((i, "name", normalise(text)))
+
+        self._postings = {}
+        self._trigram_postings = {}
+        for doc, (_, field, text) in enumerate(self.documents):
+            for gram in ngrams(text):
+                self._postings.setdefault(gram, []).append(doc)
+            if field == "name":
+                for gram in trigrams(text):
+                    self._trigram_postings.setdefault(gram, []).append(doc)
+        logger.info(f"Panel search index built: {len(self.documents)} fields of {len(snapshot.panels)} panels, "
+                    f"{len(self._postings)} n-grams in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    def _containing(self, query: str) -> set:
+        grams = [query] if len(query) <= NGRAM else [query[i:i + NGRAM] for i in range(len(query) - NGRAM + 1)]
+        postings = sorted((self._postings.get(gram, []) for gram in set(grams)), key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return {doc for doc in candidates if query in self.documents[doc][2]}
+
+    def _similar(self, query: str, fields: tuple) -> dict:
+        grams = trigrams(query)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._trigram_postings.get(gram, ()))
+        scores = {}
+        for doc, count in shared.items():
+            if self.documents[doc][1] in fields:
+                score = count / len(grams)
+                if score >= MIN_SIMILARITY:
+                    scores[doc] = score
+        return scores
+
+    def search(self, query: str, fields: tuple = ("Panel_ID", "rcodes", "name")) -> list:
+        """
+        Panels with a field similar to the query, best first.
+
+        Parameters
+        ----------
+        query : str
+            Panel_ID, R code or panel name, or part of one
+        fields : tuple
+            Fields to search, of 'Panel_ID', 'rcodes' and 'name'
+
+        Returns
+        -------
+        list of SearchHit
+            One per panel, its best matching field. Ranked by match type (exact, prefix, start of a word,
+            substring, similar), then the searched fields in order, then similarity, shorter texts
+            and Panel_ID
+        """
+        query = normalise(query)
+        if not query:
+            return []
+        found = {doc: 1.0 for doc in self._containing(query) if self.documents[doc][1] in fields}
+        if not found and "name" in fields and len(query) >= NGRAM:
+            found = self._similar(query, fields)
+
+        best = {}
+        for doc, score in found.items():
+            panel, field, text = self.documents[doc]
+            if query not in text:
+                match = "similar"
+            elif text == query:
+                match = "exact"
+            elif text.startswith(query):
+                match = "prefix"
+            elif f" {query}" in f" {text}":
+                match = "word"
+            else:
+                match = "substring"
+            key = (MATCH_ORDER[match], fields.index(field), -score, len(text),
+                   str(self.snapshot.panels[panel][0]).zfill(12), panel)
+            if panel not in best or key < best[panel][0]:
+                best[panel] = (key, SearchHit(panel, field, text, match, round(score, 3)))
+        return [hit for _, hit in sorted(best.values())]
@@ -0,0 +1,371 @@
+from vimmo.logger.logging_config import logger
+from datetime import date
+from sqlite3 import Connection
+from typing import Optional, Union
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+
+# As patient_update_validator (vimmo/utils/arg_validator.py), plus the sub-panel R codes of the panel table (R41.3)
+PATIENT_PATTERN = r"[a-zA-Z\d]+"
+RCODE_PATTERN = r"R\d+(\.\d+)?"
+
+COLUMNS = ("Patient_ID", "Rcode", "Version", "Date")
+
+# Accepted header / NDJSON key spellings, compared lower-cased without spaces and underscores
+COLUMN_ALIASES = {"patientid": "Patient_ID", "patient": "Patient_ID", "rcode": "Rcode",
+                  "version": "Version", "date": "Date"}
+
+# Rows inserted and committed per transaction
+CHUNK_SIZE = 5000
+
+# Rejected rows listed in the summary, the rest are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+class IngestError(ValueError):
+    """The upload as a whole cannot be read (unknown format, missing columns)."""
+
+
+def detect_format(content_type: Optional[str], data: bytes) -> str:
+    """'csv' or 'ndjson', from the Content-Type or, failing that, the first character of the data."""
+    content_type = (content_type or "").lower()
+    if "json" in content_type:
+        return "ndjson"
+    if "csv" in content_type:
+        return "csv"
+    return "ndjson" if data.lstrip()[:1] == b"{" else "csv"
+
+
+def _column(name) -> Optional[str]:
+    return COLUMN_ALIASES.get(str(name).lower().replace(" ", "").replace("_", ""))
+
+
+def _csv_lines(data: bytes) -> list:
+    """
+    Line each CSV data row starts on, skipping blank lines as pd.read_csv(skip_blank_lines=True) does.
+
+    A quoted field may span lines, so lines are counted with the csv module rather than split.
+    """
+    reader = csv.reader(io.StringIO(data.decode("utf-8-sig", errors="replace"), newline=""))
+    lines, start = [], 1
+    for row in reader:
+        if row and (len(row) > 1 or row[0].strip()):
+            lines.append(start)
+        start = reader.line_num + 1
+    return lines[1:]  # the first is the header
+
+
+def read_records(data: Union[bytes, str], fmt: str = "auto", content_type: Optional[str] = None) -> tuple:
+    """
+    Reads an upload of patient tests into a DataFrame.
+
+    Parameters
+    ----------
+    data : bytes or str
+        CSV with a header row, or one JSON object per line (NDJSON). Columns / keys are Patient ID,
+        R code and, optionally, Version and Date; spaces, underscores and case are ignored
+    fmt : str
+        'csv', 'ndjson' or 'auto' (detect_format)
+
+    Returns
+    -------
+    tuple of (pandas.DataFrame, list)
+        The records as strings ('' when absent) in COLUMNS plus the Line they came from, and
+        {"Line", "Error"} for the NDJSON lines that are not JSON objects
+
+    Raises
+    ------
+    IngestError
+        Unknown format, or no Patient ID / R code column
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    if fmt == "auto":
+        fmt = detect_format(content_type, data)
+
+    rejected = []
+    if fmt == "csv":
+        try:
+            frame = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, skip_blank_lines=True)
+        except pd.errors.EmptyDataError:
+            frame = pd.DataFrame()
+        except (pd.errors.ParserError, UnicodeDecodeError) as err:
+            raise IngestError(f"CSV could not be read: {err}")
+        frame = frame.rename(columns={name: _column(name) for name in frame.columns if _column(name)})
+        lines = _csv_lines(data) if len(frame) else []
+        if len(lines) != len(frame):  # the csv module and pandas disagree on the rows; count them in order
+            lines = np.arange(2, len(frame) + 2)
+        frame["Line"] = lines
+    elif fmt == "ndjson":
+        records, lines = [], []
+        for number, line in enumerate(data.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except (ValueError, UnicodeDecodeError):
+                record = None
+            if not isinstance(record, dict):
+                rejected.append({"Line": number, "Error": "Not a JSON object"})
+                continue
+            records.append({_column(key): "" if value is None else str(value)
+                            for key, value in record.items() if _column(key)})
+            lines.append(number)
+        frame = pd.DataFrame.from_records(records)
+        frame["Line"] = lines
+    else:
+        raise IngestError(f"Unknown format '{fmt}', expected csv or ndjson")
+
+    if len(frame) and not {"Patient_ID", "Rcode"} <= set(frame.columns):
+        raise IngestError("Records need a Patient ID and an R code column")
+    for name in COLUMNS:
+        frame[name] = frame[name].fillna("").astype(str).str.strip() if name in frame.columns else ""
+    return frame[list(COLUMNS) + ["Line"]].reset_index(drop=True), rejected
+
+
+def panel_map(conn: Connection, catalogue=None) -> dict:
+    """
+    R code -> (Panel_ID, Version) of every panel, from the catalogue snapshot when there is one.
+
+    Falls back to one read of the panel table, which is then the map for the whole upload.
+    """
+    if catalogue is not None and not conn.in_transaction:
+        snapshot = catalogue.snapshot(conn)
+        panels = {}
+        for panel_id, rcode, version in snapshot.panels:
+            panels.setdefault(rcode, (panel_id, version))
+        return panels
+    panels = {}
+    for rcode, panel_id, version in conn.execute("SELECT rcodes, Panel_ID, Version FROM panel"):
+        panels.setdefault(rcode, (panel_id, version))
+    return panels
+
+
+def validate_records(frame: pd.DataFrame, panels: dict, today: Optional[date] = None) -> tuple:
+    """
+    Checks every column at once and fills in the panel, version and date of the valid rows.
+
+    Parameters
+    ----------
+    frame : pandas.DataFrame
+        Output of read_records
+    panels : dict
+        Output of panel_map
+    today : date, optional
+        Date of rows without one, and the latest date accepted
+
+    Returns
+    -------
+    tuple of (pandas.DataFrame, list)
+        Valid rows (Patient_ID, Panel_ID, Rcode, Version as float, ISO Date, Line) and
+        {"Line", "Error"} for the others
+
+    Notes
+    -----
+    - A blank Version is the panel's current version in the database, as add_record() records
+    - Versions newer than the database's are rejected: run the scheduled update first
+    """
+    today = today or date.today()
+    rcode = frame["Rcode"].str.upper()
+    panel_id = rcode.map({key: panel[0] for key, panel in panels.items()})
+    current = rcode.map({key: panel[1] for key, panel in panels.items()}).astype(float)
+
+    blank_version = frame["Version"] == ""
+    version = pd.to_numeric(frame["Version"].where(~blank_version), errors="coerce").where(~blank_version, current)
+    parsed_date = pd.to_datetime(frame["Date"].where(frame["Date"] != "", today.isoformat()),
+                                 format="%Y-%m-%d", errors="coerce")
+
+    checks = [
+        (~frame["Patient_ID"].str.fullmatch(PATIENT_PATTERN), "Invalid Patient ID"),
+        (~rcode.str.fullmatch(RCODE_PATTERN), "Invalid R code"),
+        (panel_id.isna(), "R code not in the database"),
+        (version.isna() | (version <= 0), "Invalid Version"),
+        (version > current, "Version is newer than the database's, run the scheduled update first"),
+        (parsed_date.isna(), "Invalid Date, expected YYYY-MM-DD"),
+        (parsed_date > pd.Timestamp(today), "Date is in the future"),
+    ]
+    invalid = np.logical_or.reduce([mask.to_numpy(dtype=bool) for mask, _ in checks])
+    errors = np.select([mask.to_numpy(dtype=bool) for mask, _ in checks], [message for _, message in checks], "")
+    rejected = [{"Line": int(line), "Error": str(error)}
+                for line, error in zip(frame["Line"][invalid], errors[invalid])]
+
+    valid = pd.DataFrame({
+        "Patient_ID": frame["Patient_ID"],
+        "Panel_ID": panel_id,
+        "Rcode": rcode,
+        "Version": version,
+        "Date": parsed_date.dt.strftime("%Y-%m-%d"),
+        "Line": frame["Line"],
+    })[~invalid]
+    return valid.reset_index(drop=True), rejected
+
+
+def existing_records(conn: Connection, keys: list) -> set:
+    """
+    The (Patient_ID, Rcode, Version) keys already in patient_data, in one query.
+
+    The keys are bound as a single JSON array and joined to patient_data, so the lookup is one
+    statement through idx_patient_data_patient whatever the number of keys.
+    """
+    if not keys:
+        return set()
+    rows = conn.execute("""
+        SELECT DISTINCT p.Patient_ID, p.Rcode, p.Version
+        FROM json_each(?) AS k
+        JOIN patient_data AS p
+          ON p.Patient_ID = json_extract(k.value, '$[0]')
+         AND p.Rcode = json_extract(k.value, '$[1]')
+         AND p.Version = json_extract(k.value, '$[2]')
+        """, (json.dumps(keys),)).fetchall()
+    return {(str(patient_id), rcode, float(version)) for patient_id, rcode, version in rows}
+
+
+def insert_records(conn: Connection, rows: list, chunk_size: int = CHUNK_SIZE) -> tuple:
+    """
+    Inserts patient_data rows with executemany, committing every chunk_size rows.
+
+    Returns
+    -------
+    tuple of (int, int, str or None)
+        Rows and chunks committed, and the error that stopped the insert. A failed chunk is rolled
+        back, the chunks before it stay committed
+    """
+    inserted = chunks = 0
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            conn.executemany("INSERT INTO patient_data (Patient_ID, Panel_ID, Rcode, Version, Date) "
+                             "VALUES (?, ?, ?, ?, ?)", chunk)
+            conn.commit()
+        except sqlite3.Error as err:
+            conn.rollback()
+            logger.error(f"Patient ingest failed in the chunk starting at row {start}, {inserted} rows were committed: {err}")
+            return inserted, chunks, str(err)
+        inserted += len(chunk)
+        chunks += 1
+    return inserted, chunks, None
+
+
+def ingest_records(conn: Connection, data: Union[bytes, str], fmt: str = "auto", content_type: Optional[str] = None,
+                   catalogue=None, chunk_size: int = CHUNK_SIZE, dry_run: bool = False) -> dict:
+    """
+    Adds many patient tests to patient_data: read, validate, deduplicate, insert.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Writable connection
+    data, fmt, content_type :
+        The upload, see read_records
+    catalogue : PanelCatalogue, optional
+        Source of the R code -> panel map, one read of the panel table without it
+    chunk_size : int
+        Rows per insert transaction
+    dry_run : bool
+        Validate and deduplicate only
+
+    Returns
+    -------
+    dict
+        Received, Inserted, Duplicates (repeated in the upload), Already_Present (in patient_data),
+        Rejected, Errors (the first MAX_REPORTED_ERRORS rejected lines), Chunks and Dry_Run; Error when
+        an insert failed
+
+    Raises
+    ------
+    IngestError
+        The upload cannot be read
+
+    Notes
+    -----
+    - A test is the same record as one in patient_data, or earlier in the upload, when its
+      Patient_ID, R code and version match, as check_presence() decides for a single test
+    - Unlike the single-test endpoint nothing is fetched from PanelApp; versions come from the database
+    """
+    started = time.perf_counter()
+    frame, rejected = read_records(data, fmt, content_type)
+    received = len(frame) + len(rejected)
+    valid, invalid = validate_records(frame, panel_map(conn, catalogue))
+    rejected = sorted(rejected + invalid, key=lambda error: error["Line"])
+
+    keys = valid[["Patient_ID", "Rcode", "Version"]]
+    repeated = keys.duplicated()
+    valid, keys = valid[~repeated], keys[~repeated]
+    present = existing_records(conn, keys.to_numpy().tolist())
+    in_db = np.fromiter(((patient_id, rcode, float(version)) in present
+                         for patient_id, rcode, version in keys.itertuples(index=False)), dtype=bool, count=len(keys))
+    valid = valid[~in_db]
+
+    summary = {
+        "Received": received,
+        "Inserted": 0,
+        "Duplicates": int(repeated.sum()),
+        "Already_Present": int(in_db.sum()),
+        "Rejected": len(rejected),
+        "Errors": rejected[:MAX_REPORTED_ERRORS],
+        "Chunks": 0,
+        "Dry_Run": dry_run,
+    }
+    if not dry_run and len(valid):
+        rows = [(patient_id, int(panel_id), rcode, float(version), test_date) for patient_id, panel_id, rcode, version, test_date
+                in valid[["Patient_ID", "Panel_ID", "Rcode", "Version", "Date"]].itertuples(index=False)]
+        summary["Inserted"], summary["Chunks"], error = insert_records(conn, rows, chunk_size)
+        if error:
+            summary["Error"] = f"Insert failed after {summary['Inserted']} rows: {error}"
+    logger.info(f"Patient ingest: {received} received, {summary['Inserted']} inserted, {summary['Duplicates']} duplicates, "
+                f"{summary['Already_Present']} already present, {summary['Rejected']} rejected "
+                f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+    return summary
+
+
+def main(argv: Optional[list] = None):
+    """
+    Console script: adds the patient tests of a CSV or NDJSON file to the database.
+
+    Example
+    -------
+    patientingest lims_export.csv --chunk-size 10000
+    """
+    from vimmo.db.db import Database
+    from vimmo.db.migrations import run_migrations
+
+    parser = argparse.ArgumentParser(description="Bulk add patient test records (Patient ID, R code, Version, Date) to the Vimmo database")
+    parser.add_argument("path", help="CSV (with a header row) or NDJSON file, '-' for stdin")
+    parser.add_argument("--format", choices=["auto", "csv", "ndjson"], default="auto")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Rows inserted per transaction")
+    parser.add_argument("--dry-run", action="store_true", help="Validate and deduplicate without inserting")
+    args = parser.parse_args(argv)
+
+    if args.path == "-":
+        data = sys.stdin.buffer.read()
+    else:
+        with open(args.path, "rb") as handle:
+            data = handle.read()
+    fmt = args.format
+    if fmt == "auto" and args.path.lower().endswith((".ndjson", ".jsonl")):
+        fmt = "ndjson"
+
+    db = Database(role="batch")
+    db.connect()
+    try:
+        run_migrations(db.conn)
+        summary = ingest_records(db.conn, data, fmt, chunk_size=max(args.chunk_size, 1), dry_run=args.dry_run)
+    except IngestError as err:
+        print(f"error: {err}", file=sys.stderr)
+        return 2
+    finally:
+        db.close()
+    print(json.dumps(summary, indent=2))
+    return 1 if "Error" in summary else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,174 +1,573 @@
+import argparse
+import json
 import requests
 import logging
 import os
-from db import Database
-from database_prework.createdb.jason_all_data import extract_rcodes
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from urllib.parse import urlsplit, urlunsplit, parse_qs, urlencode
+from vimmo.db.db import Database
+from vimmo.db.migrations import run_migrations
+from vimmo.db.panel_contents import backfill_gene_changes, compose_gene_changes, replace_panel_genes
+from vimmo.utils.http_transport import get_transport
+from vimmo.utils.bed_artefacts import invalidate_bed_artefacts
 
-def fetch_latest_versions(api_url):
+PANELAPP_API = "https://panelapp.genomicsengland.co.uk/api/v1/panels"
+
+# Concurrent PanelApp requests; the shared transport also caps requests per host
+MAX_WORKERS = 4
+
+# Panels downloaded and committed together by run_journaled_update
+BATCH_SIZE = 25
+
+# Interrupted runs are resumed for this long, after that the next run starts a new crawl
+MAX_RESUME_AGE = timedelta(hours=24)
+
+
+def extract_rcodes(disorders_list):
+    """
+    Returns the items of disorders_list that are R codes (e.g. R45, R128, R21.5).
+
+    Same rule as database_prework/createdb/jason_all_data.py, which runs its whole crawl when imported.
+    """
+    return [disorder for disorder in disorders_list if re.match(r'^R\d+(\.\d+)?$', disorder)]
+
+
+def _page_url(api_url, page):
+    """Returns api_url with its page query parameter set to page."""
+    parts = urlsplit(api_url)
+    query = parse_qs(parts.query)
+    query["page"] = [str(page)]
+    return urlunsplit(parts._replace(query=urlencode(query, doseq=True)))
+
+
+def _fetch_json(url):
+    response = get_transport().get(url)
+    response.raise_for_status()  # Raise an error for HTTP issues
+    return response.json()  # Parse JSON response
+
+
+def _parse_version_page(data):
+    """Turns one signedoff page into [panel id, R codes, version] lists."""
+    latest_versions = []
+    results = data.get("results", []) # extract relevant part from JSON data
+    for item in results:
+        try:
+            panel_id = item.get("id")
+            version = float(item.get("version"))  # Convert version to a float for comparison with current version
+            r_code = item.get("relevant_disorders", [])
+            r_code = ", ".join(extract_rcodes(r_code)) # extract R codes from list which could contain worded
+                                                       # descriptions and join in a string
+            latest_versions.append([panel_id, r_code, version]) # add list of panels to list of lists
+        except (TypeError, ValueError) as e:
+            logging.warning(f"Skipping invalid version for panel {item.get('id')}: {e}")
+    return latest_versions
+
+
+def fetch_latest_versions(api_url, max_workers=MAX_WORKERS):
     """
     Fetches the latest panel versions from a paginated API.
 
+    The first page gives the total count and page size, the remaining pages are then fetched
+    concurrently. Falls back to following the "next" links one by one if the API does not report a count.
+
     Args:
         api_url (str): The initial URL of the API (page 1) to fetch panel versions.
+        max_workers (int): Maximum number of pages fetched at once.
 
     Returns:
-        latest_versions: A list of lists containing panel id, R codes and version
+        latest_versions: A list of lists containing panel id, R codes and version, in page order
     """
-    latest_versions = []
-
-    while api_url:
-        try:
-            # Send GET request to the API
-            response = requests.get(api_url)
-            response.raise_for_status()  # Raise an error for HTTP issues
-            data = response.json()  # Parse JSON response
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching data from API: {e}")
-            break
-
-        # Process results in the current page
-        results = data.get("results", []) # extract relevant part from JSON data
-        for item in results:
+    started = time.perf_counter()
+    try:
+        first_page = _fetch_json(api_url)
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error fetching data from API: {e}")
+        return []
+
+    latest_versions = _parse_version_page(first_page)
+    count = first_page.get("count")
+    page_size = len(first_page.get("results", []))
+    pages = 1
+
+    if first_page.get("next") and count and page_size:
+        total_pages = -(-count // page_size)  # ceiling division
+        urls = [_page_url(api_url, page) for page in range(2, total_pages + 1)]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(_fetch_json, url) for url in urls]
+            for url, future in zip(urls, futures):  # keep page order
+                try:
+                    latest_versions.extend(_parse_version_page(future.result()))
+                    pages += 1
+                except requests.exceptions.RequestException as e:
+                    logging.error(f"Error fetching data from API ({url}): {e}")
+    else:
+        api_url = first_page.get("next")
+        while api_url:
             try:
-                panel_id = item.get("id")
-                version = float(item.get("version"))  # Convert version to a float for comparison with current version
-                r_code = item.get("relevant_disorders", [])
-                r_code = ", ".join(extract_rcodes(r_code)) # extract R codes from list which could contain worded
-                                                           # descriptions and join in a string
-                latest_versions.append([panel_id, r_code, version]) # add list of panels to list of lists
-            except ValueError as e:
-                logging.warning(f"Skipping invalid version for panel {item.get('id')}: {e}")
-
-        # Move to the next page of the API data if available (automated paginating, stops when no more pages)
-        api_url = data.get("next")
-
-    logging.info(f"Fetched {len(latest_versions)} panels from PanelApp API.") # log number of panels fetched
+                data = _fetch_json(api_url)
+            except requests.exceptions.RequestException as e:
+                logging.error(f"Error fetching data from API: {e}")
+                break
+            latest_versions.extend(_parse_version_page(data))
+            pages += 1
+            # Move to the next page of the API data if available (automated paginating, stops when no more pages)
+            api_url = data.get("next")
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Fetched {len(latest_versions)} panels from PanelApp API ({pages} pages in {elapsed:.1f} s).") # log number of panels fetched
     return latest_versions
 
-def fetch_latest_version_genes(id, latest_version):
-    """
 
-    Fetches the genes for the latest version of a given panel
+def download_panel_genes(id, latest_version, base_url=PANELAPP_API):
+    """
+    Downloads the genes of one panel version.
 
     Args:
         id (str): The panel id
-        latest_version (list): A list of lists containing panel id, R codes and version
+        latest_version (float): The panel version to download
+        base_url (str): PanelApp panels API
 
     Returns:
         list of lists containing panel ID, HGNC ID and confidence for a given panel
+
+    Raises:
+        requests.exceptions.RequestException: If the download fails
     """
+    # genes_url will change dependent on the ID and latest version provided
+    genes_url = f"{base_url}/{id}/?format=json&version={latest_version}"
+    data = _fetch_json(genes_url)
+    return [[id, gene['gene_data']['hgnc_id'], gene['confidence_level']] for gene in data.get("genes") or []]
 
-    latest_genes = []
 
-    # genes_url will change dependent on the ID and latest version provided
-    genes_url = f"https://panelapp.genomicsengland.co.uk/api/v1/panels/{id}/?format=json&version={latest_version}"
+def fetch_latest_version_genes(id, latest_version, base_url=PANELAPP_API):
+    """
 
-    try:
-        # Send GET request to the API
-        response = requests.get(genes_url)
-        response.raise_for_status()  # Raise an error for HTTP issues
-        data = response.json()  # Parse JSON response
-        panel_genes = data.get("genes")
-        for gene in panel_genes:
-            hgnc_id = gene['gene_data']['hgnc_id']
-            confidence = gene['confidence_level']
-            latest_genes.append([id, hgnc_id, confidence])
+    Fetches the genes for the latest version of a given panel
+
+    Args:
+        id (str): The panel id
+        latest_version (list): A list of lists containing panel id, R codes and version
+        base_url (str): PanelApp panels API
 
+    Returns:
+        list of lists containing panel ID, HGNC ID and confidence for a given panel (empty if the download failed)
+    """
+    try:
+        return download_panel_genes(id, latest_version, base_url)
     except requests.exceptions.RequestException as e:
         logging.error(f"Error fetching latest genes from API: {e}")
+        return []
+
+
+def fetch_panels_genes(panels, base_url=PANELAPP_API, max_workers=MAX_WORKERS, report_every=25):
+    """
+    Downloads the genes of many panel versions concurrently, logging progress and throughput.
+
+    Args:
+        panels (list): (panel id, version) pairs
+        base_url (str): PanelApp panels API
+        max_workers (int): Maximum number of downloads at once
+        report_every (int): Log progress after this many completed downloads
 
+    Returns:
+        tuple: ({panel id: gene rows} for the downloads that succeeded, [panel ids that failed])
+    """
+    genes, failed = {}, []
+    if not panels:
+        return genes, failed
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(download_panel_genes, panel_id, version, base_url): panel_id
+                   for panel_id, version in panels}
+        for done, future in enumerate(as_completed(futures), start=1):
+            panel_id = futures[future]
+            try:
+                genes[panel_id] = future.result()
+            except (requests.exceptions.RequestException, KeyError, TypeError, ValueError) as e:
+                logging.error(f"Error fetching latest genes for panel {panel_id} from API: {e}")
+                failed.append(panel_id)
+            if done % report_every == 0 or done == len(futures):
+                elapsed = time.perf_counter() - started
+                logging.info(f"Downloaded genes for {done}/{len(futures)} panels "
+                             f"({done / elapsed if elapsed else 0:.1f} panels/s, {len(failed)} failed).")
+    return genes, failed
+
+
+def compare_versions(existing_versions, latest_versions):
+    """
+    Splits the listed panels into changed and new ones.
 
-    return latest_genes
+    Args:
+        existing_versions (dict): Panel id -> version in the panel table.
+        latest_versions (list): [panel_id, r_code, version] lists, the first listing of a panel is used.
 
+    Returns:
+        tuple: ([(panel id, existing version, latest version)] for changed panels,
+                [(panel id, r code, latest version)] for new panels)
+    """
+    changed, new, seen = [], [], set()
+    for panel_id, r_code, latest_version in latest_versions:
+        if panel_id in seen:
+            continue
+        seen.add(panel_id)
+        if panel_id not in existing_versions:
+            new.append((panel_id, r_code, latest_version))
+        elif existing_versions[panel_id] != latest_version:
+            changed.append((panel_id, existing_versions[panel_id], latest_version))
+    return changed, new
+
+
+def apply_panel_updates(cursor, changed, new, genes):
+    """
+    Writes downloaded panels to the database, without committing.
+
+    Changed panels get their new version, and their genes are archived under the old version and
+    replaced with replace_panel_genes, which only writes the rows that differ and stores the gene
+    changes in panel_gene_changes. New panels and their genes are inserted with executemany.
 
-def update_or_insert_panel_versions(cursor, latest_versions):
+    Args:
+        cursor: SQLite database cursor for executing queries.
+        changed (list): (panel id, existing version, latest version) of the changed panels.
+        new (list): (panel id, r code, latest version) of the new panels.
+        genes (dict): Panel id -> [panel id, HGNC ID, confidence] rows, for every panel in changed and new.
+
+    Returns:
+        int: Number of gene rows written.
+    """
+    conn = cursor.connection
+    if not conn.in_transaction:
+        cursor.execute("BEGIN")  # one transaction for the caller to commit, replace_panel_genes joins it
+    rows_written = 0
+    if changed:
+        # Set the new version, archive existing genes of the old version and replace them with the latest ones
+        for panel_id, existing_version, latest_version in changed:
+            changes = replace_panel_genes(conn, panel_id, [(hgnc_id, confidence) for _, hgnc_id, confidence in genes[panel_id]],
+                                          archive_version=existing_version, versions=(existing_version, latest_version))
+            rows_written += sum(changes["rows"].values())
+    if new:
+        # Insert new panels
+        cursor.executemany(
+            'INSERT INTO panel (Panel_ID, rcodes, Version) VALUES (?, ?, ?)',
+            new
+        )
+        gene_rows = [row for panel_id, _, _ in new for row in genes[panel_id]]
+        cursor.executemany(
+            '''INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence) VALUES (?, ?, ?)''',
+            gene_rows
+        )
+        rows_written += len(gene_rows)
+    return rows_written
+
+
+def log_applied_panels(cursor, changed, new):
+    """Logs the gene changes of the changed panels and the new panels, once the writes are made."""
+    for panel_id, existing_version, latest_version in changed:
+        logging.info(f"Updated panel {panel_id} from version {existing_version} to version {latest_version}.")
+        # Fetch gene changes and log them
+        added_genes, removed_genes, confidence_changes = fetch_gene_changes(cursor, panel_id, existing_version, latest_version)
+        logging.info(
+            f"{panel_id} --> {added_genes} added, {removed_genes} removed. Confidence changes: {confidence_changes}")
+    for panel_id, _, latest_version in new:
+        logging.info(f"Inserted panel {panel_id} with version {latest_version}.")
+
+
+def update_or_insert_panel_versions(cursor, latest_versions, base_url=PANELAPP_API, max_workers=MAX_WORKERS):
     """
     Updates or inserts panel versions in the database, archives genes in the current version and adds the latest genes to
     panel_genes.
 
+    Runs as a pipeline: the current versions are read in one query, the genes of every new or changed
+    panel are downloaded concurrently, then all writes are applied (apply_panel_updates). No request is
+    made while the write transaction is open. A panel whose genes could not be downloaded is left at
+    its current version, so the next run retries it.
+
     Args:
         cursor: SQLite database cursor for executing queries.
         latest_versions (list): A list of lists, where each sublist contains [panel_id, r_code, version].
+        base_url (str): PanelApp panels API the genes are downloaded from.
+        max_workers (int): Maximum number of concurrent gene downloads.
 
     Returns:
         bool: True if any updates or inserts were made, False otherwise.
     """
-    # updates variable will be changed to true if updates are made, to decide on logging
-    updates = False
-
-    for panel_info in latest_versions:
-        panel_id, r_code, latest_version = panel_info  # Unpack the sublist
-
-        # Check if the panel already exists in the database
-        cursor.execute('SELECT Panel_ID, Version FROM panel WHERE Panel_ID = ?', (panel_id,))
-        existing_row = cursor.fetchone()
-
-        if existing_row:
-            existing_id, existing_version = existing_row
-            # Update version and archive old version genes if it differs
-            if existing_version != latest_version:
-                latest_genes = fetch_latest_version_genes(panel_id, latest_version)
-
-                # Archive existing genes of the old version
-                cursor.execute(
-                    '''
-                    INSERT INTO panel_genes_archive (Panel_ID, HGNC_ID, Version, Confidence)
-                    SELECT Panel_ID, HGNC_ID, ?, Confidence
-                    FROM panel_genes
-                    WHERE Panel_ID = ?
-                    ''',
-                    (existing_version, panel_id)
-                )
-
-                # Update the panel version
-                cursor.execute(
-                    'UPDATE panel SET Version = ? WHERE Panel_ID = ?',
-                    (latest_version, panel_id)
-                )
-                logging.info(f"Updated panel {panel_id} from version {existing_version} to version {latest_version}.")
-                updates = True
-
-                # Delete the old genes and insert new ones
-                cursor.execute('DELETE FROM panel_genes WHERE Panel_ID = ?', (panel_id,))
-                cursor.executemany(
-                    '''INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence) VALUES (?, ?, ?)''',
-                    latest_genes
-                )
-
-                # Fetch gene changes and log them
-                added_genes, removed_genes, confidence_changes = fetch_gene_changes(cursor, panel_id, existing_version)
-                logging.info(
-                    f"{panel_id} --> {added_genes} added, {removed_genes} removed. Confidence changes: {confidence_changes}")
-        else:
-            # calling func to retrieve the genes that are in the panel so they can be added in to the database if
-            # the panel doesnt yet exist in it
-            latest_genes = fetch_latest_version_genes(panel_id, latest_version)
-            # Insert new panel if it doesn't exist
-            cursor.execute(
-                'INSERT INTO panel (Panel_ID, rcodes, Version) VALUES (?, ?, ?)',
-                (panel_id, r_code, latest_version)
-            )
-            cursor.executemany(
-                '''INSERT INTO panel_genes (Panel_ID, HGNC_ID, Confidence) VALUES (?, ?, ?)''',
-                latest_genes
-            )
-            logging.info(f"Inserted panel {panel_id} with version {latest_version}.")
-            updates = True
+    started = time.perf_counter()
 
+    # 1. Work out which panels changed
+    existing_versions = {row[0]: row[1] for row in cursor.execute('SELECT Panel_ID, Version FROM panel').fetchall()}
+    changed, new = compare_versions(existing_versions, latest_versions)
+    logging.info(f"{len(latest_versions)} panels checked: {len(changed)} changed, {len(new)} new.")
+
+    # 2. Download their genes
+    genes, failed = fetch_panels_genes(
+        [(panel_id, version) for panel_id, _, version in changed] + [(panel_id, version) for panel_id, _, version in new],
+        base_url=base_url, max_workers=max_workers
+    )
+    if failed:
+        logging.warning(f"Skipping {len(failed)} panels whose genes could not be downloaded: {sorted(failed)}")
+    changed = [panel for panel in changed if panel[0] in genes]
+    new = [panel for panel in new if panel[0] in genes]
+
+    # 3. Apply everything in one go
+    rows_written = apply_panel_updates(cursor, changed, new, genes) if changed or new else 0
+    log_applied_panels(cursor, changed, new)
+    for panel_id, _, _ in changed:
+        # Cached BED downloads are keyed by version, so none is served stale; this just frees the space
+        invalidate_bed_artefacts(panel_id)
+
+    elapsed = time.perf_counter() - started
+    logging.info(f"Applied {len(changed)} updated and {len(new)} new panels ({rows_written} gene rows written) "
+                 f"in {elapsed:.1f} s.")
+
+    updates = bool(changed or new)
     if not updates:
         logging.info("0 updates made.") # hence the updates boolean
     return updates
 
-def fetch_gene_changes(cursor, panel_id, old_version):
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def _resumable_run(conn, max_resume_age):
+    """
+    The last run if it was interrupted after its crawl and is recent enough to resume, else None.
+
+    Older unfinished runs are marked interrupted.
+    """
+    row = conn.execute("SELECT Run_ID, Status, Started_At, Crawl_Seconds FROM update_runs "
+                       "ORDER BY Run_ID DESC LIMIT 1").fetchone()
+    if row is None or row[1] not in ("running", "failed"):
+        return None
+    cutoff = (datetime.now() - max_resume_age).isoformat(timespec="seconds")
+    if row[3] is not None and row[2] >= cutoff:
+        return row[0]
+    conn.execute("UPDATE update_runs SET Status = 'interrupted' WHERE Run_ID = ?", (row[0],))
+    conn.commit()
+    return None
+
+
+def _journal_crawl(conn, run_id, latest_versions, recheck_after):
+    """
+    Records the listed versions in update_journal and returns the run's counts.
+
+    Every listed version is compared with the panel table; changed and new panels are marked pending.
+    Unchanged panels are marked unchanged with a new confirmation time, except those already
+    confirmed (found unchanged or applied) within recheck_after, which are skipped. Panels no longer
+    listed are dropped.
+    """
+    now = _now()
+    cutoff = (datetime.now() - recheck_after).isoformat(timespec="seconds") if recheck_after else None
+    recent = set()
+    if cutoff:
+        recent = {row[0] for row in conn.execute(
+            "SELECT Panel_ID FROM update_journal WHERE State IN ('unchanged', 'applied') AND Confirmed_At >= ?", (cutoff,))}
+    existing_versions = {row[0]: row[1] for row in conn.execute('SELECT Panel_ID, Version FROM panel')}
+
+    listed = {}
+    for panel_id, r_code, latest_version in latest_versions:
+        listed.setdefault(panel_id, (r_code, latest_version))
+    changed, new = compare_versions(existing_versions, [[panel_id, r_code, version]
+                                                        for panel_id, (r_code, version) in listed.items()])
+    pending = {panel_id for panel_id, _, _ in changed} | {panel_id for panel_id, _, _ in new}
+    # The listing is already fetched, so only unchanged panels confirmed recently are left alone
+    checked = [[panel_id, r_code, version] for panel_id, (r_code, version) in listed.items()
+               if panel_id in pending or panel_id not in recent]
+
+    conn.executemany(
+        '''
+        INSERT INTO update_journal (Panel_ID, rcodes, Run_ID, Fetched_Version, Applied_Version, State, Attempts,
+                                    Fetched_At, Confirmed_At, Error)
+        VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, NULL)
+        ON CONFLICT (Panel_ID) DO UPDATE SET
+            rcodes = excluded.rcodes, Run_ID = excluded.Run_ID, Fetched_Version = excluded.Fetched_Version,
+            Applied_Version = COALESCE(excluded.Applied_Version, Applied_Version), State = excluded.State,
+            Fetched_At = excluded.Fetched_At, Confirmed_At = COALESCE(excluded.Confirmed_At, Confirmed_At),
+            Error = NULL
+        ''',
+        [(panel_id, r_code, run_id, version,
+          None if panel_id in pending else version,
+          "pending" if panel_id in pending else "unchanged",
+          now,
+          None if panel_id in pending else now)
+         for panel_id, r_code, version in checked]
+    )
+    # Panels PanelApp no longer lists would never be confirmed again
+    conn.execute("DELETE FROM update_journal WHERE Panel_ID NOT IN (SELECT value FROM json_each(?))",
+                 (json.dumps(list(listed)),))
+    return {"Listed": len(listed), "Changed": len(changed), "New": len(new), "Skipped": len(listed) - len(checked)}
+
+
+def _apply_batch(conn, run_id, batch, base_url, max_workers):
+    """
+    Downloads and applies one batch of pending panels, then commits it with its journal entries.
+
+    Returns:
+        tuple: (applied, failed, download seconds, apply seconds)
+    """
+    cursor = conn.cursor()
+    panel_ids = [panel_id for panel_id, _, _ in batch]
+    existing_versions = {row[0]: row[1] for row in cursor.execute(
+        f"SELECT Panel_ID, Version FROM panel WHERE Panel_ID IN ({', '.join('?' * len(panel_ids))})", panel_ids)}
+    # A panel already at its fetched version was applied before an interruption
+    changed, new = compare_versions(existing_versions, [list(panel) for panel in batch])
+
+    started = time.perf_counter()
+    genes, failed = fetch_panels_genes(
+        [(panel_id, version) for panel_id, _, version in changed] + [(panel_id, version) for panel_id, _, version in new],
+        base_url=base_url, max_workers=max_workers
+    )
+    download_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    changed = [panel for panel in changed if panel[0] in genes]
+    new = [panel for panel in new if panel[0] in genes]
+    now = _now()
+    try:
+        apply_panel_updates(cursor, changed, new, genes)
+        failed = set(failed)
+        cursor.executemany(
+            "UPDATE update_journal SET State = 'applied', Applied_Version = ?, Confirmed_At = ?, "
+            "Attempts = Attempts + 1, Error = NULL WHERE Panel_ID = ?",
+            [(version, now, panel_id) for panel_id, _, version in batch if panel_id not in failed]
+        )
+        cursor.executemany(
+            "UPDATE update_journal SET State = 'failed', Attempts = Attempts + 1, Error = ? WHERE Panel_ID = ?",
+            [("Genes could not be downloaded", panel_id) for panel_id in failed]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    log_applied_panels(cursor, changed, new)
+    for panel_id, _, _ in changed:
+        invalidate_bed_artefacts(panel_id)
+    return len(batch) - len(failed), len(failed), download_seconds, time.perf_counter() - started
+
+
+def run_journaled_update(conn, api_url, base_url=PANELAPP_API, batch_size=BATCH_SIZE, recheck_after=None,
+                         max_resume_age=MAX_RESUME_AGE, max_workers=MAX_WORKERS):
+    """
+    Brings the panel tables up to date with PanelApp, journaling progress so an interrupted run can resume.
+
+    Args:
+        conn: SQLite connection with write access, migrated (update_runs and update_journal tables).
+        api_url (str): First page of the signed-off panel listing.
+        base_url (str): PanelApp panels API the genes are downloaded from.
+        batch_size (int): Panels downloaded and committed together.
+        recheck_after (timedelta): Unchanged panels confirmed more recently than this are not confirmed
+            again; None confirms every listed panel. Listed versions are always compared.
+        max_resume_age (timedelta): Interrupted runs older than this are abandoned rather than resumed.
+        max_workers (int): Maximum number of concurrent requests.
+
+    Returns:
+        dict: The run's update_runs row.
+
+    Notes:
+        - The crawl (listing and comparison with the panel table) is recorded in update_journal in one
+          commit: panels that are unchanged are confirmed, the others are pending
+        - Pending panels are then downloaded and applied batch by batch, each batch committed with
+          its journal entries. A crash loses at most the batch in progress
+        - If the last run did not finish, the next one resumes its pending panels without crawling again
+        - A panel whose genes could not be downloaded is marked failed and keeps its current version,
+          the next crawl retries it
+        - If every journaled panel was confirmed within recheck_after the run is recorded as skipped
+          without contacting PanelApp (new panels are then found once the window has passed)
+    """
+    started = time.perf_counter()
+    run_id = _resumable_run(conn, max_resume_age)
+    try:
+        if run_id is not None:
+            logging.info(f"Resuming interrupted update run {run_id}.")
+            conn.execute("UPDATE update_runs SET Status = 'running', Error = NULL WHERE Run_ID = ?", (run_id,))
+            conn.commit()
+        else:
+            if recheck_after:
+                cutoff = (datetime.now() - recheck_after).isoformat(timespec="seconds")
+                known, stale = conn.execute(
+                    "SELECT COUNT(*), COALESCE(SUM(State NOT IN ('unchanged', 'applied') OR Confirmed_At IS NULL "
+                    "OR Confirmed_At < ?), 0) FROM update_journal", (cutoff,)).fetchone()
+                if known and not stale:
+                    conn.execute("INSERT INTO update_runs (Started_At, Finished_At, Status, Total_Seconds) "
+                                 "VALUES (?, ?, 'skipped', ?)", (_now(), _now(), time.perf_counter() - started))
+                    conn.commit()
+                    logging.info(f"All {known} panels were confirmed within {recheck_after}, skipping this run.")
+                    return _run_row(conn, conn.execute("SELECT MAX(Run_ID) FROM update_runs").fetchone()[0])
+
+            run_id = conn.execute("INSERT INTO update_runs (Started_At, Status) VALUES (?, 'running')", (_now(),)).lastrowid
+            conn.commit()
+            crawl_started = time.perf_counter()
+            latest_versions = fetch_latest_versions(api_url, max_workers=max_workers)
+            if not latest_versions:
+                raise RuntimeError("No panels could be fetched from the PanelApp listing")
+            counts = _journal_crawl(conn, run_id, latest_versions, recheck_after)
+            conn.execute("UPDATE update_runs SET Listed = ?, Changed = ?, New = ?, Skipped = ?, Crawl_Seconds = ? "
+                         "WHERE Run_ID = ?", (counts["Listed"], counts["Changed"], counts["New"], counts["Skipped"],
+                                              time.perf_counter() - crawl_started, run_id))
+            conn.commit()
+            logging.info(f"{counts['Listed']} panels listed: {counts['Changed']} changed, {counts['New']} new, "
+                         f"{counts['Skipped']} confirmed recently.")
+
+        pending = [tuple(row) for row in conn.execute(
+            "SELECT Panel_ID, rcodes, Fetched_Version FROM update_journal WHERE Run_ID = ? AND State = 'pending' "
+            "ORDER BY Panel_ID", (run_id,))]
+        for start in range(0, len(pending), batch_size):
+            applied, failed, download_seconds, apply_seconds = _apply_batch(
+                conn, run_id, pending[start:start + batch_size], base_url, max_workers)
+            conn.execute("UPDATE update_runs SET Applied = Applied + ?, Failed = Failed + ?, Batches = Batches + 1, "
+                         "Download_Seconds = Download_Seconds + ?, Apply_Seconds = Apply_Seconds + ? WHERE Run_ID = ?",
+                         (applied, failed, download_seconds, apply_seconds, run_id))
+            conn.commit()
+            logging.info(f"Batch {start // batch_size + 1}/{-(-len(pending) // batch_size)} committed: "
+                         f"{applied} applied, {failed} failed.")
+
+        conn.execute("UPDATE update_runs SET Status = 'completed', Finished_At = ?, "
+                     "Total_Seconds = COALESCE(Total_Seconds, 0) + ? WHERE Run_ID = ?",
+                     (_now(), time.perf_counter() - started, run_id))
+        conn.commit()
+    except Exception as err:
+        conn.rollback()
+        if run_id is not None:
+            conn.execute("UPDATE update_runs SET Status = 'failed', Error = ?, "
+                         "Total_Seconds = COALESCE(Total_Seconds, 0) + ? WHERE Run_ID = ?",
+                         (str(err), time.perf_counter() - started, run_id))
+            conn.commit()
+        raise
+    return _run_row(conn, run_id)
+
+
+def _run_row(conn, run_id):
+    cursor = conn.execute("SELECT * FROM update_runs WHERE Run_ID = ?", (run_id,))
+    columns = [column[0] for column in cursor.description]
+    return dict(zip(columns, cursor.fetchone()))
+
+
+def recent_runs(conn, limit=10):
+    """
+    The latest update_runs rows, newest first, e.g. to see how long refreshes take.
+
+    Returns:
+        list of dict: One per run, with its status, panel counts and crawl / download / apply / total seconds.
+    """
+    cursor = conn.execute("SELECT * FROM update_runs ORDER BY Run_ID DESC LIMIT ?", (limit,))
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def fetch_gene_changes(cursor, panel_id, old_version, new_version=None):
     """
     Fetches the genes that have been added, removed, or had changes in confidence between
-    the current version of a panel and its archived version. This can be used to log changes
+    an older version of a panel and its current version. This can be used to log changes
     made during an update.
 
     Args:
         cursor: SQLite database cursor for executing queries.
         panel_id (int): The ID of the panel being compared.
-        old_version (str): The version of the panel to compare against (stored in the archive table).
+        old_version (str): The version of the panel to compare against.
+        new_version (str): The version compared to, defaults to the panel's version in the panel table.
 
     Returns:
         tuple: A tuple containing three lists:
@@ -178,58 +577,33 @@ def fetch_gene_changes(cursor, panel_id, old_version):
               as a tuple (HGNC_ID, Confidence).
             - confidence_changed (list of tuple): Genes whose confidence levels have changed between
               versions, each represented as a tuple (HGNC_ID, old_confidence, new_confidence).
-    """
-
-
-    # Fetch genes from the old version
-    cursor.execute(
-        '''
-        SELECT HGNC_ID, Confidence
-        FROM panel_genes_archive
-        WHERE Panel_ID = ? AND Version = ?
-        ''',
-        (panel_id, old_version)
-    )
-    old_version_genes = {row['HGNC_ID']: row['Confidence'] for row in cursor.fetchall()}  # Map of HGNC_ID to Confidence
-
-    # Fetch genes from the new version
-    cursor.execute(
-        '''
-        SELECT HGNC_ID, Confidence
-        FROM panel_genes
-        WHERE Panel_ID = ? 
-        ''',
-        (panel_id,)
-    )
-    new_version_genes = {row['HGNC_ID']: row['Confidence'] for row in cursor.fetchall()}  # Map of HGNC_ID to Confidence
-
-    # Identify added genes (present in new but not in old)
-    added_genes = [
-        (hgnc_id, confidence) for hgnc_id, confidence in new_version_genes.items()
-        if hgnc_id not in old_version_genes
-    ]
-
-    # Identify removed genes (present in old but not in new)
-    removed_genes = [
-        (hgnc_id, confidence) for hgnc_id, confidence in old_version_genes.items()
-        if hgnc_id not in new_version_genes
-    ]
-
-    # Identify confidence changes (same HGNC_ID but different Confidence)
-    confidence_changed = [
-        (hgnc_id, old_version_genes[hgnc_id], new_version_genes[hgnc_id])
-        for hgnc_id in old_version_genes
-        if hgnc_id in new_version_genes and old_version_genes[hgnc_id] != new_version_genes[hgnc_id]
-    ]
 
+    Reads the deltas stored in panel_gene_changes when the update was applied (compose_gene_changes),
+    empty lists if none lead from old_version to new_version.
+    """
+    if new_version is None:
+        row = cursor.execute('SELECT Version FROM panel WHERE Panel_ID = ?', (panel_id,)).fetchone()
+        new_version = row[0] if row else old_version
+    genes_added, genes_removed, conf_changes = compose_gene_changes(cursor.connection, panel_id, old_version, new_version) or ({}, {}, {})
+    added_genes = list(genes_added.items())
+    removed_genes = list(genes_removed.items())
+    confidence_changed = [(hgnc_id, old, new) for hgnc_id, (old, new) in conf_changes.items()]
     return added_genes, removed_genes, confidence_changed
 
 
 
-def main():
+def main(argv=None):
     """
     Main function to coordinate fetching panel versions and updating the database.
     """
+    parser = argparse.ArgumentParser(description="Update the Vimmo panel tables from PanelApp")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Panels downloaded and committed together")
+    parser.add_argument("--recheck-after", type=float, default=0,
+                        help="Hours after which an unchanged panel is confirmed again (default: every run)")
+    parser.add_argument("--history", type=int, metavar="N", help="Print the last N runs and their timings, then exit")
+    parser.add_argument("--backfill-changes", action="store_true",
+                        help="Store the gene changes between the archived panel versions, then exit")
+    args = parser.parse_args(argv)
 
     # Determine the directory of the current script
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -256,30 +630,38 @@ def main():
     console_handler.setFormatter(formatter)
     logging.getLogger().addHandler(console_handler)
 
-    logging.info("Starting the panel update process.")
-
-    # URL for the latest signed off panel versions API endpoint
-    api_url = "https://panelapp.genomicsengland.co.uk/api/v1/panels/signedoff/?display=latest&page=1"
-
     # Initialize and connect to the database
-    db = Database()
+    db = Database(role="batch")
     db.connect()
+    run_migrations(db.conn)  # make sure the journal tables and the indexes the updater relies on exist
+
+    if args.history:
+        for run in recent_runs(db.conn, args.history):
+            print(json.dumps(run))
+        db.close()
+        return
+    if args.backfill_changes:
+        backfill_gene_changes(db.conn)
+        db.close()
+        return
 
-    # Fetch latest versions from the API
-    latest_versions = fetch_latest_versions(api_url)
-
-    # Get a cursor for database operations
-    cursor = db.conn.cursor()
-
-    # Update or insert panel versions
-    updates_made = update_or_insert_panel_versions(cursor, latest_versions)
-
+    logging.info("Starting the panel update process.")
 
-    # Commit changes and close the database connection
-    db.conn.commit()
-    db.close()
+    # URL for the latest signed off panel versions API endpoint
+    api_url = f"{PANELAPP_API}/signedoff/?display=latest&page=1"
 
-    logging.info("Completed the panel update process.\n")
+    # Crawl, then apply the changed panels batch by batch; progress is journaled so an interrupted run resumes
+    try:
+        run = run_journaled_update(db.conn, api_url, batch_size=max(args.batch_size, 1),
+                                   recheck_after=timedelta(hours=args.recheck_after) if args.recheck_after else None)
+    except Exception:
+        logging.exception("Panel update failed, committed batches are kept and the next run resumes.")
+        raise
+    finally:
+        db.close()
+
+    logging.info(f"Completed update run {run['Run_ID']} ({run['Status']}) in {run['Total_Seconds']:.1f} s: "
+                 f"{run['Applied']} panels applied, {run['Failed']} failed.\n")
 
 
 if __name__ == "__main__":
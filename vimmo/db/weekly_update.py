@@ -2,6 +2,7 @@ import requests
 import logging
 
 from db import Database
+from vimmo.utils.http_transport import get_transport
 
 def fetch_latest_versions(api_url):
     """
@@ -18,7 +19,7 @@ def fetch_latest_versions(api_url):
     while api_url:
         try:
             # Send GET request to the API
-            response = requests.get(api_url)
+            response = get_transport().get(api_url)
             response.raise_for_status()  # Raise an error for HTTP issues
             data = response.json()  # Parse JSON response
         except requests.exceptions.RequestException as e:
@@ -48,7 +49,7 @@ def fetch_latest_version_genes(id, latest_version):
 
     try:
         # Send GET request to the API
-        response = requests.get(genes_url)
+        response = get_transport().get(genes_url)
         response.raise_for_status()  # Raise an error for HTTP issues
         data = response.json()  # Parse JSON response
         panel_genes = data.get("genes")
@@ -205,7 +206,7 @@ def main():
     api_url = "https://panelapp.genomicsengland.co.uk/api/v1/panels/signedoff/?display=latest&page=1"
 
     # Initialize and connect to the database
-    db = Database()
+    db = Database(role="batch")
     db.connect()
 
     # Fetch latest versions from the API
@@ -4,7 +4,7 @@ from vimmo.API import get_db
 import re
 
 
-def validate_hgnc_ids(hgnc_id_value):
+def validate_hgnc_ids(hgnc_id_value, matches=False, wildcards=False):
     """
     Validates one or multiple HGNC_IDs provided as a comma-separated string.
 
@@ -12,6 +12,11 @@ def validate_hgnc_ids(hgnc_id_value):
     ----------
     hgnc_ids_str : str
         A string containing one or more HGNC IDs, e.g. "HGNC:12345" or "HGNC:12345,HGNC:67890".
+    matches : bool
+        True for similar matching, which also accepts gene symbols and partial IDs (e.g. "BRCA1", "BRC").
+    wildcards : bool
+        True where a trailing '*' is a prefix wildcard (e.g. "HGNC:110*", or "BRCA*" with matches),
+        i.e. the /panels search.
 
     Returns
     -------
@@ -23,24 +28,30 @@ def validate_hgnc_ids(hgnc_id_value):
     ValueError
         If any HGNC_ID does not match the required format.
     """
-    # Pattern for HGNC_ID: Matches strings like 'HGNC:12345'
-    hgnc_pattern = r"^HGNC:\d+$"
+    # Pattern for HGNC_ID: Matches strings like 'HGNC:12345' (or 'HGNC:123*' with wildcards)
+    hgnc_pattern = r"^HGNC:(\d+|\d*\*)$" if wildcards else r"^HGNC:\d+$"
+    # Pattern for similar matches: gene symbols (e.g. 'BRCA1', 'HLA-DRB1', 'C1orf112') and HGNC ID fragments
+    similar_pattern = r"^[A-Za-z0-9][A-Za-z0-9:._@-]*\*?$" if wildcards else r"^[A-Za-z0-9][A-Za-z0-9:._@-]*$"
 
 
     # Validate each HGNC ID against the pattern
     for hgnc_id in hgnc_id_value:
         # print(hgnc_id)
-        if not re.fullmatch(hgnc_pattern, hgnc_id):
+        if matches:
+            if not re.fullmatch(similar_pattern, hgnc_id):
+                logger.error(f"Invalid format for 'HGNC_ID': '{hgnc_id}' is not an HGNC ID or gene symbol.")
+                raise ValueError(
+                    f"Invalid format for 'HGNC_ID': '{hgnc_id}' must be an HGNC ID or gene symbol (e.g., 'HGNC:12345', 'BRCA1')."
+                )
+        elif not re.fullmatch(hgnc_pattern, hgnc_id):
             logger.error(f"Invalid format for 'HGNC_ID': '{hgnc_id}' must start with 'HGNC:' followed by digits only.")
             raise ValueError(
                 f"Invalid format for 'HGNC_ID': '{hgnc_id}' must start with 'HGNC:' followed by digits only (e.g., 'HGNC:12345')."
             )
-        else:
-            logger.info(f"Validated HGNC_ID: {hgnc_id}")
-            continue
+        logger.info(f"Validated HGNC_ID: {hgnc_id}")
 
 
-def panel_space_validator(panel_id_value, rcode_value, hgnc_id_value):
+def panel_space_validator(panel_id_value, rcode_value, hgnc_id_value, matches=False):
     """
     Validates identifiers specifically for the panel space.
 
@@ -48,17 +59,20 @@ def panel_space_validator(panel_id_value, rcode_value, hgnc_id_value):
         panel_id_value (str): Value of the Panel_ID (should be numeric).
         rcode_value (str): Value of the Rcode (should start with 'r' or 'R' followed by digits).
         hgnc_id_value (str): Value of the HGNC_ID (should start with 'HGNC:' followed by digits).
+        matches (bool): Similar_Matches, when True HGNC_ID may also hold gene symbols and Rcode a panel name.
 
     Raises:
         ValueError: If any provided value does not match the expected format.
 
     Notes:
-        - `Rcode` must match the pattern 'r\\d+' or 'R\\d+' (e.g., 'R123').
+        - `Rcode` must match the pattern 'r\\d+' or 'R\\d+' (e.g., 'R123'), or with `matches` be a panel name.
         - `HGNC_ID` must match the pattern 'HGNC:d+' (e.g., 'HGNC:12345').
         - `Panel_ID` must be numeric.
     """
     # Pattern for Rcode: Matches strings like 'r123' or 'R123'
     rcode_pattern = r"^[rR]\d+$"
+    # Pattern for similar matches on Rcode: also panel names or parts of them, e.g. 'cardiomyopathy'
+    panel_name_pattern = r"^[A-Za-z0-9][A-Za-z0-9 ,'()/.+_-]{0,99}$"
 
     # Validate Panel_ID: Must be numeric
     if panel_id_value:
@@ -71,7 +85,9 @@ def panel_space_validator(panel_id_value, rcode_value, hgnc_id_value):
 
     # Validate Rcode: Must match 'R123' or 'r123'
     if rcode_value:
-        if not re.fullmatch(rcode_pattern, rcode_value):
+        if matches and re.fullmatch(panel_name_pattern, rcode_value):
+            logger.info(f"Rcode '{rcode_value}' will be matched against R codes and panel names")
+        elif not re.fullmatch(rcode_pattern, rcode_value):
             logger.error("Invalid format for 'Rcode': Must start with 'R' followed by digits only")
             raise ValueError("Invalid format for 'Rcode': Must start with 'R' followed by digits only (e.g., 'R123').")
 
@@ -80,7 +96,7 @@ def panel_space_validator(panel_id_value, rcode_value, hgnc_id_value):
         logger.info("Validating HGNC_ID")
         # We'll validate all HGNC IDs at once
         # If this fails, it will raise ValueError
-        validate_hgnc_ids(hgnc_id_value)
+        validate_hgnc_ids(hgnc_id_value, matches=matches, wildcards=True)
         logger.info(f"Validation for HGNC_ID: {hgnc_id_value} successful")
 
 def bed_space_validator(panel_id_value, rcode_value, hgnc_id_value):
@@ -162,7 +178,7 @@ def validate_panel_id_or_Rcode_or_hgnc(args, panel_space=False, bed_space=False)
     # Delegate validation based on the specified space
     if panel_space:
         logger.info("Validation for panel space")
-        panel_space_validator(panel_id_value, rcode_value, hgnc_id_value)
+        panel_space_validator(panel_id_value, rcode_value, hgnc_id_value, matches=bool(args.get('Similar_Matches')))
 
     if bed_space:
         logger.info("Validation for bed space")
@@ -192,6 +208,35 @@ def hgnc_to_list(args):
         return args
 
 
+def panel_lists_validator(args):
+    """
+    Splits and validates the comma separated Panel_ID and Rcode lists of the multi-panel download.
+
+    Args:
+        args (dict): Dictionary containing `Panel_ID`, `Rcode` and `Padding`.
+
+    Returns:
+        tuple: (list of Panel_IDs, list of upper-cased Rcodes), duplicates removed, in input order.
+
+    Raises:
+        ValueError: If neither list is given, any identifier is malformed or Padding is negative.
+    """
+    panel_ids = list(dict.fromkeys(p.strip() for p in (args.get('Panel_ID') or '').split(',') if p.strip()))
+    rcodes = list(dict.fromkeys(r.strip().upper() for r in (args.get('Rcode') or '').split(',') if r.strip()))
+
+    if not panel_ids and not rcodes:
+        logger.error("At least one 'Panel_ID' or 'Rcode' must be provided.")
+        raise ValueError("At least one 'Panel_ID' or 'Rcode' must be provided.")
+    for panel_id in panel_ids:
+        bed_space_validator(panel_id, None, None)
+    for rcode in rcodes:
+        bed_space_validator(None, rcode, None)
+    if (args.get('Padding') or 0) < 0:
+        raise ValueError("Invalid 'Padding': must be zero or a positive number of bases.")
+    logger.info(f"Validated Panel_IDs: {panel_ids}, Rcodes: {rcodes}")
+    return panel_ids, rcodes
+
+
 def patient_update_validator(args):
     """ Validates patient update inputs (Patient_ID and Rcode).
 
@@ -238,3 +283,73 @@ def patient_update_validator(args):
    
     # Query function to check if rcode is in db
     # raise error is not found 
+
+
+# Most regions accepted by one /panels/regions request
+MAX_REGIONS = 200000
+
+# Whole-chromosome regions end here (longer than any chromosome)
+MAX_POSITION = 2 ** 31 - 1
+
+# 'chr17:43044295-43125483', '17:43044295-43125483' or a single position 'chrX:153724856'
+REGION_PATTERN = re.compile(r"^(?:chr)?([0-9]{1,2}|[XYM]|MT)(?::(\d+)(?:-(\d+))?)?$", re.IGNORECASE)
+
+
+def parse_regions(regions_value):
+    """
+    Validates the regions given to /panels/regions and converts them to 0-based half-open coordinates.
+
+    Parameters
+    ----------
+    regions_value : str or list
+        Either a comma / whitespace separated string of 'chrom:start-end' regions, or a list whose items
+        are such strings or {"chrom", "start", "end"} objects.
+        - Region strings are 1-based and inclusive, like samtools / genome browser positions
+          ('chr17:100-200' covers bases 100 to 200, 'chr17:150' a single base, 'chr17' the whole chromosome)
+        - Objects are BED intervals: 0-based, end exclusive
+
+    Returns
+    -------
+    list of tuple
+        (chrom, start, end) per region, in input order, with 0 <= start < end
+
+    Raises
+    ------
+    ValueError
+        If no region is given, there are more than MAX_REGIONS, or any region is malformed
+    """
+    if isinstance(regions_value, str):
+        items = regions_value.replace(",", " ").split()
+    elif isinstance(regions_value, (list, tuple)):
+        items = list(regions_value)
+    else:
+        items = []
+    if not items:
+        raise ValueError("At least one region must be provided (e.g., 'chr17:43044295-43125483').")
+    if len(items) > MAX_REGIONS:
+        raise ValueError(f"Too many regions: {len(items)} given, at most {MAX_REGIONS} are accepted per request.")
+
+    regions = []
+    for item in items:
+        if isinstance(item, dict):
+            try:
+                chrom, start, end = str(item["chrom"]).strip(), int(item["start"]), int(item["end"])
+            except (KeyError, TypeError, ValueError):
+                raise ValueError(f"Invalid region {item}: objects need 'chrom' and integer 'start' and 'end'.")
+            if not REGION_PATTERN.fullmatch(chrom) or ":" in chrom:
+                raise ValueError(f"Invalid chromosome in region {item}: '{chrom}'.")
+        else:
+            match = REGION_PATTERN.fullmatch(str(item).strip())
+            if not match:
+                raise ValueError(f"Invalid region '{item}': expected 'chrom:start-end' (e.g., 'chr17:43044295-43125483').")
+            chrom = str(item).strip().split(":")[0]
+            if match.group(2) is None:
+                start, end = 0, MAX_POSITION
+            else:
+                start = int(match.group(2)) - 1
+                end = int(match.group(3)) if match.group(3) else start + 1
+        if start < 0 or end <= start:
+            raise ValueError(f"Invalid region {item}: start must be positive and not after the end.")
+        regions.append((chrom, start, min(end, MAX_POSITION)))
+    logger.info(f"Validated {len(regions)} regions")
+    return regions
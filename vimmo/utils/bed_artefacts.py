@@ -0,0 +1,177 @@
+from vimmo.logger.logging_config import logger
+from typing import Iterable, Optional
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+DEFAULT_ARTEFACT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "db", "bed_artefacts")
+
+# File extension of each stored encoding
+EXTENSIONS = {"identity": "bed", "gzip": "bed.gz", "bgzf": "bgzf.gz"}
+
+
+class BedArtefactCache:
+    """
+    On-disk cache of rendered local BED downloads, one file per panel version, parameter set and encoding.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Where the files live, defaults to $VIMMO_BED_ARTEFACT_DIR or vimmo/db/bed_artefacts
+    max_bytes : int
+        Total size kept; the least recently served files are removed past it
+
+    Notes
+    -----
+    - The key covers the panels and their versions (panel table), the gene list the request resolved
+      to, genome build, confidence, padding, encoding and the exon store fingerprint. Any change to a
+      panel's version or genes, or to the bed tables, therefore gives a new key; invalidate() only
+      clears files that can no longer be requested
+    - File names start with the Panel_IDs ('635_<digest>.bed.gz'), so invalidate(panel_id) works from
+      any process sharing the directory, including the scheduled updater
+    - Files are written through a temporary file and os.replace, readers never see a partial file
+    """
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 1024 * 1024 * 1024):
+        self.directory = directory or os.environ.get("VIMMO_BED_ARTEFACT_DIR", DEFAULT_ARTEFACT_DIR)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._invalidated = 0
+        self._evicted = 0
+
+    @staticmethod
+    def make_key(panels: list, genes: Iterable[str], genome_build: str, confidence: str, padding: int,
+                 encoding: str, source: tuple = ()) -> str:
+        """
+        Content address of one rendered BED.
+
+        Parameters
+        ----------
+        panels : list of (Panel_ID, Version)
+            Panels the download was resolved from, with their version in the panel table
+        genes : iterable of str
+            HGNC IDs the panels resolved to
+        genome_build, confidence, padding, encoding :
+            Request parameters that change the bytes
+        source : tuple
+            Fingerprint of the exon data (ExonStore.fingerprint)
+        """
+        material = json.dumps([sorted([str(panel_id), str(version)] for panel_id, version in panels), sorted(genes),
+                               genome_build, confidence, int(padding), encoding, list(source)])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def path(self, panel_ids: Iterable, key: str, encoding: str) -> str:
+        prefix = "-".join(sorted({str(panel_id) for panel_id in panel_ids}))
+        return os.path.join(self.directory, f"{prefix}_{key[:32]}.{EXTENSIONS[encoding]}")
+
+    def get(self, panel_ids: Iterable, key: str, encoding: str) -> Optional[str]:
+        """Path of the stored file, or None. A hit refreshes the file's mtime for eviction."""
+        path = self.path(panel_ids, key, encoding)
+        try:
+            os.utime(path)
+        except OSError:
+            self._misses += 1
+            return None
+        self._hits += 1
+        return path
+
+    def store(self, panel_ids: Iterable, key: str, encoding: str, chunks: Iterable[bytes]) -> Optional[str]:
+        """
+        Writes a rendered (already encoded) BED and returns its path.
+
+        Returns None, leaving nothing behind, if the directory cannot be written.
+        """
+        path = self.path(panel_ids, key, encoding)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        started = time.perf_counter()
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, "wb") as handle:
+                for chunk in chunks:
+                    handle.write(chunk)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logger.warning(f"BED artefact {path} could not be written: {err}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return None
+        logger.info(f"BED artefact {os.path.basename(path)} written ({os.path.getsize(path)} bytes) "
+                    f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        self._prune()
+        return path
+
+    def _files(self) -> list:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return [os.path.join(self.directory, name) for name in names if not name.endswith(".tmp")]
+
+    def _prune(self):
+        """Removes the least recently served files while the directory is over max_bytes."""
+        with self._lock:
+            entries = []
+            for path in self._files():
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    self._evicted += 1
+                except OSError:
+                    pass
+                total -= size
+
+    def invalidate(self, panel_id=None) -> int:
+        """
+        Removes the stored files of one panel (any file whose name lists the Panel_ID), or all of them.
+
+        Returns
+        -------
+        int
+            Number of files removed
+        """
+        removed = 0
+        for path in self._files():
+            panel_ids = os.path.basename(path).split("_", 1)[0].split("-")
+            if panel_id is None or str(panel_id) in panel_ids:
+                try:
+                    os.remove(path)
+                    removed += 1
+                except OSError:
+                    pass
+        self._invalidated += removed
+        if removed:
+            logger.info(f"Removed {removed} BED artefacts for {'all panels' if panel_id is None else f'panel {panel_id}'}")
+        return removed
+
+    def stats(self) -> dict:
+        lookups = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "invalidated": self._invalidated,
+            "evicted": self._evicted,
+        }
+
+
+# Shared by the API endpoints and the database writers
+bed_artefacts = BedArtefactCache()
+
+
+def invalidate_bed_artefacts(panel_id=None) -> int:
+    """Drops the cached BED downloads of a panel whose version or genes were just changed."""
+    return bed_artefacts.invalidate(panel_id)
@@ -0,0 +1,219 @@
+from vimmo.logger.logging_config import logger
+from flask import Response, request, send_file, stream_with_context
+from typing import Iterable, Iterator, Optional
+import os
+import struct
+import zlib
+
+
+# zlib level used when none is given: 1 (fastest) .. 9 (smallest), set with VIMMO_COMPRESSION_LEVEL
+DEFAULT_LEVEL = int(os.environ.get("VIMMO_COMPRESSION_LEVEL", 6))
+
+# Values of the BED endpoints' Compression argument
+COMPRESSION_CHOICES = ("auto", "none", "gzip", "bgzf")
+
+# Uncompressed bytes per BGZF block (what bgzip uses, keeps every compressed block below 64 KiB)
+BGZF_BLOCK_SIZE = 0xff00
+
+# Empty block that terminates a BGZF file (SAM/BAM specification, section 4.1.2)
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> str:
+    """
+    Picks the response Content-Encoding from an Accept-Encoding header.
+
+    Parameters
+    ----------
+    accept_encoding : str or None
+        e.g. "gzip, deflate, br" or "gzip;q=0, identity"
+
+    Returns
+    -------
+    str
+        'gzip' when the client accepts it (q > 0, directly or through '*'), otherwise 'identity'
+    """
+    weights = {}
+    for item in (accept_encoding or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights["gzip" if name == "x-gzip" else name] = weight
+    gzip_weight = weights.get("gzip", weights.get("*", 0.0))
+    return "gzip" if gzip_weight > 0 else "identity"
+
+
+def gzip_stream(chunks: Iterable[bytes], level: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Compresses a stream of byte chunks into one gzip member, chunk by chunk.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+        e.g. the generator returned by local_bed_stream
+    level : int, optional
+        zlib compression level, defaults to DEFAULT_LEVEL
+
+    Yields
+    ------
+    bytes
+        Compressed output as soon as zlib releases it, then the gzip trailer
+    """
+    compressor = zlib.compressobj(DEFAULT_LEVEL if level is None else level, zlib.DEFLATED, 31)  # 31: gzip wrapper
+    raw = packed = 0
+    for chunk in chunks:
+        raw += len(chunk)
+        data = compressor.compress(chunk)
+        if data:
+            packed += len(data)
+            yield data
+    data = compressor.flush()
+    packed += len(data)
+    yield data
+    logger.info(f"gzip stream: {raw} bytes compressed to {packed} bytes")
+
+
+def bgzf_block(data: bytes, level: Optional[int] = None) -> bytes:
+    """Compresses at most BGZF_BLOCK_SIZE bytes into one BGZF block (a gzip member with a BC extra field)."""
+    compressor = zlib.compressobj(DEFAULT_LEVEL if level is None else level, zlib.DEFLATED, -15)  # raw deflate
+    deflated = compressor.compress(data) + compressor.flush()
+    block_size = 18 + len(deflated) + 8  # header with extra field + data + CRC32 / ISIZE
+    header = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, block_size - 1)
+    return header + deflated + struct.pack("<2I", zlib.crc32(data) & 0xffffffff, len(data))
+
+
+def bgzf_stream(chunks: Iterable[bytes], level: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Compresses a stream of byte chunks into BGZF, the blocked gzip that tabix and htslib index.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+    level : int, optional
+        zlib compression level, defaults to DEFAULT_LEVEL
+
+    Yields
+    ------
+    bytes
+        Complete BGZF blocks of BGZF_BLOCK_SIZE input bytes, the remainder, then the EOF block
+
+    Notes
+    -----
+    - The output is valid gzip, so any gzip reader can decompress it
+    - tabix also needs the BED sorted by chromosome and start, which holds for the local (exon store)
+      downloads
+    """
+    buffer = bytearray()
+    raw = packed = 0
+    for chunk in chunks:
+        raw += len(chunk)
+        buffer += chunk
+        while len(buffer) >= BGZF_BLOCK_SIZE:
+            block = bgzf_block(bytes(buffer[:BGZF_BLOCK_SIZE]), level)
+            del buffer[:BGZF_BLOCK_SIZE]
+            packed += len(block)
+            yield block
+    if buffer:
+        block = bgzf_block(bytes(buffer), level)
+        packed += len(block)
+        yield block
+    yield BGZF_EOF
+    logger.info(f"BGZF stream: {raw} bytes compressed to {packed + len(BGZF_EOF)} bytes")
+
+
+def file_chunks(file_obj, size: int = 64 * 1024) -> Iterator[bytes]:
+    """Reads a file object (e.g. the BytesIO from VarValClient.parse_to_bed) in chunks."""
+    return iter(lambda: file_obj.read(size), b"")
+
+
+def choose_encoding(compression: str, accept_encoding: Optional[str]) -> tuple:
+    """
+    Resolves a Compression argument and the request's Accept-Encoding to the bytes to send.
+
+    Returns
+    -------
+    (str, bool)
+        Encoding of the body ('identity', 'gzip' or 'bgzf') and whether it is sent as
+        Content-Encoding (transparent to the client) rather than as a .bed.gz file
+    """
+    if compression == "auto":
+        encoding = negotiate_encoding(accept_encoding)
+        return encoding, encoding == "gzip"
+    if compression in ("gzip", "bgzf"):
+        return compression, False
+    return "identity", False
+
+
+def encode_stream(chunks: Iterable[bytes], encoding: str, level: Optional[int] = None) -> Iterable[bytes]:
+    """Wraps chunks in gzip_stream / bgzf_stream, or returns them unchanged for 'identity'."""
+    if encoding == "gzip":
+        return gzip_stream(chunks, level)
+    if encoding == "bgzf":
+        return bgzf_stream(chunks, level)
+    return chunks
+
+
+def _response_headers(filename: str, encoding: str, content_encoding: bool) -> tuple:
+    headers = {"Vary": "Accept-Encoding"}
+    mimetype = "text/plain"
+    if content_encoding:
+        headers["Content-Encoding"] = encoding
+    elif encoding != "identity":
+        mimetype = "application/gzip"
+        filename = f"{filename}.gz"
+    return filename, mimetype, headers
+
+
+def bed_response(chunks: Iterable[bytes], filename: str, compression: str = "auto", level: Optional[int] = None) -> Response:
+    """
+    Streams a BED download, compressed as requested.
+
+    Parameters
+    ----------
+    chunks : iterable of bytes
+        The uncompressed BED
+    filename : str
+        Download name; '.gz' is appended for gzip / bgzf files
+    compression : str
+        - 'auto': gzip Content-Encoding when the request's Accept-Encoding allows it, the client
+          decompresses transparently and saves a plain .bed
+        - 'none': never compressed
+        - 'gzip' / 'bgzf': a .bed.gz file (application/gzip), BGZF can be tabix-indexed
+    level : int, optional
+        zlib compression level, defaults to DEFAULT_LEVEL
+
+    Returns
+    -------
+    flask.Response
+        Streaming response; must be built inside the request so stream_with_context can keep it
+    """
+    encoding, content_encoding = choose_encoding(compression, request.headers.get("Accept-Encoding"))
+    filename, mimetype, headers = _response_headers(filename, encoding, content_encoding)
+    headers["Content-Disposition"] = f"attachment; filename={filename}"
+    logger.debug(f"BED response {filename}: compression={compression}, encoding={encoding}")
+    return Response(stream_with_context(encode_stream(chunks, encoding, level)), mimetype=mimetype, headers=headers)
+
+
+def bed_file_response(path: str, filename: str, encoding: str, content_encoding: bool, etag: str) -> Response:
+    """
+    Sends an already rendered (and encoded) BED file with send_file.
+
+    The file is served zero-copy where the server supports it, and conditional requests are
+    answered from the etag (If-None-Match -> 304 Not Modified) and Range headers.
+    """
+    filename, mimetype, headers = _response_headers(filename, encoding, content_encoding)
+    response = send_file(path, mimetype=mimetype, as_attachment=True, download_name=filename,
+                         conditional=True, etag=etag, max_age=0)
+    response.headers.update(headers)
+    if response.status_code == 304:
+        response.headers.pop("Content-Encoding", None)
+    return response
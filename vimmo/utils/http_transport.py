@@ -0,0 +1,147 @@
+from vimmo.logger.logging_config import logger
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from urllib.parse import urlsplit
+from typing import Optional
+import requests
+import threading
+
+
+# (connect, read) timeouts in seconds. VariantValidator can take tens of seconds for a large panel
+DEFAULT_TIMEOUT = (5, 60)
+
+# Status codes worth retrying: rate limited or a transient upstream failure
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# Requests in flight per host; PanelApp and VariantValidator are shared public services
+DEFAULT_HOST_LIMIT = 4
+
+
+class HttpTransport:
+    """
+    Connection-pooled HTTP session shared by the PanelApp and VariantValidator clients and the update scripts.
+
+    Parameters
+    ----------
+    timeout : tuple
+        Default (connect, read) timeout in seconds, applied to every request that does not pass its own
+    retries : int
+        Retries for connection errors and RETRY_STATUSES responses (GET/HEAD only)
+    backoff_factor : float
+        urllib3 exponential backoff between retries (backoff_factor * 2 ** (retry - 1) seconds);
+        a Retry-After header from a 429/503 response takes precedence
+    pool_maxsize : int
+        Keep-alive connections kept per host
+    host_limits : dict, optional
+        Host -> maximum concurrent requests, overriding default_host_limit for that host
+    default_host_limit : int
+        Maximum concurrent requests to any other host
+
+    Notes
+    -----
+    - After the last retry the final response is returned (raise_on_status=False), so callers keep
+      handling non-2xx responses as before
+    - The per-host limit is held for the whole request, retries included
+    """
+    def __init__(self, timeout: tuple = DEFAULT_TIMEOUT, retries: int = 2, backoff_factor: float = 0.5,
+                 pool_maxsize: int = 16, host_limits: Optional[dict] = None,
+                 default_host_limit: int = DEFAULT_HOST_LIMIT):
+        self.timeout = timeout
+        self.retries = retries
+        self.pool_maxsize = pool_maxsize
+        self.host_limits = dict(host_limits or {})
+        self.default_host_limit = default_host_limit
+        self._semaphores = {}
+        self._semaphores_lock = threading.Lock()
+        self._without_retries = None
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD"]),
+            backoff_factor=backoff_factor,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Accept": "application/json"})
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc
+        semaphore = self._semaphores.get(host)
+        if semaphore is None:
+            with self._semaphores_lock:
+                semaphore = self._semaphores.get(host)
+                if semaphore is None:
+                    semaphore = threading.BoundedSemaphore(self.host_limits.get(host, self.default_host_limit))
+                    self._semaphores[host] = semaphore
+        return semaphore
+
+    def without_retries(self) -> "HttpTransport":
+        """
+        A transport that does not retry, for callers that run their own retry loop.
+
+        Created once per transport; it shares this transport's per-host limits, so its requests count
+        against the same concurrency bound.
+        """
+        if self.retries == 0:
+            return self
+        with self._semaphores_lock:
+            if self._without_retries is None:
+                transport = HttpTransport(timeout=self.timeout, retries=0, pool_maxsize=self.pool_maxsize,
+                                          host_limits=self.host_limits, default_host_limit=self.default_host_limit)
+                transport._semaphores = self._semaphores
+                transport._semaphores_lock = self._semaphores_lock
+                self._without_retries = transport
+        return self._without_retries
+
+    def get(self, url: str, timeout=None, **kwargs) -> requests.Response:
+        """
+        Sends a GET request through the pooled session.
+
+        Parameters
+        ----------
+        url : str
+            URL to request
+        timeout : float or tuple, optional
+            Overrides the transport's default (connect, read) timeout
+        **kwargs
+            Passed to requests.Session.get (params, headers, ...)
+
+        Returns
+        -------
+        requests.Response
+
+        Raises
+        ------
+        requests.RequestException
+            Connection errors and timeouts once the retries are used up
+        """
+        with self._host_semaphore(url):
+            return self.session.get(url, timeout=timeout or self.timeout, **kwargs)
+
+    def close(self):
+        self.session.close()
+        if self._without_retries is not None:
+            self._without_retries.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> HttpTransport:
+    """Returns the process-wide HttpTransport, creating it on first use."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport()
+                logger.debug("Shared HTTP transport created")
+    return _transport
@@ -1,6 +1,7 @@
 from vimmo.logger.logging_config import logger
 import pandas as pd
 from io import BytesIO
+import itertools
 
 
 def local_bed_formatter(db_records, padding=0):
@@ -44,4 +45,137 @@ def local_bed_formatter(db_records, padding=0):
     else:
         # No records to process
         logger.warning("No database records found")
-        return None
\ No newline at end of file
+        return None
+
+# Database columns written to each BED line, in output order
+BED_COLUMNS = ('Chromosome', 'Start', 'End', 'Name', 'Strand', 'Transcript', 'Type', 'HGNC_ID')
+
+
+def local_bed_stream(db_records, padding=0, batch_size=1000):
+    """
+    Streaming counterpart of local_bed_formatter for Flask streaming responses.
+
+    Parameters
+    ----------
+    db_records : iterable
+        sqlite3 cursor (or list) of rows with the BED_COLUMNS keys, as returned by Query.local_bed
+    padding : int
+        Bases subtracted from Start and added to End of every region
+    batch_size : int
+        Lines joined into each chunk yielded to the response
+
+    Returns
+    -------
+    generator or None
+        Yields the BED file as UTF-8 chunks of at most batch_size lines, or None when there are no rows
+
+    Notes
+    -----
+    - Rows are formatted straight from the cursor as tab-separated lines, so memory use is bounded by
+      batch_size rather than the size of the panel
+    - The output is byte-for-byte what local_bed_formatter writes (None values as empty fields)
+    - The cursor must stay open until the generator is exhausted: wrap it in stream_with_context and
+      leave the connection to the teardown handler
+    """
+    if db_records is None:
+        logger.warning("No database records found")
+        return None
+    rows = iter(db_records)
+    first = next(rows, None)
+    if first is None:
+        logger.warning("No matching records found to write to BED file")
+        return None
+
+    def generate():
+        batch = []
+        written = 0
+        for row in itertools.chain((first,), rows):
+            batch.append('\t'.join((
+                _field(row['Chromosome']),
+                str(int(row['Start']) - padding),
+                str(int(row['End']) + padding),
+                _field(row['Name']),
+                _field(row['Strand']),
+                _field(row['Transcript']),
+                _field(row['Type']),
+                _field(row['HGNC_ID']),
+            )))
+            if len(batch) >= batch_size:
+                written += len(batch)
+                yield ('\n'.join(batch) + '\n').encode('utf-8')
+                batch = []
+        if batch:
+            written += len(batch)
+            yield ('\n'.join(batch) + '\n').encode('utf-8')
+        logger.info(f"Streamed {written} BED rows")
+
+    return generate()
+
+
+def _field(value):
+    return '' if value is None else str(value)
+
+
+def merged_bed_stream(db_records, padding=0, batch_size=1000):
+    """
+    Pads BED rows and merges overlapping or adjacent intervals into a 4-column BED, as a stream.
+
+    Parameters
+    ----------
+    db_records : iterable
+        Rows with the BED_COLUMNS keys sorted by chromosome, then Start (the exon store order, see
+        Query.local_bed with exon_stores)
+    padding : int
+        Bases subtracted from Start (not below 0) and added to End of every row before merging
+    batch_size : int
+        Lines joined into each chunk yielded to the response
+
+    Returns
+    -------
+    generator or None
+        Yields 'chrom, start, end, HGNC IDs' lines (the distinct HGNC IDs of the merged rows, comma
+        separated) as UTF-8 chunks, or None when there are no rows
+
+    Notes
+    -----
+    - One linear sweep: a row starting at or before the end of the open interval extends it, any other
+      row closes it. Equal padding keeps the rows in Start order, so no re-sort is needed
+    - Intervals that merely touch (end == next start) are merged, like bedtools merge
+    """
+    if db_records is None:
+        logger.warning("No database records found")
+        return None
+    rows = iter(db_records)
+    first = next(rows, None)
+    if first is None:
+        logger.warning("No matching records found to write to BED file")
+        return None
+
+    def generate():
+        batch = []
+        merged = total = 0
+        chrom = start = end = None
+        genes = {}
+        for row in itertools.chain((first,), rows):
+            total += 1
+            row_chrom = _field(row['Chromosome'])
+            row_start = max(int(row['Start']) - padding, 0)
+            row_end = int(row['End']) + padding
+            if row_chrom == chrom and row_start <= end:
+                end = max(end, row_end)
+                genes.setdefault(_field(row['HGNC_ID']), None)
+                continue
+            if chrom is not None:
+                batch.append(f"{chrom}\t{start}\t{end}\t{','.join(genes)}")
+                if len(batch) >= batch_size:
+                    merged += len(batch)
+                    yield ('\n'.join(batch) + '\n').encode('utf-8')
+                    batch = []
+            chrom, start, end = row_chrom, row_start, row_end
+            genes = {_field(row['HGNC_ID']): None}  # dict keeps first-seen order
+        batch.append(f"{chrom}\t{start}\t{end}\t{','.join(genes)}")
+        merged += len(batch)
+        yield ('\n'.join(batch) + '\n').encode('utf-8')
+        logger.info(f"Streamed {merged} merged BED intervals from {total} rows")
+
+    return generate()
@@ -1,24 +1,112 @@
 from vimmo.logger.logging_config import logger
+from vimmo.utils.http_transport import get_transport
+from typing import Optional
 import requests
+import threading
+import time
 
 class PanelAppAPIError(Exception):
     """Custom exception for errors related to the PanelApp API."""
     pass
 
 
+class PanelVersionCache:
+    """
+    Latest signedoff version of each panel, with the ETag and Last-Modified validators PanelApp sent with it.
+
+    Parameters
+    ----------
+    freshness : float
+        Seconds a checked version is served without contacting PanelApp. Past that it is revalidated
+        with a conditional GET, which costs a round trip but no response body when nothing has changed
+
+    Notes
+    -----
+    - Entries are keyed by str(panel_id), so 635 and "635" share an entry
+    - Thread safe; one instance is shared by all API requests (panel_version_cache below)
+    """
+    def __init__(self, freshness: float = 300.0):
+        self.freshness = freshness
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._revalidated = 0
+        self._fetched = 0
+
+    def get(self, panel_id) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(str(panel_id))
+            return dict(entry) if entry is not None else None
+
+    def is_fresh(self, entry: dict) -> bool:
+        fresh = time.monotonic() - entry["checked_at"] < self.freshness
+        if fresh:
+            with self._lock:
+                self._hits += 1
+        return fresh
+
+    @staticmethod
+    def validators(entry: Optional[dict]) -> dict:
+        """Conditional request headers for a stale entry (empty when there is nothing to revalidate)."""
+        headers = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, panel_id, version: float, etag: Optional[str] = None, last_modified: Optional[str] = None):
+        with self._lock:
+            self._entries[str(panel_id)] = {"version": version, "etag": etag, "last_modified": last_modified,
+                                            "checked_at": time.monotonic()}
+            self._fetched += 1
+
+    def revalidated(self, panel_id):
+        """Restarts the freshness window of an entry PanelApp confirmed unchanged (304)."""
+        with self._lock:
+            entry = self._entries.get(str(panel_id))
+            if entry is not None:
+                entry["checked_at"] = time.monotonic()
+            self._revalidated += 1
+
+    def invalidate(self, panel_id=None):
+        """Drops one panel's entry, or every entry when panel_id is None."""
+        with self._lock:
+            if panel_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(panel_id), None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self._hits, "revalidated": self._revalidated,
+                    "fetched": self._fetched, "freshness": self.freshness}
+
+
+# Shared by the API endpoints; scripts and tests create their own or go without
+panel_version_cache = PanelVersionCache()
+
+
 class PanelAppClient:
-    def __init__(self, base_url='https://panelapp.genomicsengland.co.uk/api/v1/panels'):
+    def __init__(self, base_url='https://panelapp.genomicsengland.co.uk/api/v1/panels', transport=None,
+                 version_cache: Optional[PanelVersionCache] = None):
         self.base_url = base_url
+        self.transport = transport or get_transport()  # pooled session with timeouts and retries
+        self.version_cache = version_cache  # latest-version cache, see get_latest_online_version
 
-    def _check_response(self, url):
+    def _send(self, url, headers=None):
         '''
-        Checks the HTTP response status code.
-        Raises PanelAppAPIError if status code is not 200.
+        Sends a GET request and checks the HTTP response status code.
+        Raises PanelAppAPIError on connection errors, timeouts and 4xx/5xx responses.
         '''
         try:
-            response = requests.get(url)
+            if headers:
+                response = self.transport.get(url, headers=headers)
+            else:
+                response = self.transport.get(url)
             response.raise_for_status()  # Raise HTTPError for bad responses (4xx and 5xx)
-            return response.json()
+            return response
         except requests.ConnectionError as e:
             logger.warning(f"Connection error while accessing PanelApp API: {str(e)}")
             raise PanelAppAPIError(f"Failed to connect to PanelApp API: {str(e)}")
@@ -32,14 +120,22 @@ class PanelAppClient:
             logger.warning(f"HTTP {status_code} error from PanelApp API: {str(e)}")
             raise PanelAppAPIError(f"PanelApp API returned HTTP {status_code}: {str(e)}")
             
-        except ValueError as e:
-            logger.warning(f"Invalid JSON response from PanelApp API: {str(e)}")
-            raise PanelAppAPIError(f"Failed to parse JSON response from PanelApp API: {str(e)}")
-            
         except Exception as e:
             logger.warning(f"Unexpected error while accessing PanelApp API: {str(e)}")
             raise PanelAppAPIError(f"Unexpected error occurred: {str(e)}")
 
+    def _check_response(self, url):
+        '''
+        Checks the HTTP response status code.
+        Raises PanelAppAPIError if status code is not 200.
+        '''
+        response = self._send(url)
+        try:
+            return response.json()
+        except ValueError as e:
+            logger.warning(f"Invalid JSON response from PanelApp API: {str(e)}")
+            raise PanelAppAPIError(f"Failed to parse JSON response from PanelApp API: {str(e)}")
+
 
     def get_genes_HUGO(self, rcode):
         '''
@@ -127,6 +223,9 @@ class PanelAppClient:
         - Using the response module, sends and receives a GET HTTP request and response
         - It extracts the .json response format
         - Indexes the results nested dictionary, and extracts the 'version'
+        - With a version_cache, a version checked within the cache's freshness window is returned without
+          contacting PanelApp; an older one is revalidated with a conditional GET (If-None-Match /
+          If-Modified-Since) and reused on a 304 Not Modified
 
         Example
         -----
@@ -137,10 +236,37 @@ class PanelAppClient:
         logger.info(f"Starting get_latest_online_version for panel_id: {panel_id}")
 
         url = f'{self.base_url}/signedoff/?panel_id={panel_id}&display=latest'  # Set the URL
-        logger.info(f"Constructed URL Panel app API: {url}")
-        json_data = self._check_response(url)  # Send get request to URL, if 200 return json format of the response
-        logger.info(f"Successfully retrieved JSON data for panel_id: {panel_id}")
+        if self.version_cache is None:
+            logger.info(f"Constructed URL Panel app API: {url}")
+            json_data = self._check_response(url)  # Send get request to URL, if 200 return json format of the response
+            logger.info(f"Successfully retrieved JSON data for panel_id: {panel_id}")
+            return self._parse_latest_version(json_data, panel_id)
+
+        entry = self.version_cache.get(panel_id)
+        if entry is not None and self.version_cache.is_fresh(entry):
+            logger.debug(f"Version of panel_id {panel_id} served from cache: {entry['version']}")
+            return entry["version"]
+
+        headers = self.version_cache.validators(entry)
+        response = self._send(url, headers=headers)
+        if response.status_code == 304 and entry is not None:
+            self.version_cache.revalidated(panel_id)
+            logger.debug(f"Version of panel_id {panel_id} revalidated (304 Not Modified): {entry['version']}")
+            return entry["version"]
+
+        try:
+            json_data = response.json()
+        except ValueError as e:
+            logger.warning(f"Invalid JSON response from PanelApp API: {str(e)}")
+            raise PanelAppAPIError(f"Failed to parse JSON response from PanelApp API: {str(e)}")
+        version = self._parse_latest_version(json_data, panel_id)
+        self.version_cache.store(panel_id, version,
+                                 etag=response.headers.get("ETag"),
+                                 last_modified=response.headers.get("Last-Modified"))
+        return version
 
+    def _parse_latest_version(self, json_data: dict, panel_id: str) -> float:
+        """Extracts the version of the first signedoff result, raising KeyError when there is none."""
         try:
             # Check if 'results' is empty
             if not json_data.get("results"):
@@ -1,5 +1,19 @@
 from flask_restx import reqparse, inputs
 
+
+def add_compression_argument(parser):
+    """Adds the Compression argument shared by the BED download parsers."""
+    parser.add_argument(
+        'Compression',
+        type=str,
+        choices=['auto', 'none', 'gzip', 'bgzf'],
+        help=("'auto' gzips the response when the client accepts it (Accept-Encoding), 'none' never compresses, "
+              "'gzip' / 'bgzf' download a .bed.gz file (BGZF can be indexed with tabix)."),
+        required=False,
+        default='auto'
+    )
+    return parser
+
 class IDParser:
     """Parser for handling panel ID, Rcode, and HGNC ID arguments."""
     
@@ -152,6 +166,8 @@ class PatientBedParser:
             required=False
         )
 
+        add_compression_argument(parser)
+
         return parser
     
 
@@ -220,6 +236,8 @@ class PatientLocalBedParser:
         )
 
 
+        add_compression_argument(parser)
+
         return parser
     
 
@@ -268,6 +286,8 @@ class DownloadParser:
         )
 
 
+        add_compression_argument(parser)
+
         return parser
 
 
@@ -318,6 +338,110 @@ class LocalDownloadParser:
         )
 
 
+        parser.add_argument(
+            'Padding',
+            type=int,
+            help='Please provide a value to pad the bed records by +/- N bp',
+            required=False,
+            default=0
+        )
+        add_compression_argument(parser)
+
+        return parser
+
+
+class BulkLocalDownloadParser:
+    """Parser for the multi-panel local BED download."""
+
+    @staticmethod
+    def create_parser():
+        parser = reqparse.RequestParser()
+
+        parser.add_argument(
+            'Panel_ID',
+            type=str,
+            help="Comma separated Panel_IDs (e.g., '635,398'). Can be combined with 'Rcode'.",
+            required=False
+        )
+        parser.add_argument(
+            'Rcode',
+            type=str,
+            help="Comma separated Rcodes (e.g., 'R208,R430'). Can be combined with 'Panel_ID'.",
+            required=False
+        )
+        parser.add_argument(
+            'Confidence',
+            choices=['Green', 'Amber', 'Red', 'All'],
+            help="Specify the gene confidence to restrict gene relevence.",
+            required=False,
+            default='All'
+        )
+        parser.add_argument(
+            'genome_build',
+            type=str,
+            choices=['GRCh37', 'GRCh38'],
+            help="Specify the genome build (GRCh37 or GRCh38).",
+            required=True,
+            default='GRCh38'
+        )
+        parser.add_argument(
+            'Padding',
+            type=int,
+            help='Please provide a value to pad the bed records by +/- N bp',
+            required=False,
+            default=0
+        )
+        parser.add_argument(
+            'Merge',
+            type=inputs.boolean,
+            help=("Select true to merge overlapping and adjacent regions (after padding) into a "
+                  "chrom / start / end / HGNC IDs BED."),
+            required=False,
+            default=False
+        )
+
+        add_compression_argument(parser)
+
+        return parser
+
+
+class RegionParser:
+    """Parser for the genomic region lookup (regions are also accepted as a JSON body by POST)."""
+
+    @staticmethod
+    def create_parser():
+        parser = reqparse.RequestParser()
+
+        parser.add_argument(
+            'regions',
+            type=str,
+            help=("Comma separated regions, 1-based inclusive (e.g., 'chr17:43044295-43125483,chr13:32315508-32400268'). "
+                  "POST a JSON body {\"regions\": [...]} for large batches."),
+            required=True
+        )
+        parser.add_argument(
+            'genome_build',
+            type=str,
+            choices=['GRCh37', 'GRCh38'],
+            help="Specify the genome build (GRCh37 or GRCh38).",
+            required=False,
+            default='GRCh38'
+        )
+        parser.add_argument(
+            'Confidence',
+            choices=['Green', 'Amber', 'Red', 'All'],
+            help="Only report panels on which the overlapping genes have this confidence.",
+            required=False,
+            default='All'
+        )
+        parser.add_argument(
+            'exons',
+            type=inputs.boolean,
+            help="Select false to leave the overlapping exons out of the response.",
+            required=False,
+            default=True
+        )
+
         return parser
 
 
@@ -351,6 +475,34 @@ class UpdateParser:
 
 
 
+class BulkUpdateParser:
+    """Parser for bulk adding patient records, the records themselves are the request body."""
+    @staticmethod
+    def create_parser():
+        parser = reqparse.RequestParser()
+
+        parser.add_argument(
+            'Format',
+            type=str,
+            choices=['auto', 'csv', 'ndjson'],
+            help="Format of the request body, 'auto' follows the Content-Type (text/csv or application/x-ndjson)",
+            location='args',
+            required=False,
+            default='auto'
+        )
+        parser.add_argument(
+            'Dry_Run',
+            type=inputs.boolean,
+            help='Validate and deduplicate the records without adding them (default: false)',
+            location='args',
+            required=False,
+            default=False
+        )
+
+        return parser
+
+
+
 class DowngradeParser:
     """Parser for downgrading the database for a given panel."""
     @staticmethod
@@ -1,11 +1,21 @@
 from vimmo.logger.logging_config import logger
-import requests
 from urllib.parse import quote
 import pandas as pd
+import numpy as np
 from io import BytesIO
 from vimmo.db.db_query import Query
 from vimmo.API import get_db
+from vimmo.utils.http_transport import get_transport
+from concurrent.futures import ThreadPoolExecutor
 import os
+import time
+
+# Sort rank of the non-numeric chromosomes, placed after the autosomes (see VarValClient.custom_sort)
+CHROMOSOME_RANKS = {'X': 23, 'Y': 24}
+
+# Seconds a chunk may take over all its attempts before the query fails
+CHUNK_TIMEOUT = 90.0
+
 
 class VarValAPIError(Exception):
     """Custom exception for errors related to the VarVal API."""
@@ -13,22 +23,45 @@ class VarValAPIError(Exception):
 
 
 class VarValClient:
-    def __init__(self, base_url='https://rest.variantvalidator.org/VariantValidator/tools/gene2transcripts_v2'):
+    def __init__(self, base_url='https://rest.variantvalidator.org/VariantValidator/tools/gene2transcripts_v2', cache=None,
+                 chunk_size=None, max_workers=4, chunk_retries=2, retry_backoff=1.0, chunk_timeout=CHUNK_TIMEOUT,
+                 transport=None):
         """
         Initialize the VariantValidator client.
 
         Parameters:
         - base_url (str): Base URL for the VariantValidator API.
+        - cache (VarValCache, optional): Per-gene response cache (vimmo/utils/varval_cache.py). When given,
+          get_gene_data only requests the genes missing from the cache.
+        - chunk_size (int, optional): Split gene queries into requests of at most this many genes, fetched
+          concurrently. None sends the whole query in one request.
+        - max_workers (int): Maximum number of chunks in flight at once.
+        - chunk_retries (int): Extra attempts for a chunk that fails before the whole query fails.
+        - retry_backoff (float): Seconds to wait before the first retry of a chunk, doubled on each retry.
+        - chunk_timeout (float): Seconds a chunk may take over all its attempts; no retry is started
+          past it and each attempt's read timeout is cut to the time left.
+        - transport (HttpTransport, optional): HTTP transport, defaults to the shared pooled session
+          (vimmo/utils/http_transport.py). Chunks are fetched through its transport.without_retries(),
+          so the chunk retries are the only retry layer.
         """
 
         self.base_url = base_url
-
-    def _check_response(self, url):
+        self.cache = cache
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.chunk_retries = chunk_retries
+        self.retry_backoff = retry_backoff
+        self.chunk_timeout = chunk_timeout
+        self.transport = transport or get_transport()
+
+    def _check_response(self, url, transport=None, timeout=None):
         """
         Sends a GET request to the specified URL and validates the response.
 
         Parameters:
         - url (str): URL to send the GET request to.
+        - transport (HttpTransport, optional): Transport to send it through, defaults to self.transport.
+        - timeout (tuple, optional): (connect, read) timeout, defaults to the transport's.
 
         Returns:
         - dict: Parsed JSON response from the API.
@@ -37,7 +70,7 @@ class VarValClient:
         - VarValAPIError: If the request fails or the status code is not 200.
         """
         try:
-            response = requests.get(url)
+            response = (transport or self.transport).get(url, timeout=timeout)
         except :
             logger.error(f"Failed to connect to {url}. Please check your internet connection and try again.")
             raise VarValAPIError(f"Failed to connect. Please check your internet connection and try again")
@@ -65,6 +98,83 @@ class VarValClient:
         Raises:
         - VarValAPIError: If the API request fails or returns an error response.
         """
+        if self.cache is not None:
+            return self._get_gene_data_cached(gene_query, genome_build, transcript_set, limit_transcripts)
+        return self._request_genes(gene_query, genome_build, transcript_set, limit_transcripts)
+
+    def _request_genes(self, gene_query, genome_build, transcript_set, limit_transcripts):
+        """Sends a pipe-joined gene query in one request, or in concurrent chunks when chunk_size is set."""
+        genes = [gene for gene in gene_query.split("|") if gene]
+        if self.chunk_size and len(genes) > self.chunk_size:
+            return self._fetch_gene_data_chunked(genes, genome_build, transcript_set, limit_transcripts)
+        return self._fetch_gene_data(gene_query, genome_build, transcript_set, limit_transcripts)
+
+    def _fetch_chunk(self, chunk_number, total_chunks, genes, genome_build, transcript_set, limit_transcripts):
+        """
+        Fetches one chunk of genes, retrying it with exponential backoff within chunk_timeout.
+
+        Returns:
+        - list: The records returned for the chunk.
+
+        Raises:
+        - VarValAPIError: If every attempt failed or chunk_timeout ran out.
+        """
+        transport = self.transport.without_retries()
+        connect_timeout, read_timeout = transport.timeout if isinstance(transport.timeout, tuple) else (transport.timeout,) * 2
+        deadline = time.monotonic() + self.chunk_timeout
+        for attempt in range(1, self.chunk_retries + 2):
+            started = time.perf_counter()
+            timeout = (connect_timeout, max(min(read_timeout, deadline - time.monotonic()), 0.1))
+            try:
+                records = self._fetch_gene_data("|".join(genes), genome_build, transcript_set, limit_transcripts,
+                                                transport=transport, timeout=timeout)
+            except VarValAPIError as e:
+                elapsed = (time.perf_counter() - started) * 1000
+                logger.warning(f"VariantValidator chunk {chunk_number}/{total_chunks} ({len(genes)} genes) failed "
+                               f"after {elapsed:.0f} ms on attempt {attempt}: {e}")
+                backoff = self.retry_backoff * 2 ** (attempt - 1)
+                if attempt > self.chunk_retries or time.monotonic() + backoff >= deadline:
+                    raise
+                time.sleep(backoff)
+            else:
+                elapsed = (time.perf_counter() - started) * 1000
+                logger.info(f"VariantValidator chunk {chunk_number}/{total_chunks} ({len(genes)} genes) fetched "
+                            f"in {elapsed:.0f} ms on attempt {attempt}")
+                return records if isinstance(records, list) else [records]
+
+    def _fetch_gene_data_chunked(self, genes, genome_build, transcript_set, limit_transcripts):
+        """
+        Fans a gene list out over chunk_size requests run on a bounded thread pool and merges the results.
+
+        Parameters:
+        - genes (list): Gene identifiers.
+        - genome_build, transcript_set, limit_transcripts (str): As for get_gene_data.
+
+        Returns:
+        - list: The records of every chunk, in the order of the chunks.
+
+        Raises:
+        - VarValAPIError: If a chunk still fails after chunk_retries retries.
+        """
+        chunks = [genes[i:i + self.chunk_size] for i in range(0, len(genes), self.chunk_size)]
+        logger.info(f"Fetching {len(genes)} genes from VariantValidator in {len(chunks)} chunks "
+                    f"of up to {self.chunk_size} ({self.max_workers} at a time).")
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [
+                executor.submit(self._fetch_chunk, number, len(chunks), chunk, genome_build, transcript_set, limit_transcripts)
+                for number, chunk in enumerate(chunks, start=1)
+            ]
+            records = []
+            for future in futures:
+                records.extend(future.result())
+
+        logger.info(f"Fetched {len(chunks)} VariantValidator chunks in {(time.perf_counter() - started) * 1000:.0f} ms.")
+        return records
+
+    def _fetch_gene_data(self, gene_query, genome_build, transcript_set, limit_transcripts, transport=None, timeout=None):
+        """Builds the gene2transcripts URL for get_gene_data and requests it (see _check_response for transport and timeout)."""
         # Encode URL components to ensure compatibility
         encoded_gene_query = quote(gene_query)
         encoded_transcript_set = quote(transcript_set)
@@ -82,7 +192,52 @@ class VarValClient:
 
         # Make the request and return the response
         logger.info(f"Pulling gene data from URL: {url}.")
-        return self._check_response(url)
+        return self._check_response(url, transport=transport, timeout=timeout)
+
+    def _get_gene_data_cached(self, gene_query, genome_build, transcript_set, limit_transcripts):
+        """
+        get_gene_data through the per-gene cache: cached genes are served locally and the rest are
+        requested in one call, then stored.
+
+        Parameters:
+        - gene_query (str): Pipe-joined gene identifiers, as built by get_hgnc_ids_with_replacements.
+        - genome_build, transcript_set, limit_transcripts (str): As for get_gene_data.
+
+        Returns:
+        - list: One record per gene, cached records first in query order, as returned by the API.
+
+        Notes:
+        - Response records are matched to the requested genes through their 'requested_symbol'
+        - Records carrying an 'error' (e.g. VVTA temporarily unavailable) are returned but never cached
+        """
+        genes = list(dict.fromkeys(gene for gene in gene_query.split("|") if gene))
+        params = (genome_build, transcript_set, limit_transcripts)
+        cached = self.cache.get_many(genes, *params, source=self.base_url)
+        missing = [gene for gene in genes if gene not in cached]
+        logger.info(f"VariantValidator cache served {len(cached)} of {len(genes)} genes, requesting {len(missing)}.")
+
+        fetched, unmatched = {}, []
+        if missing:
+            response = self._request_genes("|".join(missing), genome_build, transcript_set, limit_transcripts)
+            if not isinstance(response, list):
+                response = [response]
+
+            requested = {gene.upper(): gene for gene in missing}
+            for record in response:
+                symbol = record.get("requested_symbol") if isinstance(record, dict) else None
+                if symbol is None and len(missing) == 1:
+                    symbol = missing[0]
+                gene = requested.get(str(symbol).upper()) if symbol is not None else None
+                if gene is None:
+                    unmatched.append(record)
+                else:
+                    fetched[gene] = record
+
+            self.cache.put_many({gene: record for gene, record in fetched.items() if "error" not in record},
+                                *params, source=self.base_url)
+
+        return [cached[gene] if gene in cached else fetched[gene]
+                for gene in genes if gene in cached or gene in fetched] + unmatched
     
 
 
@@ -219,6 +374,50 @@ class VarValClient:
         logger.debug(f"sorted key: {chrom_number}, {start}, {end}")
         return (chrom_number, start, end)
 
+    def sort_order(self, bed_df):
+        """
+        Row order that sorts a BED DataFrame by the custom_sort key, computed column-wise.
+
+        Parameters
+        ----------
+        bed_df : pd.DataFrame
+            Rows with 'chrom', 'start' and 'end' columns (strings and/or integers, as built by parse_to_bed)
+
+        Returns
+        -------
+        np.ndarray
+            Positional indexes; bed_df.iloc[order] is the sorted BED
+
+        Notes
+        -----
+        - Same key as custom_sort: chromosome rank (1-22, X=23, Y=24, anything else inf), then start, then end,
+          with coordinates that are not integers ranked inf and "NoRecord"/"Error" rows keyed (inf, inf, inf)
+        - The three keys are float arrays sorted with one stable np.lexsort, so rows with equal keys
+          (e.g. the NoRecord and Error rows at the end) keep the order they were parsed in
+        """
+        # A BED has a few dozen distinct chromosome labels: rank each label once, then index by label code
+        codes, labels = pd.factorize(bed_df['chrom'])
+        label_rank = np.full(len(labels) + 1, np.inf)  # the extra last slot serves missing labels (code -1)
+        special = np.ones(len(labels) + 1, dtype=bool)
+        for i, label in enumerate(labels):
+            if not isinstance(label, str) or label in ("NoRecord", "Error"):
+                continue
+            special[i] = False
+            suffix = label[3:]
+            if suffix.isdigit():
+                label_rank[i] = int(suffix)
+            elif suffix in CHROMOSOME_RANKS:
+                label_rank[i] = CHROMOSOME_RANKS[suffix]
+        rank = label_rank[codes]
+        special = special[codes]
+
+        start = np.trunc(pd.to_numeric(bed_df['start'], errors='coerce').to_numpy(dtype=float))
+        end = np.trunc(pd.to_numeric(bed_df['end'], errors='coerce').to_numpy(dtype=float))
+        for key in (start, end):
+            key[np.isnan(key) | special] = np.inf
+        rank[special] = np.inf
+        return np.lexsort((end, start, rank))
+
 
     def parse_to_bed(self, gene_query, genome_build='GRCh38', transcript_set='all', limit_transcripts='mane_select', padding=0):
         """
@@ -307,14 +506,11 @@ class VarValClient:
         # Convert rows into a DataFrame
         logger.info("Converting parsed data into DataFrame.")
         bed_df = pd.DataFrame(bed_rows)
-        # Define a custom sorting function
 
-        # Add sorting key
+        # Sort by chromosome, start and end (the custom_sort key, computed for all rows at once)
         logger.info("Sorting the DataFrame.")
-        bed_df['sort_key'] = bed_df.apply(self.custom_sort, axis=1)
-
-        # Sort DataFrame based on the key
-        bed_df = bed_df.sort_values('sort_key').drop(columns=['sort_key'])
+        if not bed_df.empty:
+            bed_df = bed_df.iloc[self.sort_order(bed_df)]
 
         # Reset index after sorting
         bed_df.reset_index(drop=True, inplace=True)
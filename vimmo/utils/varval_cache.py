@@ -0,0 +1,194 @@
+from vimmo.logger.logging_config import logger
+from typing import Optional
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "db", "varval_cache.db")
+
+
+class VarValCache:
+    """
+    Persistent per-gene cache of VariantValidator gene2transcripts records.
+
+    Each gene record of a response is stored on its own, zlib-compressed, under a content address:
+    the SHA-256 of (gene, genome_build, transcript_set, limit_transcripts, source). Panels that share
+    genes therefore share cache entries, and only the genes missing from the cache are requested.
+
+    Parameters
+    ----------
+    path : str, optional
+        SQLite file holding the cache, defaults to $VIMMO_VARVAL_CACHE or vimmo/db/varval_cache.db
+    ttl : float
+        Seconds a record stays valid after it was fetched (default 7 days)
+    max_entries : int
+        LRU cap on the number of records kept
+    max_bytes : int
+        LRU cap on the total compressed size of the records kept
+
+    Notes
+    -----
+    - Safe to share between the threads of a Flask worker, access is serialised with a lock
+    - Expired records are removed when they are looked up, least recently used records when a put
+      takes the cache over one of its caps
+    """
+    def __init__(self, path: Optional[str] = None, ttl: float = 7 * 24 * 3600,
+                 max_entries: int = 50000, max_bytes: int = 256 * 1024 * 1024):
+        self.path = path or os.environ.get("VIMMO_VARVAL_CACHE", DEFAULT_CACHE_PATH)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._hits = 0
+        self._misses = 0
+        self._expired = 0
+        self._evictions = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened lazily so importing the API does not create the file
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.execute("PRAGMA synchronous = NORMAL")
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS varval_cache (
+                    key TEXT PRIMARY KEY,
+                    gene TEXT,
+                    genome_build TEXT,
+                    transcript_set TEXT,
+                    limit_transcripts TEXT,
+                    payload BLOB,
+                    size INTEGER,
+                    stored_at REAL,
+                    last_used REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_varval_cache_last_used ON varval_cache (last_used);
+            ''')
+            logger.info(f"VariantValidator cache opened at {self.path}")
+        return self._conn
+
+    @staticmethod
+    def make_key(gene: str, genome_build: str, transcript_set: str, limit_transcripts: str, source: str = "") -> str:
+        """Content address of one gene record for one parameter set."""
+        material = json.dumps([gene.upper(), genome_build, transcript_set, limit_transcripts, source])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get_many(self, genes: list, genome_build: str, transcript_set: str, limit_transcripts: str,
+                 source: str = "") -> dict:
+        """
+        Looks up the cached records for a list of genes.
+
+        Returns
+        -------
+        dict
+            gene -> record for every gene with a valid entry, genes missing from the dict are misses
+        """
+        if not genes:
+            return {}
+        keys = {self.make_key(gene, genome_build, transcript_set, limit_transcripts, source): gene for gene in genes}
+        now = time.time()
+        found = {}
+
+        with self._lock:
+            conn = self._connect()
+            rows = []
+            key_list = list(keys)
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                placeholders = ", ".join(["?"] * len(batch))
+                rows += conn.execute(
+                    f"SELECT key, payload, stored_at FROM varval_cache WHERE key IN ({placeholders})", batch
+                ).fetchall()
+
+            expired = [key for key, _, stored_at in rows if now - stored_at >= self.ttl]
+            for key, payload, stored_at in rows:
+                if now - stored_at < self.ttl:
+                    found[keys[key]] = json.loads(zlib.decompress(payload).decode("utf-8"))
+
+            if expired:
+                conn.executemany("DELETE FROM varval_cache WHERE key = ?", [(key,) for key in expired])
+            if found:
+                hit_keys = [key for key, _, stored_at in rows if now - stored_at < self.ttl]
+                conn.executemany("UPDATE varval_cache SET last_used = ? WHERE key = ?", [(now, key) for key in hit_keys])
+            conn.commit()
+
+            self._hits += len(found)
+            self._misses += len(genes) - len(found)
+            self._expired += len(expired)
+
+        logger.debug(f"VariantValidator cache: {len(found)} hits, {len(genes) - len(found)} misses "
+                     f"({len(expired)} expired) for {genome_build}/{transcript_set}/{limit_transcripts}")
+        return found
+
+    def put_many(self, records: dict, genome_build: str, transcript_set: str, limit_transcripts: str,
+                 source: str = ""):
+        """
+        Stores gene -> record pairs, then evicts least recently used records beyond the caps.
+        """
+        if not records:
+            return
+        now = time.time()
+        rows = []
+        for gene, record in records.items():
+            payload = zlib.compress(json.dumps(record).encode("utf-8"))
+            rows.append((self.make_key(gene, genome_build, transcript_set, limit_transcripts, source), gene,
+                         genome_build, transcript_set, limit_transcripts, payload, len(payload), now, now))
+
+        with self._lock:
+            conn = self._connect()
+            conn.executemany("INSERT OR REPLACE INTO varval_cache VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._evict(conn)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection):
+        entries, total_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM varval_cache").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM varval_cache ORDER BY last_used, stored_at").fetchall():
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM varval_cache WHERE key = ?", (key,))
+            entries -= 1
+            total_bytes -= size
+            evicted += 1
+        self._evictions += evicted
+        logger.info(f"VariantValidator cache evicted {evicted} least recently used records")
+
+    def clear(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM varval_cache")
+            conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, total_bytes = self._connect().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM varval_cache").fetchone()
+        lookups = self._hits + self._misses
+        return {
+            "path": self.path,
+            "entries": entries,
+            "bytes": total_bytes,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_ratio": round(self._hits / lookups, 4) if lookups else 0.0,
+            "expired": self._expired,
+            "evictions": self._evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# Shared by the API endpoints, see VarValClient(cache=varval_cache)
+varval_cache = VarValCache()